@@ -4,6 +4,7 @@ Supabase 資料庫連接模組
 """
 from supabase import create_client, Client
 from app.settings import get_settings
+from app.services.case_events import publish_application_changed
 from typing import Optional
 
 settings = get_settings()
@@ -102,7 +103,10 @@ class DatabaseService:
                 serialized_data = serialize_data(application_data)
                 
                 result = self.client.table('applications').insert(serialized_data).execute()
-                return result.data[0] if result.data else None
+                created = result.data[0] if result.data else None
+                if created:
+                    publish_application_changed(created)
+                return created
                 
             except Exception as e:
                 last_error = e
@@ -132,6 +136,16 @@ class DatabaseService:
             .execute()
         return result.data
     
+    def get_applications_by_ids(self, application_ids: list):
+        """批次取得申請案件"""
+        if not application_ids:
+            return []
+        result = self.client.table('applications') \
+            .select('*') \
+            .in_('id', list(application_ids)) \
+            .execute()
+        return result.data or []
+    
     def get_application_by_case_no(self, case_no: str):
         """根據案件編號取得申請案件"""
         result = self.client.table('applications') \
@@ -167,12 +181,197 @@ class DatabaseService:
             .update(update_data) \
             .eq('id', application_id) \
             .execute()
+        updated = result.data[0] if result.data else None
+        if updated:
+            publish_application_changed(updated)
+        return updated
+
+    def update_application_location(self, application_id: str, latitude: float, longitude: float, formatted_address: Optional[str] = None):
+        """更新申請案件的地理編碼結果"""
+        result = self.client.table('applications') \
+            .update({
+                'latitude': latitude,
+                'longitude': longitude,
+                'formatted_address': formatted_address
+            }) \
+            .eq('id', application_id) \
+            .execute()
+        updated = result.data[0] if result.data else None
+        if updated:
+            publish_application_changed(updated)
+        return updated
+
+    def get_geocoded_applications(
+        self,
+        status: Optional[str] = None,
+        district_id: Optional[str] = None,
+        application_ids: Optional[list] = None,
+        columns: str = 'id, case_no, latitude, longitude, status, district_id',
+        limit: int = 10000,
+        page_size: int = 1000
+    ):
+        """
+        取得已有經緯度的申請案件（分頁讀取，避免單次查詢上限）
+
+        Args:
+            status: 案件狀態篩選
+            district_id: 區域篩選
+            application_ids: 指定案件 ID
+            columns: 要取得的欄位
+            limit: 最多回傳筆數
+            page_size: 每次查詢筆數
+        """
+        rows = []
+        offset = 0
+        while len(rows) < limit:
+            query = self.client.table('applications') \
+                .select(columns) \
+                .not_.is_('latitude', 'null') \
+                .not_.is_('longitude', 'null')
+
+            if status:
+                query = query.eq('status', status)
+            if district_id:
+                query = query.eq('district_id', district_id)
+            if application_ids:
+                query = query.in_('id', application_ids)
+
+            end = offset + min(page_size, limit - len(rows)) - 1
+            result = query.order('id').range(offset, end).execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < end - offset + 1:
+                break
+            offset = end + 1
+        return rows
+
+    def get_geocoded_applications_page(
+        self,
+        columns: str,
+        after_id: Optional[str] = None,
+        page_size: int = 1000,
+        status: Optional[list] = None,
+        district_id: Optional[str] = None,
+        disaster_type: Optional[str] = None,
+        submitted_from: Optional[str] = None,
+        submitted_to: Optional[str] = None
+    ):
+        """
+        取得一頁已有經緯度的申請案件（以 id 做 keyset 分頁，供串流匯出）
+
+        Args:
+            columns: 要取得的欄位（須包含 id）
+            after_id: 上一頁最後一筆的 id
+            page_size: 每頁筆數
+            status: 狀態篩選（多個）
+            district_id: 區域篩選
+            disaster_type: 災害類型篩選
+            submitted_from: 送件時間起（含，ISO 8601）
+            submitted_to: 送件時間迄（不含，ISO 8601）
+        """
+        query = self.client.table('applications') \
+            .select(columns) \
+            .not_.is_('latitude', 'null') \
+            .not_.is_('longitude', 'null')
+
+        if status:
+            query = query.in_('status', status)
+        if district_id:
+            query = query.eq('district_id', district_id)
+        if disaster_type:
+            query = query.eq('disaster_type', disaster_type)
+        if submitted_from:
+            query = query.gte('submitted_at', submitted_from)
+        if submitted_to:
+            query = query.lt('submitted_at', submitted_to)
+        if after_id:
+            query = query.gt('id', after_id)
+
+        result = query.order('id').limit(page_size).execute()
+        return result.data or []
+
+    def assign_reviewer(self, application_ids: list, reviewer_id: str):
+        """批次指派審核員"""
+        if not application_ids:
+            return []
+        result = self.client.table('applications') \
+            .update({'assigned_reviewer_id': reviewer_id}) \
+            .in_('id', application_ids) \
+            .execute()
+        for updated in result.data or []:
+            publish_application_changed(updated)
+        return result.data
+
+    def get_applications_without_district(self, after_id: Optional[str] = None, page_size: int = 1000):
+        """
+        取得尚未指派區域的案件（以 id 做 keyset 分頁）
+
+        Args:
+            after_id: 上一頁最後一筆的 id
+            page_size: 每頁筆數
+        """
+        query = self.client.table('applications') \
+            .select('id, address, damage_location, latitude, longitude') \
+            .is_('district_id', 'null')
+        if after_id:
+            query = query.gt('id', after_id)
+        result = query.order('id').limit(page_size).execute()
+        return result.data or []
+
+    def assign_district(self, application_ids: list, district_id: str):
+        """批次設定案件所屬區域"""
+        if not application_ids:
+            return []
+        result = self.client.table('applications') \
+            .update({'district_id': district_id}) \
+            .in_('id', application_ids) \
+            .execute()
+        for updated in result.data or []:
+            publish_application_changed(updated)
+        return result.data
+
+    def get_district_applications_page(self, district_id: str, after_id: Optional[str] = None, page_size: int = 200):
+        """
+        取得區域內的案件編號（以 id 做 keyset 分頁）
+
+        Args:
+            district_id: 區域 ID
+            after_id: 上一頁最後一筆的 id
+            page_size: 每頁筆數
+        """
+        query = self.client.table('applications') \
+            .select('id, case_no') \
+            .eq('district_id', district_id)
+        if after_id:
+            query = query.gt('id', after_id)
+        result = query.order('id').limit(page_size).execute()
+        return result.data or []
+
+    # ==========================================
+    # 區域相關操作
+    # ==========================================
+
+    def get_district_by_id(self, district_id: str):
+        """根據 ID 取得區域"""
+        result = self.client.table('districts') \
+            .select('*') \
+            .eq('id', district_id) \
+            .limit(1) \
+            .execute()
         return result.data[0] if result.data else None
-    
+
+    def get_active_districts(self):
+        """取得所有啟用中的區域（供地址配對使用）"""
+        result = self.client.table('districts') \
+            .select('id, city, district, village') \
+            .eq('is_active', True) \
+            .execute()
+        return result.data or []
+
     # ==========================================
     # 使用者相關操作
     # ==========================================
-    
+
     def create_user(self, user_data: dict):
         """建立新使用者"""
         serialized_data = serialize_data(user_data)
@@ -240,6 +439,41 @@ class DatabaseService:
         result = self.client.table('damage_photos').insert(serialized_data).execute()
         return result.data[0] if result.data else None
     
+    def create_damage_photos(self, photos: list):
+        """批次建立災損照片記錄（單次寫入）"""
+        if not photos:
+            return []
+        result = self.client.table('damage_photos').insert([serialize_data(p) for p in photos]).execute()
+        return result.data or []
+    
+    def get_photos_by_storage_paths(self, storage_paths: list):
+        """依 Storage 路徑取得照片記錄"""
+        if not storage_paths:
+            return []
+        result = self.client.table('damage_photos') \
+            .select('*') \
+            .in_('storage_path', list(storage_paths)) \
+            .execute()
+        return result.data or []
+    
+    def get_photos_by_upload_refs(self, upload_refs: list):
+        """依直接上傳路徑（upload_ref）取得照片記錄"""
+        if not upload_refs:
+            return []
+        result = self.client.table('damage_photos') \
+            .select('*') \
+            .in_('upload_ref', list(upload_refs)) \
+            .execute()
+        return result.data or []
+    
+    def get_photo_by_id(self, photo_id: str):
+        """根據 ID 取得照片記錄"""
+        result = self.client.table('damage_photos') \
+            .select('*') \
+            .eq('id', photo_id) \
+            .execute()
+        return result.data[0] if result.data else None
+    
     def get_photos_by_application(self, application_id: str):
         """取得申請案件的所有照片"""
         result = self.client.table('damage_photos') \
@@ -249,6 +483,40 @@ class DatabaseService:
             .execute()
         return result.data
     
+    def get_photos_by_applications(self, application_ids: list, page_size: int = 1000):
+        """
+        批次取得多個申請案件的照片（分頁讀取，避免單次查詢上限截斷結果）
+
+        Args:
+            application_ids: 申請案件 ID
+            page_size: 每次查詢筆數
+        """
+        if not application_ids:
+            return []
+        rows = []
+        offset = 0
+        while True:
+            result = self.client.table('damage_photos') \
+                .select('*') \
+                .in_('application_id', list(application_ids)) \
+                .order('created_at', desc=False) \
+                .order('id') \
+                .range(offset, offset + page_size - 1) \
+                .execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
+    
+    def update_photo(self, photo_id: str, update_data: dict):
+        """更新照片記錄"""
+        result = self.client.table('damage_photos') \
+            .update(serialize_data(update_data)) \
+            .eq('id', photo_id) \
+            .execute()
+        return result.data[0] if result.data else None
+    
     def delete_photo(self, photo_id: str):
         """刪除照片記錄"""
         result = self.client.table('damage_photos') \
@@ -257,6 +525,115 @@ class DatabaseService:
             .execute()
         return result.data
     
+    # ==========================================
+    # 照片感知雜湊（相似照片偵測）相關操作
+    # ==========================================
+    
+    def get_photo_hashes(self, after_id: Optional[str] = None, page_size: int = 5000):
+        """
+        取得已計算感知雜湊的照片（以 id 做 keyset 分頁）
+
+        Args:
+            after_id: 上一頁最後一筆的 id
+            page_size: 每頁筆數
+        """
+        query = self.client.table('damage_photos') \
+            .select('id, application_id, phash') \
+            .not_.is_('phash', 'null')
+        if after_id:
+            query = query.gt('id', after_id)
+        result = query.order('id').limit(page_size).execute()
+        return result.data or []
+    
+    def get_photos_without_phash(self, after_id: Optional[str] = None, page_size: int = 500):
+        """取得尚未計算感知雜湊的照片（以 id 做 keyset 分頁）"""
+        query = self.client.table('damage_photos') \
+            .select('id, application_id, storage_path, thumbnail_path') \
+            .is_('phash', 'null')
+        if after_id:
+            query = query.gt('id', after_id)
+        result = query.order('id').limit(page_size).execute()
+        return result.data or []
+    
+    def get_photos_by_ids(self, photo_ids: list):
+        """依 ID 批次取得照片記錄"""
+        if not photo_ids:
+            return []
+        result = self.client.table('damage_photos') \
+            .select('*') \
+            .in_('id', list(photo_ids)) \
+            .execute()
+        return result.data or []
+    
+    def create_photo_similarity_flags(self, flags: list):
+        """批次建立相似照片標記（已存在的照片配對略過）"""
+        if not flags:
+            return []
+        result = self.client.table('photo_similarity_flags') \
+            .upsert([serialize_data(f) for f in flags], on_conflict='photo_id,similar_photo_id', ignore_duplicates=True) \
+            .execute()
+        return result.data or []
+    
+    def get_photo_similarity_flags(self, application_id: str):
+        """
+        取得案件的相似照片標記（本案照片與他案相似，或他案照片與本案相似）
+
+        兩個方向各以 .eq() 查詢後合併，不把 application_id 拼入 PostgREST 的 or 篩選字串
+        """
+        flags = {}
+        for column in ('application_id', 'similar_application_id'):
+            result = self.client.table('photo_similarity_flags') \
+                .select('*') \
+                .eq(column, application_id) \
+                .order('distance') \
+                .execute()
+            for flag in result.data or []:
+                flags.setdefault(flag['id'], flag)
+        return sorted(flags.values(), key=lambda flag: flag['distance'])
+    
+    # ==========================================
+    # 照片物件（內容定址）相關操作
+    # ==========================================
+    
+    def get_photo_object(self, sha256: str):
+        """依內容雜湊取得照片物件"""
+        result = self.client.table('photo_objects') \
+            .select('*') \
+            .eq('sha256', sha256) \
+            .execute()
+        return result.data[0] if result.data else None
+    
+    def acquire_photo_object(self, sha256: str, storage_path: str, file_size: int, mime_type: str):
+        """取得照片物件引用（不存在時以 storage_path 建立，存在時引用數 +1），回傳物件記錄"""
+        result = self.client.rpc('acquire_photo_object', {
+            'p_sha256': sha256,
+            'p_storage_path': storage_path,
+            'p_file_size': file_size,
+            'p_mime_type': mime_type
+        }).execute()
+        return result.data[0] if result.data else None
+    
+    def release_photo_object(self, sha256: str):
+        """釋放照片物件引用（引用數 -1），回傳物件記錄"""
+        result = self.client.rpc('release_photo_object', {'p_sha256': sha256}).execute()
+        return result.data[0] if result.data else None
+    
+    def mark_photo_object_stored(self, sha256: str):
+        """標記照片物件已上傳完成"""
+        result = self.client.table('photo_objects') \
+            .update({'status': 'stored'}) \
+            .eq('sha256', sha256) \
+            .execute()
+        return result.data[0] if result.data else None
+    
+    def collect_orphaned_photo_objects(self, grace_seconds: int, limit: int = 500):
+        """刪除引用歸零超過保留時間的照片物件記錄，回傳被刪除的物件"""
+        result = self.client.rpc('collect_orphaned_photo_objects', {
+            'p_grace_seconds': grace_seconds,
+            'p_limit': limit
+        }).execute()
+        return result.data or []
+    
     # ==========================================
     # 審核記錄相關操作
     # ==========================================
@@ -286,6 +663,23 @@ class DatabaseService:
         result = self.client.table('digital_certificates').insert(serialized_data).execute()
         return result.data[0] if result.data else None
     
+    def create_certificates(self, certificates: list):
+        """批次建立數位憑證（單次寫入）"""
+        if not certificates:
+            return []
+        result = self.client.table('digital_certificates').insert([serialize_data(c) for c in certificates]).execute()
+        return result.data or []
+    
+    def get_certificates_by_applications(self, application_ids: list):
+        """批次取得申請案件的憑證"""
+        if not application_ids:
+            return []
+        result = self.client.table('digital_certificates') \
+            .select('*') \
+            .in_('application_id', list(application_ids)) \
+            .execute()
+        return result.data or []
+    
     def get_certificate_by_no(self, certificate_no: str):
         """根據憑證編號取得憑證"""
         result = self.client.table('digital_certificates') \
@@ -375,6 +769,17 @@ class DatabaseService:
         result = self.client.table('application_documents').insert(serialized_data).execute()
         return result.data[0] if result.data else None
     
+    def create_documents(self, documents: list):
+        """批次建立證明文件記錄（單次寫入）"""
+        from datetime import datetime
+        
+        if not documents:
+            return []
+        uploaded_at = datetime.now().isoformat()
+        rows = [serialize_data({'uploaded_at': uploaded_at, **document}) for document in documents]
+        result = self.client.table('application_documents').insert(rows).execute()
+        return result.data or []
+    
     def get_document_by_id(self, document_id: str):
         """根據 ID 取得證明文件"""
         result = self.client.table('application_documents') \
@@ -396,6 +801,40 @@ class DatabaseService:
         result = query.execute()
         return result.data if result.data else []
     
+    def get_documents_by_applications(self, application_ids: list, page_size: int = 1000):
+        """
+        批次取得多個申請案件的證明文件（分頁讀取，避免單次查詢上限截斷結果）
+
+        Args:
+            application_ids: 申請案件 ID
+            page_size: 每次查詢筆數
+        """
+        if not application_ids:
+            return []
+        rows = []
+        offset = 0
+        while True:
+            result = self.client.table('application_documents') \
+                .select('*') \
+                .in_('application_id', list(application_ids)) \
+                .order('uploaded_at', desc=False) \
+                .order('id') \
+                .range(offset, offset + page_size - 1) \
+                .execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
+    
+    def update_document(self, document_id: str, update_data: dict):
+        """更新證明文件記錄"""
+        result = self.client.table('application_documents') \
+            .update(serialize_data(update_data)) \
+            .eq('id', document_id) \
+            .execute()
+        return result.data[0] if result.data else None
+    
     def delete_document(self, document_id: str):
         """刪除證明文件記錄"""
         result = self.client.table('application_documents') \
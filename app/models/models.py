@@ -215,6 +215,14 @@ class CertificateVerifyRequest(BaseModel):
     qr_code_data: Optional[str] = None
 
 
+class CertificateBatchCreate(BaseModel):
+    """批次建立憑證請求"""
+    application_ids: List[str] = Field(..., min_length=1, max_length=500, description="已核准的申請案件 ID")
+    issued_by: str = Field(..., description="核發人 ID")
+    expires_days: int = Field(365, ge=1, description="憑證有效天數")
+    image_format: Optional[str] = Field(None, pattern="^(png|svg)$", description="QR Code 格式，預設依系統設定")
+
+
 class CertificateDisburseRequest(BaseModel):
     """憑證發放補助請求"""
     certificate_id: str
@@ -273,6 +281,38 @@ class FileUploadResponse(BaseModel):
     uploaded_at: datetime
 
 
+class DirectUploadFile(BaseModel):
+    """直接上傳的檔案宣告"""
+    file_name: str
+    size: int = Field(..., gt=0, description="檔案大小（位元組）")
+    mime_type: str = Field(..., description="MIME 類型，例如 image/jpeg")
+    sha256: str = Field(..., description="檔案內容的 SHA-256（十六進位）")
+    description: Optional[str] = None
+
+
+class PhotoUploadIntentRequest(BaseModel):
+    """照片直接上傳意圖請求"""
+    application_id: str
+    photo_type: str = Field(..., description="照片類型: before_damage, after_damage, site_inspection")
+    uploaded_by: Optional[str] = None
+    files: List[DirectUploadFile] = Field(..., min_length=1)
+
+
+class PhotoUploadCommitRequest(BaseModel):
+    """照片直接上傳確認請求"""
+    intent_token: str
+
+
+class ResumableUploadCreateRequest(BaseModel):
+    """建立可續傳照片上傳工作請求"""
+    application_id: str
+    photo_type: str = Field(..., description="照片類型: before_damage, after_damage, site_inspection")
+    file_name: str
+    size: int = Field(..., gt=0, description="檔案總大小（位元組）")
+    description: Optional[str] = None
+    uploaded_by: Optional[str] = None
+
+
 # ==========================================
 # 通知相關模型
 # ==========================================
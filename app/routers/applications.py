@@ -3,8 +3,10 @@
 颱風水災受災戶申請管理
 """
 from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
 from datetime import datetime
+from urllib.parse import quote
 from app.models.models import (
     ApplicationCreate, 
     ApplicationResponse, 
@@ -13,6 +15,9 @@ from app.models.models import (
     APIResponse
 )
 from app.models.database import db_service
+from app.services.auth import check_application_access
+from app.services.evidence_archive import EvidenceArchive, application_entries
+from app.services.photo_derivatives import get_photo_derivative_service
 
 router = APIRouter(prefix="/applications", tags=["申請案件（颱風水災）"])
 
@@ -88,6 +93,23 @@ async def create_application(application: ApplicationCreate):
         
         # 建立申請案件
         application_data = application.model_dump()
+
+        # 依災損地點、聯絡地址自動指派所屬區域
+        try:
+            from app.services.district_matcher import get_district_assignment_service
+            assignment = await get_district_assignment_service().assign(
+                application.damage_location, application.address
+            )
+            if assignment["district_id"]:
+                application_data["district_id"] = assignment["district_id"]
+            geocode = assignment["geocode"]
+            if geocode and geocode.get("success"):
+                application_data["latitude"] = geocode["latitude"]
+                application_data["longitude"] = geocode["longitude"]
+                application_data["formatted_address"] = geocode["formatted_address"]
+        except Exception as e:
+            print(f"自動指派區域失敗: {e}")
+
         result = db_service.create_application(application_data)
         
         if not result:
@@ -126,8 +148,11 @@ async def get_application(application_id: str):
         
         # 取得相關資料
         photos = db_service.get_photos_by_application(application_id)
+        await get_photo_derivative_service().attach_urls(photos, expires_in=3600)
         review_records = db_service.get_review_records_by_application(application_id)
         subsidy_items = db_service.get_subsidy_items_by_application(application_id)
+        # 與其他案件相似的照片（可能重複使用的災損照片）
+        photo_similarity_flags = db_service.get_photo_similarity_flags(application_id)
         
         # 嘗試取得憑證（可能不存在）
         try:
@@ -138,6 +163,7 @@ async def get_application(application_id: str):
         detail = {
             "application": application,
             "photos": photos,
+            "photo_similarity_flags": photo_similarity_flags,
             "review_records": review_records,
             "subsidy_items": subsidy_items,
             "certificate": certificate
@@ -157,6 +183,30 @@ async def get_application(application_id: str):
             detail=f"發生錯誤: {str(e)}"
         )
 
+@router.get("/{application_id}/evidence.zip")
+async def download_application_evidence(
+    application_id: str,
+    application: Dict = Depends(check_application_access)
+):
+    """
+    下載案件所有災損照片與證明文件（ZIP）
+
+    - 管理員可下載所有案件，里長只能下載自己轄區的案件，災民只能下載自己的案件
+    - 邊從 Storage 讀取邊寫出 ZIP，不需等待全部檔案；讀取失敗的檔案記錄在 manifest.csv
+    """
+    entries = application_entries(
+        application,
+        db_service.get_photos_by_application(application_id),
+        db_service.get_documents_by_application(application_id)
+    )
+    filename = quote(f"{application.get('case_no') or application_id}_evidence.zip")
+    return StreamingResponse(
+        EvidenceArchive(entries).stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
+
+
 @router.get("/case-no/{case_no}", response_model=APIResponse)
 async def get_application_by_case_no(case_no: str):
     """
@@ -241,10 +291,10 @@ async def get_applications_by_district(
     """
     根據區域 ID 取得申請案件列表（里長專用）
     
-    **暫時方案**: 由於災民提交申請時未設定 district_id，
-    目前返回所有案件。未來會根據地址自動匹配區域。
+    災民提交申請時會依地址自動指派 district_id，
+    既有案件可用 `python command.py backfill-districts` 補齊。
     
-    - **district_id**: 區域 ID（暫時未使用）
+    - **district_id**: 區域 ID
     - **status**: 可選的狀態篩選 (pending, under_review, approved, rejected)
     - **limit**: 回傳數量限制，預設 100
     """
@@ -256,10 +306,9 @@ async def get_applications_by_district(
         except:
             pass
         
-        # 暫時方案：查詢所有案件（不限區域）
-        # TODO: 未來根據 address 或 damage_location 自動匹配區域
         query = db_service.client.table("applications")\
             .select("*")\
+            .eq("district_id", district_id)\
             .order("created_at", desc=True)\
             .limit(limit)
         
@@ -276,8 +325,7 @@ async def get_applications_by_district(
             data={
                 "applications": applications,
                 "total": len(applications),
-                "district": district,
-                "note": "⚠️ 暫時顯示所有案件，未來會根據區域篩選"
+                "district": district
             }
         )
     
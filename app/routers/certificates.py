@@ -4,6 +4,7 @@
 """
 from fastapi import APIRouter, HTTPException, status
 from app.models.models import (
+    CertificateBatchCreate,
     CertificateCreate, 
     CertificateResponse, 
     CertificateVerifyRequest,
@@ -12,8 +13,11 @@ from app.models.models import (
 )
 from app.models.database import db_service
 from app.services.storage import storage_service
+from app.services.cpu_executor import CPUExecutorBusy, CPUJobTimeout
 from app.services.gov_wallet import get_gov_wallet_service
+from app.services.qr_codes import get_qr_code_service
 from datetime import datetime, timedelta
+import asyncio
 import json
 
 router = APIRouter(prefix="/certificates", tags=["數位憑證（政府沙盒整合）"])
@@ -81,7 +85,7 @@ async def create_certificate(
                 # 如果政府 API 有提供 QR Code，使用它；否則自己生成
                 if gov_credential.get('qrCode'):
                     qr_data_str = json.dumps(gov_credential, ensure_ascii=False)
-                    qr_result = storage_service.generate_qr_code(cert_no, gov_credential)
+                    qr_result = await get_qr_code_service().issue_certificate_code(cert_no, gov_credential)
                 else:
                     # 政府 API 沒有提供 QR Code，自己生成
                     qr_data = {
@@ -97,7 +101,7 @@ async def create_certificate(
                         "expires_at": (datetime.now() + timedelta(days=expires_days)).isoformat(),
                         "gov_api": True
                     }
-                    qr_result = storage_service.generate_qr_code(cert_no, qr_data)
+                    qr_result = await get_qr_code_service().issue_certificate_code(cert_no, qr_data)
                 
             except Exception as e:
                 print(f"政府 API 發行憑證失敗，使用本地方式: {e}")
@@ -105,19 +109,8 @@ async def create_certificate(
         
         if not use_gov_api or not gov_credential:
             # 使用本地方式生成 QR Code
-            qr_data = {
-                "certificate_no": cert_no,
-                "application_id": application_id,
-                "case_no": application['case_no'],
-                "applicant_name": application['applicant_name'],
-                "id_number": application['id_number'],
-                "approved_amount": float(application['approved_amount']),
-                "disaster_type": application.get('disaster_type'),
-                "issued_at": datetime.now().isoformat(),
-                "expires_at": (datetime.now() + timedelta(days=expires_days)).isoformat(),
-                "gov_api": False
-            }
-            qr_result = storage_service.generate_qr_code(cert_no, qr_data)
+            qr_data = _local_qr_data(cert_no, application, expires_days)
+            qr_result = await get_qr_code_service().issue_certificate_code(cert_no, qr_data)
         
         # 建立憑證記錄
         certificate_data = {
@@ -149,7 +142,107 @@ async def create_certificate(
             data=result
         )
     
-    except HTTPException:
+    except (HTTPException, CPUExecutorBusy, CPUJobTimeout):
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
+def _local_qr_data(cert_no: str, application: dict, expires_days: int) -> dict:
+    """本地方式核發的憑證 QR Code 內容"""
+    return {
+        "certificate_no": cert_no,
+        "application_id": application['id'],
+        "case_no": application['case_no'],
+        "applicant_name": application['applicant_name'],
+        "id_number": application['id_number'],
+        "approved_amount": float(application['approved_amount']),
+        "disaster_type": application.get('disaster_type'),
+        "issued_at": datetime.now().isoformat(),
+        "expires_at": (datetime.now() + timedelta(days=expires_days)).isoformat(),
+        "gov_api": False
+    }
+
+@router.post("/batch", response_model=APIResponse, status_code=status.HTTP_201_CREATED)
+async def create_certificates_batch(request: CertificateBatchCreate):
+    """
+    為多個已核准的申請案件批次建立數位憑證（本地模式）
+    
+    QR Code 在背景子程序中並行產生、並行上傳，最後以單次寫入建立憑證記錄；
+    不存在、未核准或已有憑證的案件會略過並在結果中說明
+    """
+    try:
+        application_ids = list(dict.fromkeys(request.application_ids))
+        applications = {
+            app['id']: app
+            for app in await asyncio.to_thread(db_service.get_applications_by_ids, application_ids)
+        }
+        issued = {
+            cert['application_id']
+            for cert in await asyncio.to_thread(db_service.get_certificates_by_applications, application_ids)
+        }
+        
+        errors = {}
+        pending = []
+        for application_id in application_ids:
+            application = applications.get(application_id)
+            if not application:
+                errors[application_id] = "申請案件不存在"
+            elif application['status'] != 'approved':
+                errors[application_id] = "只有已核准的案件才能建立憑證"
+            elif application_id in issued:
+                errors[application_id] = "此案件已有憑證"
+            else:
+                cert_no = f"CERT-{datetime.now().strftime('%Y%m%d%H%M%S')}-{application_id[:8]}"
+                pending.append((cert_no, application))
+        
+        outcomes = await get_qr_code_service().issue_certificate_codes(
+            [(cert_no, _local_qr_data(cert_no, application, request.expires_days)) for cert_no, application in pending],
+            request.image_format
+        )
+        
+        rows = []
+        expires_at = (datetime.now() + timedelta(days=request.expires_days)).isoformat()
+        qr_urls = {}
+        for (cert_no, application), (qr_result, error) in zip(pending, outcomes):
+            if error is not None:
+                errors[application['id']] = f"產生 QR Code 失敗: {error}"
+                continue
+            qr_urls[cert_no] = qr_result['public_url']
+            rows.append({
+                "application_id": application['id'],
+                "certificate_no": cert_no,
+                "qr_code_data": qr_result['qr_data'],
+                "qr_code_image_path": qr_result['storage_path'],
+                "issued_amount": application['approved_amount'],
+                "issued_by": request.issued_by,
+                "expires_at": expires_at
+            })
+        
+        created = await asyncio.to_thread(db_service.create_certificates, rows)
+        for certificate in created:
+            certificate['qr_code_url'] = qr_urls.get(certificate['certificate_no'])
+        
+        by_application = {certificate['application_id']: certificate for certificate in created}
+        results = [
+            {
+                "application_id": application_id,
+                "success": application_id in by_application,
+                "certificate_no": by_application[application_id]['certificate_no'] if application_id in by_application else None,
+                "error": errors.get(application_id)
+            }
+            for application_id in application_ids
+        ]
+        
+        return APIResponse(
+            success=bool(created),
+            message=f"成功建立 {len(created)} 張憑證，{len(application_ids) - len(created)} 件未建立",
+            data={"created": created, "results": results}
+        )
+    
+    except (HTTPException, CPUExecutorBusy, CPUJobTimeout):
         raise
     except Exception as e:
         raise HTTPException(
@@ -192,11 +192,12 @@ async def review_and_issue_credential(request: ReviewApplicationRequest):
         if not request.approved:
             print(f"\n❌ 步驟 2: 駁回申請...")
             try:
-                db_service.client.table("applications").update({
-                    "status": "rejected",
-                    "review_notes": request.review_notes,
-                    "reviewed_at": datetime.now(timezone.utc).isoformat()
-                }).eq("id", request.application_id).execute()
+                db_service.update_application_status(
+                    request.application_id,
+                    "rejected",
+                    review_notes=request.review_notes,
+                    reviewed_at=datetime.now(timezone.utc).isoformat()
+                )
                 
                 print(f"✅ 申請已駁回")
                 return {
@@ -277,15 +278,16 @@ async def review_and_issue_credential(request: ReviewApplicationRequest):
         
         # 5. 更新資料庫
         try:
-            db_service.client.table("applications").update({
-                "status": "approved",
-                "review_notes": request.review_notes,
-                "approved_amount": request.approved_amount,
-                "reviewed_at": datetime.now(timezone.utc).isoformat(),
-                "gov_qr_code_data": issue_result.get("qr_code_data"),
-                "gov_transaction_id": issue_result.get("transaction_id"),
-                "gov_deep_link": issue_result.get("deep_link")
-            }).eq("id", request.application_id).execute()
+            db_service.update_application_status(
+                request.application_id,
+                "approved",
+                review_notes=request.review_notes,
+                approved_amount=request.approved_amount,
+                reviewed_at=datetime.now(timezone.utc).isoformat(),
+                gov_qr_code_data=issue_result.get("qr_code_data"),
+                gov_transaction_id=issue_result.get("transaction_id"),
+                gov_deep_link=issue_result.get("deep_link")
+            )
         except Exception as db_error:
             print(f"❌ 更新資料庫失敗: {db_error}")
             raise HTTPException(
@@ -552,11 +554,12 @@ async def verify_vp(request: VerifyVPRequest):
                         print(f"⚠️  姓名不符: 憑證={name}, 申請={application.get('applicant_name')}")
                     
                     # 更新申請案件狀態為「已發放」
-                    db_service.client.table("applications").update({
-                        "status": "disbursed",
-                        "disbursed_at": datetime.now(timezone.utc).isoformat(),
-                        "vp_transaction_id": request.transaction_id
-                    }).eq("id", application_id).execute()
+                    db_service.update_application_status(
+                        application_id,
+                        "disbursed",
+                        disbursed_at=datetime.now(timezone.utc).isoformat(),
+                        vp_transaction_id=request.transaction_id
+                    )
                     
                     print(f"✅ 補助已發放: {case_no} ({name})")
                     
@@ -3,11 +3,15 @@
 處理區域（里/鄰）管理功能
 """
 from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
+from urllib.parse import quote
 
 from app.services.auth import get_current_user, require_admin
 from app.models.database import db_service
+from app.services.district_matcher import get_district_assignment_service
+from app.services.evidence_archive import EvidenceArchive, district_entries
 
 router = APIRouter(prefix="/api/v1/districts", tags=["區域管理"])
 
@@ -150,6 +154,7 @@ async def create_district(
                 detail="區域建立失敗"
             )
         
+        get_district_assignment_service().invalidate()
         return result.data[0]
     
     except HTTPException:
@@ -196,6 +201,7 @@ async def update_district(
             update_data
         ).eq('id', district_id).execute()
         
+        get_district_assignment_service().invalidate()
         return result.data[0] if result.data else {}
     
     except HTTPException:
@@ -228,6 +234,7 @@ async def delete_district(
                 detail="區域不存在"
             )
         
+        get_district_assignment_service().invalidate()
         return {
             "message": "區域已停用",
             "district_id": district_id
@@ -288,6 +295,45 @@ async def get_district_applications(
         )
 
 
+@router.get("/{district_id}/evidence.zip", summary="下載區域所有案件的證據")
+async def download_district_evidence(
+    district_id: str,
+    current_user: Dict = Depends(get_current_user)
+):
+    """
+    將區域內所有案件的災損照片與證明文件打包成 ZIP（每個案件一個資料夾）
+    
+    - 管理員可下載所有區域
+    - 里長只能下載自己轄區
+    - 逐頁查詢案件並邊讀取邊寫出，區域再大也不會佔用大量記憶體
+    """
+    if current_user['role'] == 'reviewer':
+        if current_user.get('district_id') != district_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="您沒有權限下載此區域的案件"
+            )
+    elif current_user['role'] == 'applicant':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="災民無法下載區域案件"
+        )
+    
+    district = db_service.get_district_by_id(district_id)
+    if not district:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="區域不存在"
+        )
+    
+    filename = quote(f"{district.get('district_code') or district_id}_evidence.zip")
+    return StreamingResponse(
+        EvidenceArchive(district_entries(district_id)).stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
+
+
 @router.get("/{district_id}/stats", response_model=Dict, summary="取得區域統計")
 async def get_district_stats(
     district_id: str,
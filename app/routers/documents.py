@@ -2,20 +2,24 @@
 文件上傳相關 API 路由
 災民補助申請文件管理（如戶籍謄本、財產證明、收入證明等）
 """
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import StreamingResponse, Response
+from fastapi import APIRouter, HTTPException, Request, status, UploadFile, File, Form
 from typing import List, Optional
 from app.models.models import APIResponse
 from app.models.database import db_service
-from app.services.storage import storage_service
+from app.services.cpu_executor import CPUExecutorBusy, CPUJobTimeout
+from app.services.document_previews import PREVIEW_VERSION, get_document_preview_service, needs_conversion
+from app.services.downloads import content_etag, stream_storage_object
+from app.services.storage import DOCUMENT_SIGNED_URL_EXPIRES_IN, storage_service
+from app.services.signed_urls import get_signed_url_service
+from app.services.uploads import UploadError, receive_upload, upload_batch
+from app.settings import get_settings
 import mimetypes
-import io
-import tempfile
-import os
 from urllib.parse import quote
 
 router = APIRouter(prefix="/documents", tags=["文件管理（證明文件）"])
 
+settings = get_settings()
+
 # 允許的文件類型
 ALLOWED_MIME_TYPES = {
     'application/pdf': '.pdf',
@@ -68,23 +72,19 @@ async def upload_document(
                 detail=f"不支援的檔案類型。允許的類型: PDF, JPG, PNG, DOC, DOCX, XLS, XLSX"
             )
         
-        # 讀取檔案內容
-        file_content = await file.read()
-        
-        # 檢查檔案大小 (20MB)
-        max_size = 20 * 1024 * 1024  # 20MB
-        if len(file_content) > max_size:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"檔案大小不能超過 20MB（當前: {len(file_content) / 1024 / 1024:.2f}MB）"
-            )
+        # 以區塊讀取並檢查檔案大小，同時以檔案內容確認格式
+        try:
+            upload = await receive_upload(file, ALLOWED_MIME_TYPES, settings.MAX_DOCUMENT_UPLOAD_SIZE)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
         # 上傳到 Storage
         storage_result = storage_service.upload_document(
             application_id=application_id,
-            file=file_content,
-            filename=file.filename,
-            document_type=document_type
+            file=upload.payload(),
+            filename=upload.filename,
+            document_type=document_type,
+            content_type=upload.mime_type
         )
         
         # 建立資料庫記錄
@@ -92,9 +92,10 @@ async def upload_document(
             "application_id": application_id,
             "document_type": document_type,
             "storage_path": storage_result['storage_path'],
-            "file_name": file.filename,
-            "file_size": len(file_content),
-            "mime_type": file.content_type,
+            "file_name": upload.filename,
+            "file_size": upload.size,
+            "mime_type": upload.mime_type,
+            "content_sha256": upload.sha256,
             "description": description,
             "uploaded_by": uploaded_by
         }
@@ -110,6 +111,9 @@ async def upload_document(
         # 加入簽名 URL（有效期 7 天）
         result['signed_url'] = storage_result['signed_url']
         
+        # DOCX 在背景預先轉換預覽
+        get_document_preview_service().schedule([result])
+        
         return APIResponse(
             success=True,
             message="文件上傳成功",
@@ -146,50 +150,37 @@ async def upload_multiple_documents(
                 detail="申請案件不存在"
             )
         
-        uploaded_documents = []
-        errors = []
-        
-        for file in files:
-            try:
-                # 檢查檔案類型
-                if file.content_type not in ALLOWED_MIME_TYPES:
-                    errors.append(f"{file.filename}: 不支援的檔案類型")
-                    continue
-                
-                # 讀取檔案
-                file_content = await file.read()
-                
-                # 檢查檔案大小
-                if len(file_content) > 20 * 1024 * 1024:
-                    errors.append(f"{file.filename}: 檔案過大")
-                    continue
-                
-                # 上傳到 Storage
-                storage_result = storage_service.upload_document(
-                    application_id=application_id,
-                    file=file_content,
-                    filename=file.filename,
-                    document_type=document_type
-                )
-                
-                # 建立資料庫記錄
-                document_data = {
-                    "application_id": application_id,
-                    "document_type": document_type,
-                    "storage_path": storage_result['storage_path'],
-                    "file_name": file.filename,
-                    "file_size": len(file_content),
-                    "mime_type": file.content_type,
-                    "uploaded_by": uploaded_by
-                }
-                
-                result = db_service.create_document(document_data)
-                if result:
-                    result['signed_url'] = storage_result['signed_url']
-                    uploaded_documents.append(result)
-                
-            except Exception as e:
-                errors.append(f"{file.filename}: {str(e)}")
+        # 並行上傳到 Storage（以檔案內容判斷格式），完成後一次寫入所有文件記錄並批次產生簽名 URL
+        batch = await upload_batch(
+            files,
+            ALLOWED_MIME_TYPES,
+            settings.MAX_DOCUMENT_UPLOAD_SIZE,
+            store=lambda upload: storage_service.upload_document(
+                application_id=application_id,
+                file=upload.payload(),
+                filename=upload.filename,
+                document_type=document_type,
+                content_type=upload.mime_type,
+                sign=False
+            ),
+            build_row=lambda upload, stored: {
+                "application_id": application_id,
+                "document_type": document_type,
+                "storage_path": stored['storage_path'],
+                "file_name": upload.filename,
+                "file_size": upload.size,
+                "mime_type": upload.mime_type,
+                "content_sha256": upload.sha256,
+                "uploaded_by": uploaded_by
+            },
+            insert_rows=db_service.create_documents,
+            bucket=storage_service.documents_bucket,
+            signed_url_expires_in=DOCUMENT_SIGNED_URL_EXPIRES_IN,
+            concurrency=settings.UPLOAD_CONCURRENCY
+        )
+        uploaded_documents = batch["uploaded"]
+        errors = batch["errors"]
+        get_document_preview_service().schedule(uploaded_documents)
         
         return APIResponse(
             success=True,
@@ -197,6 +188,7 @@ async def upload_multiple_documents(
             data={
                 "uploaded": uploaded_documents,
                 "errors": errors,
+                "results": batch["results"],
                 "total": len(files),
                 "success_count": len(uploaded_documents),
                 "error_count": len(errors)
@@ -229,13 +221,15 @@ async def get_documents_by_application(
             document_type=document_type
         )
         
-        # 為每個文件生成簽名 URL（有效期 24 小時）
+        # 一次產生所有文件的簽名 URL（有效期 24 小時，快取到到期前不久）
+        urls = get_signed_url_service().sign_many(
+            storage_service.documents_bucket,
+            [doc['storage_path'] for doc in documents if doc.get('storage_path')],
+            expires_in=86400  # 24 hours
+        )
         for doc in documents:
             if doc.get('storage_path'):
-                doc['signed_url'] = storage_service.get_document_url(
-                    storage_path=doc['storage_path'],
-                    expires_in=86400  # 24 hours
-                )
+                doc['signed_url'] = urls.get(doc['storage_path'])
         
         return APIResponse(
             success=True,
@@ -287,12 +281,13 @@ async def get_document(document_id: str):
 
 
 @router.get("/{document_id}/preview")
-async def preview_document(document_id: str):
+async def preview_document(document_id: str, request: Request):
     """
     預覽文件
     
-    - 對於 DOCX 文件，會自動轉換為 PDF 進行預覽
-    - 對於 PDF 和圖片文件，直接返回原檔案
+    - 對於 DOCX 文件，回傳轉換後的 PDF（轉換一次後快取在 Storage，之後直接串流）
+    - 對於 PDF 和圖片文件，直接串流原檔案
+    - 支援 Range（206）與 ETag / Last-Modified 條件式請求（304）
     """
     try:
         # 取得文件資訊
@@ -304,96 +299,58 @@ async def preview_document(document_id: str):
                 detail="文件不存在"
             )
         
-        # 從 Storage 取得文件內容
-        file_content = storage_service.download_document(document['storage_path'])
-        
-        if not file_content:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="文件內容不存在"
-            )
-        
-        mime_type = document.get('mime_type', 'application/octet-stream')
+        bucket = storage_service.documents_bucket
         file_name = document['file_name']
         
-        # 如果是 DOCX 文件，轉換為 PDF
-        if mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-            try:
-                # 嘗試使用 python-docx 和 reportlab 轉換
-                from docx import Document
-                from reportlab.lib.pagesizes import letter, A4
-                from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                from reportlab.lib.units import inch
-                from reportlab.pdfbase import pdfmetrics
-                from reportlab.pdfbase.ttfonts import TTFont
-                
-                # 建立臨時檔案來處理 DOCX
-                with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp_docx:
-                    tmp_docx.write(file_content)
-                    tmp_docx_path = tmp_docx.name
-                
-                # 讀取 DOCX
-                doc = Document(tmp_docx_path)
-                
-                # 建立 PDF 輸出緩衝
-                pdf_buffer = io.BytesIO()
-                pdf_doc = SimpleDocTemplate(pdf_buffer, pagesize=A4)
-                
-                # 準備內容
-                story = []
-                styles = getSampleStyleSheet()
-                
-                # 添加文檔內容
-                for para in doc.paragraphs:
-                    if para.text.strip():
-                        story.append(Paragraph(para.text, styles['Normal']))
-                        story.append(Spacer(1, 0.2*inch))
-                
-                # 生成 PDF
-                pdf_doc.build(story)
-                pdf_content = pdf_buffer.getvalue()
-                
-                # 清理臨時檔案
-                os.unlink(tmp_docx_path)
-                
-                # 返回轉換後的 PDF
-                return Response(
-                    content=pdf_content,
+        # 如果是 DOCX 文件，串流轉換後的 PDF
+        if needs_conversion(document):
+            previews = get_document_preview_service()
+            pdf_name = quote(file_name.rsplit('.', 1)[0] + '.pdf')
+            
+            def stream_preview(path):
+                return stream_storage_object(
+                    request, bucket, path,
                     media_type='application/pdf',
-                    headers={
-                        'Content-Disposition': f'inline; filename="{file_name.replace(".docx", ".pdf")}"',
-                        'Content-Length': str(len(pdf_content))
-                    }
+                    content_disposition=f"inline; filename*=UTF-8''{pdf_name}",
+                    etag=content_etag(document.get('content_sha256'), f"preview-v{PREVIEW_VERSION}"),
+                    last_modified=document.get('uploaded_at')
                 )
             
+            cached_path = previews.cached_path(document)
+            if cached_path:
+                try:
+                    return await stream_preview(cached_path)
+                except FileNotFoundError:
+                    pass
+            
+            # 尚未轉換（或背景轉換尚未完成）：在 process pool 轉換並寫入快取
+            try:
+                path = await previews.ensure_preview(document)
+            except FileNotFoundError:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="文件內容不存在"
+                )
             except ImportError:
                 # 如果沒有安裝轉換庫，返回提示訊息
                 raise HTTPException(
                     status_code=status.HTTP_501_NOT_IMPLEMENTED,
                     detail="DOCX 轉 PDF 功能需要安裝 python-docx 和 reportlab 套件。請直接下載檔案查看。"
                 )
+            except (CPUExecutorBusy, CPUJobTimeout):
+                raise
             except Exception as e:
-                # 轉換失敗，返回原檔案
                 print(f"DOCX 轉 PDF 失敗: {str(e)}")
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"文件轉換失敗，請直接下載檔案: {str(e)}"
                 )
+            return await stream_preview(path)
         
-        # 其他文件類型直接返回
-        # 使用 RFC 2231 編碼來處理中文文件名
-        encoded_filename = quote(file_name)
-        return Response(
-            content=file_content,
-            media_type=mime_type,
-            headers={
-                'Content-Disposition': f"inline; filename*=UTF-8''{encoded_filename}",
-                'Content-Length': str(len(file_content))
-            }
-        )
+        # 其他文件類型直接串流
+        return await _stream_document(request, document, disposition="inline")
     
-    except HTTPException:
+    except (HTTPException, CPUExecutorBusy, CPUJobTimeout):
         raise
     except Exception as e:
         raise HTTPException(
@@ -403,11 +360,11 @@ async def preview_document(document_id: str):
 
 
 @router.get("/{document_id}/download")
-async def download_document(document_id: str):
+async def download_document(document_id: str, request: Request):
     """
     下載文件
     
-    返回文件的二進制內容，可以直接下載
+    以固定大小區塊串流文件內容，支援 Range 續傳與 ETag / Last-Modified 條件式請求
     """
     try:
         # 取得文件資訊
@@ -419,27 +376,7 @@ async def download_document(document_id: str):
                 detail="文件不存在"
             )
         
-        # 從 Storage 取得文件內容
-        file_content = storage_service.download_document(document['storage_path'])
-        
-        if not file_content:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="文件內容不存在"
-            )
-        
-        # 使用 RFC 2231 編碼來處理中文文件名
-        encoded_filename = quote(document["file_name"])
-        
-        # 返回串流回應
-        return StreamingResponse(
-            iter([file_content]),
-            media_type=document.get('mime_type', 'application/octet-stream'),
-            headers={
-                'Content-Disposition': f"attachment; filename*=UTF-8''{encoded_filename}",
-                'Content-Length': str(len(file_content))
-            }
-        )
+        return await _stream_document(request, document, disposition="attachment")
     
     except HTTPException:
         raise
@@ -450,6 +387,27 @@ async def download_document(document_id: str):
         )
 
 
+async def _stream_document(request: Request, document: dict, disposition: str):
+    """串流文件原檔（檔案不存在時回傳 404）"""
+    # 使用 RFC 2231 編碼來處理中文文件名
+    encoded_filename = quote(document["file_name"])
+    try:
+        return await stream_storage_object(
+            request,
+            storage_service.documents_bucket,
+            document['storage_path'],
+            media_type=document.get('mime_type') or 'application/octet-stream',
+            content_disposition=f"{disposition}; filename*=UTF-8''{encoded_filename}",
+            etag=content_etag(document.get('content_sha256')),
+            last_modified=document.get('uploaded_at')
+        )
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文件內容不存在"
+        )
+
+
 @router.delete("/{document_id}", response_model=APIResponse)
 async def delete_document(document_id: str):
     """
@@ -467,8 +425,9 @@ async def delete_document(document_id: str):
                 detail="文件不存在"
             )
         
-        # 刪除 Storage 中的檔案
+        # 刪除 Storage 中的檔案（含轉換的預覽 PDF）
         storage_service.delete_document(document['storage_path'])
+        get_document_preview_service().discard(document)
         
         # 刪除資料庫記錄
         db_service.delete_document(document_id)
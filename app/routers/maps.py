@@ -2,11 +2,15 @@
 Google Maps API 路由
 提供地址驗證、地理編碼等 API 端點
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Union
+from datetime import date, timedelta
+import asyncio
 import logging
 
+from app.services.auth import get_current_user, require_reviewer
 from app.services.google_maps import get_google_maps_service
 
 logger = logging.getLogger(__name__)
@@ -37,6 +41,14 @@ class DistanceRequest(BaseModel):
     mode: Optional[str] = "driving"  # driving, walking, bicycling, transit
 
 
+class DistanceMatrixRequest(BaseModel):
+    """距離矩陣請求（地點可為地址、[lat, lng] 或 {"lat", "lng"}）"""
+    origins: List[Union[str, List[float], Dict[str, float]]]
+    destinations: List[Union[str, List[float], Dict[str, float]]]
+    mode: Optional[str] = "driving"
+    language: Optional[str] = "zh-TW"
+
+
 class NearbyPlacesRequest(BaseModel):
     """附近地點搜尋請求"""
     latitude: float
@@ -44,6 +56,7 @@ class NearbyPlacesRequest(BaseModel):
     place_type: Optional[str] = "convenience_store"
     radius: Optional[int] = 1000
     language: Optional[str] = "zh-TW"
+    limit: Optional[int] = 20
 
 
 class RouteRequest(BaseModel):
@@ -67,6 +80,24 @@ class ApplicationLocationsRequest(BaseModel):
     application_ids: List[str]  # 案件 ID 列表
 
 
+class InspectorInput(BaseModel):
+    """勘查人員設定"""
+    reviewer_id: str
+    capacity: Optional[int] = None  # 最多可分配案件數
+    start_latitude: Optional[float] = None  # 出發點
+    start_longitude: Optional[float] = None
+
+
+class InspectionScheduleRequest(BaseModel):
+    """多審核員現場勘查排程請求"""
+    inspectors: List[InspectorInput]
+    district_id: Optional[str] = None
+    status: Optional[str] = "site_inspection"
+    application_ids: Optional[List[str]] = None  # 指定案件，未指定則依狀態/區域查詢
+    default_capacity: Optional[int] = None
+    apply: Optional[bool] = False  # 是否寫回 assigned_reviewer_id
+
+
 # ==========================================
 # API 端點
 # ==========================================
@@ -161,11 +192,59 @@ async def validate_address(request: GeocodeRequest):
     try:
         maps_service = get_google_maps_service()
         result = await maps_service.validate_address(request.address)
+
+        # 驗證成功的地址只將路名加入自動完成索引
+        if result.get("valid") and result.get("formatted_address"):
+            from app.services.address_autocomplete import get_address_autocomplete_service
+            get_address_autocomplete_service().add_validated(result["formatted_address"])
+
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/autocomplete")
+async def autocomplete_address(
+    q: str = Query(..., min_length=1, description="使用者目前輸入的地址"),
+    session: Optional[str] = Query(None, description="輸入 session（同一輸入框連續輸入使用同一值）"),
+    limit: int = Query(8, ge=1, le=20, description="最多回傳筆數"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    ⌨️ 地址自動完成（需登入）
+
+    優先由本地前綴索引（區域、路名）回應；本地結果不足且前綴未曾查詢過時，
+    才在防抖後呼叫 Google Places Autocomplete，結果會加入索引供之後的輸入使用。
+    索引不含申請人的門牌地址與座標。
+
+    Example:
+    GET /api/v1/maps/autocomplete?q=台南市中西區民權&session=abc123
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "suggestions": [
+            {"text": "台南市中西區民權路一段", "source": "road", "weight": 1.5, "place_id": null}
+        ],
+        "source": "local",
+        "count": 1
+    }
+    ```
+    """
+    from app.services.address_autocomplete import get_address_autocomplete_service
+
+    try:
+        result = await get_address_autocomplete_service().suggest(q, session=session, limit=limit)
+        return {
+            "success": True,
+            **result,
+            "count": len(result["suggestions"])
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/distance")
 async def calculate_distance(request: DistanceRequest):
     """
@@ -209,6 +288,53 @@ async def calculate_distance(request: DistanceRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/distance-matrix")
+async def calculate_distance_matrix(request: DistanceMatrixRequest):
+    """
+    🧮 批次計算多起點 × 多終點的距離矩陣
+
+    用於審核員到案件、案件到最近服務據點等多對多計算。
+    結果會快取；配額用盡時以直線距離估算（需以座標提供地點）。
+
+    Example:
+    ```json
+    {
+        "origins": [[22.9917, 120.2009]],
+        "destinations": [[22.9851, 120.1930], "台南市政府"],
+        "mode": "driving"
+    }
+    ```
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "origin_addresses": ["..."],
+        "destination_addresses": ["...", "..."],
+        "rows": [
+            {"elements": [
+                {"status": "OK", "distance": {"text": "1.2 公里", "value": 1200}, "duration": {"text": "4 分鐘", "value": 240}, "estimated": false},
+                {"status": "OK", "distance": {...}, "duration": {...}, "estimated": false}
+            ]}
+        ],
+        "cached_count": 0,
+        "estimated_count": 0
+    }
+    ```
+    """
+    try:
+        maps_service = get_google_maps_service()
+        result = await maps_service.distance_matrix(
+            origins=request.origins,
+            destinations=request.destinations,
+            mode=request.mode,
+            language=request.language
+        )
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/nearby-places")
 async def find_nearby_places(request: NearbyPlacesRequest):
     """
@@ -243,6 +369,7 @@ async def find_nearby_places(request: NearbyPlacesRequest):
                 "name": "7-ELEVEN 台南民權門市",
                 "address": "台南市中西區民權路一段...",
                 "location": {"lat": 22.9917, "lng": 120.2009},
+                "distance": 135.2,
                 "rating": 4.2,
                 "is_open": true
             }
@@ -258,7 +385,8 @@ async def find_nearby_places(request: NearbyPlacesRequest):
             longitude=request.longitude,
             place_type=request.place_type,
             radius=request.radius,
-            language=request.language
+            language=request.language,
+            limit=request.limit
         )
         return result
     except Exception as e:
@@ -419,6 +547,79 @@ async def get_optimal_routes(request: MultiDestinationRouteRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/inspection-schedule")
+async def schedule_inspections(request: InspectionScheduleRequest):
+    """
+    👥 多審核員現場勘查排程
+
+    將待勘查案件依地理位置分群分配給多位審核員（遵守容量上限），
+    並為每位審核員規劃訪查順序。`apply` 為 true 時寫回 `assigned_reviewer_id`。
+
+    Example:
+    ```json
+    {
+        "district_id": "uuid-district",
+        "status": "site_inspection",
+        "inspectors": [
+            {"reviewer_id": "uuid-1", "capacity": 30},
+            {"reviewer_id": "uuid-2", "capacity": 30, "start_latitude": 22.99, "start_longitude": 120.20}
+        ],
+        "apply": true
+    }
+    ```
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "assignments": [
+            {
+                "reviewer_id": "uuid-1",
+                "application_ids": ["uuid-a", "uuid-b"],
+                "case_count": 2,
+                "route_distance_m": 1830.5
+            }
+        ],
+        "unassigned": [],
+        "applied": true,
+        "message": "已將 2 件案件分配給 2 位審核員"
+    }
+    ```
+    """
+    try:
+        from app.models.database import db_service
+        from app.services.inspection_scheduler import get_inspection_scheduler
+
+        if not request.inspectors:
+            raise HTTPException(status_code=400, detail="請至少提供一位審核員")
+
+        cases = db_service.get_geocoded_applications(
+            status=request.status,
+            district_id=request.district_id,
+            application_ids=request.application_ids
+        )
+
+        scheduler = get_inspection_scheduler()
+        result = await asyncio.to_thread(
+            scheduler.schedule,
+            cases,
+            [inspector.model_dump() for inspector in request.inspectors],
+            request.default_capacity
+        )
+
+        result["applied"] = False
+        if request.apply and result.get("success"):
+            for assignment in result["assignments"]:
+                db_service.assign_reviewer(assignment["application_ids"], assignment["reviewer_id"])
+            result["applied"] = True
+
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/applications-map-data")
 async def get_applications_map_data(request: ApplicationLocationsRequest):
     """
@@ -503,11 +704,9 @@ async def get_applications_map_data(request: ApplicationLocationsRequest):
                         
                         # 可選：將經緯度存回資料庫（避免重複查詢）
                         try:
-                            db_service.client.table("applications").update({
-                                "latitude": latitude,
-                                "longitude": longitude,
-                                "formatted_address": formatted_address
-                            }).eq("id", app_id).execute()
+                            db_service.update_application_location(
+                                app_id, latitude, longitude, formatted_address
+                            )
                         except Exception as update_error:
                             logger.warning(f"Failed to update geocode data: {update_error}")
                     else:
@@ -545,6 +744,327 @@ async def get_applications_map_data(request: ApplicationLocationsRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cases-near")
+async def get_cases_near(
+    latitude: float = Query(..., description="查詢中心緯度"),
+    longitude: float = Query(..., description="查詢中心經度"),
+    radius_m: Optional[float] = Query(None, gt=0, description="半徑（公尺），與 k 擇一或併用"),
+    k: Optional[int] = Query(None, ge=1, le=1000, description="最近 k 件"),
+    status: Optional[List[str]] = Query(None, description="狀態篩選，可重複指定"),
+    district_id: Optional[str] = Query(None, description="區域篩選"),
+    limit: int = Query(500, ge=1, le=5000, description="半徑查詢最多回傳筆數")
+):
+    """
+    📌 查詢某地點附近的案件（行程內空間索引）
+
+    - 只給 `radius_m`：回傳半徑內所有案件（依距離排序）
+    - 只給 `k`：回傳最近的 k 件
+    - 兩者皆給：回傳半徑內最近的 k 件
+
+    Example:
+    GET /api/v1/maps/cases-near?latitude=22.9917&longitude=120.2009&radius_m=500&status=pending
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "cases": [
+            {
+                "id": "uuid-1",
+                "latitude": 22.9920,
+                "longitude": 120.2011,
+                "status": "pending",
+                "district_id": "uuid-district",
+                "distance_m": 38.2
+            }
+        ],
+        "count": 1
+    }
+    ```
+    """
+    from app.services.spatial_index import get_case_spatial_index
+
+    if radius_m is None and k is None:
+        raise HTTPException(status_code=400, detail="請指定 radius_m 或 k")
+
+    try:
+        index = get_case_spatial_index()
+        if k is not None:
+            cases = index.query_knn(
+                latitude, longitude, k,
+                status=status, district_id=district_id, max_radius_m=radius_m
+            )
+        else:
+            cases = index.query_radius(
+                latitude, longitude, radius_m,
+                status=status, district_id=district_id, limit=limit
+            )
+
+        return {
+            "success": True,
+            "cases": cases,
+            "count": len(cases),
+            "indexed_cases": len(index),
+            "message": f"找到 {len(cases)} 個案件"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def get_map_tile(
+    z: int,
+    x: int,
+    y: int,
+    status: Optional[List[str]] = Query(None, description="狀態篩選，可重複指定"),
+    district_id: Optional[str] = Query(None, description="區域篩選")
+):
+    """
+    🧩 取得預先分群的地圖圖磚（Web Mercator z/x/y）
+
+    每個圖磚最多回傳 8x8 個分群，分群包含件數、申請金額合計與狀態分布；
+    只有一件的分群以個別案件回傳。縮放層級 17 以上且案件不多時直接回傳所有案件。
+
+    Example:
+    GET /api/v1/maps/tiles/13/6840/3631?status=pending
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "tile": {
+            "z": 13, "x": 6840, "y": 3631,
+            "total": 152,
+            "requested_amount": 4560000.0,
+            "status_counts": {"pending": 152},
+            "clusters": [
+                {
+                    "latitude": 22.9921,
+                    "longitude": 120.2013,
+                    "count": 37,
+                    "requested_amount": 1110000.0,
+                    "status_counts": {"pending": 37}
+                }
+            ],
+            "points": [
+                {"id": "uuid-1", "latitude": 22.9950, "longitude": 120.2101, "status": "pending", "requested_amount": 30000.0}
+            ]
+        }
+    }
+    ```
+    """
+    from app.services.map_tiles import get_map_tile_service
+
+    try:
+        tile = await asyncio.to_thread(
+            get_map_tile_service().get_tile, z, x, y, status=status, district_id=district_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "tile": tile
+    }
+
+
+@router.get("/analytics/grid")
+async def get_damage_grid(
+    resolution: float = Query(0.01, description="網格解析度（度）：0.002, 0.005, 0.01, 0.02, 0.05, 0.1"),
+    district_id: Optional[str] = Query(None, description="區域篩選"),
+    disaster_type: Optional[str] = Query(None, description="災害類型篩選 (flood/typhoon/earthquake/fire)")
+):
+    """
+    📊 災損網格統計
+
+    依經緯度網格彙總件數、申請金額與核准金額（核准、已完成、已撥款狀態），只回傳非空格子。
+    格子 (row, col) 的西南角為 origin + (row, col) * resolution_deg。
+
+    Example:
+    GET /api/v1/maps/analytics/grid?resolution=0.01&disaster_type=flood
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "grid": {
+            "resolution_deg": 0.01,
+            "origin": {"latitude": 22.97, "longitude": 120.18},
+            "shape": [5, 6],
+            "cell_count": 2,
+            "cells": {
+                "row": [1, 2], "col": [2, 3],
+                "count": [12, 3],
+                "requested_amount": [360000.0, 90000.0],
+                "approved_count": [4, 0],
+                "approved_amount": [80000.0, 0.0]
+            },
+            "totals": {"count": 15, "requested_amount": 450000.0, "approved_count": 4, "approved_amount": 80000.0},
+            "max": {"count": 12.0, "requested_amount": 360000.0, "approved_count": 4.0, "approved_amount": 80000.0}
+        }
+    }
+    ```
+    """
+    from app.services.geo_analytics import get_geo_analytics_service
+
+    try:
+        grid = await asyncio.to_thread(
+            get_geo_analytics_service().get_grid, resolution, district_id, disaster_type
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "grid": grid
+    }
+
+
+@router.get("/analytics/heatmap")
+async def get_damage_heatmap(
+    resolution: float = Query(0.01, description="網格解析度（度）：0.002, 0.005, 0.01, 0.02, 0.05, 0.1"),
+    district_id: Optional[str] = Query(None, description="區域篩選"),
+    disaster_type: Optional[str] = Query(None, description="災害類型篩選 (flood/typhoon/earthquake/fire)"),
+    weight: str = Query("count", description="強度依據：count, requested_amount, approved_count, approved_amount")
+):
+    """
+    🔥 災損熱區圖
+
+    回傳各格子中心點與正規化（0~1）強度，可直接作為前端熱區圖圖層的資料。
+
+    Example:
+    GET /api/v1/maps/analytics/heatmap?resolution=0.005&weight=requested_amount
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "heatmap": {
+            "resolution_deg": 0.005,
+            "weight": "requested_amount",
+            "points": [[22.9925, 120.2025, 1.0], [22.9975, 120.2075, 0.25]],
+            "max": 360000.0
+        }
+    }
+    ```
+    """
+    from app.services.geo_analytics import get_geo_analytics_service
+
+    try:
+        heatmap = await asyncio.to_thread(
+            get_geo_analytics_service().get_heatmap, resolution, district_id, disaster_type, weight
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "heatmap": heatmap
+    }
+
+
+@router.get("/export/cases.geojson")
+async def export_case_locations(
+    request: Request,
+    properties: Optional[str] = Query(None, description="輸出的屬性欄位（逗號分隔），例如 case_no,status,requested_amount"),
+    status: Optional[List[str]] = Query(None, description="狀態篩選，可重複指定"),
+    district_id: Optional[str] = Query(None, description="區域篩選"),
+    disaster_type: Optional[str] = Query(None, description="災害類型篩選"),
+    submitted_from: Optional[date] = Query(None, description="送件日期起（含）"),
+    submitted_to: Optional[date] = Query(None, description="送件日期迄（含）"),
+    current_user: dict = Depends(require_reviewer)
+):
+    """
+    🗂️ 匯出案件位置（GeoJSON FeatureCollection，串流輸出）
+
+    以 keyset 分頁逐頁讀取並邊讀邊輸出，不受案件數量影響記憶體用量；
+    用戶端送出 `Accept-Encoding: gzip` 時以 gzip 壓縮傳送。
+
+    Example:
+    GET /api/v1/maps/export/cases.geojson?properties=case_no,status,approved_amount&status=approved&submitted_from=2025-07-01
+
+    Response:
+    ```json
+    {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": "uuid-1",
+                "geometry": {"type": "Point", "coordinates": [120.2009, 22.9917]},
+                "properties": {"case_no": "CASE-20250101-001", "status": "approved", "approved_amount": 30000}
+            }
+        ]
+    }
+    ```
+    """
+    from app.services.geo_export import gzip_stream, iter_application_pages, iter_feature_collection, parse_properties
+
+    try:
+        fields = parse_properties(properties)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pages = iter_application_pages(
+        fields,
+        status=status,
+        district_id=district_id,
+        disaster_type=disaster_type,
+        submitted_from=submitted_from.isoformat() if submitted_from else None,
+        submitted_to=(submitted_to + timedelta(days=1)).isoformat() if submitted_to else None
+    )
+    body = iter_feature_collection(pages, fields)
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="cases-{date.today().isoformat()}.geojson"',
+        "Vary": "Accept-Encoding"
+    }
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(body, media_type="application/geo+json", headers=headers)
+
+
+@router.get("/usage")
+async def get_maps_usage(days: int = Query(7, ge=1, le=31, description="回傳最近幾天的用量")):
+    """
+    📈 Google Maps API 用量報表（所有 worker 合計）
+
+    Response:
+    ```json
+    {
+        "success": true,
+        "today": {
+            "geocode": {
+                "requests": 1520, "daily_limit": 20000, "remaining": 18480,
+                "denied": 3, "degraded": 3, "quota_errors": 0, "qps": 40, "blocked": false
+            }
+        },
+        "daily": [
+            {"date": "2025-10-18", "endpoints": {"geocode": {"requests": 1520}}, "estimated_cost_usd": 7.6}
+        ]
+    }
+    ```
+    """
+    from app.services.rate_limiter import get_maps_rate_limiter
+
+    try:
+        usage = await asyncio.to_thread(get_maps_rate_limiter().usage, days)
+        return {
+            "success": True,
+            **usage
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/health")
 async def health_check():
     """健康檢查"""
@@ -2,14 +2,27 @@
 照片上傳相關 API 路由
 颱風水災災損照片管理
 """
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form
-from typing import List
-from app.models.models import DamagePhotoCreate, DamagePhotoResponse, FileUploadResponse, APIResponse
+import asyncio
+import mimetypes
+from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, Header, Query, Request, Response, status, UploadFile, File, Form
+from typing import List, Optional
+from app.models.models import DamagePhotoCreate, DamagePhotoResponse, FileUploadResponse, APIResponse, PhotoUploadIntentRequest, PhotoUploadCommitRequest, ResumableUploadCreateRequest
 from app.models.database import db_service
-from app.services.storage import storage_service
+from app.services.storage import PHOTO_SIGNED_URL_EXPIRES_IN, storage_service
+from app.services.direct_uploads import get_direct_upload_service
+from app.services.downloads import content_etag, stream_storage_object
+from app.services.photo_derivatives import get_photo_derivative_service
+from app.services.photo_objects import get_photo_object_service
+from app.services.photo_similarity import get_photo_similarity_service
+from app.services.resumable_uploads import get_resumable_upload_service
+from app.services.uploads import PHOTO_MIME_TYPES, UploadError, receive_upload, upload_batch
+from app.settings import get_settings
 
 router = APIRouter(prefix="/photos", tags=["照片管理（災損）"])
 
+settings = get_settings()
+
 @router.post("/upload", response_model=APIResponse, status_code=status.HTTP_201_CREATED)
 async def upload_damage_photo(
     application_id: str = Form(...),
@@ -36,29 +49,19 @@ async def upload_damage_photo(
                 detail="申請案件不存在"
             )
         
-        # 檢查檔案類型
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="只接受圖片檔案"
-            )
-        
-        # 讀取檔案內容
-        file_content = await file.read()
+        # 以區塊讀取並檢查檔案大小與格式（只接受圖片）
+        try:
+            upload = await receive_upload(file, PHOTO_MIME_TYPES, settings.MAX_UPLOAD_SIZE)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
-        # 檢查檔案大小 (10MB)
-        if len(file_content) > 10 * 1024 * 1024:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="檔案大小不能超過 10MB"
-            )
-        
-        # 上傳到 Storage
-        storage_result = storage_service.upload_damage_photo(
-            application_id=application_id,
-            file=file_content,
-            filename=file.filename,
-            photo_type=photo_type
+        # 上傳到 Storage（已有相同內容的照片時只增加引用，不重複上傳）
+        storage_result = get_photo_object_service().store(
+            sha256=upload.sha256,
+            size=upload.size,
+            mime_type=upload.mime_type,
+            filename=upload.filename,
+            open_payload=upload.payload
         )
         
         # 建立資料庫記錄
@@ -66,16 +69,23 @@ async def upload_damage_photo(
             "application_id": application_id,
             "photo_type": photo_type,
             "storage_path": storage_result['storage_path'],
-            "file_name": file.filename,
-            "file_size": len(file_content),
-            "mime_type": file.content_type,
+            "file_name": upload.filename,
+            "file_size": upload.size,
+            "mime_type": upload.mime_type,
+            "content_sha256": upload.sha256,
             "description": description,
             "uploaded_by": uploaded_by
         }
         
-        result = db_service.create_damage_photo(photo_data)
+        # 寫入失敗（含資料庫錯誤）時釋放 store() 取得的引用，避免物件永遠無法回收
+        try:
+            result = db_service.create_damage_photo(photo_data)
+        except Exception:
+            get_photo_object_service().release_photos([photo_data])
+            raise
         
         if not result:
+            get_photo_object_service().release_photos([photo_data])
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="建立照片記錄失敗"
@@ -84,6 +94,9 @@ async def upload_damage_photo(
         # 加入簽名 URL
         result['signed_url'] = storage_result['signed_url']
         
+        # 背景產生縮圖與預覽圖
+        get_photo_derivative_service().schedule([result])
+        
         return APIResponse(
             success=True,
             message="照片上傳成功",
@@ -122,50 +135,38 @@ async def upload_multiple_photos(
                 detail="申請案件不存在"
             )
         
-        uploaded_photos = []
-        errors = []
-        
-        for file in files:
-            try:
-                # 檢查檔案類型
-                if not file.content_type.startswith('image/'):
-                    errors.append(f"{file.filename}: 不是圖片檔案")
-                    continue
-                
-                # 讀取檔案內容
-                file_content = await file.read()
-                
-                # 檢查檔案大小
-                if len(file_content) > 10 * 1024 * 1024:
-                    errors.append(f"{file.filename}: 檔案大小超過 10MB")
-                    continue
-                
-                # 上傳到 Storage
-                storage_result = storage_service.upload_damage_photo(
-                    application_id=application_id,
-                    file=file_content,
-                    filename=file.filename,
-                    photo_type=photo_type
-                )
-                
-                # 建立資料庫記錄
-                photo_data = {
-                    "application_id": application_id,
-                    "photo_type": photo_type,
-                    "storage_path": storage_result['storage_path'],
-                    "file_name": file.filename,
-                    "file_size": len(file_content),
-                    "mime_type": file.content_type,
-                    "uploaded_by": uploaded_by
-                }
-                
-                result = db_service.create_damage_photo(photo_data)
-                if result:
-                    result['signed_url'] = storage_result['signed_url']
-                    uploaded_photos.append(result)
-                
-            except Exception as e:
-                errors.append(f"{file.filename}: {str(e)}")
+        # 並行上傳到 Storage，完成後一次寫入所有照片記錄並批次產生簽名 URL
+        batch = await upload_batch(
+            files,
+            PHOTO_MIME_TYPES,
+            settings.MAX_UPLOAD_SIZE,
+            store=lambda upload: get_photo_object_service().store(
+                sha256=upload.sha256,
+                size=upload.size,
+                mime_type=upload.mime_type,
+                filename=upload.filename,
+                open_payload=upload.payload,
+                sign=False
+            ),
+            build_row=lambda upload, stored: {
+                "application_id": application_id,
+                "photo_type": photo_type,
+                "storage_path": stored['storage_path'],
+                "file_name": upload.filename,
+                "file_size": upload.size,
+                "mime_type": upload.mime_type,
+                "content_sha256": upload.sha256,
+                "uploaded_by": uploaded_by
+            },
+            insert_rows=db_service.create_damage_photos,
+            bucket=storage_service.documents_bucket,
+            signed_url_expires_in=PHOTO_SIGNED_URL_EXPIRES_IN,
+            concurrency=settings.UPLOAD_CONCURRENCY,
+            discard=get_photo_object_service().release_photos
+        )
+        uploaded_photos = batch["uploaded"]
+        errors = batch["errors"]
+        get_photo_derivative_service().schedule(uploaded_photos)
         
         return APIResponse(
             success=len(uploaded_photos) > 0,
@@ -173,6 +174,7 @@ async def upload_multiple_photos(
             data={
                 "uploaded": uploaded_photos,
                 "errors": errors,
+                "results": batch["results"],
                 "total_uploaded": len(uploaded_photos),
                 "total_errors": len(errors)
             }
@@ -186,6 +188,203 @@ async def upload_multiple_photos(
             detail=f"發生錯誤: {str(e)}"
         )
 
+@router.post("/upload-intent", response_model=APIResponse, status_code=status.HTTP_201_CREATED)
+async def create_photo_upload_intent(request: PhotoUploadIntentRequest):
+    """
+    取得照片直接上傳網址（檔案不經過 API 伺服器）
+    
+    1. 宣告每個檔案的名稱、大小、MIME 類型與 SHA-256，取得簽名上傳 URL 與 intent_token
+    2. 用戶端以簽名上傳 URL 直接把檔案上傳到 Storage
+    3. 呼叫 `POST /photos/commit` 驗證檔案並建立照片記錄
+    """
+    try:
+        # 檢查申請案件是否存在
+        application = db_service.get_application_by_id(request.application_id)
+        if not application:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="申請案件不存在"
+            )
+        
+        try:
+            intent = get_direct_upload_service().create_photo_intent(
+                application_id=request.application_id,
+                photo_type=request.photo_type,
+                files=[f.model_dump() for f in request.files],
+                uploaded_by=request.uploaded_by
+            )
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        
+        return APIResponse(
+            success=True,
+            message=f"已產生 {len(intent['uploads'])} 個上傳網址",
+            data=intent
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
+@router.post("/commit", response_model=APIResponse, status_code=status.HTTP_201_CREATED)
+async def commit_photo_uploads(request: PhotoUploadCommitRequest):
+    """
+    確認直接上傳的照片：驗證 Storage 物件的大小、格式與 SHA-256，並批次建立照片記錄
+    
+    可重複呼叫（已建立的記錄不會重複寫入）
+    """
+    try:
+        try:
+            batch = await get_direct_upload_service().commit_photos(request.intent_token)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        
+        uploaded_photos = batch["uploaded"]
+        errors = batch["errors"]
+        get_photo_derivative_service().schedule(uploaded_photos)
+        
+        return APIResponse(
+            success=len(uploaded_photos) > 0,
+            message=f"成功建立 {len(uploaded_photos)} 張照片記錄",
+            data={
+                "uploaded": uploaded_photos,
+                "errors": errors,
+                "results": batch["results"],
+                "total_uploaded": len(uploaded_photos),
+                "total_errors": len(errors)
+            }
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
+def _resumable_headers(upload: dict) -> dict:
+    """續傳上傳狀態的回應標頭"""
+    return {
+        "Upload-Offset": str(upload["offset"]),
+        "Upload-Length": str(upload["length"]),
+        "Upload-Expires": upload["expires_at"],
+        "Cache-Control": "no-store"
+    }
+
+@router.post("/resumable", response_model=APIResponse, status_code=status.HTTP_201_CREATED)
+async def create_resumable_upload(request: ResumableUploadCreateRequest, response: Response):
+    """
+    建立可續傳的照片上傳工作（適用於不穩定的行動網路）
+    
+    1. 建立工作，取得 upload_id
+    2. `PATCH /photos/resumable/{upload_id}`：標頭 Upload-Offset 為目前位置，內容為下一個區塊
+    3. 連線中斷時 `HEAD /photos/resumable/{upload_id}` 取得伺服器已收到的位置（Upload-Offset）再繼續
+    4. 最後一個區塊送達後自動上傳到 Storage 並建立照片記錄
+    """
+    try:
+        # 檢查申請案件是否存在
+        application = db_service.get_application_by_id(request.application_id)
+        if not application:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="申請案件不存在"
+            )
+        
+        try:
+            upload = get_resumable_upload_service().create(
+                application_id=request.application_id,
+                photo_type=request.photo_type,
+                file_name=request.file_name,
+                length=request.size,
+                description=request.description,
+                uploaded_by=request.uploaded_by
+            )
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        
+        response.headers.update(_resumable_headers(upload))
+        response.headers["Location"] = f"/api/v1/photos/resumable/{upload['upload_id']}"
+        return APIResponse(
+            success=True,
+            message="已建立上傳工作",
+            data=upload
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
+@router.head("/resumable/{upload_id}")
+async def get_resumable_upload_offset(upload_id: str):
+    """
+    查詢上傳工作已收到的位元組數（回應標頭 Upload-Offset）
+    """
+    try:
+        upload = get_resumable_upload_service().status(upload_id)
+    except UploadError as e:
+        return Response(status_code=e.status_code, headers={"Cache-Control": "no-store"})
+    return Response(status_code=status.HTTP_200_OK, headers=_resumable_headers(upload))
+
+@router.patch("/resumable/{upload_id}", response_model=APIResponse)
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias="Upload-Offset")
+):
+    """
+    從 Upload-Offset 附加一個區塊（Content-Type: application/offset+octet-stream）
+    
+    - Upload-Offset 與伺服器不一致時回傳 409，請先以 HEAD 查詢目前位置
+    - 最後一個區塊送達後回傳 completed=true 與照片記錄
+    """
+    try:
+        try:
+            upload = await get_resumable_upload_service().append(upload_id, upload_offset, request.stream())
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        
+        response.headers.update(_resumable_headers(upload))
+        if upload["completed"]:
+            get_photo_derivative_service().schedule([upload["photo"]])
+        return APIResponse(
+            success=True,
+            message="照片上傳成功" if upload["completed"] else f"已接收 {upload['offset']}/{upload['length']} 位元組",
+            data=upload
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
+@router.delete("/resumable/{upload_id}", response_model=APIResponse)
+async def cancel_resumable_upload(upload_id: str):
+    """
+    取消上傳工作並刪除已收到的內容
+    """
+    try:
+        get_resumable_upload_service().cancel(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return APIResponse(
+        success=True,
+        message="已取消上傳工作",
+        data={"upload_id": upload_id}
+    )
+
 @router.get("/application/{application_id}", response_model=APIResponse)
 async def get_photos_by_application(application_id: str):
     """
@@ -204,12 +403,8 @@ async def get_photos_by_application(application_id: str):
         photos = db_service.get_photos_by_application(application_id)
         
         # 為每張照片生成簽名 URL
-        for photo in photos:
-            signed_url = storage_service.get_damage_photo_url(
-                photo['storage_path'],
-                expires_in=3600  # 1 小時
-            )
-            photo['signed_url'] = signed_url
+        # 一次產生原圖、縮圖、預覽圖的簽名 URL（1 小時），缺少衍生圖的照片在背景補產生
+        await get_photo_derivative_service().attach_urls(photos, expires_in=3600)
         
         return APIResponse(
             success=True,
@@ -225,6 +420,103 @@ async def get_photos_by_application(application_id: str):
             detail=f"發生錯誤: {str(e)}"
         )
 
+@router.get("/{photo_id}/file")
+async def get_photo_file(
+    photo_id: str,
+    request: Request,
+    variant: str = Query("original", pattern="^(original|preview|thumbnail)$", description="original、preview 或 thumbnail")
+):
+    """
+    串流照片檔案（原圖或衍生圖），支援 Range（206）與 ETag / Last-Modified 條件式請求（304）
+    
+    衍生圖尚未產生時回傳原圖
+    """
+    try:
+        photo = db_service.get_photo_by_id(photo_id)
+        if not photo:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="照片不存在"
+            )
+        
+        path = photo.get(f"{variant}_path") if variant != "original" else None
+        if path:
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        else:
+            variant = "original"
+            path = photo["storage_path"]
+            media_type = photo.get("mime_type") or "application/octet-stream"
+        
+        try:
+            return await stream_storage_object(
+                request,
+                storage_service.bucket_for_photo_path(photo["storage_path"]),
+                path,
+                media_type=media_type,
+                content_disposition=f"inline; filename*=UTF-8''{quote(photo['file_name'])}",
+                etag=content_etag(photo.get("content_sha256"), None if variant == "original" else path.rsplit("_", 1)[-1]),
+                last_modified=photo.get("created_at")
+            )
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="照片檔案不存在"
+            )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
+@router.get("/{photo_id}/similar", response_model=APIResponse)
+async def get_similar_photos(
+    photo_id: str,
+    max_distance: Optional[int] = Query(None, ge=0, le=24, description="最大漢明距離（預設 SIMILAR_PHOTO_MAX_DISTANCE）"),
+    include_same_application: bool = Query(False, description="是否包含同案件的照片"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    查詢與指定照片相似的照片（預設只列出其他案件的照片，用於偵測重複使用的災損照片）
+    """
+    try:
+        photo = db_service.get_photo_by_id(photo_id)
+        if not photo:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="照片不存在"
+            )
+        if photo.get("phash") is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="照片尚未完成處理，請稍後再試"
+            )
+        
+        similar = await asyncio.to_thread(
+            get_photo_similarity_service().find_similar,
+            photo,
+            max_distance,
+            include_same_application,
+            limit
+        )
+        await get_photo_derivative_service().attach_urls(similar, expires_in=3600)
+        
+        return APIResponse(
+            success=True,
+            message=f"找到 {len(similar)} 張相似照片",
+            data={"photo_id": photo_id, "similar": similar, "total": len(similar)}
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"發生錯誤: {str(e)}"
+        )
+
 @router.delete("/{photo_id}", response_model=APIResponse)
 async def delete_photo(photo_id: str):
     """
@@ -232,8 +524,7 @@ async def delete_photo(photo_id: str):
     """
     try:
         # 取得照片資料
-        photos = db_service.get_photos_by_application("")  # 這裡需要優化
-        photo = next((p for p in photos if p['id'] == photo_id), None)
+        photo = db_service.get_photo_by_id(photo_id)
         
         if not photo:
             raise HTTPException(
@@ -241,11 +532,10 @@ async def delete_photo(photo_id: str):
                 detail="照片不存在"
             )
         
-        # 從 Storage 刪除檔案
-        storage_service.delete_damage_photo(photo['storage_path'])
-        
-        # 從資料庫刪除記錄
+        # 先刪除資料庫記錄，再釋放對共用物件的引用（引用歸零的物件由背景工作延後刪除）
         db_service.delete_photo(photo_id)
+        get_photo_object_service().release_photos([photo])
+        get_photo_similarity_service().index.remove(photo_id)
         
         return APIResponse(
             success=True,
@@ -293,22 +583,19 @@ async def upload_inspection_photo(
                 detail="沒有權限上傳現場勘查照片"
             )
         
-        # 檢查檔案類型
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="只接受圖片檔案"
-            )
-        
-        # 讀取檔案內容
-        file_content = await file.read()
+        # 以區塊讀取並檢查檔案大小與格式（只接受圖片）
+        try:
+            upload = await receive_upload(file, PHOTO_MIME_TYPES, settings.MAX_UPLOAD_SIZE)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
         # 上傳到 Storage
         storage_result = storage_service.upload_inspection_photo(
             application_id=application_id,
-            file=file_content,
-            filename=file.filename,
-            reviewer_id=reviewer_id
+            file=upload.payload(),
+            filename=upload.filename,
+            reviewer_id=reviewer_id,
+            content_type=upload.mime_type
         )
         
         # 建立資料庫記錄
@@ -316,9 +603,10 @@ async def upload_inspection_photo(
             "application_id": application_id,
             "photo_type": "site_inspection",
             "storage_path": storage_result['storage_path'],
-            "file_name": file.filename,
-            "file_size": len(file_content),
-            "mime_type": file.content_type,
+            "file_name": upload.filename,
+            "file_size": upload.size,
+            "mime_type": upload.mime_type,
+            "content_sha256": upload.sha256,
             "description": description,
             "uploaded_by": reviewer_id
         }
@@ -334,6 +622,9 @@ async def upload_inspection_photo(
         # 加入簽名 URL
         result['signed_url'] = storage_result['signed_url']
         
+        # 背景產生縮圖與預覽圖
+        get_photo_derivative_service().schedule([result])
+        
         return APIResponse(
             success=True,
             message="現場勘查照片上傳成功",
@@ -8,6 +8,7 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 
 from app.models.database import DatabaseService
+from app.services.case_events import publish_application_changed
 from app.services.gov_wallet import GovWalletService
 
 router = APIRouter(prefix="/api/v1/simplified", tags=["simplified"])
@@ -92,6 +93,15 @@ async def submit_application(request: SubmitApplicationRequest):
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat()
         }
+
+        # 依地址自動指派所屬區域（僅離線配對，不呼叫地理編碼）
+        try:
+            from app.services.district_matcher import get_district_assignment_service
+            district_id = get_district_assignment_service().match_offline(request.address)
+            if district_id:
+                application_data["district_id"] = district_id
+        except Exception as e:
+            print(f"自動指派區域失敗: {e}")
         
         result = db_service.supabase.table("applications").insert(application_data).execute()
         
@@ -99,6 +109,7 @@ async def submit_application(request: SubmitApplicationRequest):
             raise HTTPException(status_code=500, detail="儲存申請失敗")
         
         application_id = result.data[0]["id"]
+        publish_application_changed(result.data[0])
         
         # 3. 呼叫政府發行端 API 產生 QR Code
         qr_result = await gov_wallet_service.issue_disaster_relief_qrcode(
@@ -172,11 +183,12 @@ async def verify_credential(request: VerifyCredentialRequest):
         application = result.data[0]
         
         # 3. 更新狀態為「已發放」
-        db_service.supabase.table("applications").update({
-            "status": "disbursed",
-            "disbursed_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }).eq("id", application["id"]).execute()
+        db_service.update_application_status(
+            application["id"],
+            "disbursed",
+            disbursed_at=datetime.now().isoformat(),
+            updated_at=datetime.now().isoformat()
+        )
         
         # 4. 返回結果
         return VerifyResponse(
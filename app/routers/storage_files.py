@@ -0,0 +1,99 @@
+"""
+本機 Storage 檔案路由
+STORAGE_BACKEND=local 時，簽名 URL、公開 URL 與簽名上傳 URL 都指向這裡；
+使用 Supabase Storage 時這些路由一律回傳 404
+"""
+import asyncio
+import mimetypes
+import tempfile
+
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from storage3.exceptions import StorageApiError
+
+from app.services import storage
+from app.services.downloads import stream_storage_object
+from app.services.local_storage import verify_token
+from app.settings import get_settings
+
+router = APIRouter(prefix="/api/v1/storage", tags=["本機檔案"])
+
+settings = get_settings()
+
+# 上傳暫存超過此大小時改寫入磁碟
+_SPOOL_SIZE = 1024 * 1024
+
+
+def _local_storage():
+    service = storage.storage_service
+    if not hasattr(service, "local_path"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未啟用本機 Storage")
+    return service
+
+
+async def _serve(request: Request, bucket: str, path: str):
+    _local_storage()
+    filename = path.rsplit("/", 1)[-1]
+    try:
+        return await stream_storage_object(
+            request,
+            bucket,
+            path,
+            media_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            content_disposition="inline"
+        )
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError, ValueError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="檔案不存在")
+
+
+@router.get("/object/{bucket}/{path:path}")
+async def get_signed_object(request: Request, bucket: str, path: str, token: str = Query(..., description="簽名 token")):
+    """
+    下載檔案（簽名 URL）
+
+    支援 Range 與條件式請求；設定 LOCAL_STORAGE_ACCEL_REDIRECT 時由 nginx 傳送檔案內容
+    """
+    if not verify_token("download", bucket, path, token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="簽名無效或已過期")
+    return await _serve(request, bucket, path)
+
+
+@router.get("/public/{bucket}/{path:path}")
+async def get_public_object(request: Request, bucket: str, path: str):
+    """下載公開 bucket 中的檔案（例如憑證 QR Code）"""
+    if bucket not in _local_storage().public_buckets:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="檔案不存在")
+    return await _serve(request, bucket, path)
+
+
+@router.put("/upload/{bucket}/{path:path}", status_code=status.HTTP_201_CREATED)
+async def upload_signed_object(request: Request, bucket: str, path: str, token: str = Query(..., description="簽名 token")):
+    """
+    以簽名上傳 URL 上傳檔案（請求內容即為檔案內容）
+
+    與 Supabase 相同，預設不覆寫既有檔案（x-upsert: true 時覆寫）
+    """
+    service = _local_storage()
+    if not verify_token("upload", bucket, path, token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="簽名無效或已過期")
+
+    max_size = max(settings.MAX_UPLOAD_SIZE, settings.MAX_DOCUMENT_UPLOAD_SIZE)
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE) as buffer:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"檔案大小超過上限 {max_size // (1024 * 1024)}MB"
+                )
+            await asyncio.to_thread(buffer.write, chunk)
+        buffer.seek(0)
+        upsert = request.headers.get("x-upsert", "false").lower() == "true"
+        try:
+            await asyncio.to_thread(service.write_object, bucket, path, buffer, upsert)
+        except StorageApiError as e:
+            raise HTTPException(status_code=int(e.status), detail=str(e.message))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Storage 路徑不正確")
+
+    return {"Key": f"{bucket}/{path}", "size": size}
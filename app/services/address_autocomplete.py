@@ -0,0 +1,229 @@
+"""
+地址自動完成服務
+以排序陣列 + 二分搜尋建立的本地前綴索引回應輸入中的地址，
+索引來源為區域與路名（不含申請人的門牌地址與座標）；只有本地沒看過的前綴才會呼叫 Google
+"""
+import asyncio
+import heapq
+import logging
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.services.cache import TTLCache
+from app.services.district_matcher import normalize_address
+
+logger = logging.getLogger(__name__)
+
+# 前綴少於此長度不查詢（單一字元幾乎會命中整個索引）
+MIN_PREFIX_LENGTH = 2
+# 單一前綴最多掃描的索引項目數
+MAX_SCAN = 5000
+# 本地結果少於此數量時才考慮呼叫 Google，且前綴至少需要此長度
+PROVIDER_MIN_RESULTS = 3
+PROVIDER_MIN_PREFIX_LENGTH = 4
+# 呼叫 Google 前的伺服器端防抖時間（秒），期間同一 session 有新輸入則放棄本次呼叫
+DEBOUNCE_SECONDS = 0.25
+
+# 來源權重：區域 > 路名 > Google 建議
+SOURCE_WEIGHTS = {"district": 2.0, "road": 1.5, "provider": 1.0}
+
+_POSTAL_PREFIX = re.compile(r"^\d{0,6}(?:台灣(?!大道)|中華民國)?\d{0,6}")
+_ROAD = re.compile(r"^(.+?(?:縣|市).+?(?:區|鄉|鎮|市).*?(?:路|街|大道)(?:[一二三四五六七八九十]+段)?)")
+# 從縣市、行政區之後開始的位置也建立索引，讓使用者可以直接輸入路名
+_SUFFIX_STARTS = re.compile(r"(?<=[縣市])|(?<=[區鄉鎮])")
+
+
+def clean_address(address: str) -> str:
+    """正規化地址並移除郵遞區號與國名前綴"""
+    text = normalize_address(address)
+    return _POSTAL_PREFIX.sub("", text)
+
+
+class AddressPrefixIndex:
+    """以排序陣列實作的地址前綴索引"""
+
+    def __init__(self):
+        # (索引鍵, 地址) 依字典序排序；同一地址會以多個起點（全址、去縣市、去行政區）建立索引鍵
+        self._keys: List[Tuple[str, str]] = []
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, address: str, source: str = "road", place_id: Optional[str] = None) -> None:
+        """新增或加權地址（已存在時提高權重）"""
+        text = clean_address(address)
+        if len(text) < MIN_PREFIX_LENGTH:
+            return
+        with self._lock:
+            entry = self._entries.get(text)
+            if entry is None:
+                entry = {"text": text, "source": source, "weight": 0.0, "place_id": None}
+                self._entries[text] = entry
+                for key in self._index_keys(text):
+                    insort(self._keys, (key, text))
+            entry["weight"] += SOURCE_WEIGHTS.get(source, 1.0)
+            if SOURCE_WEIGHTS.get(source, 1.0) > SOURCE_WEIGHTS.get(entry["source"], 1.0):
+                entry["source"] = source
+            if place_id:
+                entry["place_id"] = place_id
+
+    def build(self, items: Iterable[Tuple[str, str]]) -> int:
+        """
+        批次建立索引（一次排序，避免逐筆插入）
+
+        Args:
+            items: (地址, 來源) 列表
+
+        Returns:
+            索引中的地址數
+        """
+        with self._lock:
+            for address, source in items:
+                text = clean_address(address)
+                if len(text) < MIN_PREFIX_LENGTH:
+                    continue
+                entry = self._entries.setdefault(text, {"text": text, "source": source, "weight": 0.0, "place_id": None})
+                entry["weight"] += SOURCE_WEIGHTS.get(source, 1.0)
+            self._keys = sorted({(key, text) for text in self._entries for key in self._index_keys(text)})
+            return len(self._entries)
+
+    @staticmethod
+    def _index_keys(text: str) -> List[str]:
+        starts = {0} | {m.start() for m in _SUFFIX_STARTS.finditer(text) if 0 < m.start() < len(text) - 1}
+        return [text[start:] for start in sorted(starts)]
+
+    def search(self, prefix: str, limit: int = 8) -> List[Dict]:
+        """
+        查詢以 prefix 開頭的地址（依權重排序）
+
+        Args:
+            prefix: 使用者輸入
+            limit: 最多回傳筆數
+        """
+        key = clean_address(prefix)
+        if len(key) < MIN_PREFIX_LENGTH:
+            return []
+        with self._lock:
+            lo = bisect_left(self._keys, (key,))
+            hi = bisect_left(self._keys, (key + "\U0010ffff",), lo, min(len(self._keys), lo + MAX_SCAN))
+            texts = {text for _, text in self._keys[lo:hi]}
+            best = heapq.nlargest(limit, (self._entries[t] for t in texts), key=lambda e: (e["weight"], -len(e["text"])))
+            return [dict(entry) for entry in best]
+
+
+class AddressAutocompleteService:
+    """地址自動完成（本地索引優先，必要時才呼叫 Google）"""
+
+    def __init__(self):
+        self.index = AddressPrefixIndex()
+        # 已送過 Google 的前綴 → 建議結果
+        self.provider_cache = TTLCache(maxsize=50_000, ttl=86400)
+        # session → 最新一次輸入的序號，用於防抖
+        self._latest_by_session: Dict[str, int] = {}
+        self._sequence = 0
+        self.stats = {"local": 0, "provider": 0, "debounced": 0}
+
+    def load_from_database(self) -> int:
+        """
+        從區域資料與案件地址的路名建立索引
+
+        申請案件的地址屬於個人資料，索引只收錄區域與路名，不收錄門牌與座標
+        """
+        from app.models.database import db_service
+
+        roads = set()
+        for row in db_service.get_geocoded_applications(columns="formatted_address", limit=100_000):
+            road = _ROAD.match(clean_address(row.get("formatted_address") or ""))
+            if road:
+                roads.add(road.group(1))
+        items = [(road, "road") for road in roads]
+
+        for district in db_service.get_active_districts():
+            base = f"{district.get('city') or ''}{district.get('district') or ''}"
+            items.append((base, "district"))
+            if district.get("village"):
+                items.append((base + district["village"], "district"))
+
+        return self.index.build(items)
+
+    def add_validated(self, formatted_address: str) -> None:
+        """地址驗證成功後只將路名加入索引（門牌地址不分享給其他使用者）"""
+        road = _ROAD.match(clean_address(formatted_address))
+        if road:
+            self.index.add(road.group(1), "road")
+
+    async def suggest(self, text: str, session: Optional[str] = None, limit: int = 8) -> Dict:
+        """
+        取得地址建議
+
+        Args:
+            text: 使用者目前輸入
+            session: 前端的輸入 session（同一輸入框連續輸入使用同一值）
+            limit: 最多回傳筆數
+
+        Returns:
+            {"suggestions": list, "source": "local" | "provider", "debounced": bool}
+        """
+        prefix = clean_address(text)
+        suggestions = self.index.search(prefix, limit)
+        if len(suggestions) >= PROVIDER_MIN_RESULTS or len(prefix) < PROVIDER_MIN_PREFIX_LENGTH:
+            self.stats["local"] += 1
+            return {"suggestions": suggestions, "source": "local", "debounced": False}
+
+        cached = self.provider_cache.get(prefix)
+        if cached is not None:
+            self.stats["local"] += 1
+            return {"suggestions": self._merge(suggestions, cached, limit), "source": "local", "debounced": False}
+
+        # 防抖：等待一小段時間，若同一 session 已有更新的輸入就不呼叫 Google
+        if session:
+            self._sequence += 1
+            sequence = self._sequence
+            self._latest_by_session[session] = sequence
+            await asyncio.sleep(DEBOUNCE_SECONDS)
+            if self._latest_by_session.get(session) != sequence:
+                self.stats["debounced"] += 1
+                return {"suggestions": suggestions, "source": "local", "debounced": True}
+            self._latest_by_session.pop(session, None)
+
+        from app.services.google_maps import get_google_maps_service
+        result = await get_google_maps_service().autocomplete_address(text, session_token=session)
+        if not result.get("success"):
+            return {"suggestions": suggestions, "source": "local", "debounced": False}
+
+        predictions = []
+        for prediction in result["predictions"]:
+            # 完整建議（可能含門牌）只留在此前綴的快取，共用索引只收錄路名
+            road = _ROAD.match(clean_address(prediction["description"]))
+            if road:
+                self.index.add(road.group(1), "provider")
+            predictions.append({
+                "text": clean_address(prediction["description"]),
+                "source": "provider",
+                "weight": SOURCE_WEIGHTS["provider"],
+                "place_id": prediction.get("place_id")
+            })
+        self.provider_cache.set(prefix, predictions)
+        self.stats["provider"] += 1
+        return {"suggestions": self._merge(suggestions, predictions, limit), "source": "provider", "debounced": False}
+
+    @staticmethod
+    def _merge(local: List[Dict], remote: List[Dict], limit: int) -> List[Dict]:
+        seen = {s["text"] for s in local}
+        return (local + [s for s in remote if s["text"] not in seen])[:limit]
+
+
+# 全域服務實例
+_address_autocomplete_service: Optional[AddressAutocompleteService] = None
+
+
+def get_address_autocomplete_service() -> AddressAutocompleteService:
+    """取得地址自動完成服務實例"""
+    global _address_autocomplete_service
+    if _address_autocomplete_service is None:
+        _address_autocomplete_service = AddressAutocompleteService()
+    return _address_autocomplete_service
@@ -0,0 +1,41 @@
+"""
+案件異動通知
+當申請案件的座標、狀態等欄位變更時，通知行程內的索引與快取同步更新
+"""
+import logging
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+ApplicationListener = Callable[[Dict], None]
+
+_listeners: List[ApplicationListener] = []
+
+
+def subscribe(listener: ApplicationListener) -> None:
+    """註冊案件異動監聽器（重複註冊會被忽略）"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener: ApplicationListener) -> None:
+    """取消註冊監聽器"""
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def publish_application_changed(application: Dict) -> None:
+    """
+    發布案件異動
+
+    Args:
+        application: 異動後的案件資料（至少包含 id）
+    """
+    if not application or not application.get("id"):
+        return
+    for listener in list(_listeners):
+        try:
+            listener(application)
+        except Exception as e:
+            # 索引同步失敗不應影響主要流程
+            logger.error(f"案件異動監聽器執行失敗: {e}")
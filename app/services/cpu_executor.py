@@ -0,0 +1,230 @@
+"""
+CPU 工作執行器
+影像處理、DOCX 轉 PDF、QR Code 等 CPU 密集工作共用一個 process pool（於 lifespan 啟動），
+不佔用 event loop 與 API worker 的 GIL。排隊中的工作數有上限：超過時等待空位（back-pressure），
+等候逾時則拒絕；每個工作有執行時限，並依工作名稱統計次數與耗時
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+
+class CPUExecutorBusy(Exception):
+    """等待中的 CPU 工作已達上限"""
+
+
+class CPUJobTimeout(TimeoutError):
+    """CPU 工作超過執行時限"""
+
+
+class CPUExecutor:
+    """共用的 CPU 工作 process pool"""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        job_timeout: Optional[float] = None,
+        queue_timeout: Optional[float] = None,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Args:
+            max_workers: 子程序數
+            max_pending: 已送入 pool（執行中或排隊中）的工作上限
+            job_timeout: 預設的工作執行時限（秒）
+            queue_timeout: 等待空位的時限（秒），0 表示滿了直接拒絕
+            executor: 指定使用的 executor（測試時可用 thread pool）
+        """
+        self.max_workers = max_workers or settings.CPU_EXECUTOR_WORKERS
+        self.max_pending = max_pending or settings.CPU_EXECUTOR_MAX_PENDING
+        self.job_timeout = settings.CPU_JOB_TIMEOUT_SECONDS if job_timeout is None else job_timeout
+        self.queue_timeout = settings.CPU_EXECUTOR_QUEUE_TIMEOUT_SECONDS if queue_timeout is None else queue_timeout
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._metrics: Dict[str, Dict[str, float]] = {}
+
+    # ==========================================
+    # 生命週期
+    # ==========================================
+
+    def start(self) -> Executor:
+        """建立 process pool（於 lifespan 啟動時呼叫；未呼叫時在第一個工作送出時建立）"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def shutdown(self) -> None:
+        """關閉 process pool，取消尚未開始的工作（於 lifespan 結束時呼叫）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # ==========================================
+    # 送出工作
+    # ==========================================
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        job: Optional[str] = None,
+        timeout: Optional[float] = None,
+        queue_timeout: Optional[float] = None
+    ) -> T:
+        """
+        在 process pool 中執行 func(*args)
+
+        Args:
+            func: 模組層級函式（需可 pickle）
+            args: 參數（需可 pickle）
+            job: 統計用的工作名稱，預設為函式名稱
+            timeout: 執行時限（秒），預設 CPU_JOB_TIMEOUT_SECONDS
+            queue_timeout: 等待空位的時限（秒），預設 CPU_EXECUTOR_QUEUE_TIMEOUT_SECONDS
+
+        Returns:
+            func 的回傳值
+
+        Raises:
+            CPUExecutorBusy: 等待空位逾時
+            CPUJobTimeout: 工作超過執行時限（尚未開始者會被取消；已在子程序執行者仍會佔用位置直到結束）
+        """
+        name = job or getattr(func, "__name__", "job")
+        metrics = self._job_metrics(name)
+        try:
+            await self._acquire(self.queue_timeout if queue_timeout is None else queue_timeout)
+        except CPUExecutorBusy:
+            metrics["rejected"] += 1
+            raise
+
+        try:
+            future: Future = self.start().submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # 工作真正結束（包含逾時後仍在執行者）才釋放位置
+        future.add_done_callback(lambda _: self._release())
+        metrics["submitted"] += 1
+
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.job_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            logger.warning(f"CPU 工作 {name} 超過執行時限")
+            raise CPUJobTimeout(f"{name} 超過執行時限")
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics["total_seconds"] += elapsed
+            metrics["max_seconds"] = max(metrics["max_seconds"], elapsed)
+        metrics["completed"] += 1
+        return result
+
+    async def _acquire(self, queue_timeout: float) -> None:
+        with self._lock:
+            if self._pending < self.max_pending and not self._waiters:
+                self._pending += 1
+                return
+            if queue_timeout <= 0:
+                raise CPUExecutorBusy("CPU 工作佇列已滿")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+
+        try:
+            # 位置由 _release 直接轉交，不需再遞增計數
+            await asyncio.wait_for(waiter, queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise CPUExecutorBusy("CPU 工作佇列已滿，請稍後再試")
+            raise
+
+    def _release(self) -> None:
+        """釋放一個位置：有等待者時轉交給最早的等待者（可能在 pool 的執行緒中呼叫）"""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.done():
+                    continue
+                try:
+                    waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+                    return
+                except RuntimeError:
+                    # 等待者的 event loop 已關閉
+                    continue
+            self._pending -= 1
+
+    def _grant(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # 等待者已逾時或取消：把位置交給下一位
+            self._release()
+        else:
+            waiter.set_result(None)
+
+    # ==========================================
+    # 統計
+    # ==========================================
+
+    def _job_metrics(self, name: str) -> Dict[str, float]:
+        metrics = self._metrics.get(name)
+        if metrics is None:
+            metrics = self._metrics.setdefault(name, {
+                "submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "rejected": 0,
+                "total_seconds": 0.0, "max_seconds": 0.0
+            })
+        return metrics
+
+    def stats(self) -> Dict:
+        """執行器狀態與各工作統計"""
+        with self._lock:
+            pending, waiting = self._pending, len(self._waiters)
+        jobs = {}
+        for name, metrics in list(self._metrics.items()):
+            finished = metrics["completed"] + metrics["failed"] + metrics["timeouts"]
+            jobs[name] = {
+                **metrics,
+                "avg_seconds": round(metrics["total_seconds"] / finished, 4) if finished else 0.0
+            }
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": pending,
+            "waiting": waiting,
+            "started": self._executor is not None,
+            "jobs": jobs
+        }
+
+
+# 全域 CPU 執行器實例
+_cpu_executor: Optional[CPUExecutor] = None
+
+
+def get_cpu_executor() -> CPUExecutor:
+    """取得共用的 CPU 執行器（單例）"""
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = CPUExecutor()
+    return _cpu_executor
@@ -0,0 +1,325 @@
+"""
+直接上傳服務
+用戶端先以上傳意圖取得簽名上傳 URL 與 Storage 路徑，把檔案直接上傳到 Supabase Storage，
+再呼叫 commit 由伺服器驗證物件（大小、格式、SHA-256）並以單次寫入建立記錄；
+檔案內容不經過 API worker（驗證雜湊時僅由伺服器端讀回，不佔用用戶端網路）
+"""
+import asyncio
+import hashlib
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Dict, List, Optional
+
+from jose import JWTError, jwt
+
+from app.services.uploads import CHUNK_SIZE, PHOTO_MIME_TYPES, SNIFF_BYTES, UploadError, run_concurrently, sniff_mime_type
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 上傳意圖 token 的類型（避免與登入 token 混用）
+INTENT_TOKEN_TYPE = "photo_upload_intent"
+
+_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_CONTENT_RANGE_PATTERN = re.compile(r"/(\d+)$")
+
+
+class DirectUploadService:
+    """直接上傳到 Storage 的意圖與確認"""
+
+    def __init__(
+        self,
+        allowed_mime_types: Collection[str] = PHOTO_MIME_TYPES,
+        max_size: Optional[int] = None,
+        max_files: Optional[int] = None,
+        intent_expires_minutes: Optional[int] = None,
+        verify_hash: Optional[bool] = None
+    ):
+        self.allowed_mime_types = set(allowed_mime_types)
+        self.max_size = max_size or settings.MAX_UPLOAD_SIZE
+        self.max_files = max_files or settings.DIRECT_UPLOAD_MAX_FILES
+        self.intent_expires_minutes = intent_expires_minutes or settings.DIRECT_UPLOAD_INTENT_EXPIRES_MINUTES
+        self.verify_hash = settings.DIRECT_UPLOAD_VERIFY_HASH if verify_hash is None else verify_hash
+
+    # ==========================================
+    # 上傳意圖
+    # ==========================================
+
+    def create_photo_intent(
+        self,
+        application_id: str,
+        photo_type: str,
+        files: List[Dict],
+        uploaded_by: Optional[str] = None
+    ) -> Dict:
+        """
+        建立照片上傳意圖：檢查宣告的檔案資訊，為每個檔案產生 Storage 路徑與簽名上傳 URL
+
+        Args:
+            application_id: 申請案件 ID
+            photo_type: 照片類型
+            files: [{"file_name", "size", "mime_type", "sha256", "description"}]
+            uploaded_by: 上傳者 ID
+
+        Returns:
+            {
+                "intent_token": 呼叫 commit 時使用,
+                "expires_at": 意圖到期時間,
+                "uploads": [{"file_name", "storage_path", "signed_url", "token"}]
+            }
+
+        Raises:
+            UploadError: 檔案數、大小、格式或雜湊格式不符
+        """
+        from app.services.storage import storage_service
+
+        if not files:
+            raise UploadError("沒有要上傳的檔案")
+        if len(files) > self.max_files:
+            raise UploadError(f"單次最多上傳 {self.max_files} 個檔案")
+
+        declared = []
+        for item in files:
+            declared.append(self._validate_declared(item))
+
+        uploads = []
+        for item in declared:
+            path = storage_service.build_damage_photo_path(application_id, item["name"], photo_type)
+            signed = storage_service.create_signed_upload_url(storage_service.documents_bucket, path)
+            item["path"] = path
+            uploads.append({
+                "file_name": item["name"],
+                "storage_path": path,
+                "signed_url": signed["signed_url"],
+                "token": signed["token"]
+            })
+
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=self.intent_expires_minutes)
+        claims = {
+            "typ": INTENT_TOKEN_TYPE,
+            "application_id": application_id,
+            "photo_type": photo_type,
+            "uploaded_by": uploaded_by,
+            "files": declared,
+            "exp": expires_at
+        }
+        return {
+            "intent_token": jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM),
+            "expires_at": expires_at.isoformat(),
+            "uploads": uploads
+        }
+
+    def _validate_declared(self, item: Dict) -> Dict:
+        name = item.get("file_name") or "upload"
+        size = item.get("size")
+        mime_type = item.get("mime_type")
+        sha256 = (item.get("sha256") or "").lower()
+
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError(f"{name}: 檔案大小不正確")
+        if size > self.max_size:
+            raise UploadError(f"{name}: 檔案大小不能超過 {self.max_size // 1024 // 1024}MB", status_code=413)
+        if mime_type not in self.allowed_mime_types:
+            raise UploadError(f"{name}: 不支援的檔案格式（{mime_type}）", status_code=415)
+        if not _SHA256_PATTERN.match(sha256):
+            raise UploadError(f"{name}: sha256 必須是 64 位十六進位字串")
+
+        return {
+            "name": name,
+            "size": size,
+            "mime_type": mime_type,
+            "sha256": sha256,
+            "description": item.get("description")
+        }
+
+    def decode_intent(self, intent_token: str) -> Dict:
+        """
+        驗證並解開上傳意圖
+
+        Raises:
+            UploadError: token 無效或已過期（401）
+        """
+        try:
+            claims = jwt.decode(intent_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            raise UploadError("上傳意圖無效或已過期，請重新取得上傳網址", status_code=401)
+        if claims.get("typ") != INTENT_TOKEN_TYPE:
+            raise UploadError("上傳意圖無效或已過期，請重新取得上傳網址", status_code=401)
+        return claims
+
+    # ==========================================
+    # 確認上傳
+    # ==========================================
+
+    def verify_object(self, item: Dict) -> None:
+        """
+        驗證已上傳的物件與意圖宣告一致
+
+        Args:
+            item: 意圖中的檔案資訊（path、size、mime_type、sha256）
+
+        Raises:
+            UploadError: 物件不存在（404）、大小不符（422）、格式不符（415）或雜湊不符（422）
+        """
+        from app.services.storage import storage_service
+
+        bucket = storage_service.documents_bucket
+        byte_range = None if self.verify_hash else f"bytes=0-{SNIFF_BYTES - 1}"
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        try:
+            with storage_service.open_object_stream(bucket, item["path"], CHUNK_SIZE, byte_range) as (headers, chunks):
+                for chunk in chunks:
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                    size += len(chunk)
+                    if self.verify_hash:
+                        if size > item["size"]:
+                            raise UploadError("檔案大小與宣告不符", status_code=422)
+                        digest.update(chunk)
+                    elif len(head) >= SNIFF_BYTES:
+                        break
+                if not self.verify_hash:
+                    # 只取開頭位元組時，由 Content-Range 取得物件總大小
+                    match = _CONTENT_RANGE_PATTERN.search(headers.get("content-range", ""))
+                    size = int(match.group(1)) if match else int(headers.get("content-length", size))
+        except FileNotFoundError:
+            raise UploadError("找不到已上傳的檔案，請先完成上傳", status_code=404)
+
+        if size != item["size"]:
+            raise UploadError("檔案大小與宣告不符", status_code=422)
+        if sniff_mime_type(head, item["mime_type"]) != item["mime_type"]:
+            raise UploadError("檔案內容與宣告的格式不符", status_code=415)
+        if self.verify_hash and digest.hexdigest() != item["sha256"]:
+            raise UploadError("檔案 SHA-256 與宣告不符", status_code=422)
+
+    async def commit_photos(self, intent_token: str) -> Dict:
+        """
+        確認照片上傳：並行驗證所有物件，以單次寫入建立照片記錄並批次產生簽名 URL
+
+        重複呼叫時已建立的記錄直接回傳（不會重複寫入）；驗證失敗的物件會從 Storage 刪除；
+        已有相同內容的照片物件時改為引用共用物件，記錄建立後刪除重複上傳的檔案。
+        未驗證雜湊（DIRECT_UPLOAD_VERIFY_HASH=false）時不參與內容定址，上傳的檔案即為照片物件
+
+        Args:
+            intent_token: create_photo_intent 回傳的 token
+
+        Returns:
+            {
+                "uploaded": 照片記錄（含 signed_url）,
+                "errors": ["檔名: 錯誤訊息"],
+                "results": [{"file_name", "success", "id", "error"}]（依意圖順序）
+            }
+
+        Raises:
+            UploadError: 意圖無效或已過期
+        """
+        from app.models.database import db_service
+        from app.services.photo_objects import get_photo_object_service
+        from app.services.signed_urls import get_signed_url_service
+        from app.services.storage import PHOTO_SIGNED_URL_EXPIRES_IN, storage_service
+
+        photo_objects = get_photo_object_service()
+        claims = self.decode_intent(intent_token)
+        files = claims["files"]
+        bucket = storage_service.documents_bucket
+        paths = [item["path"] for item in files]
+
+        # 以上傳路徑（upload_ref）辨識已建立的記錄
+        committed = {
+            row["upload_ref"]: row
+            for row in await asyncio.to_thread(db_service.get_photos_by_upload_refs, paths)
+        }
+        pending = [item for item in files if item["path"] not in committed]
+
+        async def verify(item):
+            await asyncio.to_thread(self.verify_object, item)
+            if not self.verify_hash:
+                # 未驗證的宣告雜湊不能作為內容定址的 key（否則可冒用其他照片的雜湊），保留為獨立物件
+                return item["path"], None
+            return await asyncio.to_thread(
+                photo_objects.adopt, item["sha256"], item["path"], item["size"], item["mime_type"]
+            )
+
+        outcomes = dict(zip(
+            [item["path"] for item in pending],
+            await run_concurrently(pending, verify, settings.UPLOAD_CONCURRENCY)
+        ))
+
+        rejected = [path for path, (_, error) in outcomes.items() if isinstance(error, UploadError) and error.status_code != 404]
+        if rejected:
+            # 與宣告不符的物件不保留，用戶端需重新取得上傳網址
+            await asyncio.to_thread(storage_service.remove_files, bucket, rejected)
+
+        rows = [
+            {
+                "application_id": claims["application_id"],
+                "photo_type": claims["photo_type"],
+                "storage_path": outcomes[item["path"]][0][0],
+                "upload_ref": item["path"],
+                "file_name": item["name"],
+                "file_size": item["size"],
+                "mime_type": item["mime_type"],
+                "content_sha256": item["sha256"] if self.verify_hash else None,
+                "description": item.get("description"),
+                "uploaded_by": claims.get("uploaded_by")
+            }
+            for item in pending if outcomes[item["path"]][1] is None
+        ]
+
+        insert_error = None
+        if rows:
+            try:
+                for record in await asyncio.to_thread(db_service.create_damage_photos, rows):
+                    committed[record["upload_ref"]] = record
+            except Exception as e:
+                # 釋放引用，上傳的檔案保留在 Storage，意圖有效期內可再次 commit
+                logger.error(f"直接上傳建立照片記錄失敗: {e}")
+                insert_error = f"建立記錄失敗: {e}"
+                await asyncio.to_thread(photo_objects.release_photos, rows)
+            else:
+                redundant = [outcomes[row["upload_ref"]][0][1] for row in rows]
+                redundant = [path for path in redundant if path]
+                if redundant:
+                    await asyncio.to_thread(storage_service.remove_files, bucket, redundant)
+
+        uploaded = [committed[path] for path in paths if path in committed]
+        if uploaded:
+            urls = await asyncio.to_thread(
+                get_signed_url_service().sign_many, bucket,
+                [record["storage_path"] for record in uploaded], PHOTO_SIGNED_URL_EXPIRES_IN
+            )
+            for record in uploaded:
+                record["signed_url"] = urls.get(record["storage_path"])
+
+        results = []
+        for item in files:
+            record = committed.get(item["path"])
+            error = outcomes.get(item["path"], (None, None))[1]
+            if record is None and error is None:
+                error = insert_error
+            results.append({
+                "file_name": item["name"],
+                "success": record is not None,
+                "id": record.get("id") if record else None,
+                "error": str(error) if record is None and error else None
+            })
+
+        errors = [f"{r['file_name']}: {r['error']}" for r in results if not r["success"]]
+        return {"uploaded": uploaded, "errors": errors, "results": results}
+
+
+# 全域直接上傳服務實例
+_direct_upload_service: Optional[DirectUploadService] = None
+
+
+def get_direct_upload_service() -> DirectUploadService:
+    """取得直接上傳服務（單例）"""
+    global _direct_upload_service
+    if _direct_upload_service is None:
+        _direct_upload_service = DirectUploadService()
+    return _direct_upload_service
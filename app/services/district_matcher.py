@@ -0,0 +1,312 @@
+"""
+地址自動配對區域服務
+以 Aho-Corasick 自動機一次掃描地址中出現的縣市、行政區與里名稱，
+在申請送出時離線指派 district_id；無法判定時改用地理編碼的座標（里界圖層）或地址元件比對
+"""
+import logging
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 名稱層級
+LEVEL_CITY = "city"
+LEVEL_DISTRICT = "district"
+LEVEL_VILLAGE = "village"
+
+
+def normalize_address(text: Optional[str]) -> str:
+    """
+    正規化地址字串：全形轉半形、「臺」統一為「台」、移除空白
+
+    Args:
+        text: 原始地址
+
+    Returns:
+        正規化後的字串
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    return "".join(text.replace("臺", "台").split())
+
+
+class AhoCorasick:
+    """多樣式字串比對自動機"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        """
+        建立自動機
+
+        Args:
+            patterns: (樣式字串, 附帶資料) 列表，同一樣式可對應多筆資料
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, object]]] = [[]]
+
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append((pattern, payload))
+
+        # 以 BFS 建立失敗連結，並合併後綴節點的輸出
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def search(self, text: str) -> List[Tuple[int, str, object]]:
+        """
+        掃描字串
+
+        Returns:
+            [(結束位置, 樣式字串, 附帶資料), ...]
+        """
+        matches = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern, payload in self._output[node]:
+                matches.append((position, pattern, payload))
+        return matches
+
+
+class DistrictMatcher:
+    """依地址配對 districts 資料表中的區域"""
+
+    def __init__(self, districts: Iterable[Dict]):
+        """
+        Args:
+            districts: 區域列表，需包含 id、city、district，可選 village
+        """
+        self.districts: List[Dict] = []
+        patterns = []
+        for row in districts:
+            if not row.get("id") or not row.get("district"):
+                continue
+            entry = {
+                "id": str(row["id"]),
+                "city": normalize_address(row.get("city")),
+                "district": normalize_address(row.get("district")),
+                "village": normalize_address(row.get("village")) or None
+            }
+            self.districts.append(entry)
+
+        names = {
+            LEVEL_CITY: {d["city"] for d in self.districts if d["city"]},
+            LEVEL_DISTRICT: {d["district"] for d in self.districts},
+            LEVEL_VILLAGE: {d["village"] for d in self.districts if d["village"]},
+        }
+        for level, values in names.items():
+            patterns.extend((name, level) for name in values)
+        self._automaton = AhoCorasick(patterns)
+
+        # (行政區, 里) → 區域，里為 None 表示行政區層級的區域
+        self._by_name: Dict[Tuple[str, Optional[str]], List[Dict]] = {}
+        for entry in self.districts:
+            self._by_name.setdefault((entry["district"], entry["village"]), []).append(entry)
+
+    def match(self, address: Optional[str]) -> Optional[str]:
+        """
+        以地址配對區域
+
+        規則：地址中須出現行政區名稱；若同時出現該行政區下的里名稱則配對到里，
+        否則配對到行政區層級的區域。地址含縣市名稱時會排除其他縣市的同名行政區。
+
+        Args:
+            address: 地址字串
+
+        Returns:
+            district_id，無法唯一判定時回傳 None
+        """
+        text = normalize_address(address)
+        if not text:
+            return None
+
+        found = {LEVEL_CITY: set(), LEVEL_DISTRICT: set(), LEVEL_VILLAGE: set()}
+        for _, name, level in self._automaton.search(text):
+            found[level].add(name)
+
+        return self._resolve(found[LEVEL_CITY], found[LEVEL_DISTRICT], found[LEVEL_VILLAGE])
+
+    def match_components(self, city: str = "", district: str = "", village: str = "") -> Optional[str]:
+        """以地理編碼拆解出的縣市、行政區、里配對區域"""
+        city, district, village = (normalize_address(v) for v in (city, district, village))
+        return self._resolve(
+            {city} if city else set(),
+            {district} if district else set(),
+            {village} if village else set()
+        )
+
+    def _resolve(self, cities: set, districts: set, villages: set) -> Optional[str]:
+        if not districts:
+            # 沒有行政區時，僅在里名稱於指定縣市內唯一時配對
+            candidates = [
+                d for d in self.districts
+                if d["village"] in villages and (not cities or d["city"] in cities)
+            ]
+            return candidates[0]["id"] if len(candidates) == 1 else None
+
+        for village in villages:
+            candidates = [
+                entry
+                for district in districts
+                for entry in self._by_name.get((district, village), [])
+                if not cities or entry["city"] in cities
+            ]
+            if len(candidates) == 1:
+                return candidates[0]["id"]
+
+        candidates = [
+            entry
+            for district in districts
+            for entry in self._by_name.get((district, None), [])
+            if not cities or entry["city"] in cities
+        ]
+        return candidates[0]["id"] if len(candidates) == 1 else None
+
+
+class DistrictAssignmentService:
+    """申請案件區域指派服務"""
+
+    def __init__(self, refresh_seconds: float = 600):
+        """
+        Args:
+            refresh_seconds: 區域資料重新載入間隔（秒）
+        """
+        self.refresh_seconds = refresh_seconds
+        self._matcher: Optional[DistrictMatcher] = None
+        self._polygon_districts: List[Optional[str]] = []
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_matcher(self) -> DistrictMatcher:
+        """取得（必要時重新建立）區域配對器"""
+        with self._lock:
+            if self._matcher is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+                from app.models.database import db_service
+                self._matcher = DistrictMatcher(db_service.get_active_districts())
+                self._polygon_districts = self._bind_boundaries(self._matcher)
+                self._loaded_at = time.monotonic()
+            return self._matcher
+
+    @staticmethod
+    def _bind_boundaries(matcher: DistrictMatcher) -> List[Optional[str]]:
+        """將里界圖層的每個多邊形對應到 district_id"""
+        from app.services.village_boundaries import get_village_boundary_layer
+        layer = get_village_boundary_layer()
+        if layer is None:
+            return []
+        return [
+            names.get("district_id") or matcher.match_components(
+                names.get("city") or "", names.get("district") or "", names.get("village") or ""
+            )
+            for names in layer.names
+        ]
+
+    def match_coordinates(self, latitude: float, longitude: float) -> Optional[str]:
+        """以座標透過里界圖層判定區域；未設定圖層時回傳 None"""
+        return self.match_coordinates_many([latitude], [longitude])[0]
+
+    def match_coordinates_many(self, latitudes: Sequence[float], longitudes: Sequence[float]) -> List[Optional[str]]:
+        """批次以座標判定區域（回填大量案件用）"""
+        from app.services.village_boundaries import get_village_boundary_layer
+        self.get_matcher()
+        layer = get_village_boundary_layer()
+        if layer is None or not self._polygon_districts:
+            return [None] * len(latitudes)
+        if len(latitudes) == 1:
+            polygons = [layer.locate(latitudes[0], longitudes[0])]
+        else:
+            polygons = layer.locate_many(latitudes, longitudes).tolist()
+        return [self._polygon_districts[p] if p >= 0 else None for p in polygons]
+
+    def invalidate(self) -> None:
+        """區域資料異動後呼叫，下次配對時重新載入"""
+        with self._lock:
+            self._matcher = None
+
+    def match_offline(self, *addresses: Optional[str]) -> Optional[str]:
+        """依序以多個地址離線配對，回傳第一個配對成功的 district_id"""
+        matcher = self.get_matcher()
+        for address in addresses:
+            district_id = matcher.match(address)
+            if district_id:
+                return district_id
+        return None
+
+    async def assign(self, *addresses: Optional[str]) -> Dict:
+        """
+        為申請案件指派區域，離線配對失敗時以地理編碼結果配對
+
+        Args:
+            addresses: 依優先順序排列的地址（例如災損地點、聯絡地址）
+
+        Returns:
+            {
+                "district_id": str | None,
+                "method": "offline" | "boundary" | "geocode" | None,
+                "geocode": 地理編碼結果（有呼叫時）
+            }
+        """
+        district_id = self.match_offline(*addresses)
+        if district_id:
+            return {"district_id": district_id, "method": "offline", "geocode": None}
+
+        address = next((a for a in addresses if a), None)
+        if not address:
+            return {"district_id": None, "method": None, "geocode": None}
+
+        from app.services.google_maps import get_google_maps_service
+        maps_service = get_google_maps_service()
+        geocode = await maps_service.geocode_address(address)
+        if not geocode.get("success"):
+            return {"district_id": None, "method": None, "geocode": geocode}
+
+        district_id = self.match_coordinates(geocode["latitude"], geocode["longitude"])
+        if district_id:
+            return {"district_id": district_id, "method": "boundary", "geocode": geocode}
+
+        parsed = maps_service.parse_address_components(geocode.get("address_components", []))
+        district_id = self.get_matcher().match_components(
+            parsed.get("city", ""), parsed.get("district", ""), parsed.get("village", "")
+        )
+        return {
+            "district_id": district_id,
+            "method": "geocode" if district_id else None,
+            "geocode": geocode
+        }
+
+
+# 全域服務實例
+_district_assignment_service: Optional[DistrictAssignmentService] = None
+
+
+def get_district_assignment_service() -> DistrictAssignmentService:
+    """取得區域指派服務實例"""
+    global _district_assignment_service
+    if _district_assignment_service is None:
+        _district_assignment_service = DistrictAssignmentService()
+    return _district_assignment_service
@@ -0,0 +1,185 @@
+"""
+證明文件預覽服務
+DOCX 文件轉成 PDF 預覽：轉換在 process pool 中執行，結果以「文件 ID + 內容雜湊」為 key
+存放在原始檔旁（previews/），之後的預覽直接串流已轉換的 PDF；
+上傳 DOCX 後在背景預先轉換，第一次預覽也不必等待
+"""
+import asyncio
+import hashlib
+import io
+import logging
+from typing import Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape
+
+from app.services.cpu_executor import CPUExecutor, CPUExecutorBusy, get_cpu_executor
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# 轉換方式變更時調整版本，舊的預覽檔不再被使用
+PREVIEW_VERSION = 1
+
+
+def convert_docx_to_pdf(data: bytes) -> bytes:
+    """
+    將 DOCX 轉成 PDF（於子程序中執行，必須是模組層級函式）
+
+    Args:
+        data: DOCX 檔案內容
+
+    Returns:
+        PDF 內容
+
+    Raises:
+        ImportError: 未安裝 python-docx 或 reportlab
+    """
+    from docx import Document
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    # 內建的繁體中文 CID 字型，不需要字型檔
+    pdfmetrics.registerFont(UnicodeCIDFont("MSung-Light"))
+    style = ParagraphStyle("Preview", parent=getSampleStyleSheet()["Normal"], fontName="MSung-Light", leading=16)
+
+    doc = Document(io.BytesIO(data))
+    story = []
+    for para in doc.paragraphs:
+        if para.text.strip():
+            # Paragraph 會解析標記，文字需先跳脫
+            story.append(Paragraph(escape(para.text), style))
+            story.append(Spacer(1, 0.2 * inch))
+
+    pdf_buffer = io.BytesIO()
+    SimpleDocTemplate(pdf_buffer, pagesize=A4).build(story)
+    return pdf_buffer.getvalue()
+
+
+def preview_path(document: Dict, content_sha256: str) -> str:
+    """預覽 PDF 的 Storage 路徑（與原始檔相同資料夾，以文件 ID 與內容雜湊區分）"""
+    folder = document["storage_path"].rsplit("/", 1)[0] if "/" in document["storage_path"] else ""
+    name = f"{document['id']}_{content_sha256[:16]}_v{PREVIEW_VERSION}.pdf"
+    return f"{folder}/previews/{name}" if folder else f"previews/{name}"
+
+
+def needs_conversion(document: Dict) -> bool:
+    return document.get("mime_type") == DOCX_MIME_TYPE
+
+
+class DocumentPreviewService:
+    """DOCX 預覽轉換與快取"""
+
+    def __init__(self, cpu: Optional[CPUExecutor] = None):
+        self._cpu = cpu
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._failed: set = set()
+
+    @property
+    def cpu(self) -> CPUExecutor:
+        """轉換使用的 CPU 執行器（預設為共用執行器）"""
+        return self._cpu or get_cpu_executor()
+
+    def cached_path(self, document: Dict) -> Optional[str]:
+        """已知內容雜湊時回傳預覽 PDF 的路徑（檔案不一定存在）"""
+        sha256 = document.get("content_sha256")
+        return preview_path(document, sha256) if sha256 else None
+
+    async def ensure_preview(self, document: Dict) -> str:
+        """
+        產生文件的預覽 PDF（同一文件同時只轉換一次）
+
+        Args:
+            document: 文件記錄（需含 id、storage_path）
+
+        Returns:
+            預覽 PDF 的 Storage 路徑
+
+        Raises:
+            ImportError: 未安裝轉換套件
+        """
+        document_id = document["id"]
+        task = self._inflight.get(document_id)
+        if task is None:
+            task = asyncio.create_task(self._convert(document))
+            self._inflight[document_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(document_id, None))
+        # 請求中斷時不取消轉換，背景完成後仍會寫入快取
+        return await asyncio.shield(task)
+
+    async def _convert(self, document: Dict) -> str:
+        from app.models.database import db_service
+        from app.services.storage import storage_service
+
+        data = await asyncio.to_thread(storage_service.download_document, document["storage_path"])
+        if not data:
+            raise FileNotFoundError(document["storage_path"])
+
+        sha256 = document.get("content_sha256")
+        if not sha256:
+            # 加入檢查碼前上傳的文件：補上內容雜湊
+            sha256 = hashlib.sha256(data).hexdigest()
+            await asyncio.to_thread(db_service.update_document, document["id"], {"content_sha256": sha256})
+            document["content_sha256"] = sha256
+
+        pdf = await self.cpu.run(convert_docx_to_pdf, data, job="docx_preview")
+
+        path = preview_path(document, sha256)
+        await asyncio.to_thread(
+            storage_service.upload_file, storage_service.documents_bucket, path, pdf, "application/pdf"
+        )
+        return path
+
+    def schedule(self, documents: Iterable[Dict]) -> List[asyncio.Task]:
+        """
+        在背景為新上傳的 DOCX 文件預先轉換預覽
+
+        Args:
+            documents: 文件記錄
+
+        Returns:
+            新建立的背景工作
+        """
+        tasks = []
+        for document in documents:
+            if not needs_conversion(document) or document["id"] in self._inflight or document["id"] in self._failed:
+                continue
+            task = asyncio.create_task(self._preconvert(document))
+            tasks.append(task)
+        return tasks
+
+    async def _preconvert(self, document: Dict) -> None:
+        try:
+            await self.ensure_preview(document)
+        except CPUExecutorBusy:
+            # 系統忙碌時略過，第一次預覽時再轉換
+            logger.info(f"文件 {document['id']} 預先轉換預覽略過（CPU 工作佇列已滿）")
+        except Exception as e:
+            logger.warning(f"文件 {document['id']} 預先轉換預覽失敗: {e}")
+            self._failed.add(document["id"])
+
+    def discard(self, document: Dict) -> None:
+        """刪除文件的預覽 PDF（文件刪除時呼叫）"""
+        from app.services.storage import storage_service
+
+        path = self.cached_path(document)
+        if path and needs_conversion(document):
+            storage_service.remove_files(storage_service.documents_bucket, [path])
+
+
+# 全域文件預覽服務實例
+_document_preview_service: Optional[DocumentPreviewService] = None
+
+
+def get_document_preview_service() -> DocumentPreviewService:
+    """取得文件預覽服務（單例）"""
+    global _document_preview_service
+    if _document_preview_service is None:
+        _document_preview_service = DocumentPreviewService()
+    return _document_preview_service
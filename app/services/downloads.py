@@ -0,0 +1,167 @@
+"""
+Storage 物件的串流下載
+以固定大小的區塊轉送 Storage 物件（每個下載佔用的記憶體固定），支援 Range / If-Range（206）、
+ETag / Last-Modified 與條件式請求（304）。已知內容 SHA-256 時以雜湊作為 ETag，
+重複瀏覽的 304 直接由 API 判斷，不必向 Storage 發出請求；本機 Storage 後端直接回應檔案
+"""
+import asyncio
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Union
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# 轉送區塊大小
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# 物件路徑不重複使用（內容變更會產生新路徑），瀏覽器可快取一段時間再重新驗證
+DOWNLOAD_CACHE_CONTROL = "private, max-age=3600"
+
+# 沿用 Storage 回應的標頭
+_PASSTHROUGH_HEADERS = ("content-length", "content-range")
+
+
+def content_etag(sha256: Optional[str], variant: Optional[str] = None) -> Optional[str]:
+    """以內容雜湊組成強 ETag（同一內容的不同衍生檔以 variant 區分）"""
+    if not sha256:
+        return None
+    return f'"{sha256}-{variant}"' if variant else f'"{sha256}"'
+
+
+def _http_date(value: Union[str, datetime, None]) -> Optional[str]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _if_none_match(header: str, etag: str) -> bool:
+    """If-None-Match 以弱比較判斷是否符合"""
+    candidates = [tag.strip() for tag in header.split(",")]
+    if "*" in candidates:
+        return True
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+def _if_range_matches(if_range: str, etag: str, last_modified: Optional[str]) -> bool:
+    """If-Range 為 ETag（強比較）或 HTTP 日期（需與 Last-Modified 完全相同）"""
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return bool(last_modified) and if_range == last_modified
+
+
+def _not_modified_since(header: str, last_modified: str) -> bool:
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+
+async def stream_storage_object(
+    request: Request,
+    bucket: str,
+    path: str,
+    media_type: str,
+    content_disposition: str,
+    etag: Optional[str] = None,
+    last_modified: Union[str, datetime, None] = None,
+    cache_control: str = DOWNLOAD_CACHE_CONTROL
+) -> Response:
+    """
+    轉送 Storage 物件，處理 Range 與條件式請求
+
+    Args:
+        request: 用戶端請求（讀取 Range、If-Range、If-None-Match、If-Modified-Since）
+        bucket: Bucket 名稱
+        path: Storage 路徑
+        media_type: 回應的 Content-Type
+        content_disposition: Content-Disposition 標頭
+        etag: 已知的 ETag（通常由 content_etag 產生），未提供時沿用 Storage 的 ETag
+        last_modified: 已知的最後修改時間，未提供時沿用 Storage 的 Last-Modified
+        cache_control: Cache-Control 標頭
+
+    Returns:
+        200 / 206 串流回應，或 304 / 416 回應
+
+    Raises:
+        FileNotFoundError: 物件不存在
+    """
+    from app.services.storage import storage_service
+
+    local_file = None
+    if hasattr(storage_service, "local_path"):
+        # 本機後端：以檔案資訊補上 ETag / Last-Modified，條件式請求一律在本地判斷
+        from app.services.local_storage import stat_etag
+
+        local_file = storage_service.local_path(bucket, path)
+        stat = await asyncio.to_thread(local_file.stat)
+        etag = etag or stat_etag(stat)
+        last_modified = last_modified or datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+
+    last_modified = _http_date(last_modified)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    byte_range = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+
+    upstream = {}
+    if etag:
+        # 已知 ETag：條件式請求在本地判斷，不需要向 Storage 發出請求
+        if if_none_match:
+            if _if_none_match(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+        elif if_modified_since and last_modified and _not_modified_since(if_modified_since, last_modified):
+            return Response(status_code=304, headers=headers)
+        if byte_range and if_range and not _if_range_matches(if_range, etag, last_modified):
+            # 內容已變更：忽略 Range，回傳完整內容
+            byte_range = None
+    else:
+        # 未知 ETag：由 Storage 判斷條件式請求
+        for name, value in (("If-None-Match", if_none_match), ("If-Modified-Since", if_modified_since),
+                            ("If-Range", if_range)):
+            if value:
+                upstream[name] = value
+
+    if local_file is not None:
+        from app.services.local_storage import file_response
+
+        headers["Content-Disposition"] = content_disposition
+        return file_response(
+            local_file, stat, byte_range, headers, media_type, storage_service.accel_redirect_path(bucket, path)
+        )
+
+    if byte_range:
+        upstream["Range"] = byte_range
+
+    status_code, storage_headers, chunks = await asyncio.to_thread(
+        storage_service.stream_object, bucket, path, DOWNLOAD_CHUNK_SIZE, upstream
+    )
+    if not etag and storage_headers.get("etag"):
+        headers["ETag"] = storage_headers["etag"]
+    if not last_modified and storage_headers.get("last-modified"):
+        headers["Last-Modified"] = storage_headers["last-modified"]
+
+    if status_code in (304, 416):
+        chunks.close()
+        if status_code == 416 and storage_headers.get("content-range"):
+            headers["Content-Range"] = storage_headers["content-range"]
+        return Response(status_code=status_code, headers=headers)
+
+    for name in _PASSTHROUGH_HEADERS:
+        if storage_headers.get(name):
+            headers[name.title()] = storage_headers[name]
+    headers["Content-Disposition"] = content_disposition
+    return StreamingResponse(chunks, status_code=status_code, media_type=media_type, headers=headers)
@@ -0,0 +1,332 @@
+"""
+證據打包下載服務
+將案件（或整個區域）的災損照片與證明文件即時打包成 ZIP 串流給用戶端：
+同時從 Storage 預先讀取少數幾個檔案（每個檔案只緩衝固定數量的區塊），依到達順序寫入 ZIP；
+已壓縮的格式（圖片、PDF、Office Open XML）以 stored 模式寫入，其餘以 deflate 壓縮。
+整個封存檔不會完整放在記憶體或磁碟上，讀取失敗的檔案記錄在 manifest.csv 而不中斷下載
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import logging
+import posixpath
+import zipfile
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Union
+
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 每次從 Storage 讀取的區塊大小
+ARCHIVE_CHUNK_SIZE = 256 * 1024
+
+# 每個預先讀取中的檔案最多緩衝的區塊數
+ARCHIVE_BUFFERED_CHUNKS = 4
+
+MANIFEST_NAME = "manifest.csv"
+
+# 內容本身已壓縮，再壓縮只會浪費 CPU 的格式
+_STORED_MIME_TYPES = {
+    "application/pdf",
+    "application/zip",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# ZIP 內的時間為當地時間（台灣）
+_ARCHIVE_TZ = timezone(timedelta(hours=8))
+
+# 結束排程的標記
+_END = object()
+
+
+def compress_type_for(mime_type: Optional[str]) -> int:
+    """依 MIME 類型決定壓縮方式（已壓縮格式使用 stored）"""
+    if mime_type and (mime_type.startswith(("image/", "video/")) or mime_type in _STORED_MIME_TYPES):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _zip_date_time(value: Union[str, datetime, None]) -> tuple:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            value = None
+    if not isinstance(value, datetime):
+        value = datetime.now(timezone.utc)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(_ARCHIVE_TZ)
+    # ZIP 只能記錄 1980 年以後的時間
+    return max(value.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _safe_name(value: Optional[str], default: str) -> str:
+    name = posixpath.basename((value or "").replace("\\", "/")).strip()
+    return name or default
+
+
+class _ZipSink:
+    """ZipFile 的輸出目標：收集寫入的位元組，由串流端取出後清空"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class EvidenceArchive:
+    """
+    以串流方式產生 ZIP
+
+    entries 為 {"name", "bucket", "path", "mime_type", "size", "sha256", "modified"} 字典，
+    可以是一般或非同步迭代器（依需要逐頁查詢資料庫，不必一次取得所有記錄）
+    """
+
+    def __init__(self, entries: Union[Iterable[Dict], AsyncIterator[Dict]], prefetch: Optional[int] = None):
+        self.entries = entries
+        self.prefetch = max(1, prefetch or settings.EVIDENCE_ARCHIVE_PREFETCH)
+        self._names: set = set()
+
+    def _unique_name(self, name: str) -> str:
+        """同一封存檔內檔名重複時加上序號"""
+        candidate = name
+        stem, ext = posixpath.splitext(name)
+        counter = 2
+        while candidate in self._names or candidate == MANIFEST_NAME:
+            candidate = f"{stem} ({counter}){ext}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    async def _iter_entries(self) -> AsyncIterator[Dict]:
+        if hasattr(self.entries, "__aiter__"):
+            async for entry in self.entries:
+                yield entry
+        else:
+            for entry in self.entries:
+                yield entry
+
+    async def _fetch(self, entry: Dict, ready: asyncio.Queue, slots: asyncio.Semaphore) -> None:
+        """開啟 Storage 物件，把區塊放進該檔案的緩衝佇列（緩衝滿時暫停讀取）"""
+        from app.services.storage import storage_service
+
+        body = None
+        try:
+            try:
+                _, _, body = await asyncio.to_thread(
+                    storage_service.stream_object, entry["bucket"], entry["path"], ARCHIVE_CHUNK_SIZE
+                )
+            except Exception as e:
+                await ready.put((entry, None, e))
+                return
+
+            chunks: asyncio.Queue = asyncio.Queue(maxsize=ARCHIVE_BUFFERED_CHUNKS)
+            await ready.put((entry, chunks, None))
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(next, body, None)
+                    if chunk is None:
+                        break
+                    await chunks.put(chunk)
+            except Exception as e:
+                await chunks.put(e)
+            else:
+                await chunks.put(None)
+        finally:
+            if body is not None:
+                body.close()
+            slots.release()
+
+    async def _schedule(self, ready: asyncio.Queue, slots: asyncio.Semaphore, tasks: set) -> None:
+        """依序為每個項目啟動讀取工作，同時進行的讀取數不超過 prefetch"""
+        count = 0
+        try:
+            async for entry in self._iter_entries():
+                await slots.acquire()
+                task = asyncio.create_task(self._fetch(entry, ready, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                count += 1
+        except Exception as e:
+            await ready.put((_END, count, e))
+        else:
+            await ready.put((_END, count, None))
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """
+        產生 ZIP 串流
+
+        Yields:
+            ZIP 位元組區塊
+        """
+        sink = _ZipSink()
+        archive = zipfile.ZipFile(sink, mode="w", allowZip64=True)
+        ready: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(self.prefetch)
+        tasks: set = set()
+        manifest: List[Dict] = []
+        scheduler = asyncio.create_task(self._schedule(ready, slots, tasks))
+
+        try:
+            written = 0
+            total = None
+            while total is None or written < total:
+                entry, chunks, error = await ready.get()
+                if entry is _END:
+                    if error is not None:
+                        raise error
+                    total = chunks
+                    continue
+                written += 1
+
+                name = self._unique_name(entry["name"])
+                row = {"name": name, "size": 0, "sha256": "", "status": "ok"}
+                manifest.append(row)
+                if error is not None:
+                    logger.warning(f"打包證據時讀取 {entry['path']} 失敗: {error}")
+                    row["status"] = "missing" if isinstance(error, FileNotFoundError) else f"error: {error}"
+                    continue
+
+                info = zipfile.ZipInfo(name, date_time=_zip_date_time(entry.get("modified")))
+                info.compress_type = compress_type_for(entry.get("mime_type"))
+                # 預先宣告大小，超過 4GB 的檔案才會使用 ZIP64 欄位
+                info.file_size = entry.get("size") or 0
+                digest = hashlib.sha256()
+                with archive.open(info, mode="w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as target:
+                    while True:
+                        chunk = await chunks.get()
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            # 已寫入的部分無法收回：保留截斷的檔案並在 manifest 註明
+                            row["status"] = f"truncated: {chunk}"
+                            break
+                        target.write(chunk)
+                        digest.update(chunk)
+                        row["size"] += len(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+
+                row["sha256"] = digest.hexdigest()
+                if row["status"] == "ok" and entry.get("sha256") and entry["sha256"] != row["sha256"]:
+                    row["status"] = "checksum_mismatch"
+                data = sink.drain()
+                if data:
+                    yield data
+
+            archive.writestr(
+                zipfile.ZipInfo(MANIFEST_NAME, date_time=_zip_date_time(None)),
+                self._manifest_csv(manifest),
+                compress_type=zipfile.ZIP_DEFLATED
+            )
+            archive.close()
+            yield sink.drain()
+        finally:
+            # 用戶端中斷或發生錯誤時停止所有讀取並關閉 Storage 連線
+            scheduler.cancel()
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(scheduler, *tasks, return_exceptions=True)
+
+    @staticmethod
+    def _manifest_csv(rows: List[Dict]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=["name", "size", "sha256", "status"])
+        writer.writeheader()
+        writer.writerows(rows)
+        # 加上 BOM，Excel 才會以 UTF-8 開啟中文檔名
+        return buffer.getvalue().encode("utf-8-sig")
+
+
+# ==========================================
+# 封存項目
+# ==========================================
+
+def application_entries(application: Dict, photos: Iterable[Dict], documents: Iterable[Dict]) -> List[Dict]:
+    """
+    案件的封存項目（以案件編號為資料夾）
+
+    Args:
+        application: 案件記錄（需含 id，case_no 可選）
+        photos: 災損照片記錄
+        documents: 證明文件記錄
+
+    Returns:
+        封存項目
+    """
+    from app.services.storage import storage_service
+
+    folder = _safe_name(application.get("case_no"), application["id"])
+    entries = []
+    for photo in photos:
+        entries.append({
+            "name": f"{folder}/photos/{photo.get('photo_type') or 'photo'}_{_safe_name(photo.get('file_name'), photo['id'])}",
+            "bucket": storage_service.bucket_for_photo_path(photo["storage_path"]),
+            "path": photo["storage_path"],
+            "mime_type": photo.get("mime_type"),
+            "size": photo.get("file_size"),
+            "sha256": photo.get("content_sha256"),
+            "modified": photo.get("created_at")
+        })
+    for document in documents:
+        entries.append({
+            "name": f"{folder}/documents/{document.get('document_type') or 'document'}_{_safe_name(document.get('file_name'), document['id'])}",
+            "bucket": storage_service.documents_bucket,
+            "path": document["storage_path"],
+            "mime_type": document.get("mime_type"),
+            "size": document.get("file_size"),
+            "sha256": document.get("content_sha256"),
+            "modified": document.get("uploaded_at")
+        })
+    return entries
+
+
+async def district_entries(district_id: str, page_size: int = 50) -> AsyncIterator[Dict]:
+    """
+    區域內所有案件的封存項目（逐頁查詢案件，每頁以兩次查詢取得照片與文件）
+
+    Args:
+        district_id: 區域 ID
+        page_size: 每頁案件數
+    """
+    from app.models.database import db_service
+
+    after_id = None
+    while True:
+        applications = await asyncio.to_thread(
+            db_service.get_district_applications_page, district_id, after_id, page_size
+        )
+        if not applications:
+            return
+        ids = [application["id"] for application in applications]
+        photos, documents = await asyncio.gather(
+            asyncio.to_thread(db_service.get_photos_by_applications, ids),
+            asyncio.to_thread(db_service.get_documents_by_applications, ids)
+        )
+        for application in applications:
+            for entry in application_entries(
+                application,
+                [photo for photo in photos if photo["application_id"] == application["id"]],
+                [document for document in documents if document["application_id"] == application["id"]]
+            ):
+                yield entry
+        if len(applications) < page_size:
+            return
+        after_id = ids[-1]
@@ -0,0 +1,210 @@
+"""
+地理運算工具
+提供經緯度距離計算（Haversine）、平面投影與 geohash 等共用函式
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# 地球平均半徑（公尺）
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    計算兩點之間的大圓距離
+
+    Args:
+        lat1, lng1: 起點經緯度
+        lat2, lng2: 終點經緯度
+
+    Returns:
+        距離（公尺）
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_matrix(
+    lats_a: np.ndarray,
+    lngs_a: np.ndarray,
+    lats_b: np.ndarray,
+    lngs_b: np.ndarray
+) -> np.ndarray:
+    """
+    向量化計算兩組點之間的距離矩陣
+
+    Args:
+        lats_a, lngs_a: 第一組點的經緯度（長度 m）
+        lats_b, lngs_b: 第二組點的經緯度（長度 n）
+
+    Returns:
+        m x n 的距離矩陣（公尺）
+    """
+    phi_a = np.radians(np.asarray(lats_a, dtype=np.float64))[:, None]
+    phi_b = np.radians(np.asarray(lats_b, dtype=np.float64))[None, :]
+    lam_a = np.radians(np.asarray(lngs_a, dtype=np.float64))[:, None]
+    lam_b = np.radians(np.asarray(lngs_b, dtype=np.float64))[None, :]
+
+    a = np.sin((phi_b - phi_a) / 2) ** 2 + np.cos(phi_a) * np.cos(phi_b) * np.sin((lam_b - lam_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_to_point(lats: np.ndarray, lngs: np.ndarray, lat: float, lng: float) -> np.ndarray:
+    """
+    向量化計算多個點到單一點的距離
+
+    Args:
+        lats, lngs: 點的經緯度陣列
+        lat, lng: 目標點
+
+    Returns:
+        距離陣列（公尺）
+    """
+    return haversine_matrix(lats, lngs, np.array([lat]), np.array([lng]))[:, 0]
+
+
+def project_local(lats: np.ndarray, lngs: np.ndarray, origin: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    以等距圓柱投影將經緯度轉為以公尺為單位的平面座標
+
+    在單一縣市範圍內誤差極小，適合用於分群、路線等需要大量歐氏距離運算的場景
+
+    Args:
+        lats, lngs: 經緯度陣列
+        origin: 投影原點 (lat, lng)，預設為所有點的平均值
+
+    Returns:
+        n x 2 的座標陣列（x 為東向、y 為北向，單位公尺）
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if origin is None:
+        origin = (float(lats.mean()), float(lngs.mean())) if lats.size else (0.0, 0.0)
+
+    lat0, lng0 = origin
+    x = np.radians(lngs - lng0) * math.cos(math.radians(lat0)) * EARTH_RADIUS_M
+    y = np.radians(lats - lat0) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+# ==========================================
+# Geohash
+# ==========================================
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_GEOHASH_DECODE = {c: i for i, c in enumerate(GEOHASH_BASE32)}
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """
+    取得指定精度 geohash 格子的大小
+
+    Returns:
+        (緯度高度, 經度寬度)，單位為度
+    """
+    bits = precision * 5
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def geohash_encode(lat: float, lng: float, precision: int = 6) -> str:
+    """
+    將經緯度編碼為 geohash
+
+    Args:
+        lat, lng: 經緯度
+        precision: 字元數（6 約 1.2 x 0.6 公里，5 約 4.9 x 4.9 公里）
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    value = 0
+    bit = 0
+    even = True
+    while len(chars) < precision:
+        target, rng = (lng, lng_range) if even else (lat, lat_range)
+        mid = (rng[0] + rng[1]) / 2
+        if target >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_BASE32[value])
+            value = 0
+            bit = 0
+    return "".join(chars)
+
+
+def geohash_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    解碼 geohash 為格子範圍
+
+    Returns:
+        (min_lat, min_lng, max_lat, max_lng)
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _GEOHASH_DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def geohash_cells_in_radius(lat: float, lng: float, radius_m: float, precision: int) -> List[str]:
+    """
+    取得與圓形範圍重疊的所有 geohash 格子
+
+    Args:
+        lat, lng: 圓心
+        radius_m: 半徑（公尺）
+        precision: geohash 精度
+
+    Returns:
+        geohash 列表（第一個為圓心所在格子）
+    """
+    cell_lat, cell_lng = geohash_cell_size(precision)
+    d_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    d_lng = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+
+    center = geohash_encode(lat, lng, precision)
+    cells = [center]
+    seen = {center}
+    row_start = math.floor((lat - d_lat + 90.0) / cell_lat)
+    row_end = math.floor((lat + d_lat + 90.0) / cell_lat)
+    col_start = math.floor((lng - d_lng + 180.0) / cell_lng)
+    col_end = math.floor((lng + d_lng + 180.0) / cell_lng)
+    for row in range(row_start, row_end + 1):
+        min_lat = row * cell_lat - 90.0
+        if min_lat >= 90.0 or min_lat + cell_lat <= -90.0:
+            continue
+        for col in range(col_start, col_end + 1):
+            min_lng = col * cell_lng - 180.0
+            # 格子內離圓心最近的點在半徑內才算重疊
+            near_lat = min(max(lat, min_lat), min_lat + cell_lat)
+            near_lng = min(max(lng, min_lng), min_lng + cell_lng)
+            if haversine_m(lat, lng, near_lat, near_lng) > radius_m:
+                continue
+            cell = geohash_encode(min_lat + cell_lat / 2, ((min_lng + cell_lng / 2 + 180.0) % 360.0) - 180.0, precision)
+            if cell not in seen:
+                seen.add(cell)
+                cells.append(cell)
+    return cells
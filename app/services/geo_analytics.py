@@ -0,0 +1,300 @@
+"""
+災損地理分析服務
+將案件座標與金額載入 NumPy 陣列，以 histogram2d 依經緯度網格彙總件數、申請金額與核准金額，
+產生災損熱區圖與各網格統計；結果依（區域、災害類型、解析度）快取，並隨案件異動增量更新
+"""
+import logging
+import math
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.services.cache import TTLCache
+from app.services.spatial_index import CaseSpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# 可選的網格解析度（度），0.01 度約 1 公里
+RESOLUTIONS_DEG = (0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+DEFAULT_RESOLUTION_DEG = 0.01
+
+# 單一網格的格數上限（全台以細解析度計算時需指定區域）
+MAX_GRID_CELLS = 250_000
+
+# 計入核准金額的狀態（與區域統計一致）
+APPROVED_STATUSES = ("approved", "completed", "disbursed")
+
+# 各網格彙總的欄位：件數、申請金額、核准件數、核准金額
+LAYERS = ("count", "requested_amount", "approved_count", "approved_amount")
+
+GridKey = Tuple[Optional[str], Optional[str], float]
+
+
+class _Grid:
+    """單一篩選條件的網格彙總（可增量加減）"""
+
+    def __init__(self, origin_lat: float, origin_lng: float, resolution: float, rows: int, cols: int):
+        self.origin_lat = origin_lat
+        self.origin_lng = origin_lng
+        self.resolution = resolution
+        self.lat_edges = origin_lat + np.arange(rows + 1) * resolution
+        self.lng_edges = origin_lng + np.arange(cols + 1) * resolution
+        self.layers = {name: np.zeros((rows, cols), dtype=np.float64) for name in LAYERS}
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.layers["count"].shape
+
+    def cell_of(self, latitude: float, longitude: float) -> Optional[Tuple[int, int]]:
+        """座標所在的格子；與 histogram2d 相同以 searchsorted 判定，落在網格外時回傳 None"""
+        row = int(np.searchsorted(self.lat_edges, latitude, side="right")) - 1
+        col = int(np.searchsorted(self.lng_edges, longitude, side="right")) - 1
+        rows, cols = self.shape
+        if 0 <= row < rows and 0 <= col < cols:
+            return row, col
+        return None
+
+
+class GeoAnalyticsService:
+    """災損熱區與網格統計"""
+
+    def __init__(self, index: CaseSpatialIndex, cache_ttl: float = 3600, cache_size: int = 64):
+        """
+        初始化地理分析服務
+
+        Args:
+            index: 案件空間索引（座標、狀態、金額的資料來源）
+            cache_ttl: 網格快取秒數（案件異動時會增量更新，TTL 僅作保險）
+            cache_size: 最多快取的網格數
+        """
+        self.index = index
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._keys: set = set()
+        self._lock = threading.Lock()
+        self._generation = 0
+        index.add_listener(self._on_index_change)
+
+    def get_grid(
+        self,
+        resolution: float = DEFAULT_RESOLUTION_DEG,
+        district_id: Optional[str] = None,
+        disaster_type: Optional[str] = None
+    ) -> Dict:
+        """
+        取得網格彙總（只回傳非空格子，以欄位陣列表示）
+
+        Args:
+            resolution: 網格解析度（度），須為 RESOLUTIONS_DEG 之一
+            district_id: 區域篩選
+            disaster_type: 災害類型篩選
+
+        Returns:
+            {
+                "resolution_deg": float,
+                "origin": {"latitude", "longitude"},  # 網格西南角
+                "shape": [rows, cols],
+                "cells": {"row": [...], "col": [...], "count": [...], "requested_amount": [...],
+                          "approved_count": [...], "approved_amount": [...]},
+                "totals": {...}, "max": {...}
+            }
+        """
+        if resolution not in RESOLUTIONS_DEG:
+            raise ValueError(f"不支援的解析度: {resolution}，可用值: {', '.join(map(str, RESOLUTIONS_DEG))}")
+
+        key: GridKey = (district_id, disaster_type, resolution)
+        with self._lock:
+            grid = self.cache.get(key)
+            if grid is not None:
+                return self._payload(grid)
+            generation = self._generation
+
+        grid = self._compute(resolution, district_id, disaster_type)
+        payload = self._payload(grid)
+
+        with self._lock:
+            if generation == self._generation:
+                self.cache.set(key, grid)
+                self._keys.add(key)
+        return payload
+
+    def get_heatmap(
+        self,
+        resolution: float = DEFAULT_RESOLUTION_DEG,
+        district_id: Optional[str] = None,
+        disaster_type: Optional[str] = None,
+        weight: str = "count"
+    ) -> Dict:
+        """
+        取得熱區圖點位（格子中心 + 正規化至 0~1 的強度）
+
+        Args:
+            weight: 強度依據（count、requested_amount、approved_count、approved_amount）
+
+        Returns:
+            {"resolution_deg", "weight", "points": [[lat, lng, intensity], ...], "max": float}
+        """
+        if weight not in LAYERS:
+            raise ValueError(f"不支援的強度欄位: {weight}")
+
+        grid = self.get_grid(resolution, district_id, disaster_type)
+        cells = grid["cells"]
+        values = np.asarray(cells[weight], dtype=np.float64)
+        peak = float(values.max()) if len(values) else 0.0
+        lats = grid["origin"]["latitude"] + (np.asarray(cells["row"]) + 0.5) * resolution
+        lngs = grid["origin"]["longitude"] + (np.asarray(cells["col"]) + 0.5) * resolution
+        intensity = values / peak if peak > 0 else values
+        keep = values > 0
+        return {
+            "resolution_deg": resolution,
+            "weight": weight,
+            "points": np.column_stack([
+                np.round(lats[keep], 6), np.round(lngs[keep], 6), np.round(intensity[keep], 4)
+            ]).tolist(),
+            "max": peak
+        }
+
+    # ==========================================
+    # 計算
+    # ==========================================
+
+    def _compute(self, resolution: float, district_id: Optional[str], disaster_type: Optional[str]) -> _Grid:
+        """自空間索引取出符合條件的案件陣列，以 histogram2d 彙總"""
+        data = self.index.query_bbox_arrays(
+            -90.0, -180.0, 90.0, 180.0,
+            district_id=district_id,
+            disaster_type=disaster_type
+        )
+        lats = data["latitude"]
+        lngs = data["longitude"]
+
+        if len(lats):
+            # 網格原點對齊解析度的整數倍，並預留一格讓之後新增的鄰近案件可直接增量加入
+            origin_lat = (math.floor(lats.min() / resolution) - 1) * resolution
+            origin_lng = (math.floor(lngs.min() / resolution) - 1) * resolution
+            rows = math.floor((lats.max() - origin_lat) / resolution) + 2
+            cols = math.floor((lngs.max() - origin_lng) / resolution) + 2
+        else:
+            origin_lat, origin_lng, rows, cols = 0.0, 0.0, 0, 0
+
+        if rows * cols > MAX_GRID_CELLS:
+            raise ValueError(f"網格過大（{rows}x{cols}），請改用較粗的解析度或指定區域")
+
+        grid = _Grid(origin_lat, origin_lng, resolution, rows, cols)
+        if not len(lats):
+            return grid
+
+        approved = self._approved_mask(data["status_code"], data["status_names"])
+        weights = {
+            "count": None,
+            "requested_amount": data["requested_amount"],
+            "approved_count": approved.astype(np.float64),
+            "approved_amount": np.where(approved, data["approved_amount"], 0.0),
+        }
+        for name, layer_weights in weights.items():
+            grid.layers[name], _, _ = np.histogram2d(
+                lats, lngs, bins=[grid.lat_edges, grid.lng_edges], weights=layer_weights
+            )
+        return grid
+
+    @staticmethod
+    def _approved_mask(status_codes: np.ndarray, status_names) -> np.ndarray:
+        codes = [code for code, name in enumerate(status_names) if name in APPROVED_STATUSES]
+        return np.isin(status_codes, codes)
+
+    @staticmethod
+    def _payload(grid: _Grid) -> Dict:
+        counts = grid.layers["count"]
+        rows, cols = np.nonzero(counts)
+        cells = {"row": rows.tolist(), "col": cols.tolist()}
+        totals = {}
+        peaks = {}
+        for name, layer in grid.layers.items():
+            values = layer[rows, cols]
+            if name in ("count", "approved_count"):
+                cells[name] = values.astype(np.int64).tolist()
+                totals[name] = int(layer.sum())
+            else:
+                cells[name] = np.round(values, 2).tolist()
+                totals[name] = round(float(layer.sum()), 2)
+            peaks[name] = float(values.max()) if len(values) else 0.0
+
+        return {
+            "resolution_deg": grid.resolution,
+            "origin": {"latitude": round(grid.origin_lat, 6), "longitude": round(grid.origin_lng, 6)},
+            "shape": list(grid.shape),
+            "cell_count": len(cells["row"]),
+            "cells": cells,
+            "totals": totals,
+            "max": peaks
+        }
+
+    # ==========================================
+    # 增量更新
+    # ==========================================
+
+    def _on_index_change(self, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """案件新增、移除或狀態、金額異動時，從快取中的網格扣除舊值並加入新值"""
+        if before is None and after is None:
+            self.invalidate_all()
+            return
+
+        with self._lock:
+            self._generation += 1
+            for key in list(self._keys):
+                grid = self.cache.get(key)
+                if grid is None:
+                    self._keys.discard(key)
+                    continue
+                district_id, disaster_type, _ = key
+                if not (self._apply(grid, before, -1, district_id, disaster_type)
+                        and self._apply(grid, after, 1, district_id, disaster_type)):
+                    # 案件落在網格範圍外，下次查詢時重新計算
+                    self.cache.pop(key)
+                    self._keys.discard(key)
+
+    @staticmethod
+    def _apply(grid: _Grid, row: Optional[Dict], sign: int, district_id: Optional[str], disaster_type: Optional[str]) -> bool:
+        """將單一案件加入（sign=1）或扣除（sign=-1）網格；無法增量處理時回傳 False"""
+        if row is None:
+            return True
+        if district_id and row.get("district_id") != str(district_id):
+            return True
+        if disaster_type and row.get("disaster_type") != str(disaster_type):
+            return True
+
+        cell = grid.cell_of(row["latitude"], row["longitude"])
+        if cell is None:
+            return False
+
+        approved = row.get("status") in APPROVED_STATUSES
+        grid.layers["count"][cell] += sign
+        grid.layers["requested_amount"][cell] += sign * (row.get("requested_amount") or 0)
+        if approved:
+            grid.layers["approved_count"][cell] += sign
+            grid.layers["approved_amount"][cell] += sign * (row.get("approved_amount") or 0)
+        return True
+
+    def invalidate_all(self) -> None:
+        """清除所有網格快取"""
+        with self._lock:
+            self._generation += 1
+            self.cache.clear()
+            self._keys.clear()
+
+    def stats(self) -> Dict:
+        """快取統計"""
+        return self.cache.stats()
+
+
+# 全域服務實例
+_geo_analytics_service: Optional[GeoAnalyticsService] = None
+
+
+def get_geo_analytics_service() -> GeoAnalyticsService:
+    """取得地理分析服務實例"""
+    global _geo_analytics_service
+    if _geo_analytics_service is None:
+        from app.services.spatial_index import get_case_spatial_index
+        _geo_analytics_service = GeoAnalyticsService(get_case_spatial_index())
+    return _geo_analytics_service
@@ -0,0 +1,120 @@
+"""
+案件位置匯出服務
+以 keyset 分頁逐頁讀取已地理編碼的案件，邊讀邊輸出 GeoJSON FeatureCollection，
+記憶體用量只與單頁大小有關；可選擇以 gzip 串流壓縮
+"""
+import json
+import logging
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 可匯出的屬性欄位（不含申請人姓名、身分證字號等個資）
+EXPORTABLE_PROPERTIES = (
+    "case_no",
+    "status",
+    "district_id",
+    "disaster_type",
+    "disaster_date",
+    "subsidy_type",
+    "requested_amount",
+    "approved_amount",
+    "formatted_address",
+    "submitted_at",
+    "approved_at",
+    "updated_at",
+)
+DEFAULT_PROPERTIES = ("case_no", "status", "district_id", "disaster_type", "requested_amount")
+
+# 每次查詢的筆數
+EXPORT_PAGE_SIZE = 1000
+
+# 累積到此大小再送出一個區塊，避免每筆案件都產生一次寫入
+FLUSH_BYTES = 64 * 1024
+
+
+def parse_properties(spec: Optional[str]) -> List[str]:
+    """
+    解析屬性投影（逗號分隔），未指定時使用預設欄位
+
+    Raises:
+        ValueError: 含有不可匯出的欄位
+    """
+    if not spec:
+        return list(DEFAULT_PROPERTIES)
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXPORTABLE_PROPERTIES]
+    if unknown:
+        raise ValueError(f"不支援的屬性欄位: {', '.join(unknown)}，可用欄位: {', '.join(EXPORTABLE_PROPERTIES)}")
+    return list(dict.fromkeys(names))
+
+
+def iter_application_pages(
+    properties: Sequence[str],
+    page_size: int = EXPORT_PAGE_SIZE,
+    **filters
+) -> Iterator[List[Dict]]:
+    """
+    以 id 做 keyset 分頁逐頁讀取案件
+
+    Args:
+        properties: 屬性欄位
+        page_size: 每頁筆數
+        filters: status、district_id、disaster_type、submitted_from、submitted_to
+    """
+    from app.models.database import db_service
+
+    columns = ", ".join(["id", "latitude", "longitude", *[p for p in properties if p != "id"]])
+    after_id = None
+    while True:
+        page = db_service.get_geocoded_applications_page(columns, after_id=after_id, page_size=page_size, **filters)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]["id"]
+
+
+def iter_feature_collection(pages: Iterable[List[Dict]], properties: Sequence[str]) -> Iterator[bytes]:
+    """
+    將案件頁面轉為 GeoJSON FeatureCollection 的位元組區塊
+
+    Args:
+        pages: 案件頁面
+        properties: 輸出的屬性欄位
+    """
+    buffer = ['{"type":"FeatureCollection","features":[\n']
+    size = len(buffer[0])
+    first = True
+    count = 0
+    for page in pages:
+        for row in page:
+            feature = {
+                "type": "Feature",
+                "id": row["id"],
+                "geometry": {"type": "Point", "coordinates": [row["longitude"], row["latitude"]]},
+                "properties": {name: row.get(name) for name in properties}
+            }
+            text = ("" if first else ",\n") + json.dumps(feature, ensure_ascii=False, separators=(",", ":"), default=str)
+            first = False
+            count += 1
+            buffer.append(text)
+            size += len(text)
+            if size >= FLUSH_BYTES:
+                yield "".join(buffer).encode("utf-8")
+                buffer, size = [], 0
+    buffer.append("\n]}\n")
+    yield "".join(buffer).encode("utf-8")
+    logger.info(f"GeoJSON 匯出完成：{count} 件")
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """以 gzip 格式串流壓縮位元組區塊"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -4,15 +4,58 @@ Google Maps API 服務
 用於災害補助系統的地址驗證和災損地點定位
 """
 import os
+import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
+import math
+import time
+from typing import Dict, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 import httpx
 
+from app.services.cache import TTLCache
+from app.services.geo import geohash_bbox, geohash_cells_in_radius, haversine_m
+from app.services.rate_limiter import get_maps_rate_limiter
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Distance Matrix API 單次請求上限
+MATRIX_MAX_ORIGINS = 25
+MATRIX_MAX_DESTINATIONS = 25
+MATRIX_MAX_ELEMENTS = 100
+
+# 配額用盡時以直線距離估算：繞路係數與各交通方式平均速度（公尺/秒）
+ESTIMATE_DETOUR_FACTOR = 1.3
+ESTIMATE_SPEED_MPS = {
+    "driving": 30 / 3.6,
+    "walking": 5 / 3.6,
+    "bicycling": 15 / 3.6,
+    "transit": 20 / 3.6,
+}
+
+# 代表配額/權限問題的 API 狀態
+QUOTA_ERROR_STATUSES = {"OVER_QUERY_LIMIT", "OVER_DAILY_LIMIT", "REQUEST_DENIED"}
+
+# 速率限制器拒絕時的狀態（非 Google 回傳值）
+RATE_LIMITED = "RATE_LIMITED"
+
+# 代表使用量達上限的狀態（REQUEST_DENIED 為金鑰或權限設定問題，不屬於此類）
+USAGE_LIMIT_STATUSES = {RATE_LIMITED, "OVER_QUERY_LIMIT", "OVER_DAILY_LIMIT"}
+
+# 附近地點快取：查詢半徑級距 → geohash 精度（半徑越大格子越大，使每次查詢涵蓋的格子數維持在十個左右）
+PLACES_RADIUS_TIERS = ((1000, 6), (5000, 5), (20000, 4), (50000, 3))
+PLACES_MAX_RADIUS = 50000
+# 超過 PLACES_REFRESH_SECONDS 的格子先回傳舊資料並在背景更新，超過 PLACES_EXPIRE_SECONDS 才移除
+PLACES_REFRESH_SECONDS = 86400
+PLACES_EXPIRE_SECONDS = 30 * 86400
+# Nearby Search 每頁最多 20 筆、最多 3 頁；next_page_token 需等待約 2 秒才會生效
+PLACES_MAX_PAGES = 3
+PLACES_PAGE_TOKEN_DELAY = 2.0
+
+# 地點可為地址字串、(lat, lng) 或 {"lat": ..., "lng": ...}
+Location = Union[str, Tuple[float, float], Dict[str, float]]
+
 
 class GoogleMapsService:
     """Google Maps API 服務類別"""
@@ -30,6 +73,61 @@ class GoogleMapsService:
         
         self.base_url = "https://maps.googleapis.com/maps/api"
         self.timeout = 10.0
+
+        # Distance Matrix：成對結果快取（距離變化極慢，保留 1 天）與並行請求上限
+        self.matrix_cache = TTLCache(maxsize=200_000, ttl=86400)
+        self.matrix_concurrency = 4
+
+        # 跨 worker 的速率限制；額度不足時改用以下快取或估算結果
+        self.rate_limiter = get_maps_rate_limiter()
+        self.geocode_cache = TTLCache(maxsize=50_000, ttl=7 * 86400)
+        self.places_cache = TTLCache(maxsize=50_000, ttl=PLACES_EXPIRE_SECONDS)
+        self._places_inflight: Dict[tuple, asyncio.Future] = {}
+        self.details_cache = TTLCache(maxsize=10_000, ttl=86400)
+        self.route_cache = TTLCache(maxsize=5_000, ttl=3600)
+
+    async def _call_api(
+        self,
+        endpoint: str,
+        path: str,
+        params: Dict,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Dict:
+        """
+        呼叫 Google Maps API（經過速率限制）
+
+        Args:
+            endpoint: 額度類別（geocode, directions, places, details, distance_matrix, autocomplete）
+            path: API 路徑，例如 "geocode/json"
+            params: 查詢參數
+            client: 共用的 httpx client，未提供時自行建立
+
+        Returns:
+            API 回應；額度不足時回傳 {"status": "RATE_LIMITED"}
+        """
+        if not await self.rate_limiter.acquire(endpoint):
+            return {"status": RATE_LIMITED}
+
+        if client is None:
+            async with httpx.AsyncClient(timeout=self.timeout) as own_client:
+                response = await own_client.get(f"{self.base_url}/{path}", params=params)
+        else:
+            response = await client.get(f"{self.base_url}/{path}", params=params)
+        data = response.json()
+
+        if data.get("status") in QUOTA_ERROR_STATUSES:
+            await asyncio.to_thread(self.rate_limiter.record_quota_error, endpoint)
+        return data
+
+    async def _rate_limited_response(self, endpoint: str, **extra) -> Dict:
+        """額度不足且沒有快取可用時的回應"""
+        await asyncio.to_thread(self.rate_limiter.record_degraded, endpoint)
+        return {
+            "success": False,
+            "rate_limited": True,
+            **extra,
+            "message": "地圖服務使用量已達上限，請稍後再試"
+        }
     
     async def geocode_address(self, address: str, language: str = "zh-TW") -> Dict:
         """
@@ -55,24 +153,26 @@ class GoogleMapsService:
                 "success": False,
                 "message": "未設定 Google Maps API Key"
             }
+
+        cache_key = (" ".join(address.split()), language)
+        cached = self.geocode_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
         
         try:
-            url = f"{self.base_url}/geocode/json"
             params = {
                 "address": address,
                 "key": self.api_key,
                 "language": language
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                data = response.json()
+            data = await self._call_api("geocode", "geocode/json", params)
             
             if data["status"] == "OK" and data["results"]:
                 result = data["results"][0]
                 location = result["geometry"]["location"]
                 
-                return {
+                geocoded = {
                     "success": True,
                     "formatted_address": result["formatted_address"],
                     "latitude": location["lat"],
@@ -82,6 +182,10 @@ class GoogleMapsService:
                     "location_type": result["geometry"]["location_type"],
                     "message": "地址解析成功"
                 }
+                self.geocode_cache.set(cache_key, geocoded)
+                return dict(geocoded)
+            elif data["status"] == RATE_LIMITED:
+                return await self._rate_limited_response("geocode")
             else:
                 return {
                     "success": False,
@@ -118,28 +222,35 @@ class GoogleMapsService:
                 "message": "未設定 Google Maps API Key"
             }
         
+        # 座標取到小數第 5 位（約 1 公尺）共用快取
+        cache_key = (round(latitude, 5), round(longitude, 5), language)
+        cached = self.geocode_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
         try:
-            url = f"{self.base_url}/geocode/json"
             params = {
                 "latlng": f"{latitude},{longitude}",
                 "key": self.api_key,
                 "language": language
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                data = response.json()
+            data = await self._call_api("geocode", "geocode/json", params)
             
             if data["status"] == "OK" and data["results"]:
                 result = data["results"][0]
                 
-                return {
+                reverse = {
                     "success": True,
                     "formatted_address": result["formatted_address"],
                     "address_components": result["address_components"],
                     "place_id": result["place_id"],
                     "message": "地址查詢成功"
                 }
+                self.geocode_cache.set(cache_key, reverse)
+                return dict(reverse)
+            elif data["status"] == RATE_LIMITED:
+                return await self._rate_limited_response("geocode")
             else:
                 return {
                     "success": False,
@@ -228,7 +339,6 @@ class GoogleMapsService:
             }
         
         try:
-            url = f"{self.base_url}/distancematrix/json"
             params = {
                 "origins": origin,
                 "destinations": destination,
@@ -237,10 +347,10 @@ class GoogleMapsService:
                 "language": "zh-TW"
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                data = response.json()
+            data = await self._call_api("distance_matrix", "distancematrix/json", params)
             
+            if data["status"] == RATE_LIMITED:
+                return await self._rate_limited_response("distance_matrix")
             if data["status"] == "OK":
                 element = data["rows"][0]["elements"][0]
                 
@@ -270,17 +380,249 @@ class GoogleMapsService:
                 "success": False,
                 "message": f"距離計算錯誤: {str(e)}"
             }
-    
+
+    async def calculate_distance_and_time(
+        self,
+        origin: Location,
+        destination: Location,
+        mode: str = "driving"
+    ) -> Dict:
+        """
+        計算單一起訖點的距離和時間（經由 distance_matrix，可共用快取）
+
+        Returns:
+            與 calculate_distance 相同格式，估算值會帶有 "estimated": true
+        """
+        result = await self.distance_matrix([origin], [destination], mode=mode)
+        if not result["success"]:
+            return result
+
+        element = result["rows"][0]["elements"][0]
+        if element["status"] != "OK":
+            return {
+                "success": False,
+                "message": f"無法計算距離: {element['status']}"
+            }
+
+        return {
+            "success": True,
+            "distance": element["distance"],
+            "duration": element["duration"],
+            "origin": result["origin_addresses"][0],
+            "destination": result["destination_addresses"][0],
+            "estimated": element.get("estimated", False),
+            "message": "距離計算成功"
+        }
+
+    async def distance_matrix(
+        self,
+        origins: List[Location],
+        destinations: List[Location],
+        mode: str = "driving",
+        language: str = "zh-TW"
+    ) -> Dict:
+        """
+        批次計算多個起點到多個終點的距離矩陣
+
+        - 依 API 單次上限（25 起點 / 25 終點 / 100 元素）切塊並行請求
+        - 以（四捨五入後的座標或正規化地址, 交通方式）快取每一組結果
+        - 額度不足、配額用盡或未設定 API Key 時，以直線距離估算（需提供座標）
+
+        Args:
+            origins: 起點列表（地址字串、(lat, lng) 或 {"lat", "lng"}）
+            destinations: 終點列表
+            mode: 交通方式 (driving, walking, bicycling, transit)
+            language: 回應語言
+
+        Returns:
+            {
+                "success": bool,
+                "origin_addresses": list,
+                "destination_addresses": list,
+                "rows": [
+                    {"elements": [{"status": str, "distance": dict, "duration": dict, "estimated": bool}]}
+                ],
+                "cached_count": int,  # 命中快取的元素數
+                "estimated_count": int,  # 以直線距離估算的元素數
+                "message": str
+            }
+        """
+        if not origins or not destinations:
+            return {
+                "success": False,
+                "message": "未提供起點或終點"
+            }
+
+        origin_points = [self._normalize_location(o) for o in origins]
+        dest_points = [self._normalize_location(d) for d in destinations]
+
+        grid: List[List[Optional[Dict]]] = [[None] * len(dest_points) for _ in origin_points]
+        cached_count = 0
+        for i, (o_key, _, _) in enumerate(origin_points):
+            for j, (d_key, _, _) in enumerate(dest_points):
+                element = self.matrix_cache.get((o_key, d_key, mode))
+                if element is not None:
+                    grid[i][j] = element
+                    cached_count += 1
+
+        origin_addresses = [p[1] for p in origin_points]
+        destination_addresses = [p[1] for p in dest_points]
+
+        tiles = self._matrix_tiles(grid)
+        if tiles:
+            if self.api_key and not await asyncio.to_thread(self.rate_limiter.is_blocked, "distance_matrix"):
+                semaphore = asyncio.Semaphore(self.matrix_concurrency)
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    await asyncio.gather(*[
+                        self._fetch_matrix_tile(
+                            client, semaphore, rows, cols, origin_points, dest_points,
+                            grid, origin_addresses, destination_addresses, mode, language
+                        )
+                        for rows, cols in tiles
+                    ])
+
+        estimated_count = 0
+        for i in range(len(origin_points)):
+            for j in range(len(dest_points)):
+                if grid[i][j] is None:
+                    grid[i][j] = self._estimate_element(origin_points[i][2], dest_points[j][2], mode)
+                    if grid[i][j].get("estimated"):
+                        estimated_count += 1
+
+        return {
+            "success": True,
+            "origin_addresses": origin_addresses,
+            "destination_addresses": destination_addresses,
+            "rows": [{"elements": row} for row in grid],
+            "cached_count": cached_count,
+            "estimated_count": estimated_count,
+            "message": "距離矩陣計算成功" if not estimated_count else f"距離矩陣計算完成（{estimated_count} 筆為直線估算）"
+        }
+
+    @staticmethod
+    def _normalize_location(location: Location) -> Tuple[str, str, Optional[Tuple[float, float]]]:
+        """
+        將地點轉為（快取鍵, API 參數字串, 座標）
+
+        座標四捨五入至小數第 5 位（約 1 公尺），讓極近的查詢共用快取
+        """
+        if isinstance(location, dict):
+            location = (location["lat"], location["lng"])
+        if isinstance(location, (tuple, list)):
+            lat, lng = float(location[0]), float(location[1])
+            text = f"{lat:.5f},{lng:.5f}"
+            return text, text, (lat, lng)
+        text = " ".join(str(location).split())
+        return text, text, None
+
+    @staticmethod
+    def _matrix_tiles(grid: List[List[Optional[Dict]]]) -> List[Tuple[List[int], List[int]]]:
+        """將尚未取得結果的元素切成符合 API 上限的區塊"""
+        missing_rows = [i for i, row in enumerate(grid) if any(e is None for e in row)]
+        if not missing_rows:
+            return []
+        missing_cols = [j for j in range(len(grid[0])) if any(grid[i][j] is None for i in missing_rows)]
+
+        cols_per_tile = min(MATRIX_MAX_DESTINATIONS, len(missing_cols))
+        rows_per_tile = max(1, min(MATRIX_MAX_ORIGINS, MATRIX_MAX_ELEMENTS // cols_per_tile))
+
+        tiles = []
+        for r in range(0, len(missing_rows), rows_per_tile):
+            rows = missing_rows[r:r + rows_per_tile]
+            for c in range(0, len(missing_cols), cols_per_tile):
+                cols = missing_cols[c:c + cols_per_tile]
+                if any(grid[i][j] is None for i in rows for j in cols):
+                    tiles.append((rows, cols))
+        return tiles
+
+    async def _fetch_matrix_tile(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        rows: List[int],
+        cols: List[int],
+        origin_points: List[Tuple],
+        dest_points: List[Tuple],
+        grid: List[List[Optional[Dict]]],
+        origin_addresses: List[str],
+        destination_addresses: List[str],
+        mode: str,
+        language: str
+    ) -> None:
+        """請求單一區塊並將結果寫入 grid 與快取（失敗時保留 None 以便估算）"""
+        async with semaphore:
+            try:
+                data = await self._call_api(
+                    "distance_matrix",
+                    "distancematrix/json",
+                    {
+                        "origins": "|".join(origin_points[i][1] for i in rows),
+                        "destinations": "|".join(dest_points[j][1] for j in cols),
+                        "mode": mode,
+                        "key": self.api_key,
+                        "language": language
+                    },
+                    client=client
+                )
+            except Exception as e:
+                logger.error(f"距離矩陣請求錯誤: {e}")
+                return
+
+        status = data.get("status", "UNKNOWN_ERROR")
+        if status == RATE_LIMITED or status in QUOTA_ERROR_STATUSES:
+            logger.warning(f"Distance Matrix 無法呼叫（{status}），改以直線距離估算")
+            await asyncio.to_thread(self.rate_limiter.record_degraded, "distance_matrix")
+            return
+        if status != "OK":
+            logger.error(f"距離矩陣 API 錯誤: {status}")
+            return
+
+        for r, i in enumerate(rows):
+            if data.get("origin_addresses"):
+                origin_addresses[i] = data["origin_addresses"][r]
+            for c, j in enumerate(cols):
+                if r == 0 and data.get("destination_addresses"):
+                    destination_addresses[j] = data["destination_addresses"][c]
+                element = data["rows"][r]["elements"][c]
+                element["estimated"] = False
+                grid[i][j] = element
+                if element.get("status") == "OK":
+                    self.matrix_cache.set((origin_points[i][0], dest_points[j][0], mode), element)
+
+    @staticmethod
+    def _estimate_element(
+        origin: Optional[Tuple[float, float]],
+        destination: Optional[Tuple[float, float]],
+        mode: str
+    ) -> Dict:
+        """以直線距離與平均速度估算距離與時間（僅適用於有座標的地點）"""
+        if origin is None or destination is None:
+            return {"status": "NOT_ESTIMABLE", "estimated": False}
+
+        meters = int(round(haversine_m(origin[0], origin[1], destination[0], destination[1]) * ESTIMATE_DETOUR_FACTOR))
+        seconds = int(round(meters / ESTIMATE_SPEED_MPS.get(mode, ESTIMATE_SPEED_MPS["driving"])))
+        return {
+            "status": "OK",
+            "distance": {"text": f"約 {meters / 1000:.1f} 公里", "value": meters},
+            "duration": {"text": f"約 {max(1, seconds // 60)} 分鐘", "value": seconds},
+            "estimated": True
+        }
+
     async def find_nearby_places(
         self,
         latitude: float,
         longitude: float,
         place_type: str = "convenience_store",
         radius: int = 1000,
-        language: str = "zh-TW"
+        language: str = "zh-TW",
+        limit: int = 20
     ) -> Dict:
         """
         尋找附近的地點（例如：便利商店、政府機關）
+
+        以 (geohash 格子, 類型, 半徑級距, 語言) 為單位快取 Places 結果：
+        查詢時合併與搜尋範圍重疊的所有格子，再依實際距離過濾與排序，
+        因此 Places API 用量取決於涵蓋的區域大小，而非查詢次數
         
         Args:
             latitude: 緯度
@@ -288,6 +630,7 @@ class GoogleMapsService:
             place_type: 地點類型（例如：convenience_store, government, hospital）
             radius: 搜尋半徑（公尺）
             language: 回應語言
+            limit: 最多回傳筆數（依距離由近到遠）
             
         Returns:
             {
@@ -299,9 +642,11 @@ class GoogleMapsService:
                         "location": {"lat": float, "lng": float},
                         "distance": float,  # 公尺
                         "rating": float,
-                        "is_open": bool
+                        "is_open": bool  # 取得資料當下的營業狀態
                     }
                 ],
+                "partial": bool,  # 有區塊無法查詢或只取得部分分頁
+                "rate_limited": bool,  # 部分區塊因額度不足無法查詢
                 "message": str
             }
         """
@@ -312,52 +657,226 @@ class GoogleMapsService:
             }
         
         try:
-            url = f"{self.base_url}/place/nearbysearch/json"
+            radius = min(max(int(radius), 1), PLACES_MAX_RADIUS)
+            bucket, precision = next((b, p) for b, p in PLACES_RADIUS_TIERS if radius <= b)
+            cells = geohash_cells_in_radius(latitude, longitude, radius, precision)
+
+            outcomes = await asyncio.gather(*[
+                self._get_places_cell(cell, place_type, bucket, language) for cell in cells
+            ])
+            failures = [failure for _, failure in outcomes if failure]
+            limited = any(failure in USAGE_LIMIT_STATUSES for failure in failures)
+            if all(cell is None for cell, _ in outcomes):
+                if limited:
+                    return await self._rate_limited_response("places", places=[])
+                return {
+                    "success": False,
+                    "places": [],
+                    "message": f"地點搜尋失敗: {failures[0]}"
+                }
+            if limited:
+                await asyncio.to_thread(self.rate_limiter.record_degraded, "places")
+
+            places = []
+            for cell, _ in outcomes:
+                for place in cell or []:
+                    location = place["location"]
+                    distance = haversine_m(latitude, longitude, location["lat"], location["lng"])
+                    if distance <= radius:
+                        places.append({**place, "distance": round(distance, 1)})
+            places.sort(key=lambda p: p["distance"])
+            places = places[:limit]
+
+            missing = sum(1 for cell, _ in outcomes if cell is None)
+            return {
+                "success": True,
+                "places": places,
+                "count": len(places),
+                "partial": bool(failures),
+                "rate_limited": limited,
+                "message": f"找到 {len(places)} 個地點" + (
+                    f"（{len(failures)} 個區塊暫時無法完整查詢）" if failures else ""
+                )
+            }
+                
+        except Exception as e:
+            logger.error(f"地點搜尋錯誤: {e}")
+            return {
+                "success": False,
+                "message": f"地點搜尋錯誤: {str(e)}"
+            }
+
+    async def _get_places_cell(
+        self,
+        cell: str,
+        place_type: str,
+        bucket: int,
+        language: str
+    ) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        取得單一 geohash 格子內的地點
+
+        - 快取未過期：直接回傳；超過更新時間則在背景重新取得（stale-while-revalidate）
+        - 無快取：同一格子的並行請求共用同一次 API 呼叫
+
+        Returns:
+            (地點列表, 失敗原因)：無法取得時地點為 None；只取得部分分頁時兩者皆有值
+        """
+        key = (cell, place_type, bucket, language)
+        entry = self.places_cache.get(key)
+        if entry is not None:
+            fetched_at, places = entry
+            if time.time() - fetched_at > PLACES_REFRESH_SECONDS and key not in self._places_inflight:
+                self._places_inflight[key] = asyncio.ensure_future(self._fetch_places_cell(key))
+            # 取得時間為 0 代表上次只取得部分分頁
+            return places, (None if fetched_at else "INCOMPLETE")
+
+        inflight = self._places_inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch_places_cell(key))
+            self._places_inflight[key] = inflight
+        return await asyncio.shield(inflight)
+
+    async def _fetch_places_cell(self, key: tuple) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        以涵蓋整個格子的圓呼叫 Places API（依 next_page_token 取得所有分頁），只保留位於格子內的地點並寫入快取
+
+        後續分頁失敗時回傳已取得的地點，快取標記為需要更新，下次查詢會在背景重新取得
+
+        Returns:
+            (地點列表, 失敗原因)：第一頁失敗時地點為 None，失敗原因為 API 狀態（RATE_LIMITED、REQUEST_DENIED 等）
+        """
+        cell, place_type, _, language = key
+        try:
+            min_lat, min_lng, max_lat, max_lng = geohash_bbox(cell)
+            center_lat = (min_lat + max_lat) / 2
+            center_lng = (min_lng + max_lng) / 2
+            radius = min(PLACES_MAX_RADIUS, math.ceil(haversine_m(center_lat, center_lng, max_lat, max_lng)))
+
             params = {
-                "location": f"{latitude},{longitude}",
+                "location": f"{center_lat},{center_lng}",
                 "radius": radius,
                 "type": place_type,
                 "key": self.api_key,
                 "language": language
             }
-            
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                data = response.json()
-            
-            if data["status"] == "OK":
-                places = []
-                for result in data["results"]:
-                    place = {
-                        "name": result["name"],
-                        "address": result.get("vicinity", ""),
-                        "location": result["geometry"]["location"],
-                        "place_id": result["place_id"],
-                        "rating": result.get("rating"),
-                        "is_open": result.get("opening_hours", {}).get("open_now")
-                    }
-                    places.append(place)
-                
+            results = []
+            complete = False
+            failure = None
+            for page in range(PLACES_MAX_PAGES):
+                data = await self._call_api("places", "place/nearbysearch/json", params)
+                if page and data["status"] == "INVALID_REQUEST":
+                    # 分頁 token 尚未生效：再等待一次
+                    await asyncio.sleep(PLACES_PAGE_TOKEN_DELAY)
+                    data = await self._call_api("places", "place/nearbysearch/json", params)
+                if data["status"] not in ("OK", "ZERO_RESULTS"):
+                    failure = data.get("status") or "UNKNOWN_ERROR"
+                    if failure != RATE_LIMITED:
+                        logger.error(f"地點搜尋失敗: {failure}")
+                    if not page:
+                        return None, failure
+                    break
+                results.extend(data.get("results", []))
+                token = data.get("next_page_token")
+                if not token:
+                    complete = True
+                    break
+                if page == PLACES_MAX_PAGES - 1:
+                    # 已達 API 上限（60 筆），格子內的地點仍可能不完整
+                    logger.warning(f"地點搜尋結果超過 {PLACES_MAX_PAGES} 頁: {cell} {place_type}")
+                    complete = True
+                    break
+                await asyncio.sleep(PLACES_PAGE_TOKEN_DELAY)
+                params = {"pagetoken": token, "key": self.api_key}
+
+            places = []
+            for result in results:
+                location = result["geometry"]["location"]
+                if not (min_lat <= location["lat"] < max_lat and min_lng <= location["lng"] < max_lng):
+                    continue
+                places.append({
+                    "name": result["name"],
+                    "address": result.get("vicinity", ""),
+                    "location": location,
+                    "place_id": result["place_id"],
+                    "rating": result.get("rating"),
+                    "is_open": result.get("opening_hours", {}).get("open_now")
+                })
+            # 不完整的結果以取得時間 0 寫入，下次查詢即在背景更新
+            self.places_cache.set(key, (time.time() if complete else 0.0, places))
+            return places, failure
+        except Exception as e:
+            logger.error(f"地點搜尋錯誤: {e}")
+            return None, "ERROR"
+        finally:
+            self._places_inflight.pop(key, None)
+    
+    async def autocomplete_address(
+        self,
+        text: str,
+        session_token: Optional[str] = None,
+        language: str = "zh-TW"
+    ) -> Dict:
+        """
+        地址自動完成（Places Autocomplete，限台灣地址）
+
+        Args:
+            text: 使用者輸入
+            session_token: 同一次輸入的 session，Google 會以 session 計費
+            language: 回應語言
+
+        Returns:
+            {
+                "success": bool,
+                "predictions": [{"description": str, "place_id": str}],
+                "message": str
+            }
+        """
+        if not self.api_key:
+            return {
+                "success": False,
+                "message": "未設定 Google Maps API Key"
+            }
+
+        try:
+            params = {
+                "input": text,
+                "types": "address",
+                "components": "country:tw",
+                "key": self.api_key,
+                "language": language
+            }
+            if session_token:
+                params["sessiontoken"] = session_token
+
+            data = await self._call_api("autocomplete", "place/autocomplete/json", params)
+
+            if data["status"] in ("OK", "ZERO_RESULTS"):
+                predictions = [
+                    {"description": p["description"], "place_id": p.get("place_id")}
+                    for p in data.get("predictions", [])
+                ]
                 return {
                     "success": True,
-                    "places": places,
-                    "count": len(places),
-                    "message": f"找到 {len(places)} 個地點"
+                    "predictions": predictions,
+                    "message": f"找到 {len(predictions)} 個建議"
                 }
+            elif data["status"] == RATE_LIMITED:
+                return await self._rate_limited_response("autocomplete", predictions=[])
             else:
                 return {
                     "success": False,
-                    "places": [],
-                    "message": f"搜尋失敗: {data.get('status', 'UNKNOWN_ERROR')}"
+                    "predictions": [],
+                    "message": f"自動完成失敗: {data.get('status', 'UNKNOWN_ERROR')}"
                 }
-                
+
         except Exception as e:
-            logger.error(f"地點搜尋錯誤: {e}")
+            logger.error(f"地址自動完成錯誤: {e}")
             return {
                 "success": False,
-                "message": f"地點搜尋錯誤: {str(e)}"
+                "message": f"地址自動完成錯誤: {str(e)}"
             }
-    
+
     async def get_place_details(self, place_id: str, language: str = "zh-TW") -> Dict:
         """
         取得地點詳細資訊
@@ -384,8 +903,12 @@ class GoogleMapsService:
                 "message": "未設定 Google Maps API Key"
             }
         
+        cache_key = (place_id, language)
+        cached = self.details_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
         try:
-            url = f"{self.base_url}/place/details/json"
             params = {
                 "place_id": place_id,
                 "key": self.api_key,
@@ -393,14 +916,12 @@ class GoogleMapsService:
                 "fields": "name,formatted_address,formatted_phone_number,website,rating,opening_hours,geometry"
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                data = response.json()
+            data = await self._call_api("details", "place/details/json", params)
             
             if data["status"] == "OK":
                 result = data["result"]
                 
-                return {
+                details = {
                     "success": True,
                     "name": result.get("name"),
                     "address": result.get("formatted_address"),
@@ -411,6 +932,10 @@ class GoogleMapsService:
                     "location": result.get("geometry", {}).get("location"),
                     "message": "地點資訊取得成功"
                 }
+                self.details_cache.set(cache_key, details)
+                return dict(details)
+            elif data["status"] == RATE_LIMITED:
+                return await self._rate_limited_response("details")
             else:
                 return {
                     "success": False,
@@ -471,8 +996,12 @@ class GoogleMapsService:
                 "message": "未設定 Google Maps API Key"
             }
         
+        cache_key = (origin, destination, tuple(waypoints or ()), mode, optimize_waypoints)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
         try:
-            url = f"{self.base_url}/directions/json"
             params = {
                 "origin": origin,
                 "destination": destination,
@@ -489,9 +1018,7 @@ class GoogleMapsService:
                     waypoints_str = f"optimize:true|{waypoints_str}"
                 params["waypoints"] = waypoints_str
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                data = response.json()
+            data = await self._call_api("directions", "directions/json", params)
             
             if data["status"] == "OK":
                 routes = []
@@ -518,12 +1045,20 @@ class GoogleMapsService:
                         "overview_polyline": route.get("overview_polyline", {}).get("points", "")
                     })
                 
-                return {
+                found = {
                     "success": True,
                     "routes": routes,
                     "count": len(routes),
                     "message": f"找到 {len(routes)} 條路線"
                 }
+                self.route_cache.set(cache_key, found)
+                return dict(found)
+            elif data["status"] == RATE_LIMITED:
+                approximate = self._approximate_route(origin, destination, waypoints or [], mode)
+                if approximate is None:
+                    return await self._rate_limited_response("directions", routes=[])
+                await asyncio.to_thread(self.rate_limiter.record_degraded, "directions")
+                return approximate
             else:
                 return {
                     "success": False,
@@ -538,6 +1073,60 @@ class GoogleMapsService:
                 "message": f"路線計算錯誤: {str(e)}"
             }
     
+    def _known_coordinates(self, location: str) -> Optional[Tuple[float, float]]:
+        """取得地點的座標：「lat,lng」字串或已在地理編碼快取中的地址"""
+        parts = location.split(",")
+        if len(parts) == 2:
+            try:
+                return float(parts[0]), float(parts[1])
+            except ValueError:
+                pass
+        cached = self.geocode_cache.get((" ".join(location.split()), "zh-TW"))
+        if cached:
+            return cached["latitude"], cached["longitude"]
+        return None
+
+    def _approximate_route(
+        self,
+        origin: str,
+        destination: str,
+        waypoints: List[str],
+        mode: str
+    ) -> Optional[Dict]:
+        """以直線距離估算路線（依原順序，不優化途經點）；有地點無法取得座標時回傳 None"""
+        stops = [origin, *waypoints, destination]
+        points = [self._known_coordinates(stop) for stop in stops]
+        if any(point is None for point in points):
+            return None
+
+        legs = []
+        for (start, end), (a, b) in zip(zip(stops, stops[1:]), zip(points, points[1:])):
+            element = self._estimate_element(a, b, mode)
+            legs.append({
+                "start_address": start,
+                "end_address": end,
+                "distance": element["distance"],
+                "duration": element["duration"],
+                "steps": []
+            })
+
+        total_distance = sum(leg["distance"]["value"] for leg in legs)
+        total_duration = sum(leg["duration"]["value"] for leg in legs)
+        return {
+            "success": True,
+            "routes": [{
+                "summary": "直線距離估算",
+                "distance": {"text": f"約 {total_distance / 1000:.1f} 公里", "value": total_distance},
+                "duration": {"text": f"約 {max(1, total_duration // 60)} 分鐘", "value": total_duration},
+                "legs": legs,
+                "waypoint_order": list(range(len(waypoints))),
+                "overview_polyline": ""
+            }],
+            "count": 1,
+            "estimated": True,
+            "message": "地圖服務使用量已達上限，提供直線距離估算路線"
+        }
+
     async def get_optimized_multi_destination_routes(
         self,
         start_location: str,
@@ -648,6 +1237,7 @@ class GoogleMapsService:
                 "country": str,
                 "city": str,
                 "district": str,
+                "village": str,
                 "street": str,
                 "postal_code": str
             }
@@ -656,6 +1246,7 @@ class GoogleMapsService:
             "country": "",
             "city": "",
             "district": "",
+            "village": "",
             "street": "",
             "postal_code": ""
         }
@@ -669,6 +1260,8 @@ class GoogleMapsService:
                 parsed["city"] = component["long_name"]
             elif "administrative_area_level_3" in types or "locality" in types:
                 parsed["district"] = component["long_name"]
+            elif "administrative_area_level_4" in types:
+                parsed["village"] = component["long_name"]
             elif "route" in types:
                 parsed["street"] = component["long_name"]
             elif "postal_code" in types:
@@ -3,11 +3,10 @@
 """
 import httpx
 import json
-import qrcode
-import io
 import base64
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
+from app.services.qr_codes import get_qr_code_service
 from app.settings import get_settings
 
 settings = get_settings()
@@ -70,7 +69,7 @@ class GovWalletService:
             # 沒有 API 金鑰或有臨時身分證，返回模擬資料
             if has_temp_id:
                 print(f"⚠️ 檢測到臨時身分證號碼，使用模擬模式")
-            return self._mock_qrcode_data(vctid, fields)
+            return await self._mock_qrcode_data(vctid, fields)
         
         try:
             payload = {
@@ -292,7 +291,7 @@ class GovWalletService:
                 "message": "用戶尚未掃描或尚未存入憑證（模擬）"
             }
 
-    def _mock_qrcode_data(self, vctid: str, fields: List[Dict[str, str]]) -> Dict[str, Any]:
+    async def _mock_qrcode_data(self, vctid: str, fields: List[Dict[str, str]]) -> Dict[str, Any]:
         """
         模擬 QR Code 資料（開發用）
         生成真實的 QR Code 圖片
@@ -305,22 +304,9 @@ class GovWalletService:
             "timestamp": datetime.now().isoformat()
         })
         
-        # 生成 QR Code 圖片
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # 轉換為 base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # 生成 QR Code 圖片並轉換為 base64
+        image = await get_qr_code_service().render_async(qr_content, "png", error_correction="L")
+        img_base64 = base64.b64encode(image).decode()
         
         transaction_id = f"mock_{vctid[:20]}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         
@@ -355,7 +341,7 @@ class GovWalletService:
         """
         if not self.verifier_api_key:
             # 沒有 API 金鑰，返回模擬資料
-            return self._mock_vp_qrcode(ref, transaction_id)
+            return await self._mock_vp_qrcode(ref, transaction_id)
         
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
@@ -463,29 +449,16 @@ class GovWalletService:
                 "message": f"政府 API 呼叫失敗: {str(e)}"
             }
     
-    def _mock_vp_qrcode(self, ref: str, transaction_id: str) -> Dict[str, Any]:
+    async def _mock_vp_qrcode(self, ref: str, transaction_id: str) -> Dict[str, Any]:
         """模擬 VP QR Code 產生（開發用）
         生成真實的 QR Code 圖片
         """
         # 準備 VP 驗證 QR Code 內容
         auth_uri = f"twfido://verify?ref={ref}&txn={transaction_id}"
         
-        # 生成 QR Code 圖片
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(auth_uri)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # 轉換為 base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # 生成 QR Code 圖片並轉換為 base64
+        image = await get_qr_code_service().render_async(auth_uri, "png", error_correction="L")
+        img_base64 = base64.b64encode(image).decode()
         
         return {
             "success": True,
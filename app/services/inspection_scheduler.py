@@ -0,0 +1,312 @@
+"""
+現場勘查排程服務
+將大量待勘查案件依地理位置分配給多位審核員，並為每位審核員規劃訪查順序
+
+演算法：
+1. 將經緯度投影為平面座標（公尺）
+2. 容量限制的平衡 k-means 分群（每群對應一位審核員）
+3. 各群以最近鄰居法建立初始路線，再以向量化 2-opt 改善
+"""
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.geo import project_local
+
+logger = logging.getLogger(__name__)
+
+
+class InspectionScheduler:
+    """多審核員現場勘查排程器"""
+
+    def __init__(self, max_iterations: int = 30, two_opt_passes: int = 20, seed: int = 42):
+        """
+        初始化排程器
+
+        Args:
+            max_iterations: 分群最大迭代次數
+            two_opt_passes: 每條路線 2-opt 最大改善輪數
+            seed: 亂數種子（確保相同輸入得到相同排程）
+        """
+        self.max_iterations = max_iterations
+        self.two_opt_passes = two_opt_passes
+        self.seed = seed
+
+    def schedule(
+        self,
+        cases: List[Dict],
+        inspectors: List[Dict],
+        default_capacity: Optional[int] = None
+    ) -> Dict:
+        """
+        將案件分配給審核員並規劃路線
+
+        Args:
+            cases: 案件列表，每筆需包含 id、latitude、longitude
+            inspectors: 審核員列表，每筆需包含 reviewer_id，
+                可選 capacity（最多案件數）、start_latitude、start_longitude（出發點）
+            default_capacity: 未指定 capacity 時的預設值，None 表示平均分配
+
+        Returns:
+            {
+                "success": bool,
+                "assignments": [
+                    {
+                        "reviewer_id": str,
+                        "application_ids": list,  # 依訪查順序排列
+                        "case_count": int,
+                        "route_distance_m": float  # 直線距離估算
+                    }
+                ],
+                "unassigned": list,  # 超出總容量而未分配的案件 ID
+                "message": str
+            }
+        """
+        if not inspectors:
+            return {"success": False, "assignments": [], "unassigned": [], "message": "未提供審核員"}
+
+        valid_cases = []
+        skipped = []
+        for case in cases:
+            if case.get("latitude") is not None and case.get("longitude") is not None:
+                valid_cases.append(case)
+            else:
+                skipped.append(str(case.get("id")))
+
+        if not valid_cases:
+            return {
+                "success": True,
+                "assignments": [
+                    {"reviewer_id": i["reviewer_id"], "application_ids": [], "case_count": 0, "route_distance_m": 0.0}
+                    for i in inspectors
+                ],
+                "unassigned": skipped,
+                "message": "沒有可排程的案件"
+            }
+
+        n = len(valid_cases)
+        k = len(inspectors)
+        lats = np.array([float(c["latitude"]) for c in valid_cases])
+        lngs = np.array([float(c["longitude"]) for c in valid_cases])
+        origin = (float(lats.mean()), float(lngs.mean()))
+        points = project_local(lats, lngs, origin)
+
+        capacities = self._resolve_capacities(inspectors, n, default_capacity)
+
+        starts = None
+        if all(i.get("start_latitude") is not None and i.get("start_longitude") is not None for i in inspectors):
+            starts = project_local(
+                np.array([float(i["start_latitude"]) for i in inspectors]),
+                np.array([float(i["start_longitude"]) for i in inspectors]),
+                origin
+            )
+
+        labels = self._balanced_kmeans(points, k, capacities, starts)
+
+        assignments = []
+        for j, inspector in enumerate(inspectors):
+            member_idx = np.flatnonzero(labels == j)
+            start = starts[j] if starts is not None else None
+            order, distance = self._optimize_tour(points[member_idx], start)
+            ordered = member_idx[order]
+            assignments.append({
+                "reviewer_id": inspector["reviewer_id"],
+                "application_ids": [str(valid_cases[i]["id"]) for i in ordered],
+                "case_count": int(len(ordered)),
+                "route_distance_m": round(float(distance), 1)
+            })
+
+        unassigned = skipped + [str(valid_cases[i]["id"]) for i in np.flatnonzero(labels < 0)]
+        assigned_count = n - int((labels < 0).sum())
+
+        return {
+            "success": True,
+            "assignments": assignments,
+            "unassigned": unassigned,
+            "message": f"已將 {assigned_count} 件案件分配給 {k} 位審核員"
+        }
+
+    # ==========================================
+    # 分群
+    # ==========================================
+
+    @staticmethod
+    def _resolve_capacities(inspectors: List[Dict], n: int, default_capacity: Optional[int]) -> np.ndarray:
+        """決定每位審核員的容量上限（明確設定為 0 代表不接受分配）"""
+        # 向上取整，由可出勤的審核員平均分配
+        available = sum(1 for i in inspectors if i.get("capacity") is None or int(i["capacity"]) > 0)
+        fallback = default_capacity if default_capacity else -(-n // max(1, available))
+        return np.array(
+            [fallback if i.get("capacity") is None else int(i["capacity"]) for i in inspectors],
+            dtype=np.int64
+        )
+
+    def _balanced_kmeans(
+        self,
+        points: np.ndarray,
+        k: int,
+        capacities: np.ndarray,
+        starts: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        容量限制的平衡 k-means
+
+        每輪以「距離由近到遠」的順序貪婪指派案件，群滿即跳過，再以群內平均更新中心。
+        若有出發點，中心初始化為出發點，使第 j 群自然對應第 j 位審核員。
+
+        Returns:
+            每個案件的群編號，超出總容量者為 -1
+        """
+        n = len(points)
+        rng = np.random.default_rng(self.seed)
+        centers = starts.copy() if starts is not None else self._kmeans_plus_plus(points, k, rng)
+        labels = np.full(n, -1, dtype=np.int64)
+
+        for _ in range(self.max_iterations):
+            new_labels = self._capacitated_assign(points, centers, capacities)
+
+            for j in range(k):
+                members = points[new_labels == j]
+                if len(members):
+                    centers[j] = members.mean(axis=0)
+
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+        return labels
+
+    @staticmethod
+    def _kmeans_plus_plus(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+        """k-means++ 初始化中心點"""
+        n = len(points)
+        centers = np.empty((k, 2), dtype=np.float64)
+        centers[0] = points[rng.integers(n)]
+        closest_sq = ((points - centers[0]) ** 2).sum(axis=1)
+
+        for j in range(1, k):
+            total = closest_sq.sum()
+            if total <= 0:
+                centers[j] = points[rng.integers(n)]
+            else:
+                centers[j] = points[rng.choice(n, p=closest_sq / total)]
+            closest_sq = np.minimum(closest_sq, ((points - centers[j]) ** 2).sum(axis=1))
+
+        return centers
+
+    @staticmethod
+    def _capacitated_assign(points: np.ndarray, centers: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+        """依距離由近到遠貪婪指派，遵守各群容量"""
+        n, k = len(points), len(centers)
+        dist = np.sqrt(((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+
+        flat_order = np.argsort(dist, axis=None, kind="stable")
+        point_idx, center_idx = np.unravel_index(flat_order, (n, k))
+
+        labels = np.full(n, -1, dtype=np.int64)
+        remaining = capacities.copy()
+        unassigned = n
+        for p, c in zip(point_idx.tolist(), center_idx.tolist()):
+            if labels[p] >= 0 or remaining[c] <= 0:
+                continue
+            labels[p] = c
+            remaining[c] -= 1
+            unassigned -= 1
+            if unassigned == 0 or not remaining.any():
+                break
+
+        return labels
+
+    # ==========================================
+    # 路線
+    # ==========================================
+
+    def _optimize_tour(self, points: np.ndarray, start: Optional[np.ndarray] = None):
+        """
+        規劃單一審核員的訪查順序（開放路線，不需返回出發點）
+
+        Returns:
+            (順序索引陣列, 總距離公尺)
+        """
+        m = len(points)
+        if m == 0:
+            return np.array([], dtype=np.int64), 0.0
+
+        # 有出發點時將其放在索引 0 並固定不動
+        nodes = np.vstack([start[None, :], points]) if start is not None else points
+        dist = np.sqrt(((nodes[:, None, :] - nodes[None, :, :]) ** 2).sum(axis=2))
+
+        route = self._nearest_neighbor(dist, 0)
+        route = self._two_opt(route, dist, fixed_start=start is not None)
+
+        total = float(dist[route[:-1], route[1:]].sum()) if len(route) > 1 else 0.0
+        if start is not None:
+            route = route[1:] - 1
+        return route, total
+
+    @staticmethod
+    def _nearest_neighbor(dist: np.ndarray, first: int) -> np.ndarray:
+        """最近鄰居法建立初始路線"""
+        m = len(dist)
+        visited = np.zeros(m, dtype=bool)
+        route = np.empty(m, dtype=np.int64)
+        current = first
+        for step in range(m):
+            route[step] = current
+            visited[current] = True
+            if step == m - 1:
+                break
+            candidates = np.where(visited, np.inf, dist[current])
+            current = int(np.argmin(candidates))
+        return route
+
+    def _two_opt(self, route: np.ndarray, dist: np.ndarray, fixed_start: bool) -> np.ndarray:
+        """
+        向量化 2-opt 改善（開放路線）
+
+        對每個 i 一次計算所有 j 的交換增益，取最佳者反轉 route[i:j+1]
+        """
+        m = len(route)
+        if m < 3:
+            return route
+
+        route = route.copy()
+        first_i = 1 if fixed_start else 0
+        for _ in range(self.two_opt_passes):
+            improved = False
+            for i in range(first_i, m - 1):
+                j = np.arange(i + 1, m)
+                b = route[i]
+                c = route[j]
+                nxt = route[np.minimum(j + 1, m - 1)]
+                has_next = j + 1 < m
+
+                before = np.where(has_next, dist[c, nxt], 0.0)
+                after = np.where(has_next, dist[b, nxt], 0.0)
+                if i > 0:
+                    a = route[i - 1]
+                    before = before + dist[a, b]
+                    after = after + dist[a, c]
+
+                gain = before - after
+                best = int(np.argmax(gain))
+                if gain[best] > 1e-9:
+                    route[i:j[best] + 1] = route[i:j[best] + 1][::-1]
+                    improved = True
+            if not improved:
+                break
+
+        return route
+
+
+# 全域服務實例
+_inspection_scheduler: Optional[InspectionScheduler] = None
+
+
+def get_inspection_scheduler() -> InspectionScheduler:
+    """取得現場勘查排程服務實例（單例模式）"""
+    global _inspection_scheduler
+    if _inspection_scheduler is None:
+        _inspection_scheduler = InspectionScheduler()
+    return _inspection_scheduler
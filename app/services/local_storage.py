@@ -0,0 +1,446 @@
+"""
+本機磁碟 Storage 後端
+與 StorageService 相同的介面，檔案存放在 LOCAL_STORAGE_ROOT：
+- 目錄依路徑第一層（通常是案件 ID）的雜湊分成兩層子目錄，避免單一目錄下有大量項目
+- 先寫入同目錄的暫存檔、fsync 後再改名，讀取端不會看到寫到一半的檔案
+- 簽名 URL 以 HMAC 簽署，由 API 的 /api/v1/storage 路由驗證後以 FileResponse 傳送
+  （設定 LOCAL_STORAGE_ACCEL_REDIRECT 時改由 nginx sendfile 傳送，檔案內容完全不經過 Python）
+"""
+import base64
+import hashlib
+import hmac
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from storage3.exceptions import StorageApiError
+
+from app.services.storage import StorageService
+from app.settings import get_settings
+
+settings = get_settings()
+
+# 本機 Storage 路由的前綴
+LOCAL_STORAGE_ROUTE = "/api/v1/storage"
+
+# 簽名上傳 URL 的有效期（與 Supabase 相同，約 2 小時）
+SIGNED_UPLOAD_EXPIRES_IN = 2 * 3600
+
+# 暫存檔前綴（列出檔案時略過）
+_TEMP_PREFIX = ".upload-"
+
+_COPY_BUFFER = 1024 * 1024
+
+
+# ==========================================
+# 簽名
+# ==========================================
+
+def _signing_key() -> bytes:
+    return (settings.LOCAL_STORAGE_SIGNING_KEY or settings.SECRET_KEY).encode("utf-8")
+
+
+def _signature(purpose: str, bucket: str, path: str, expires_at: int) -> str:
+    message = f"{purpose}\n{bucket}\n{path}\n{expires_at}".encode("utf-8")
+    digest = hmac.new(_signing_key(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def sign_token(purpose: str, bucket: str, path: str, expires_in: int) -> str:
+    """
+    產生簽名 token（格式為「到期時間.簽章」）
+
+    Args:
+        purpose: 用途（download 或 upload），不同用途的 token 不能互用
+        bucket: Bucket 名稱
+        path: Storage 路徑
+        expires_in: 有效秒數
+    """
+    expires_at = int(time.time()) + int(expires_in)
+    return f"{expires_at}.{_signature(purpose, bucket, path, expires_at)}"
+
+
+def verify_token(purpose: str, bucket: str, path: str, token: Optional[str]) -> bool:
+    """驗證簽名 token 的簽章與有效期"""
+    try:
+        expires_at, signature = (token or "").split(".", 1)
+        expires_at = int(expires_at)
+    except ValueError:
+        return False
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(purpose, bucket, path, expires_at))
+
+
+def _object_url(route: str, bucket: str, path: str, token: Optional[str] = None) -> str:
+    url = f"{settings.LOCAL_STORAGE_BASE_URL.rstrip('/')}{LOCAL_STORAGE_ROUTE}/{route}/{quote(bucket)}/{quote(path)}"
+    return f"{url}?token={token}" if token else url
+
+
+# ==========================================
+# 檔案資訊與 Range
+# ==========================================
+
+def stat_etag(stat: os.stat_result) -> str:
+    """以大小與修改時間組成 ETag（內容雜湊未知時使用）"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def stat_last_modified(stat: os.stat_result) -> str:
+    return format_datetime(datetime.fromtimestamp(int(stat.st_mtime), timezone.utc), usegmt=True)
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析單一 Range（bytes=a-b、bytes=a-、bytes=-n）
+
+    Args:
+        header: Range 標頭
+        size: 檔案大小
+
+    Returns:
+        (起點, 終點)（包含終點），無法解析或多段 Range 時回傳 None（回傳完整內容）
+
+    Raises:
+        ValueError: Range 超出檔案範圍（416）
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[6:].strip().partition("-")
+    if not (start or end).isdigit() or (end and not end.isdigit()):
+        return None
+    if not start:
+        # 最後 n 個位元組
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_file_range(file_path: Union[str, Path], start: int, end: int, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """依區塊讀取檔案的一段（包含 end）"""
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class _LocalObjectResponse:
+    """本機物件的回應（提供 StorageService 用到的 httpx.Response 介面：status_code、headers、iter_bytes）"""
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Dict[str, str],
+        file_path: Optional[Path] = None,
+        start: int = 0,
+        end: int = -1
+    ):
+        self.status_code = status_code
+        self.headers = headers
+        self._file_path = file_path
+        self._start = start
+        self._end = end
+        self._readers: List[Iterator[bytes]] = []
+
+    def raise_for_status(self) -> None:
+        """物件不存在時開啟就已拋出 FileNotFoundError；304、416 與 Storage 後端相同，由呼叫端依狀態碼處理"""
+
+    def iter_bytes(self, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        if self._file_path is None:
+            return iter(())
+        reader = iter_file_range(self._file_path, self._start, self._end, chunk_size or 256 * 1024)
+        self._readers.append(reader)
+        return reader
+
+    def close(self) -> None:
+        for reader in self._readers:
+            reader.close()
+
+
+def file_response(
+    file_path: Union[str, Path],
+    stat: os.stat_result,
+    byte_range: Optional[str],
+    headers: Dict[str, str],
+    media_type: str,
+    accel_redirect: Optional[str] = None
+) -> Response:
+    """
+    以本機檔案回應下載（條件式請求需由呼叫端先判斷）
+
+    Args:
+        file_path: 檔案路徑
+        stat: 檔案資訊
+        byte_range: Range 標頭（已依 If-Range 判斷，不適用時為 None）
+        headers: 回應標頭（ETag、Cache-Control、Content-Disposition 等）
+        media_type: Content-Type
+        accel_redirect: nginx internal location 內的路徑，提供時改由 nginx 傳送檔案
+
+    Returns:
+        200 / 206 / 416 回應
+    """
+    if accel_redirect:
+        # 由 nginx 以 sendfile 傳送，Range 也由 nginx 處理
+        return Response(headers={**headers, "X-Accel-Redirect": accel_redirect}, media_type=media_type)
+    try:
+        selected = parse_byte_range(byte_range, stat.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+    if selected is None:
+        return FileResponse(file_path, headers=headers, media_type=media_type, stat_result=stat)
+    start, end = selected
+    headers = {**headers, "Content-Range": f"bytes {start}-{end}/{stat.st_size}", "Content-Length": str(end - start + 1)}
+    return StreamingResponse(iter_file_range(file_path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+# ==========================================
+# Bucket
+# ==========================================
+
+class LocalBucket:
+    """單一 bucket 的檔案操作（方法與回傳格式對應 storage3 的 bucket API）"""
+
+    def __init__(self, storage: "LocalStorageService", name: str):
+        self.storage = storage
+        self.name = name
+
+    def upload(self, path: str, file, file_options: Optional[Dict] = None) -> Dict:
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        self.storage.write_object(self.name, path, file, upsert=upsert)
+        return {"path": path, "Key": f"{self.name}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        try:
+            return self.storage.local_path(self.name, path).read_bytes()
+        except FileNotFoundError:
+            raise StorageApiError("Object not found", "not_found", 404)
+
+    def remove(self, paths: List[str]) -> List[Dict]:
+        removed = []
+        for path in paths:
+            try:
+                self.storage.local_path(self.name, path).unlink()
+                removed.append({"name": path})
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def copy(self, from_path: str, to_path: str) -> Dict:
+        try:
+            with open(self.storage.local_path(self.name, from_path), "rb") as source:
+                self.storage.write_object(self.name, to_path, source, upsert=True)
+        except FileNotFoundError:
+            raise StorageApiError("Object not found", "not_found", 404)
+        return {"path": to_path}
+
+    def list(self, path: str = "") -> List[Dict]:
+        folder = path.strip("/")
+        if folder:
+            directories = [self.storage.local_path(self.name, folder)]
+        else:
+            # 根目錄：合併所有分片下的第一層
+            directories = [shard for level in self.storage.bucket_root(self.name).glob("*") for shard in level.glob("*")]
+        entries = []
+        for directory in directories:
+            if not directory.is_dir():
+                continue
+            for item in directory.iterdir():
+                if item.name.startswith(_TEMP_PREFIX):
+                    continue
+                if item.is_dir():
+                    entries.append({"name": item.name, "id": None, "metadata": None})
+                else:
+                    stat = item.stat()
+                    entries.append({
+                        "name": item.name,
+                        "id": item.name,
+                        "updated_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+                        "metadata": {"size": stat.st_size, "mimetype": mimetypes.guess_type(item.name)[0]}
+                    })
+        return sorted(entries, key=lambda entry: entry["name"])
+
+    def create_signed_url(self, path: str, expires_in: int) -> Dict:
+        if not self.storage.local_path(self.name, path).is_file():
+            raise StorageApiError("Object not found", "not_found", 404)
+        return {"signedURL": _object_url("object", self.name, path, sign_token("download", self.name, path, expires_in))}
+
+    def create_signed_urls(self, paths: List[str], expires_in: int) -> List[Dict]:
+        results = []
+        for path in paths:
+            try:
+                results.append({"path": path, "signedURL": self.create_signed_url(path, expires_in)["signedURL"], "error": None})
+            except (StorageApiError, ValueError) as e:
+                results.append({"path": path, "signedURL": None, "error": str(e)})
+        return results
+
+    def create_signed_upload_url(self, path: str) -> Dict:
+        token = sign_token("upload", self.name, path, SIGNED_UPLOAD_EXPIRES_IN)
+        return {"signed_url": _object_url("upload", self.name, path, token), "token": token, "path": path}
+
+    def get_public_url(self, path: str) -> str:
+        return _object_url("public", self.name, path)
+
+
+# ==========================================
+# Storage 服務
+# ==========================================
+
+class LocalStorageService(StorageService):
+    """以本機磁碟存放檔案的 Storage 服務"""
+
+    def __init__(self, root: Union[str, Path, None] = None):
+        super().__init__()
+        self.root = Path(root or settings.LOCAL_STORAGE_ROOT).resolve()
+        # 不需簽名即可讀取的 bucket（與 Supabase 上的公開 bucket 相同）
+        self.public_buckets = {self.qr_codes_bucket}
+
+    def _bucket(self, bucket_name: str) -> LocalBucket:
+        return LocalBucket(self, bucket_name)
+
+    def bucket_root(self, bucket_name: str) -> Path:
+        if not bucket_name or "/" in bucket_name or "\\" in bucket_name or bucket_name.startswith("."):
+            raise ValueError(f"bucket 名稱不正確: {bucket_name}")
+        return self.root / bucket_name
+
+    def local_path(self, bucket_name: str, path: str) -> Path:
+        """
+        Storage 路徑對應的本機檔案路徑（依第一層目錄的雜湊分片）
+
+        Raises:
+            ValueError: 路徑包含 ..、絕對路徑或其他不允許的字元
+        """
+        segments = path.split("/")
+        if not path or "\\" in path or "\x00" in path or any(seg in ("", ".", "..") for seg in segments):
+            raise ValueError(f"Storage 路徑不正確: {path}")
+        shard = hashlib.sha1(segments[0].encode("utf-8")).hexdigest()
+        return self.bucket_root(bucket_name).joinpath(shard[:2], shard[2:4], *segments)
+
+    def write_object(self, bucket_name: str, path: str, source: Union[bytes, str, os.PathLike, BinaryIO], upsert: bool = True) -> int:
+        """
+        以暫存檔 + 改名的方式寫入物件
+
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+            source: bytes、檔案路徑或檔案讀取器
+            upsert: 是否覆寫既有檔案
+
+        Returns:
+            寫入的位元組數
+
+        Raises:
+            StorageApiError: upsert=False 且檔案已存在（409）
+        """
+        target = self.local_path(bucket_name, path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=_TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    out.write(source)
+                elif isinstance(source, (str, os.PathLike)):
+                    with open(source, "rb") as f:
+                        shutil.copyfileobj(f, out, _COPY_BUFFER)
+                else:
+                    shutil.copyfileobj(source, out, _COPY_BUFFER)
+                out.flush()
+                os.fsync(out.fileno())
+                size = out.tell()
+            if upsert:
+                os.replace(temp_path, target)
+            else:
+                # link 在目標已存在時失敗，不會覆寫其他請求剛寫入的檔案
+                try:
+                    os.link(temp_path, target)
+                except FileExistsError:
+                    raise StorageApiError("The resource already exists", "Duplicate", 409)
+                finally:
+                    os.unlink(temp_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return size
+
+    def _local_response(
+        self,
+        bucket_name: str,
+        path: str,
+        request_headers: Optional[Dict[str, str]]
+    ) -> "_LocalObjectResponse":
+        file_path = self.local_path(bucket_name, path)
+        stat = file_path.stat()
+        headers = {
+            "etag": stat_etag(stat),
+            "last-modified": stat_last_modified(stat),
+            "content-type": mimetypes.guess_type(file_path.name)[0] or "application/octet-stream",
+        }
+        request_headers = {name.lower(): value for name, value in (request_headers or {}).items()}
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and headers["etag"] in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return _LocalObjectResponse(304, headers)
+
+        byte_range = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if if_range and if_range not in (headers["etag"], headers["last-modified"]):
+            byte_range = None
+        try:
+            selected = parse_byte_range(byte_range, stat.st_size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{stat.st_size}"
+            return _LocalObjectResponse(416, headers)
+
+        if selected is None:
+            start, end, status_code = 0, stat.st_size - 1, 200
+        else:
+            (start, end), status_code = selected, 206
+            headers["content-range"] = f"bytes {start}-{end}/{stat.st_size}"
+        headers["content-length"] = str(max(0, end - start + 1))
+        return _LocalObjectResponse(status_code, headers, file_path, start, end)
+
+    @contextmanager
+    def open_object_response(
+        self,
+        bucket_name: str,
+        path: str,
+        request_headers: Optional[Dict[str, str]] = None
+    ) -> Iterator["_LocalObjectResponse"]:
+        """
+        開啟本機物件，回傳與 httpx.Response 相同用法的回應物件（open_object_stream、stream_object 共用）
+
+        Raises:
+            FileNotFoundError: 物件不存在
+        """
+        response = self._local_response(bucket_name, path, request_headers)
+        try:
+            yield response
+        finally:
+            response.close()
+
+    def accel_redirect_path(self, bucket_name: str, path: str) -> Optional[str]:
+        """nginx internal location 內的檔案路徑（未設定 LOCAL_STORAGE_ACCEL_REDIRECT 時為 None）"""
+        if not settings.LOCAL_STORAGE_ACCEL_REDIRECT:
+            return None
+        relative = self.local_path(bucket_name, path).relative_to(self.root)
+        return f"{settings.LOCAL_STORAGE_ACCEL_REDIRECT.rstrip('/')}/{quote(relative.as_posix())}"
@@ -0,0 +1,278 @@
+"""
+地圖圖磚分群服務
+依 Web Mercator 圖磚（z/x/y）將案件以網格分群，回傳每群的件數、申請金額合計與狀態分布，
+讓審核地圖在任何縮放層級下的資料量都有上限
+"""
+import logging
+import math
+import threading
+from typing import Dict, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from app.services.cache import TTLCache
+from app.services.spatial_index import CaseSpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator 可表示的緯度上限
+MAX_LATITUDE = 85.05112878
+
+# 支援的縮放層級
+MIN_ZOOM = 0
+MAX_ZOOM = 20
+
+# 每個圖磚切成 GRID_SIZE x GRID_SIZE 個分群格，回傳的分群數不會超過 GRID_SIZE²
+GRID_SIZE = 8
+
+# 達到此縮放層級且圖磚內案件數不超過 MAX_POINTS_PER_TILE 時直接回傳個別案件
+CLUSTER_MAX_ZOOM = 17
+MAX_POINTS_PER_TILE = 500
+
+TileKey = Tuple[int, int, int]
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    計算圖磚的經緯度範圍
+
+    Returns:
+        (min_lat, min_lng, max_lat, max_lng)
+    """
+    n = 2 ** z
+    min_lng = x / n * 360.0 - 180.0
+    max_lng = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def tile_for_point(latitude: float, longitude: float, z: int) -> TileKey:
+    """計算座標在指定縮放層級所屬的圖磚"""
+    n = 2 ** z
+    lat = math.radians(min(max(latitude, -MAX_LATITUDE), MAX_LATITUDE))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n)
+    return z, min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _mercator_xy(lats: np.ndarray, lngs: np.ndarray, z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """將經緯度陣列轉為指定縮放層級下的圖磚座標（浮點數，整數部分即圖磚編號）"""
+    n = 2 ** z
+    lat = np.radians(np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE))
+    tx = (lngs + 180.0) / 360.0 * n
+    ty = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+    return tx, ty
+
+
+class MapTileService:
+    """地圖圖磚分群與快取"""
+
+    def __init__(
+        self,
+        index: CaseSpatialIndex,
+        grid_size: int = GRID_SIZE,
+        cache_ttl: float = 300,
+        cache_size: int = 5000
+    ):
+        """
+        初始化圖磚服務
+
+        Args:
+            index: 案件空間索引
+            grid_size: 每個圖磚的分群格數（每邊）
+            cache_ttl: 圖磚快取秒數（案件異動時會主動失效，TTL 僅作保險）
+            cache_size: 最多快取的圖磚數
+        """
+        self.index = index
+        self.grid_size = grid_size
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # 圖磚 → 該圖磚在快取中的所有鍵（不同篩選條件）
+        self._keys_by_tile: Dict[TileKey, Set[tuple]] = {}
+        self._lock = threading.Lock()
+        # 每次案件異動遞增；計算期間若有異動則不寫入快取，避免快取到過時的圖磚
+        self._generation = 0
+        index.add_listener(self._on_index_change)
+
+    def get_tile(
+        self,
+        z: int,
+        x: int,
+        y: int,
+        status: Optional[Union[str, Sequence[str]]] = None,
+        district_id: Optional[str] = None
+    ) -> Dict:
+        """
+        取得分群後的圖磚資料
+
+        Args:
+            z, x, y: 圖磚座標
+            status: 狀態篩選（單一或多個）
+            district_id: 區域篩選
+
+        Returns:
+            {"z", "x", "y", "total", "requested_amount", "status_counts", "clusters", "points"}
+        """
+        if not MIN_ZOOM <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError(f"無效的圖磚座標: {z}/{x}/{y}")
+
+        if isinstance(status, str):
+            status = [status]
+        status_key = tuple(sorted(status)) if status else None
+        cache_key = (z, x, y, status_key, district_id)
+
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        generation = self._generation
+        min_lat, min_lng, max_lat, max_lng = tile_bounds(z, x, y)
+        data = self.index.query_bbox_arrays(
+            min_lat, min_lng, max_lat, max_lng,
+            status=list(status_key) if status_key else None,
+            district_id=district_id
+        )
+        tile = self._cluster(z, x, y, data)
+
+        with self._lock:
+            if generation != self._generation:
+                return tile
+            self.cache.set(cache_key, tile)
+            self._keys_by_tile.setdefault((z, x, y), set()).add(cache_key)
+            if len(self._keys_by_tile) > self.cache.maxsize * 2:
+                self._prune_tile_keys()
+        return tile
+
+    def _cluster(self, z: int, x: int, y: int, data: Dict[str, np.ndarray]) -> Dict:
+        """以網格將圖磚內的案件分群（向量化彙總）"""
+        ids = data["ids"]
+        lats = data["latitude"]
+        lngs = data["longitude"]
+        amounts = data["requested_amount"]
+        # 代碼 -1（無狀態）平移為 0，對應 "unknown"
+        status_codes = data["status_code"].astype(np.int64) + 1
+        status_names = ["unknown"] + data["status_names"]
+        n_status = len(status_names)
+        status_totals = np.bincount(status_codes, minlength=n_status)
+
+        total = len(ids)
+        tile = {
+            "z": z,
+            "x": x,
+            "y": y,
+            "total": total,
+            "requested_amount": float(amounts.sum()),
+            "status_counts": {
+                status_names[s]: int(status_totals[s]) for s in np.flatnonzero(status_totals).tolist()
+            },
+            "clusters": [],
+            "points": []
+        }
+        if total == 0:
+            return tile
+
+        if z >= CLUSTER_MAX_ZOOM and total <= MAX_POINTS_PER_TILE:
+            tile["points"] = [self._point(ids[i], lats[i], lngs[i], status_names[status_codes[i]], amounts[i]) for i in range(total)]
+            return tile
+
+        # 計算每個案件所在的分群格
+        tx, ty = _mercator_xy(lats, lngs, z)
+        gx = np.clip(((tx - x) * self.grid_size).astype(np.int64), 0, self.grid_size - 1)
+        gy = np.clip(((ty - y) * self.grid_size).astype(np.int64), 0, self.grid_size - 1)
+        cell_of = gy * self.grid_size + gx
+
+        n_cells = self.grid_size * self.grid_size
+        counts = np.bincount(cell_of, minlength=n_cells)
+        lat_sum = np.bincount(cell_of, weights=lats, minlength=n_cells)
+        lng_sum = np.bincount(cell_of, weights=lngs, minlength=n_cells)
+        amount_sum = np.bincount(cell_of, weights=amounts, minlength=n_cells)
+        facets = np.bincount(cell_of * n_status + status_codes, minlength=n_cells * n_status).reshape(n_cells, n_status)
+
+        # 只有一件的分群格直接以個別案件呈現
+        singles = np.flatnonzero(counts == 1)
+        if len(singles):
+            first_of_cell = np.full(n_cells, -1, dtype=np.int64)
+            first_of_cell[cell_of[::-1]] = np.arange(total - 1, -1, -1)
+            for c in singles.tolist():
+                i = first_of_cell[c]
+                tile["points"].append(self._point(ids[i], lats[i], lngs[i], status_names[status_codes[i]], amounts[i]))
+
+        for c in np.flatnonzero(counts > 1).tolist():
+            count = int(counts[c])
+            tile["clusters"].append({
+                "latitude": float(lat_sum[c] / count),
+                "longitude": float(lng_sum[c] / count),
+                "count": count,
+                "requested_amount": float(amount_sum[c]),
+                "status_counts": {
+                    status_names[s]: int(facets[c, s])
+                    for s in np.flatnonzero(facets[c]).tolist()
+                }
+            })
+        return tile
+
+    @staticmethod
+    def _point(case_id, latitude, longitude, status, amount) -> Dict:
+        return {
+            "id": case_id,
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            "status": status,
+            "requested_amount": float(amount)
+        }
+
+    # ==========================================
+    # 快取失效
+    # ==========================================
+
+    def _on_index_change(self, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """案件座標、狀態或金額異動時，讓新舊位置在所有縮放層級的圖磚失效"""
+        if before is None and after is None:
+            self.invalidate_all()
+            return
+
+        tiles = set()
+        for row in (before, after):
+            if row is None:
+                continue
+            for z in range(MIN_ZOOM, MAX_ZOOM + 1):
+                tiles.add(tile_for_point(row["latitude"], row["longitude"], z))
+
+        with self._lock:
+            self._generation += 1
+            for tile in tiles:
+                for key in self._keys_by_tile.pop(tile, ()):
+                    self.cache.pop(key)
+
+    def _prune_tile_keys(self) -> None:
+        """移除已被 LRU 淘汰或過期之快取鍵的對照"""
+        for tile in list(self._keys_by_tile):
+            keys = {key for key in self._keys_by_tile[tile] if key in self.cache}
+            if keys:
+                self._keys_by_tile[tile] = keys
+            else:
+                del self._keys_by_tile[tile]
+
+    def invalidate_all(self) -> None:
+        """清除所有圖磚快取"""
+        with self._lock:
+            self._generation += 1
+            self.cache.clear()
+            self._keys_by_tile.clear()
+
+    def stats(self) -> Dict:
+        """快取統計"""
+        return self.cache.stats()
+
+
+# 全域服務實例
+_map_tile_service: Optional[MapTileService] = None
+
+
+def get_map_tile_service() -> MapTileService:
+    """取得地圖圖磚服務實例"""
+    global _map_tile_service
+    if _map_tile_service is None:
+        from app.services.spatial_index import get_case_spatial_index
+        _map_tile_service = MapTileService(get_case_spatial_index())
+    return _map_tile_service
@@ -0,0 +1,249 @@
+"""
+災損照片衍生圖服務
+為原始照片產生縮圖與限制解析度的預覽圖（依 EXIF 方向轉正），存放在原始檔旁並記錄在 damage_photos；
+影像處理在 process pool 中執行，不佔用 event loop 與 API worker 的 GIL；解碼時一併計算感知雜湊供相似照片偵測。
+列表與詳情以縮圖 / 預覽圖 URL 取代 4–8MB 的原始照片
+"""
+import asyncio
+import io
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from PIL import Image, ImageOps, features
+
+from app.services.cpu_executor import CPUExecutor, CPUExecutorBusy, get_cpu_executor
+from app.services.photo_similarity import dhash, to_signed
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 衍生圖名稱 → 長邊像素上限（由大到小，較小的衍生圖由前一張縮小）
+DERIVATIVE_SIZES = {
+    "preview": 1600,
+    "thumbnail": 320,
+}
+DERIVATIVE_QUALITY = {
+    "preview": 80,
+    "thumbnail": 70,
+}
+
+# 輸出格式：Pillow 支援 WebP 時使用 WebP，否則使用 JPEG
+DERIVATIVE_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+DERIVATIVE_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+DERIVATIVE_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+def _open_photo(data: bytes) -> Image.Image:
+    """解碼照片並依 EXIF 方向轉正"""
+    largest = max(DERIVATIVE_SIZES.values())
+    with Image.open(io.BytesIO(data)) as original:
+        # JPEG 可在解碼時直接縮小，大幅減少解碼時間與記憶體
+        original.draft("RGB", (largest, largest))
+        return ImageOps.exif_transpose(original)
+
+
+def render_derivatives(data: bytes, image_format: str = DERIVATIVE_FORMAT) -> Dict[str, Dict]:
+    """
+    產生照片衍生圖（於子程序中執行，必須是模組層級函式）
+
+    Args:
+        data: 原始照片內容
+        image_format: 輸出格式（WEBP 或 JPEG）
+
+    Returns:
+        {衍生圖名稱: {"content", "width", "height"}}
+    """
+    return _render(_open_photo(data), image_format)
+
+
+def process_photo(data: bytes, image_format: str = DERIVATIVE_FORMAT) -> Dict:
+    """
+    解碼一次照片，產生衍生圖並計算感知雜湊（於子程序中執行）
+
+    Returns:
+        {"derivatives": render_derivatives 的結果, "phash": 無號 64 位元 dHash}
+    """
+    image = _open_photo(data)
+    return {"phash": dhash(image), "derivatives": _render(image, image_format)}
+
+
+def _render(image: Image.Image, image_format: str) -> Dict[str, Dict]:
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if has_alpha and image_format == "WEBP":
+        image = image.convert("RGBA")
+    elif has_alpha:
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+        image = background
+    else:
+        image = image.convert("RGB")
+
+    results = {}
+    for name, max_side in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == "WEBP":
+            image.save(buffer, format="WEBP", quality=DERIVATIVE_QUALITY[name], method=4)
+        else:
+            image.save(buffer, format="JPEG", quality=DERIVATIVE_QUALITY[name], optimize=True, progressive=True)
+        results[name] = {"content": buffer.getvalue(), "width": image.width, "height": image.height}
+    return results
+
+
+def derivative_path(storage_path: str, name: str, image_format: str = DERIVATIVE_FORMAT) -> str:
+    """衍生圖的 Storage 路徑（與原始檔相同資料夾）"""
+    root = storage_path.rsplit(".", 1)[0] if "." in storage_path.rsplit("/", 1)[-1] else storage_path
+    return f"{root}_{name}.{DERIVATIVE_EXTENSIONS[image_format]}"
+
+
+class PhotoDerivativeService:
+    """照片衍生圖產生與 URL 組合"""
+
+    def __init__(self, cpu: Optional[CPUExecutor] = None):
+        self._cpu = cpu
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._failed: set = set()
+
+    @property
+    def cpu(self) -> CPUExecutor:
+        """影像處理使用的 CPU 執行器（預設為共用執行器）"""
+        return self._cpu or get_cpu_executor()
+
+    async def generate(self, photo: Dict) -> Optional[Dict]:
+        """
+        產生照片的衍生圖並記錄到 damage_photos
+
+        Args:
+            photo: 照片記錄（需含 id、storage_path）
+
+        Returns:
+            更新的欄位（thumbnail_path、preview_path、derivatives_generated_at、phash），失敗時回傳 None
+        """
+        from app.models.database import db_service
+        from app.services.photo_similarity import get_photo_similarity_service
+        from app.services.storage import storage_service
+
+        photo_id = photo["id"]
+        storage_path = photo["storage_path"]
+        bucket = storage_service.bucket_for_photo_path(storage_path)
+        try:
+            # 共用同一照片物件的記錄已有衍生圖時直接沿用（衍生圖路徑由物件路徑決定）
+            siblings = await asyncio.to_thread(db_service.get_photos_by_storage_paths, [storage_path])
+            done = next((row for row in siblings if row.get("derivatives_generated_at")), None)
+            if done:
+                update = {
+                    key: done.get(key)
+                    for key in ["derivatives_generated_at", "phash"] + [f"{name}_path" for name in DERIVATIVE_SIZES]
+                }
+            else:
+                update = await self._render_and_upload(bucket, storage_path)
+            await asyncio.to_thread(db_service.update_photo, photo_id, update)
+        except CPUExecutorBusy:
+            # 系統忙碌時略過，下次列出照片時再排程
+            logger.info(f"照片 {photo_id} 產生衍生圖略過（CPU 工作佇列已滿）")
+            return None
+        except Exception as e:
+            # 無法解碼的格式（例如未安裝 HEIC 外掛）不重複嘗試，列表改用原始照片
+            logger.warning(f"照片 {photo_id} 產生衍生圖失敗: {e}")
+            self._failed.add(photo_id)
+            return None
+
+        photo.update(update)
+        if photo.get("phash") is not None and photo.get("application_id"):
+            try:
+                await asyncio.to_thread(get_photo_similarity_service().record, photo)
+            except Exception as e:
+                logger.warning(f"照片 {photo_id} 相似照片比對失敗: {e}")
+        return update
+
+    async def _render_and_upload(self, bucket: str, storage_path: str) -> Dict:
+        from app.services.storage import storage_service
+
+        data = await asyncio.to_thread(storage_service.download_file, bucket, storage_path)
+        result = await self.cpu.run(process_photo, data, job="photo_derivatives")
+
+        mime_type = DERIVATIVE_MIME_TYPES[DERIVATIVE_FORMAT]
+        update = {
+            "derivatives_generated_at": datetime.now(timezone.utc).isoformat(),
+            "phash": to_signed(result["phash"])
+        }
+        for name, derivative in result["derivatives"].items():
+            path = derivative_path(storage_path, name)
+            await asyncio.to_thread(storage_service.upload_file, bucket, path, derivative["content"], mime_type)
+            update[f"{name}_path"] = path
+        return update
+
+    def schedule(self, photos: Iterable[Dict]) -> List[asyncio.Task]:
+        """
+        在背景為尚未有衍生圖的照片產生衍生圖（同一張照片同時只處理一次）
+
+        Args:
+            photos: 照片記錄
+
+        Returns:
+            新建立的背景工作
+        """
+        tasks = []
+        for photo in photos:
+            photo_id = photo.get("id")
+            if not photo_id or photo.get("thumbnail_path") or photo_id in self._failed or photo_id in self._inflight:
+                continue
+            if photo.get("mime_type") and not str(photo["mime_type"]).startswith("image/"):
+                continue
+            task = asyncio.create_task(self.generate(dict(photo)))
+            self._inflight[photo_id] = task
+            task.add_done_callback(lambda _, photo_id=photo_id: self._inflight.pop(photo_id, None))
+            tasks.append(task)
+        return tasks
+
+    async def attach_urls(self, photos: List[Dict], expires_in: int = 3600) -> List[Dict]:
+        """
+        為照片加上 signed_url、thumbnail_url、preview_url（快取未命中者一次批次簽名）
+
+        尚未產生衍生圖的照片以原始照片 URL 代替，並在背景排程產生
+
+        Args:
+            photos: 照片記錄
+            expires_in: URL 有效期限（秒）
+
+        Returns:
+            加上 URL 的照片記錄
+        """
+        from app.services.signed_urls import get_signed_url_service
+        from app.services.storage import storage_service
+
+        by_bucket: Dict[str, List[str]] = {}
+        for photo in photos:
+            bucket = storage_service.bucket_for_photo_path(photo["storage_path"])
+            for key in ("storage_path", "thumbnail_path", "preview_path"):
+                if photo.get(key):
+                    by_bucket.setdefault(bucket, []).append(photo[key])
+
+        urls = {}
+        for bucket, paths in by_bucket.items():
+            signed = await asyncio.to_thread(get_signed_url_service().sign_many, bucket, paths, expires_in)
+            urls.update({(bucket, path): url for path, url in signed.items()})
+
+        for photo in photos:
+            bucket = storage_service.bucket_for_photo_path(photo["storage_path"])
+            photo["signed_url"] = urls.get((bucket, photo["storage_path"]))
+            photo["thumbnail_url"] = urls.get((bucket, photo.get("thumbnail_path"))) or photo["signed_url"]
+            photo["preview_url"] = urls.get((bucket, photo.get("preview_path"))) or photo["signed_url"]
+
+        self.schedule(photos)
+        return photos
+
+
+# 全域衍生圖服務實例
+_photo_derivative_service: Optional[PhotoDerivativeService] = None
+
+
+def get_photo_derivative_service() -> PhotoDerivativeService:
+    """取得照片衍生圖服務（單例）"""
+    global _photo_derivative_service
+    if _photo_derivative_service is None:
+        _photo_derivative_service = PhotoDerivativeService()
+    return _photo_derivative_service
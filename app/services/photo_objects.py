@@ -0,0 +1,194 @@
+"""
+照片內容定址儲存
+以上傳時串流計算的 SHA-256 為 key，相同內容的照片只在 Storage 存一份（photo_objects），
+damage_photos 的 storage_path 指向共用物件並以 ref_count 記錄引用數。
+重複上傳時跳過 Storage 上傳；刪除照片只釋放引用，引用歸零超過保留時間後才由背景工作刪除物件
+"""
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 清除孤兒物件的間隔（秒）
+GC_INTERVAL_SECONDS = 3600
+
+
+def object_path(sha256: str, filename: str) -> str:
+    """
+    共用物件的 Storage 路徑
+
+    每次建立物件都帶有隨機後綴：物件被回收後再次上傳相同內容時使用新路徑，
+    不會與回收中的舊物件互相覆蓋
+    """
+    file_ext = filename.split('.')[-1].lower() if '.' in filename else 'jpg'
+    return f"objects/{sha256[:2]}/{sha256}_{uuid.uuid4().hex[:8]}.{file_ext}"
+
+
+class PhotoObjectService:
+    """照片物件的引用計數與回收"""
+
+    def __init__(self, grace_seconds: Optional[int] = None):
+        self.grace_seconds = settings.PHOTO_OBJECT_GRACE_HOURS * 3600 if grace_seconds is None else grace_seconds
+
+    @property
+    def bucket(self) -> str:
+        from app.services.storage import storage_service
+        return storage_service.documents_bucket
+
+    # ==========================================
+    # 取得引用
+    # ==========================================
+
+    def store(
+        self,
+        sha256: str,
+        size: int,
+        mime_type: str,
+        filename: str,
+        open_payload: Callable[[], Union[bytes, object]],
+        sign: bool = True
+    ) -> Dict:
+        """
+        儲存照片內容：已有相同內容的物件時只增加引用，否則上傳到共用物件路徑
+
+        Args:
+            sha256: 內容 SHA-256
+            size: 檔案大小
+            mime_type: MIME 類型
+            filename: 原始檔名（取副檔名）
+            open_payload: 取得上傳內容（bytes 或檔案讀取器），只在需要上傳時呼叫
+            sign: 是否產生簽名 URL
+
+        Returns:
+            {"storage_path", "signed_url", "bucket", "deduplicated"}
+        """
+        from app.models.database import db_service
+        from app.services.signed_urls import get_signed_url_service
+        from app.services.storage import PHOTO_SIGNED_URL_EXPIRES_IN, storage_service
+
+        record = db_service.acquire_photo_object(sha256, object_path(sha256, filename), size, mime_type)
+        path = record["storage_path"]
+        deduplicated = record.get("status") == "stored"
+        if not deduplicated:
+            # 新物件，或其他請求正在上傳相同內容（內容相同，重複上傳到同一路徑不影響結果）
+            try:
+                storage_service.upload_file(self.bucket, path, open_payload(), mime_type)
+                db_service.mark_photo_object_stored(sha256)
+            except Exception:
+                db_service.release_photo_object(sha256)
+                raise
+
+        url = get_signed_url_service().sign(self.bucket, path, PHOTO_SIGNED_URL_EXPIRES_IN) if sign else None
+        return {"storage_path": path, "signed_url": url, "bucket": self.bucket, "deduplicated": deduplicated}
+
+    def adopt(self, sha256: str, uploaded_path: str, size: int, mime_type: str) -> Tuple[str, Optional[str]]:
+        """
+        將用戶端直接上傳的檔案納入內容定址儲存
+
+        Args:
+            sha256: 已驗證的內容 SHA-256
+            uploaded_path: 用戶端上傳的路徑
+            size: 檔案大小
+            mime_type: MIME 類型
+
+        Returns:
+            (照片記錄使用的路徑, 記錄建立後可刪除的重複檔案路徑或 None)
+        """
+        from app.models.database import db_service
+        from app.services.storage import storage_service
+
+        record = db_service.acquire_photo_object(sha256, uploaded_path, size, mime_type)
+        path = record["storage_path"]
+        if path == uploaded_path:
+            db_service.mark_photo_object_stored(sha256)
+            return path, None
+        if record.get("status") != "stored":
+            # 共用物件還在上傳中：以伺服器端複製補上內容（目的已存在時表示對方已完成）
+            try:
+                storage_service.copy_file(self.bucket, uploaded_path, path)
+            except Exception as e:
+                logger.info(f"複製照片物件略過（{path}）: {e}")
+            db_service.mark_photo_object_stored(sha256)
+        return path, uploaded_path
+
+    # ==========================================
+    # 釋放引用
+    # ==========================================
+
+    def release_photos(self, photos: List[Dict]) -> None:
+        """
+        釋放照片記錄對物件的引用（照片記錄刪除或建立失敗時呼叫）
+
+        不屬於共用物件的舊照片（內容定址前上傳）在沒有其他記錄引用時直接刪除檔案
+
+        Args:
+            photos: 照片記錄（需含 storage_path、content_sha256）
+        """
+        from app.models.database import db_service
+        from app.services.photo_derivatives import DERIVATIVE_SIZES, derivative_path
+        from app.services.storage import storage_service
+
+        standalone: Dict[str, List[str]] = {}
+        for photo in photos:
+            sha256 = photo.get("content_sha256")
+            record = db_service.get_photo_object(sha256) if sha256 else None
+            if record and record["storage_path"] == photo["storage_path"]:
+                db_service.release_photo_object(sha256)
+                continue
+            if db_service.get_photos_by_storage_paths([photo["storage_path"]]):
+                continue
+            bucket = storage_service.bucket_for_photo_path(photo["storage_path"])
+            standalone.setdefault(bucket, []).extend(
+                [photo["storage_path"]] + [derivative_path(photo["storage_path"], name) for name in DERIVATIVE_SIZES]
+            )
+
+        for bucket, paths in standalone.items():
+            storage_service.remove_files(bucket, paths)
+
+    def collect_garbage(self, limit: int = 500) -> int:
+        """
+        刪除引用歸零超過保留時間的物件（含衍生圖）
+
+        Returns:
+            刪除的物件數
+        """
+        from app.models.database import db_service
+        from app.services.photo_derivatives import DERIVATIVE_SIZES, derivative_path
+        from app.services.storage import storage_service
+
+        records = db_service.collect_orphaned_photo_objects(self.grace_seconds, limit)
+        paths = []
+        for record in records:
+            paths.append(record["storage_path"])
+            paths.extend(derivative_path(record["storage_path"], name) for name in DERIVATIVE_SIZES)
+        if paths:
+            storage_service.remove_files(self.bucket, paths)
+            logger.info(f"已回收 {len(records)} 個未被引用的照片物件")
+        return len(records)
+
+    async def run_gc(self, interval: int = GC_INTERVAL_SECONDS) -> None:
+        """定期回收孤兒物件（於 lifespan 中以背景工作執行）"""
+        while True:
+            try:
+                await asyncio.to_thread(self.collect_garbage)
+            except Exception as e:
+                logger.warning(f"回收照片物件失敗: {e}")
+            await asyncio.sleep(interval)
+
+
+# 全域照片物件服務實例
+_photo_object_service: Optional[PhotoObjectService] = None
+
+
+def get_photo_object_service() -> PhotoObjectService:
+    """取得照片物件服務（單例）"""
+    global _photo_object_service
+    if _photo_object_service is None:
+        _photo_object_service = PhotoObjectService()
+    return _photo_object_service
@@ -0,0 +1,390 @@
+"""
+跨案件相似照片偵測
+為每張災損照片計算 64 位元差異雜湊（dHash），以多重索引雜湊表（multi-index hashing）建立行程內索引：
+雜湊切成 4 段 16 位元，漢明距離不超過 d 的兩個雜湊至少有一段距離不超過 d // 4，
+只需查詢各段鄰近值的候選照片再計算完整距離，百萬張照片也能在數毫秒內找出相似照片。
+與他案照片相似時寫入 photo_similarity_flags，供審核人員檢視重複使用的災損照片
+"""
+import asyncio
+import io
+import itertools
+import logging
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+HASH_BITS = 64
+INDEX_BLOCKS = 4
+BLOCK_BITS = HASH_BITS // INDEX_BLOCKS
+BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+# 回填雜湊時同時下載的照片數
+BACKFILL_DOWNLOAD_CONCURRENCY = 8
+
+
+# ==========================================
+# 感知雜湊
+# ==========================================
+
+def dhash(image: Image.Image) -> int:
+    """
+    計算差異雜湊：縮成 9x8 灰階後比較水平相鄰像素的亮度
+
+    對縮放、重新壓縮與輕微調色不敏感，回傳 64 位元無號整數
+    """
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def dhash_bytes(data: bytes) -> int:
+    """由照片內容計算差異雜湊（於子程序中執行，必須是模組層級函式）"""
+    with Image.open(io.BytesIO(data)) as original:
+        # 只需要 9x8 像素，JPEG 可在解碼時大幅縮小
+        original.draft("RGB", (64, 64))
+        return dhash(ImageOps.exif_transpose(original))
+
+
+def to_signed(value: int) -> int:
+    """無號 64 位元雜湊轉為 BIGINT 可儲存的有號整數"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed(value: int) -> int:
+    """BIGINT 讀回的有號整數轉為無號 64 位元雜湊"""
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """兩個雜湊的漢明距離"""
+    return bin(a ^ b).count("1")
+
+
+def _block_masks(radius: int) -> List[int]:
+    """16 位元內漢明距離不超過 radius 的所有 XOR 遮罩"""
+    masks = []
+    for bits in range(radius + 1):
+        for positions in itertools.combinations(range(BLOCK_BITS), bits):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return masks
+
+
+# ==========================================
+# 多重索引雜湊表
+# ==========================================
+
+class PhotoHashIndex:
+    """照片感知雜湊的多重索引雜湊表"""
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._reset(initial_capacity)
+
+    def _reset(self, initial_capacity: int) -> None:
+        self._hashes = np.zeros(initial_capacity, dtype=np.uint64)
+        self._ids: List[Optional[str]] = [None] * initial_capacity
+        self._applications: List[Optional[str]] = [None] * initial_capacity
+        self._slot_by_id: Dict[str, int] = {}
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(INDEX_BLOCKS)]
+        self._free_slots: List[int] = []
+        self._next_slot = 0
+        self._masks: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot_by_id)
+
+    @staticmethod
+    def _blocks(value: int) -> List[int]:
+        return [(value >> (block * BLOCK_BITS)) & BLOCK_MASK for block in range(INDEX_BLOCKS)]
+
+    def _allocate_slot(self) -> int:
+        if self._free_slots:
+            return self._free_slots.pop()
+        if self._next_slot >= len(self._hashes):
+            capacity = len(self._hashes) * 2
+            self._hashes = np.resize(self._hashes, capacity)
+            self._ids.extend([None] * (capacity - len(self._ids)))
+            self._applications.extend([None] * (capacity - len(self._applications)))
+        slot = self._next_slot
+        self._next_slot += 1
+        return slot
+
+    def add(self, photo_id: str, application_id: str, value: int) -> None:
+        """
+        加入或更新照片的雜湊
+
+        Args:
+            photo_id: 照片 ID
+            application_id: 所屬案件 ID
+            value: 無號 64 位元雜湊
+        """
+        with self._lock:
+            self.remove(photo_id)
+            slot = self._allocate_slot()
+            self._hashes[slot] = value
+            self._ids[slot] = photo_id
+            self._applications[slot] = application_id
+            self._slot_by_id[photo_id] = slot
+            for table, block in zip(self._tables, self._blocks(value)):
+                table.setdefault(block, []).append(slot)
+
+    def remove(self, photo_id: str) -> bool:
+        """移除照片（照片刪除時呼叫），回傳是否存在"""
+        with self._lock:
+            slot = self._slot_by_id.pop(photo_id, None)
+            if slot is None:
+                return False
+            for table, block in zip(self._tables, self._blocks(int(self._hashes[slot]))):
+                slots = table[block]
+                slots.remove(slot)
+                if not slots:
+                    del table[block]
+            self._ids[slot] = None
+            self._applications[slot] = None
+            self._free_slots.append(slot)
+            return True
+
+    def build(self, rows: Iterable[Dict]) -> int:
+        """
+        以照片資料重建索引
+
+        Args:
+            rows: [{"id", "application_id", "phash"}]，phash 為資料庫中的有號整數
+        """
+        with self._lock:
+            self._reset(1024)
+            for row in rows:
+                if row.get("phash") is not None:
+                    self.add(row["id"], row["application_id"], from_signed(int(row["phash"])))
+            return len(self)
+
+    def query(
+        self,
+        value: int,
+        max_distance: Optional[int] = None,
+        exclude_photo_id: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Tuple[str, str, int]]:
+        """
+        找出漢明距離不超過 max_distance 的照片
+
+        Args:
+            value: 無號 64 位元雜湊
+            max_distance: 最大漢明距離，預設為 SIMILAR_PHOTO_MAX_DISTANCE
+            exclude_photo_id: 排除的照片（通常是查詢的照片本身）
+            limit: 最多回傳筆數
+
+        Returns:
+            [(photo_id, application_id, distance)]，依距離排序
+        """
+        max_distance = settings.SIMILAR_PHOTO_MAX_DISTANCE if max_distance is None else max_distance
+        radius = max_distance // INDEX_BLOCKS
+        with self._lock:
+            masks = self._masks.get(radius)
+            if masks is None:
+                masks = self._masks[radius] = _block_masks(radius)
+
+            candidates = set()
+            for table, block in zip(self._tables, self._blocks(value)):
+                for mask in masks:
+                    slots = table.get(block ^ mask)
+                    if slots:
+                        candidates.update(slots)
+            if not candidates:
+                return []
+
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            xor = self._hashes[slots] ^ np.uint64(value)
+            distances = np.unpackbits(xor.view(np.uint8)).reshape(-1, HASH_BITS).sum(axis=1)
+            matched = np.flatnonzero(distances <= max_distance)
+            order = matched[np.argsort(distances[matched], kind="stable")]
+
+            results = []
+            for position in order:
+                slot = int(slots[position])
+                if self._ids[slot] == exclude_photo_id:
+                    continue
+                results.append((self._ids[slot], self._applications[slot], int(distances[position])))
+                if len(results) >= limit:
+                    break
+            return results
+
+    def load_from_database(self) -> int:
+        """
+        從 damage_photos 分頁載入所有已計算的雜湊
+
+        逐筆加入而不重建，載入期間新處理的照片不會被覆蓋
+        """
+        from app.models.database import db_service
+
+        after_id = None
+        while True:
+            page = db_service.get_photo_hashes(after_id=after_id)
+            if not page:
+                break
+            for row in page:
+                self.add(row["id"], row["application_id"], from_signed(int(row["phash"])))
+            after_id = page[-1]["id"]
+        logger.info(f"照片雜湊索引已建立：{len(self)} 張")
+        return len(self)
+
+
+# ==========================================
+# 相似照片服務
+# ==========================================
+
+class PhotoSimilarityService:
+    """相似照片查詢、跨案件標記與雜湊回填"""
+
+    def __init__(self, index: Optional[PhotoHashIndex] = None, max_distance: Optional[int] = None):
+        self.index = index or PhotoHashIndex()
+        self.max_distance = settings.SIMILAR_PHOTO_MAX_DISTANCE if max_distance is None else max_distance
+
+    async def load_index(self) -> None:
+        """載入雜湊索引（於 lifespan 中以背景工作執行，失敗不影響服務）"""
+        try:
+            await asyncio.to_thread(self.index.load_from_database)
+        except Exception as e:
+            logger.warning(f"照片雜湊索引載入失敗: {e}")
+
+    def record(self, photo: Dict) -> List[Dict]:
+        """
+        將已計算雜湊的照片加入索引，並標記與他案照片相似的配對
+
+        Args:
+            photo: 照片記錄（需含 id、application_id、phash）
+
+        Returns:
+            新增的相似照片標記
+        """
+        from app.models.database import db_service
+
+        value = from_signed(int(photo["phash"]))
+        matches = self.index.query(value, self.max_distance, exclude_photo_id=photo["id"])
+        self.index.add(photo["id"], photo["application_id"], value)
+
+        flags = [
+            {
+                "application_id": photo["application_id"],
+                "photo_id": photo["id"],
+                "similar_application_id": application_id,
+                "similar_photo_id": photo_id,
+                "distance": distance
+            }
+            for photo_id, application_id, distance in matches
+            if application_id != photo["application_id"]
+        ]
+        if flags:
+            logger.warning(f"照片 {photo['id']} 與 {len(flags)} 張他案照片相似")
+            db_service.create_photo_similarity_flags(flags)
+        return flags
+
+    def find_similar(
+        self,
+        photo: Dict,
+        max_distance: Optional[int] = None,
+        include_same_application: bool = False,
+        limit: int = 50
+    ) -> List[Dict]:
+        """
+        查詢相似照片
+
+        Args:
+            photo: 照片記錄（需含 id、application_id、phash）
+            max_distance: 最大漢明距離
+            include_same_application: 是否包含同案件的照片
+            limit: 最多回傳筆數
+
+        Returns:
+            相似照片記錄（含 distance），依距離排序
+        """
+        from app.models.database import db_service
+
+        matches = self.index.query(
+            from_signed(int(photo["phash"])),
+            self.max_distance if max_distance is None else max_distance,
+            exclude_photo_id=photo["id"],
+            limit=limit if include_same_application else limit * 4
+        )
+        if not include_same_application:
+            matches = [m for m in matches if m[1] != photo["application_id"]]
+        matches = matches[:limit]
+
+        rows = {row["id"]: row for row in db_service.get_photos_by_ids([m[0] for m in matches])}
+        results = []
+        for photo_id, _, distance in matches:
+            row = rows.get(photo_id)
+            if row is None:
+                # 其他 worker 已刪除的照片
+                self.index.remove(photo_id)
+                continue
+            results.append({**row, "distance": distance})
+        return results
+
+    def backfill(self, executor: Executor, page_size: int = 500) -> int:
+        """
+        為尚未計算雜湊的照片計算雜湊（優先下載縮圖，雜湊只需 9x8 像素）
+
+        Args:
+            executor: 計算雜湊的 process pool
+            page_size: 每批處理筆數
+
+        Returns:
+            完成的照片數
+        """
+        from app.models.database import db_service
+        from app.services.storage import storage_service
+
+        def download(photo):
+            path = photo.get("thumbnail_path") or photo["storage_path"]
+            try:
+                return storage_service.download_file(storage_service.bucket_for_photo_path(path), path)
+            except Exception as e:
+                logger.warning(f"照片 {photo['id']} 下載失敗: {e}")
+                return None
+
+        completed = 0
+        after_id = None
+        with ThreadPoolExecutor(max_workers=BACKFILL_DOWNLOAD_CONCURRENCY) as downloads:
+            while True:
+                page = db_service.get_photos_without_phash(after_id=after_id, page_size=page_size)
+                if not page:
+                    break
+                after_id = page[-1]["id"]
+                contents = list(downloads.map(download, page))
+                pending = [(photo, data) for photo, data in zip(page, contents) if data is not None]
+                futures = [executor.submit(dhash_bytes, data) for _, data in pending]
+                for (photo, _), future in zip(pending, futures):
+                    try:
+                        photo["phash"] = to_signed(future.result())
+                    except Exception as e:
+                        logger.warning(f"照片 {photo['id']} 無法計算雜湊: {e}")
+                        continue
+                    db_service.update_photo(photo["id"], {"phash": photo["phash"]})
+                    self.record(photo)
+                    completed += 1
+        return completed
+
+
+# 全域相似照片服務實例
+_photo_similarity_service: Optional[PhotoSimilarityService] = None
+
+
+def get_photo_similarity_service() -> PhotoSimilarityService:
+    """取得相似照片服務（單例）"""
+    global _photo_similarity_service
+    if _photo_similarity_service is None:
+        _photo_similarity_service = PhotoSimilarityService()
+    return _photo_similarity_service
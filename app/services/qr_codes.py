@@ -0,0 +1,240 @@
+"""
+QR Code 產生服務
+以 QR 矩陣直接繪製 PNG（整張縮放，不逐格繪製）或 SVG（每列合併成路徑，不需影像編碼），
+結果以「內容 + 格式 + 容錯等級」為 key 快取；大量核發憑證時在 process pool 中分批產生，
+不會阻塞 event loop
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+from app.services.cpu_executor import CPUExecutor, get_cpu_executor
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+QR_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+_ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# 每個模組（黑白格）的像素數與留白模組數
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+
+def _qr_matrix(content: str, error_correction: str) -> np.ndarray:
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=_ERROR_CORRECTION[error_correction],
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
+    )
+    qr.add_data(content)
+    qr.make(fit=True)
+    # get_matrix 已包含留白，True 為黑色模組
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def _render_png(matrix: np.ndarray) -> bytes:
+    size = matrix.shape[0] * QR_BOX_SIZE
+    # 1-bit 影像：True 為白色
+    image = Image.fromarray(~matrix).resize((size, size), Image.NEAREST)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _render_svg(matrix: np.ndarray) -> bytes:
+    modules = matrix.shape[0]
+    size = modules * QR_BOX_SIZE
+    path = []
+    for y, row in enumerate(matrix):
+        # 以差分找出每列連續黑色模組的起訖位置，合併成一個矩形
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], row, [False])).astype(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            path.append(f"M{start} {y}h{end - start}v1h-{end - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(path)}"/></svg>'
+    ).encode("ascii")
+
+
+def render_qr_code(content: str, image_format: str = "png", error_correction: str = "H") -> bytes:
+    """
+    產生 QR Code 圖片（可於子程序中執行，必須是模組層級函式）
+
+    Args:
+        content: QR Code 內容
+        image_format: png 或 svg
+        error_correction: 容錯等級（L、M、Q、H）
+
+    Returns:
+        圖片內容
+    """
+    matrix = _qr_matrix(content, error_correction)
+    return _render_svg(matrix) if image_format == "svg" else _render_png(matrix)
+
+
+def render_qr_codes(contents: Sequence[str], image_format: str = "png", error_correction: str = "H") -> List[bytes]:
+    """批次產生 QR Code（每批只需一次跨程序傳遞）"""
+    return [render_qr_code(content, image_format, error_correction) for content in contents]
+
+
+def _cache_key(content: str, image_format: str, error_correction: str) -> Tuple[str, str, str]:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest(), image_format, error_correction
+
+
+class QRCodeService:
+    """QR Code 產生、快取與批次核發"""
+
+    def __init__(
+        self,
+        cpu: Optional[CPUExecutor] = None,
+        cache_size: Optional[int] = None,
+        image_format: Optional[str] = None
+    ):
+        from app.services.cache import TTLCache
+
+        self._cpu = cpu
+        self.image_format = image_format or settings.QR_CODE_FORMAT
+        # 同一內容產生的圖片不會改變，快取只受容量限制
+        self.cache = TTLCache(maxsize=cache_size or settings.QR_CODE_CACHE_SIZE, ttl=24 * 3600)
+
+    @property
+    def cpu(self) -> CPUExecutor:
+        """批次產生使用的 CPU 執行器（預設為共用執行器）"""
+        return self._cpu or get_cpu_executor()
+
+    def render(self, content: str, image_format: Optional[str] = None, error_correction: str = "H") -> bytes:
+        """
+        產生單一 QR Code（同步，命中快取時不需重新產生）
+
+        Args:
+            content: QR Code 內容
+            image_format: png 或 svg，預設使用 QR_CODE_FORMAT
+            error_correction: 容錯等級
+
+        Returns:
+            圖片內容
+        """
+        image_format = image_format or self.image_format
+        key = _cache_key(content, image_format, error_correction)
+        image = self.cache.get(key)
+        if image is None:
+            image = render_qr_code(content, image_format, error_correction)
+            self.cache.set(key, image)
+        return image
+
+    async def render_async(self, content: str, image_format: Optional[str] = None, error_correction: str = "H") -> bytes:
+        """產生單一 QR Code（未快取時在 CPU 執行器中產生，不阻塞 event loop）"""
+        return (await self.render_many([content], image_format, error_correction))[0]
+
+    async def render_many(
+        self,
+        contents: Sequence[str],
+        image_format: Optional[str] = None,
+        error_correction: str = "H"
+    ) -> List[bytes]:
+        """
+        批次產生 QR Code：相同內容只產生一次，未快取的內容分成數批在 process pool 中並行產生
+
+        Args:
+            contents: QR Code 內容
+            image_format: png 或 svg，預設使用 QR_CODE_FORMAT
+            error_correction: 容錯等級
+
+        Returns:
+            依輸入順序的圖片內容
+        """
+        image_format = image_format or self.image_format
+        images: Dict[str, bytes] = {}
+        missing = []
+        for content in dict.fromkeys(contents):
+            image = self.cache.get(_cache_key(content, image_format, error_correction))
+            if image is None:
+                missing.append(content)
+            else:
+                images[content] = image
+
+        if missing:
+            batch_size = -(-len(missing) // self.cpu.max_workers)
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            results = await asyncio.gather(*(
+                self.cpu.run(render_qr_codes, batch, image_format, error_correction, job="qr_codes")
+                for batch in batches
+            ))
+            for batch, rendered in zip(batches, results):
+                for content, image in zip(batch, rendered):
+                    images[content] = image
+                    self.cache.set(_cache_key(content, image_format, error_correction), image)
+
+        return [images[content] for content in contents]
+
+    async def issue_certificate_codes(
+        self,
+        items: Sequence[Tuple[str, Dict]],
+        image_format: Optional[str] = None
+    ) -> List[Tuple[Optional[Dict], Optional[Exception]]]:
+        """
+        為多張憑證產生 QR Code 並上傳（產生在 process pool，上傳並行進行）
+
+        Args:
+            items: [(憑證編號, QR Code 資料)]
+            image_format: png 或 svg，預設使用 QR_CODE_FORMAT
+
+        Returns:
+            依輸入順序的 (storage.upload_qr_code 的結果, 例外)
+        """
+        from app.services.storage import storage_service
+        from app.services.uploads import run_concurrently
+
+        image_format = image_format or self.image_format
+        contents = [json.dumps(qr_data, ensure_ascii=False) for _, qr_data in items]
+        images = await self.render_many(contents, image_format)
+
+        async def upload(index):
+            return await asyncio.to_thread(
+                storage_service.upload_qr_code, items[index][0], contents[index], images[index], image_format
+            )
+
+        return await run_concurrently(range(len(items)), upload, settings.UPLOAD_CONCURRENCY)
+
+    async def issue_certificate_code(self, certificate_no: str, qr_data: Dict, image_format: Optional[str] = None) -> Dict:
+        """
+        為單張憑證產生 QR Code 並上傳
+
+        Returns:
+            storage.upload_qr_code 的結果
+        """
+        result, error = (await self.issue_certificate_codes([(certificate_no, qr_data)], image_format))[0]
+        if error is not None:
+            raise error
+        return result
+
+
+# 全域 QR Code 服務實例
+_qr_code_service: Optional[QRCodeService] = None
+
+
+def get_qr_code_service() -> QRCodeService:
+    """取得 QR Code 服務（單例）"""
+    global _qr_code_service
+    if _qr_code_service is None:
+        _qr_code_service = QRCodeService()
+    return _qr_code_service
@@ -0,0 +1,279 @@
+"""
+Google Maps API 速率限制與用量統計
+以檔案鎖保護的共享狀態實作權杖桶（token bucket），同一台主機上的多個 uvicorn worker 共用同一份額度，
+並記錄每日各端點的呼叫次數供成本控管
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 無 fcntl，僅限制單一行程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 各端點預設額度：每秒請求數、瞬間突發量、每日上限
+DEFAULT_BUDGETS: Dict[str, Dict[str, float]] = {
+    "geocode": {"qps": 40, "burst": 50, "daily_limit": 20000},
+    "directions": {"qps": 20, "burst": 20, "daily_limit": 5000},
+    "places": {"qps": 10, "burst": 10, "daily_limit": 3000},
+    "details": {"qps": 10, "burst": 10, "daily_limit": 3000},
+    "distance_matrix": {"qps": 20, "burst": 20, "daily_limit": 10000},
+    "autocomplete": {"qps": 20, "burst": 20, "daily_limit": 10000},
+}
+
+# 每千次請求的牌價（美元），僅供用量報表估算
+PRICE_PER_1000_USD = {
+    "geocode": 5.0,
+    "directions": 5.0,
+    "places": 32.0,
+    "details": 17.0,
+    "distance_matrix": 5.0,
+    "autocomplete": 2.83,
+}
+
+# 保留的每日用量天數
+HISTORY_DAYS = 31
+
+
+def parse_budgets(spec: Optional[str]) -> Dict[str, Dict[str, float]]:
+    """
+    解析額度設定字串並套用到預設值
+
+    格式：「端點=每秒請求數/每日上限」，以逗號分隔，例如 "geocode=20/10000,places=5/1000"
+
+    Args:
+        spec: 設定字串，空字串表示使用預設值
+
+    Returns:
+        各端點額度
+    """
+    budgets = {name: dict(values) for name, values in DEFAULT_BUDGETS.items()}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, value = (part.strip() for part in item.split("=", 1))
+        qps, _, daily_limit = value.partition("/")
+        budget = budgets.setdefault(name, {"qps": 1, "burst": 1, "daily_limit": 0})
+        if qps:
+            budget["qps"] = float(qps)
+            budget["burst"] = max(1.0, float(qps))
+        if daily_limit:
+            budget["daily_limit"] = int(daily_limit)
+    return budgets
+
+
+class MapsRateLimiter:
+    """跨 worker 共享的 Google Maps 速率限制器"""
+
+    def __init__(
+        self,
+        state_path: Optional[str] = None,
+        budgets: Optional[Dict[str, Dict[str, float]]] = None,
+        max_wait_seconds: float = 2.0,
+        quota_backoff_seconds: float = 60
+    ):
+        """
+        初始化速率限制器
+
+        Args:
+            state_path: 共享狀態檔路徑，預設放在系統暫存目錄
+            budgets: 各端點額度（qps、burst、daily_limit，daily_limit 為 0 表示不限）
+            max_wait_seconds: 權杖不足時最多排隊等待的秒數
+            quota_backoff_seconds: 收到 OVER_QUERY_LIMIT 等錯誤後暫停呼叫的秒數
+        """
+        self.state_path = state_path or os.path.join(tempfile.gettempdir(), "disaster-relief-maps-quota.json")
+        self.budgets = budgets or parse_budgets(None)
+        self.max_wait_seconds = max_wait_seconds
+        self.quota_backoff_seconds = quota_backoff_seconds
+        self._lock = threading.Lock()
+
+    # ==========================================
+    # 共享狀態
+    # ==========================================
+
+    @contextmanager
+    def _state(self):
+        """以檔案鎖讀取並寫回共享狀態"""
+        with self._lock:
+            with open(self.state_path, "a+", encoding="utf-8") as f:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw else {}
+                    except ValueError:
+                        logger.warning("Maps 用量狀態檔損毀，重新計算")
+                        state = {}
+                    state.setdefault("buckets", {})
+                    state.setdefault("usage", {})
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state, separators=(",", ":")))
+                    f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _usage_counter(state: Dict, endpoint: str, today: str) -> Dict:
+        usage = state["usage"]
+        if today not in usage:
+            usage[today] = {}
+            cutoff = (date.fromisoformat(today) - timedelta(days=HISTORY_DAYS)).isoformat()
+            for day in [d for d in usage if d < cutoff]:
+                del usage[day]
+        return usage[today].setdefault(endpoint, {"requests": 0, "denied": 0, "degraded": 0, "quota_errors": 0})
+
+    # ==========================================
+    # 取得權杖
+    # ==========================================
+
+    def try_acquire(self, endpoint: str) -> Tuple[bool, float]:
+        """
+        嘗試取得一個權杖（不等待）
+
+        Returns:
+            (是否取得, 建議等待秒數)；超過每日上限或暫停中時等待秒數為 inf
+        """
+        budget = self.budgets.get(endpoint)
+        if budget is None:
+            return True, 0.0
+
+        now = time.time()
+        today = date.today().isoformat()
+        with self._state() as state:
+            counter = self._usage_counter(state, endpoint, today)
+            bucket = state["buckets"].setdefault(endpoint, {"tokens": budget["burst"], "updated": now, "blocked_until": 0})
+
+            if now < bucket.get("blocked_until", 0):
+                return False, float("inf")
+            if budget["daily_limit"] and counter["requests"] >= budget["daily_limit"]:
+                return False, float("inf")
+
+            elapsed = max(0.0, now - bucket["updated"])
+            bucket["tokens"] = min(budget["burst"], bucket["tokens"] + elapsed * budget["qps"])
+            bucket["updated"] = now
+            if bucket["tokens"] >= 1:
+                bucket["tokens"] -= 1
+                counter["requests"] += 1
+                return True, 0.0
+            return False, (1 - bucket["tokens"]) / budget["qps"]
+
+    async def acquire(self, endpoint: str, max_wait: Optional[float] = None) -> bool:
+        """
+        取得權杖，不足時排隊等待（最多 max_wait 秒）
+
+        Returns:
+            是否取得；未取得時呼叫端應改用快取或估算結果
+        """
+        deadline = time.monotonic() + (self.max_wait_seconds if max_wait is None else max_wait)
+        while True:
+            acquired, wait = await asyncio.to_thread(self.try_acquire, endpoint)
+            if acquired:
+                return True
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                await asyncio.to_thread(self._record, endpoint, "denied")
+                return False
+            await asyncio.sleep(wait)
+
+    def record_quota_error(self, endpoint: str) -> None:
+        """收到配額錯誤時，讓所有 worker 暫停呼叫此端點一段時間"""
+        logger.warning(f"Google Maps {endpoint} 配額不足，暫停呼叫 {self.quota_backoff_seconds} 秒")
+        with self._state() as state:
+            bucket = state["buckets"].setdefault(endpoint, {"tokens": 0, "updated": time.time(), "blocked_until": 0})
+            bucket["blocked_until"] = time.time() + self.quota_backoff_seconds
+            self._usage_counter(state, endpoint, date.today().isoformat())["quota_errors"] += 1
+
+    def record_degraded(self, endpoint: str) -> None:
+        """記錄一次以快取或估算結果代替 API 呼叫"""
+        self._record(endpoint, "degraded")
+
+    def is_blocked(self, endpoint: str) -> bool:
+        """端點是否因配額錯誤暫停中"""
+        with self._state() as state:
+            return time.time() < state["buckets"].get(endpoint, {}).get("blocked_until", 0)
+
+    def _record(self, endpoint: str, field: str) -> None:
+        try:
+            with self._state() as state:
+                self._usage_counter(state, endpoint, date.today().isoformat())[field] += 1
+        except OSError as e:
+            logger.error(f"無法記錄 Maps 用量: {e}")
+
+    # ==========================================
+    # 用量報表
+    # ==========================================
+
+    def usage(self, days: int = 7) -> Dict:
+        """
+        取得每日用量報表
+
+        Args:
+            days: 回傳最近幾天
+
+        Returns:
+            {
+                "today": {"geocode": {"requests", "daily_limit", "remaining", "denied", "degraded", "quota_errors", "blocked"}},
+                "daily": [{"date": str, "endpoints": {...}, "estimated_cost_usd": float}]
+            }
+        """
+        today = date.today().isoformat()
+        now = time.time()
+        with self._state() as state:
+            usage = json.loads(json.dumps(state["usage"]))
+            buckets = dict(state["buckets"])
+
+        today_report = {}
+        for endpoint, budget in self.budgets.items():
+            counter = usage.get(today, {}).get(endpoint, {"requests": 0, "denied": 0, "degraded": 0, "quota_errors": 0})
+            limit = int(budget["daily_limit"])
+            today_report[endpoint] = {
+                **counter,
+                "daily_limit": limit or None,
+                "remaining": max(0, limit - counter["requests"]) if limit else None,
+                "qps": budget["qps"],
+                "blocked": now < buckets.get(endpoint, {}).get("blocked_until", 0)
+            }
+
+        daily = []
+        for day in sorted(usage, reverse=True)[:days]:
+            endpoints = usage[day]
+            cost = sum(
+                counter["requests"] / 1000 * PRICE_PER_1000_USD.get(endpoint, 0)
+                for endpoint, counter in endpoints.items()
+            )
+            daily.append({"date": day, "endpoints": endpoints, "estimated_cost_usd": round(cost, 2)})
+
+        return {"today": today_report, "daily": daily}
+
+
+# 全域服務實例
+_maps_rate_limiter: Optional[MapsRateLimiter] = None
+
+
+def get_maps_rate_limiter() -> MapsRateLimiter:
+    """取得 Google Maps 速率限制器實例"""
+    global _maps_rate_limiter
+    if _maps_rate_limiter is None:
+        from app.settings import get_settings
+        settings = get_settings()
+        _maps_rate_limiter = MapsRateLimiter(
+            state_path=settings.GOOGLE_MAPS_QUOTA_STATE_PATH or None,
+            budgets=parse_budgets(settings.GOOGLE_MAPS_BUDGETS),
+            max_wait_seconds=settings.GOOGLE_MAPS_MAX_WAIT_SECONDS
+        )
+    return _maps_rate_limiter
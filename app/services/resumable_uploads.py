@@ -0,0 +1,366 @@
+"""
+可續傳的照片上傳（類 tus 協定）
+建立上傳工作後，用戶端以 PATCH 依序送出區塊（標頭 Upload-Offset 為目前位置），
+連線中斷時以 HEAD 查詢伺服器已收到的位元組數，從該位置繼續；
+區塊直接附加到本機暫存檔，收齊後驗證格式與雜湊並存入照片物件（相同內容不重複上傳）。
+工作狀態與內容都存放在磁碟上（同一台主機的多個 worker 共用），接收區塊與完成上傳期間以 flock
+鎖定暫存檔，其他 worker 同時收到同一工作的請求時回傳 409；逾期未完成的工作定期清除
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Collection, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 無 fcntl，僅限制單一行程
+    fcntl = None
+
+from app.services.uploads import CHUNK_SIZE, PHOTO_MIME_TYPES, SNIFF_BYTES, UploadError, sniff_mime_type
+from app.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 清除逾期工作的間隔（秒）
+CLEANUP_INTERVAL_SECONDS = 600
+
+_UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _read_head(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(SNIFF_BYTES)
+
+
+class ResumableUploadService:
+    """可續傳上傳工作管理"""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_size: Optional[int] = None,
+        expires_minutes: Optional[int] = None,
+        allowed_mime_types: Collection[str] = PHOTO_MIME_TYPES
+    ):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "disaster-relief-resumable-uploads")
+        self.max_size = max_size or settings.MAX_UPLOAD_SIZE
+        self.expires_minutes = expires_minutes or settings.RESUMABLE_UPLOAD_EXPIRES_MINUTES
+        self.allowed_mime_types = set(allowed_mime_types)
+        os.makedirs(self.directory, exist_ok=True)
+
+    # ==========================================
+    # 工作狀態
+    # ==========================================
+
+    def _paths(self, upload_id: str):
+        if not _UPLOAD_ID_PATTERN.match(upload_id or ""):
+            raise UploadError("上傳工作不存在或已過期", status_code=404)
+        base = os.path.join(self.directory, upload_id)
+        return base + ".json", base + ".part"
+
+    def _load(self, upload_id: str) -> Dict:
+        meta_path, data_path = self._paths(upload_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise UploadError("上傳工作不存在或已過期", status_code=404)
+        if datetime.fromisoformat(meta["expires_at"]) <= datetime.now(timezone.utc):
+            self._discard(upload_id)
+            raise UploadError("上傳工作不存在或已過期", status_code=404)
+        meta["offset"] = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        return meta
+
+    def _discard(self, upload_id: str) -> None:
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _exclusive(self, upload_id: str) -> Iterator[int]:
+        """
+        鎖定上傳工作的暫存檔（flock，跨 worker 有效）
+
+        Yields:
+            以附加模式開啟的暫存檔 file descriptor
+
+        Raises:
+            UploadError: 工作不存在（404）或其他請求正在處理同一工作（409）
+        """
+        _, data_path = self._paths(upload_id)
+        try:
+            # 不使用 O_CREAT：工作完成或取消後暫存檔已刪除，不可重新建立
+            fd = os.open(data_path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            raise UploadError("上傳工作不存在或已過期", status_code=404)
+        try:
+            if fcntl:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadError("此上傳工作正在接收其他區塊", status_code=409)
+            yield fd
+        finally:
+            # 關閉即釋放 flock
+            os.close(fd)
+
+    @staticmethod
+    def _public(meta: Dict) -> Dict:
+        return {
+            "upload_id": meta["upload_id"],
+            "offset": meta["offset"],
+            "length": meta["length"],
+            "expires_at": meta["expires_at"],
+            "completed": False
+        }
+
+    def create(
+        self,
+        application_id: str,
+        photo_type: str,
+        file_name: str,
+        length: int,
+        description: Optional[str] = None,
+        uploaded_by: Optional[str] = None
+    ) -> Dict:
+        """
+        建立上傳工作
+
+        Args:
+            application_id: 申請案件 ID
+            photo_type: 照片類型
+            file_name: 檔案名稱
+            length: 檔案總大小（位元組）
+            description: 照片說明
+            uploaded_by: 上傳者 ID
+
+        Returns:
+            {"upload_id", "offset", "length", "expires_at", "completed"}
+
+        Raises:
+            UploadError: 大小不正確（400）或超過上限（413）
+        """
+        if length <= 0:
+            raise UploadError("檔案大小不正確")
+        if length > self.max_size:
+            raise UploadError(f"檔案大小不能超過 {self.max_size // 1024 // 1024}MB", status_code=413)
+
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "upload_id": upload_id,
+            "application_id": application_id,
+            "photo_type": photo_type,
+            "file_name": file_name,
+            "length": length,
+            "description": description,
+            "uploaded_by": uploaded_by,
+            "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=self.expires_minutes)).isoformat()
+        }
+        meta_path, data_path = self._paths(upload_id)
+        open(data_path, "wb").close()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        meta["offset"] = 0
+        return self._public(meta)
+
+    def status(self, upload_id: str) -> Dict:
+        """
+        查詢上傳工作目前收到的位元組數
+
+        Raises:
+            UploadError: 工作不存在或已過期（404）
+        """
+        return self._public(self._load(upload_id))
+
+    def cancel(self, upload_id: str) -> None:
+        """取消上傳工作並刪除暫存檔（其他請求正在寫入時回傳 409）"""
+        with self._exclusive(upload_id):
+            self._load(upload_id)
+            self._discard(upload_id)
+
+    # ==========================================
+    # 接收區塊
+    # ==========================================
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict:
+        """
+        從 offset 附加一個區塊；收齊檔案時驗證並上傳到 Storage、建立照片記錄
+
+        區塊邊收邊寫入暫存檔，連線在區塊中途中斷時已寫入的部分仍然保留
+
+        Args:
+            upload_id: 上傳工作 ID
+            offset: 用戶端認定的目前位置（必須與伺服器一致）
+            chunks: 請求內容
+
+        Returns:
+            未完成：{"upload_id", "offset", "length", "expires_at", "completed": False}
+            完成：另含 "completed": True 與 "photo"（照片記錄，含 signed_url）
+
+        Raises:
+            UploadError: 工作不存在（404）、位置不符（409）、超過宣告大小（413）、格式不符（415）
+        """
+        with self._exclusive(upload_id) as fd:
+            # 取得鎖之後才讀取狀態：等待期間其他 worker 可能已附加區塊或完成上傳
+            meta = self._load(upload_id)
+            meta["offset"] = os.fstat(fd).st_size
+            if offset != meta["offset"]:
+                raise UploadError(f"Upload-Offset 不符（伺服器目前為 {meta['offset']}）", status_code=409)
+
+            _, data_path = self._paths(upload_id)
+            written = meta["offset"]
+            # 第一個區塊就檢查格式，避免收完整個檔案才發現不是圖片；已收到的開頭只讀取一次
+            head = b""
+            if 0 < written < SNIFF_BYTES:
+                head = await asyncio.to_thread(_read_head, data_path)
+            # 磁碟寫入在執行緒中進行，不阻塞事件迴圈
+            with os.fdopen(fd, "ab", closefd=False) as f:
+                try:
+                    async for chunk in chunks:
+                        if not chunk:
+                            continue
+                        if written + len(chunk) > meta["length"]:
+                            raise UploadError("上傳內容超過宣告的檔案大小", status_code=413)
+                        if written < SNIFF_BYTES:
+                            head += chunk[:SNIFF_BYTES - len(head)]
+                            if len(head) >= min(SNIFF_BYTES, meta["length"]) and sniff_mime_type(head) not in self.allowed_mime_types:
+                                self._discard(upload_id)
+                                raise UploadError("不支援的檔案格式", status_code=415)
+                        await asyncio.to_thread(f.write, chunk)
+                        written += len(chunk)
+                finally:
+                    await asyncio.to_thread(f.flush)
+
+            meta["offset"] = written
+            if written < meta["length"]:
+                return self._public(meta)
+
+            try:
+                photo = await self._complete(meta, data_path)
+            except UploadError as e:
+                if e.status_code == 415:
+                    self._discard(upload_id)
+                raise
+            # 上傳或寫入記錄失敗時保留暫存檔，用戶端以相同 offset 重送空區塊即可重試
+            self._discard(upload_id)
+            return {**self._public(meta), "completed": True, "photo": photo}
+
+    async def _complete(self, meta: Dict, data_path: str) -> Dict:
+        from app.models.database import db_service
+        from app.services.photo_objects import get_photo_object_service
+
+        def verify():
+            digest = hashlib.sha256()
+            with open(data_path, "rb") as f:
+                head = f.read(SNIFF_BYTES)
+                digest.update(head)
+                for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(block)
+            return sniff_mime_type(head), digest.hexdigest()
+
+        mime_type, sha256 = await asyncio.to_thread(verify)
+        if mime_type not in self.allowed_mime_types:
+            raise UploadError("不支援的檔案格式", status_code=415)
+
+        def store():
+            with open(data_path, "rb") as f:
+                return get_photo_object_service().store(
+                    sha256=sha256,
+                    size=meta["length"],
+                    mime_type=mime_type,
+                    filename=meta["file_name"],
+                    open_payload=lambda: f
+                )
+
+        stored = await asyncio.to_thread(store)
+        photo_data = {
+            "application_id": meta["application_id"],
+            "photo_type": meta["photo_type"],
+            "storage_path": stored["storage_path"],
+            "file_name": meta["file_name"],
+            "file_size": meta["length"],
+            "mime_type": mime_type,
+            "content_sha256": sha256,
+            "description": meta.get("description"),
+            "uploaded_by": meta.get("uploaded_by")
+        }
+        # 寫入失敗（含資料庫錯誤）時釋放引用；用戶端重試時 store() 會重新取得一次
+        try:
+            photo = await asyncio.to_thread(db_service.create_damage_photo, photo_data)
+        except Exception:
+            await asyncio.to_thread(get_photo_object_service().release_photos, [photo_data])
+            raise
+        if not photo:
+            await asyncio.to_thread(get_photo_object_service().release_photos, [photo_data])
+            raise UploadError("建立照片記錄失敗", status_code=500)
+        photo["signed_url"] = stored["signed_url"]
+        return photo
+
+    # ==========================================
+    # 清除逾期工作
+    # ==========================================
+
+    def purge_expired(self) -> int:
+        """
+        刪除逾期未完成的上傳工作
+
+        Returns:
+            刪除的工作數
+        """
+        now = datetime.now(timezone.utc)
+        removed = 0
+        for name in os.listdir(self.directory):
+            upload_id, ext = os.path.splitext(name)
+            if ext != ".json" or not _UPLOAD_ID_PATTERN.match(upload_id):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    expires_at = datetime.fromisoformat(json.load(f)["expires_at"])
+            except (OSError, ValueError, KeyError):
+                expires_at = now
+            if expires_at > now:
+                continue
+            try:
+                with self._exclusive(upload_id):
+                    self._discard(upload_id)
+            except UploadError as e:
+                if e.status_code == 409:
+                    # 仍在接收區塊
+                    continue
+                self._discard(upload_id)
+            removed += 1
+        if removed:
+            logger.info(f"已清除 {removed} 個逾期的續傳上傳工作")
+        return removed
+
+    async def run_cleanup(self, interval: int = CLEANUP_INTERVAL_SECONDS) -> None:
+        """定期清除逾期工作（於 lifespan 中以背景工作執行）"""
+        while True:
+            try:
+                await asyncio.to_thread(self.purge_expired)
+            except Exception as e:
+                logger.warning(f"清除續傳上傳工作失敗: {e}")
+            await asyncio.sleep(interval)
+
+
+# 全域續傳上傳服務實例
+_resumable_upload_service: Optional[ResumableUploadService] = None
+
+
+def get_resumable_upload_service() -> ResumableUploadService:
+    """取得續傳上傳服務（單例）"""
+    global _resumable_upload_service
+    if _resumable_upload_service is None:
+        _resumable_upload_service = ResumableUploadService(directory=settings.RESUMABLE_UPLOAD_DIR or None)
+    return _resumable_upload_service
@@ -0,0 +1,107 @@
+"""
+簽名 URL 服務
+以 Storage 的批次簽名 API 一次為多個檔案產生簽名 URL，並快取到到期前不久；
+熱門案件重複瀏覽時不再呼叫 Storage
+"""
+import logging
+from typing import Dict, Iterable, Optional
+
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 快取在 URL 到期前提早失效的秒數上限（並保留至少 20% 有效期給用戶端使用）
+REFRESH_MARGIN_SECONDS = 300
+
+# 快取的 URL 數量上限
+SIGNED_URL_CACHE_SIZE = 100_000
+
+
+class SignedUrlService:
+    """批次產生並快取 Storage 簽名 URL"""
+
+    def __init__(self, cache_size: int = SIGNED_URL_CACHE_SIZE, refresh_margin: float = REFRESH_MARGIN_SECONDS):
+        self.refresh_margin = refresh_margin
+        self.cache = TTLCache(maxsize=cache_size, ttl=3600)
+        # 使用過的有效期（通常只有少數幾種），清除快取時用來組出所有 key
+        self._expires_in_values = set()
+        self.storage_calls = 0
+
+    def _cache_ttl(self, expires_in: int) -> float:
+        return expires_in - min(self.refresh_margin, expires_in * 0.2)
+
+    def sign_many(self, bucket_name: str, paths: Iterable[str], expires_in: int = 3600) -> Dict[str, Optional[str]]:
+        """
+        取得多個檔案的簽名 URL（快取未命中的檔案以單次批次簽名產生）
+
+        Args:
+            bucket_name: Bucket 名稱
+            paths: Storage 路徑
+            expires_in: URL 有效期限（秒）
+
+        Returns:
+            Storage 路徑 → 簽名 URL（產生失敗者為 None）
+        """
+        from app.services.storage import storage_service
+
+        urls: Dict[str, Optional[str]] = {}
+        missing = []
+        for path in dict.fromkeys(p for p in paths if p):
+            url = self.cache.get((bucket_name, path, expires_in))
+            if url is None:
+                missing.append(path)
+            urls[path] = url
+
+        if missing:
+            self.storage_calls += 1
+            signed = storage_service.create_signed_urls(bucket_name, missing, expires_in)
+            ttl = self._cache_ttl(expires_in)
+            self._expires_in_values.add(expires_in)
+            for path in missing:
+                url = signed.get(path)
+                urls[path] = url
+                if url:
+                    self.cache.set((bucket_name, path, expires_in), url, ttl=ttl)
+        return urls
+
+    def sign(self, bucket_name: str, path: str, expires_in: int = 3600) -> Optional[str]:
+        """
+        取得單一檔案的簽名 URL
+
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+            expires_in: URL 有效期限（秒）
+
+        Returns:
+            簽名 URL，產生失敗時回傳 None
+        """
+        return self.sign_many(bucket_name, [path], expires_in).get(path)
+
+    def invalidate(self, bucket_name: str, paths: Iterable[str]) -> None:
+        """
+        移除檔案的快取 URL（檔案刪除或覆寫時呼叫）
+
+        Args:
+            bucket_name: Bucket 名稱
+            paths: Storage 路徑
+        """
+        for path in paths:
+            for expires_in in list(self._expires_in_values):
+                self.cache.pop((bucket_name, path, expires_in))
+
+    def stats(self) -> dict:
+        """快取統計"""
+        return {**self.cache.stats(), "storage_calls": self.storage_calls}
+
+
+# 全域簽名 URL 服務實例
+_signed_url_service: Optional[SignedUrlService] = None
+
+
+def get_signed_url_service() -> SignedUrlService:
+    """取得簽名 URL 服務（單例）"""
+    global _signed_url_service
+    if _signed_url_service is None:
+        _signed_url_service = SignedUrlService()
+    return _signed_url_service
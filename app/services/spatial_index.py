@@ -0,0 +1,502 @@
+"""
+案件空間索引
+以經緯度網格（bucket）搭配 NumPy 陣列建立行程內索引，
+支援「半徑內案件」、「最近 k 件」與矩形範圍查詢，並可依狀態、區域篩選
+"""
+import logging
+import math
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.services import case_events
+from app.services.geo import haversine_to_point
+
+logger = logging.getLogger(__name__)
+
+# 每度緯度約 111.32 公里
+METERS_PER_DEGREE = 111_320.0
+
+# 索引異動監聽器：(異動前, 異動後)，新增時異動前為 None、移除時異動後為 None，
+# 整體重建時兩者皆為 None
+IndexListener = Callable[[Optional[Dict], Optional[Dict]], None]
+
+
+class CaseSpatialIndex:
+    """申請案件的網格空間索引"""
+
+    def __init__(self, cell_size_deg: float = 0.005, initial_capacity: int = 1024):
+        """
+        初始化空間索引
+
+        Args:
+            cell_size_deg: 網格邊長（度），0.005 度約 500 公尺
+            initial_capacity: 初始陣列容量，不足時自動倍增
+        """
+        self.cell_size_deg = cell_size_deg
+        self._lock = threading.RLock()
+        self._listeners: List[IndexListener] = []
+        self._notify = True
+        self._reset(initial_capacity)
+
+    def _reset(self, initial_capacity: int) -> None:
+        """清空索引並配置指定容量的陣列"""
+        self._lat = np.zeros(initial_capacity, dtype=np.float64)
+        self._lng = np.zeros(initial_capacity, dtype=np.float64)
+        self._status = np.full(initial_capacity, -1, dtype=np.int32)
+        self._district = np.full(initial_capacity, -1, dtype=np.int32)
+        self._amount = np.zeros(initial_capacity, dtype=np.float64)
+        self._approved = np.zeros(initial_capacity, dtype=np.float64)
+        self._disaster = np.full(initial_capacity, -1, dtype=np.int32)
+        self._active = np.zeros(initial_capacity, dtype=bool)
+
+        self._ids: List[Optional[str]] = [None] * initial_capacity
+        self._slot_by_id: Dict[str, int] = {}
+        self._cell_of_slot: Dict[int, Tuple[int, int]] = {}
+        self._cells: Dict[Tuple[int, int], set] = defaultdict(set)
+        # 已使用網格的外框 (min_x, max_x, min_y, max_y)，新增網格時擴張；移除邊界上的網格時設為 None，查詢時再重算
+        self._cell_bounds: Optional[Tuple[int, int, int, int]] = None
+        self._cell_bounds_dirty = False
+        self._free_slots: List[int] = []
+        self._next_slot = 0
+
+        # 將狀態、區域、災害類型字串編碼為整數，以便向量化篩選
+        self._status_codes: Dict[str, int] = {}
+        self._status_names: List[str] = []
+        self._district_codes: Dict[str, int] = {}
+        self._district_names: List[str] = []
+        self._disaster_codes: Dict[str, int] = {}
+        self._disaster_names: List[str] = []
+
+    # ==========================================
+    # 建立與更新
+    # ==========================================
+
+    def build(self, applications: Iterable[Dict]) -> int:
+        """
+        以案件資料重建索引
+
+        Args:
+            applications: 案件列表，需包含 id、latitude、longitude，
+                可選 status、district_id、disaster_type、requested_amount、approved_amount
+
+        Returns:
+            已索引的案件數
+        """
+        with self._lock:
+            self._reset(max(1024, len(self._ids)))
+            self._notify = False
+            try:
+                for application in applications:
+                    self.upsert(application)
+            finally:
+                self._notify = True
+            count = len(self._slot_by_id)
+        self._emit(None, None)
+        return count
+
+    def add_listener(self, listener: IndexListener) -> None:
+        """註冊索引異動監聽器（例如地圖圖磚快取失效）"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _emit(self, before: Optional[Dict], after: Optional[Dict]) -> None:
+        if not self._notify or before == after and before is not None:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(before, after)
+            except Exception as e:
+                logger.error(f"空間索引監聽器執行失敗: {e}")
+
+    def upsert(self, application: Dict) -> None:
+        """新增或更新單一案件；沒有座標的案件會從索引移除"""
+        application_id = application.get("id")
+        if not application_id:
+            return
+        application_id = str(application_id)
+
+        latitude = application.get("latitude")
+        longitude = application.get("longitude")
+
+        with self._lock:
+            slot = self._slot_by_id.get(application_id)
+            before = self._row(slot) if slot is not None else None
+
+            if latitude is None or longitude is None:
+                # 只有在資料本身帶有座標欄位時才視為「座標被清除」
+                if "latitude" in application or "longitude" in application:
+                    self.remove(application_id)
+                elif slot is not None:
+                    self._update_attributes(slot, application)
+                    self._emit(before, self._row(slot))
+                return
+
+            if slot is None:
+                slot = self._allocate_slot()
+                self._slot_by_id[application_id] = slot
+                self._ids[slot] = application_id
+                self._active[slot] = True
+            else:
+                self._discard_from_cell(slot, self._cell_of_slot[slot])
+
+            self._lat[slot] = float(latitude)
+            self._lng[slot] = float(longitude)
+            cell = self._cell_key(float(latitude), float(longitude))
+            self._add_to_cell(slot, cell)
+            self._update_attributes(slot, application)
+            self._emit(before, self._row(slot))
+
+    def remove(self, application_id: str) -> bool:
+        """從索引移除案件"""
+        with self._lock:
+            slot = self._slot_by_id.pop(str(application_id), None)
+            if slot is None:
+                return False
+            before = self._row(slot)
+            self._discard_from_cell(slot, self._cell_of_slot.pop(slot))
+            self._active[slot] = False
+            self._ids[slot] = None
+            self._free_slots.append(slot)
+            self._emit(before, None)
+            return True
+
+    def get(self, application_id: str) -> Optional[Dict]:
+        """取得單一案件在索引中的資料"""
+        with self._lock:
+            slot = self._slot_by_id.get(str(application_id))
+            if slot is None:
+                return None
+            return self._row(slot)
+
+    def _add_to_cell(self, slot: int, cell: Tuple[int, int]) -> None:
+        bucket = self._cells[cell]
+        if not bucket and not self._cell_bounds_dirty:
+            # 新網格：擴張外框
+            if self._cell_bounds is None:
+                self._cell_bounds = (cell[0], cell[0], cell[1], cell[1])
+            else:
+                min_x, max_x, min_y, max_y = self._cell_bounds
+                self._cell_bounds = (min(min_x, cell[0]), max(max_x, cell[0]), min(min_y, cell[1]), max(max_y, cell[1]))
+        bucket.add(slot)
+        self._cell_of_slot[slot] = cell
+
+    def _discard_from_cell(self, slot: int, cell: Tuple[int, int]) -> None:
+        bucket = self._cells[cell]
+        bucket.discard(slot)
+        if bucket:
+            return
+        del self._cells[cell]
+        bounds = self._cell_bounds
+        if bounds is not None and (cell[0] in bounds[:2] or cell[1] in bounds[2:]):
+            # 邊界上的網格清空時外框可能縮小，延後到下次查詢才重算
+            self._cell_bounds_dirty = True
+
+    def _occupied_bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """已使用網格的外框（必要時重算）"""
+        if self._cell_bounds_dirty:
+            if self._cells:
+                xs, ys = zip(*self._cells.keys())
+                self._cell_bounds = (min(xs), max(xs), min(ys), max(ys))
+            else:
+                self._cell_bounds = None
+            self._cell_bounds_dirty = False
+        return self._cell_bounds
+
+    def _update_attributes(self, slot: int, application: Dict) -> None:
+        if "status" in application:
+            self._status[slot] = self._encode(application.get("status"), self._status_codes, self._status_names)
+        if "district_id" in application:
+            self._district[slot] = self._encode(application.get("district_id"), self._district_codes, self._district_names)
+        if "requested_amount" in application:
+            self._amount[slot] = float(application.get("requested_amount") or 0)
+        if "approved_amount" in application:
+            self._approved[slot] = float(application.get("approved_amount") or 0)
+        if "disaster_type" in application:
+            self._disaster[slot] = self._encode(application.get("disaster_type"), self._disaster_codes, self._disaster_names)
+
+    @staticmethod
+    def _encode(value: Optional[str], codes: Dict[str, int], names: List[str]) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        code = codes.get(value)
+        if code is None:
+            code = len(names)
+            codes[value] = code
+            names.append(value)
+        return code
+
+    def _allocate_slot(self) -> int:
+        if self._free_slots:
+            return self._free_slots.pop()
+        if self._next_slot >= len(self._ids):
+            self._grow()
+        slot = self._next_slot
+        self._next_slot += 1
+        return slot
+
+    def _grow(self) -> None:
+        capacity = len(self._ids) * 2
+        self._lat = np.resize(self._lat, capacity)
+        self._lng = np.resize(self._lng, capacity)
+        self._status = np.concatenate([self._status, np.full(capacity - len(self._status), -1, dtype=np.int32)])
+        self._district = np.concatenate([self._district, np.full(capacity - len(self._district), -1, dtype=np.int32)])
+        self._amount = np.concatenate([self._amount, np.zeros(capacity - len(self._amount), dtype=np.float64)])
+        self._approved = np.concatenate([self._approved, np.zeros(capacity - len(self._approved), dtype=np.float64)])
+        self._disaster = np.concatenate([self._disaster, np.full(capacity - len(self._disaster), -1, dtype=np.int32)])
+        self._active = np.concatenate([self._active, np.zeros(capacity - len(self._active), dtype=bool)])
+        self._ids.extend([None] * (capacity - len(self._ids)))
+
+    def _cell_key(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (math.floor(latitude / self.cell_size_deg), math.floor(longitude / self.cell_size_deg))
+
+    # ==========================================
+    # 查詢
+    # ==========================================
+
+    def query_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_m: float,
+        status: Optional[Union[str, Sequence[str]]] = None,
+        district_id: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        查詢半徑內的案件（依距離由近到遠排序）
+
+        Args:
+            latitude, longitude: 查詢中心
+            radius_m: 半徑（公尺）
+            status: 狀態篩選（單一或多個）
+            district_id: 區域篩選
+            limit: 最多回傳筆數
+
+        Returns:
+            [{"id", "latitude", "longitude", "status", "district_id", "distance_m"}]
+        """
+        with self._lock:
+            slots, distances = self._candidates_within(latitude, longitude, radius_m, status, district_id)
+            order = np.argsort(distances, kind="stable")
+            if limit is not None:
+                order = order[:limit]
+            return [self._row(int(slots[i]), float(distances[i])) for i in order]
+
+    def query_knn(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        status: Optional[Union[str, Sequence[str]]] = None,
+        district_id: Optional[str] = None,
+        max_radius_m: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        查詢最近的 k 件案件
+
+        由一個網格大小的半徑開始，依已找到的件數擴大半徑（至少加倍）直到找到 k 件或超過 max_radius_m；
+        因每次半徑查詢皆為精確結果，找到 k 件時即為真正的最近 k 件。
+        """
+        if k <= 0:
+            return []
+
+        with self._lock:
+            farthest = self._farthest_cell_distance(latitude, longitude)
+            radius = self.cell_size_deg * METERS_PER_DEGREE
+            while True:
+                if max_radius_m is not None:
+                    radius = min(radius, max_radius_m)
+                slots, distances = self._candidates_within(latitude, longitude, radius, status, district_id)
+                covers_all = radius >= farthest
+                reached_limit = max_radius_m is not None and radius >= max_radius_m
+                if len(slots) >= k or covers_all or reached_limit:
+                    break
+                # 案件數與面積成正比：依目前找到的件數估計所需半徑，減少篩選條件嚴格時的擴張次數
+                radius *= min(8.0, max(2.0, 1.2 * math.sqrt(k / max(len(slots), 1))))
+
+            order = np.argsort(distances, kind="stable")[:k]
+            return [self._row(int(slots[i]), float(distances[i])) for i in order]
+
+    def _candidates_within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_m: float,
+        status: Optional[Union[str, Sequence[str]]],
+        district_id: Optional[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """取得半徑內且符合篩選條件的 slot 與距離"""
+        d_lat = radius_m / METERS_PER_DEGREE
+        d_lng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        slots = self._slots_in_cells(latitude - d_lat, longitude - d_lng, latitude + d_lat, longitude + d_lng)
+
+        if len(slots):
+            mask = self._filter_mask(slots, status, district_id)
+            slots = slots[mask]
+
+        if not len(slots):
+            return slots, np.empty(0, dtype=np.float64)
+
+        distances = haversine_to_point(self._lat[slots], self._lng[slots], latitude, longitude)
+        within = distances <= radius_m
+        return slots[within], distances[within]
+
+    def _slots_in_cells(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> np.ndarray:
+        """取得與矩形範圍重疊之網格內的所有 slot（候選集合，尚未精確過濾）"""
+        min_cell = self._cell_key(min_lat, min_lng)
+        max_cell = self._cell_key(max_lat, max_lng)
+        cell_count = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+
+        if cell_count > len(self._cells):
+            # 查詢範圍比已使用的網格還多時，直接掃描所有有效案件
+            return np.flatnonzero(self._active[:self._next_slot])
+
+        buckets = []
+        for cx in range(min_cell[0], max_cell[0] + 1):
+            for cy in range(min_cell[1], max_cell[1] + 1):
+                bucket = self._cells.get((cx, cy))
+                if bucket:
+                    buckets.extend(bucket)
+        return np.fromiter(buckets, dtype=np.int64, count=len(buckets))
+
+    def query_bbox_arrays(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        status: Optional[Union[str, Sequence[str]]] = None,
+        district_id: Optional[str] = None,
+        disaster_type: Optional[str] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        查詢矩形範圍內的案件，以陣列形式回傳供向量化彙總（例如地圖分群）
+
+        Returns:
+            {
+                "ids": 案件 ID 陣列（object）,
+                "latitude": 緯度陣列, "longitude": 經度陣列,
+                "status_code": 狀態代碼陣列（-1 表示無狀態）,
+                "status_names": 狀態代碼對應的名稱列表,
+                "requested_amount": 申請金額陣列,
+                "approved_amount": 核准金額陣列
+            }
+        """
+        with self._lock:
+            slots = self._slots_in_cells(min_lat, min_lng, max_lat, max_lng)
+            if len(slots):
+                lat = self._lat[slots]
+                lng = self._lng[slots]
+                inside = (lat >= min_lat) & (lat < max_lat) & (lng >= min_lng) & (lng < max_lng)
+                slots = slots[inside & self._filter_mask(slots, status, district_id, disaster_type)]
+
+            return {
+                "ids": np.array([self._ids[s] for s in slots.tolist()], dtype=object),
+                "latitude": self._lat[slots],
+                "longitude": self._lng[slots],
+                "status_code": self._status[slots],
+                "status_names": list(self._status_names),
+                "requested_amount": self._amount[slots],
+                "approved_amount": self._approved[slots],
+            }
+
+    def _filter_mask(
+        self,
+        slots: np.ndarray,
+        status: Optional[Union[str, Sequence[str]]],
+        district_id: Optional[str],
+        disaster_type: Optional[str] = None
+    ) -> np.ndarray:
+        mask = np.ones(len(slots), dtype=bool)
+        if status:
+            statuses = [status] if isinstance(status, str) else list(status)
+            codes = [self._status_codes[s] for s in statuses if s in self._status_codes]
+            mask &= np.isin(self._status[slots], codes)
+        if district_id:
+            code = self._district_codes.get(str(district_id), -2)
+            mask &= self._district[slots] == code
+        if disaster_type:
+            code = self._disaster_codes.get(str(disaster_type), -2)
+            mask &= self._disaster[slots] == code
+        return mask
+
+    def _farthest_cell_distance(self, latitude: float, longitude: float) -> float:
+        """查詢點到所有已使用網格外框角落的最遠距離（半徑超過即不會再有新結果）"""
+        bounds = self._occupied_bounds()
+        if bounds is None:
+            return 0.0
+        min_x, max_x, min_y, max_y = bounds
+        lat_lo = min_x * self.cell_size_deg
+        lat_hi = (max_x + 1) * self.cell_size_deg
+        lng_lo = min_y * self.cell_size_deg
+        lng_hi = (max_y + 1) * self.cell_size_deg
+        corners = haversine_to_point(
+            np.array([lat_lo, lat_lo, lat_hi, lat_hi]),
+            np.array([lng_lo, lng_hi, lng_lo, lng_hi]),
+            latitude, longitude
+        )
+        return float(corners.max())
+
+    def _row(self, slot: int, distance: Optional[float] = None) -> Dict:
+        status_code = int(self._status[slot])
+        district_code = int(self._district[slot])
+        disaster_code = int(self._disaster[slot])
+        row = {
+            "id": self._ids[slot],
+            "latitude": float(self._lat[slot]),
+            "longitude": float(self._lng[slot]),
+            "status": self._status_names[status_code] if status_code >= 0 else None,
+            "district_id": self._district_names[district_code] if district_code >= 0 else None,
+            "requested_amount": float(self._amount[slot]),
+            "approved_amount": float(self._approved[slot]),
+            "disaster_type": self._disaster_names[disaster_code] if disaster_code >= 0 else None,
+        }
+        if distance is not None:
+            row["distance_m"] = round(distance, 1)
+        return row
+
+    def stats(self) -> Dict:
+        """索引統計"""
+        with self._lock:
+            return {
+                "indexed_cases": len(self._slot_by_id),
+                "occupied_cells": len(self._cells),
+                "capacity": len(self._ids),
+                "cell_size_deg": self.cell_size_deg
+            }
+
+    def __len__(self) -> int:
+        return len(self._slot_by_id)
+
+    # ==========================================
+    # 資料庫載入
+    # ==========================================
+
+    def load_from_database(self, limit: int = 1_000_000) -> int:
+        """從 applications 表載入所有已地理編碼的案件"""
+        from app.models.database import db_service
+
+        rows = db_service.get_geocoded_applications(
+            columns="id, latitude, longitude, status, district_id, disaster_type, requested_amount, approved_amount",
+            limit=limit
+        )
+        count = self.build(rows)
+        logger.info(f"案件空間索引已建立：{count} 件")
+        return count
+
+
+# 全域服務實例
+_case_spatial_index: Optional[CaseSpatialIndex] = None
+
+
+def get_case_spatial_index() -> CaseSpatialIndex:
+    """取得案件空間索引實例（單例模式），並訂閱案件異動以增量更新"""
+    global _case_spatial_index
+    if _case_spatial_index is None:
+        _case_spatial_index = CaseSpatialIndex()
+        case_events.subscribe(_case_spatial_index.upsert)
+    return _case_spatial_index
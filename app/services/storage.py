@@ -1,9 +1,12 @@
 """
 Supabase Storage 檔案處理模組
+STORAGE_BACKEND=local 時改用本機磁碟（app/services/local_storage.py），介面相同
 """
-import io
-import qrcode
-from typing import BinaryIO, Optional
+import uuid
+from contextlib import ExitStack, contextmanager
+import httpx
+from storage3.exceptions import StorageApiError
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 from app.models.database import get_supabase_client
 from app.settings import get_settings
@@ -11,6 +14,32 @@ from app.settings import get_settings
 settings = get_settings()
 supabase = get_supabase_client()
 
+# 上傳後回傳的簽名 URL 有效期
+PHOTO_SIGNED_URL_EXPIRES_IN = 3600 * 24 * 365  # 1 年
+DOCUMENT_SIGNED_URL_EXPIRES_IN = 3600 * 24 * 7  # 7 天
+
+class ObjectChunks:
+    """Storage 物件的區塊迭代器，讀完或 close() 時釋放連線（未開始讀取時也能關閉）"""
+
+    def __init__(self, chunks: Iterator[bytes], on_close):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self) -> "ObjectChunks":
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+
 class StorageService:
     """Storage 服務類別"""
     
@@ -21,6 +50,10 @@ class StorageService:
         self.inspection_photos_bucket = settings.INSPECTION_PHOTOS_BUCKET
         self.documents_bucket = "application-documents"  # 新增：證明文件 bucket
     
+    def _bucket(self, bucket_name: str):
+        """取得 bucket 操作介面（本機後端覆寫此方法改用磁碟）"""
+        return self.client.storage.from_(bucket_name)
+    
     # ==========================================
     # 災損照片處理
     # ==========================================
@@ -30,7 +63,9 @@ class StorageService:
         application_id: str, 
         file: BinaryIO, 
         filename: str,
-        photo_type: str = "before_damage"
+        photo_type: str = "before_damage",
+        content_type: Optional[str] = None,
+        sign: bool = True
     ) -> dict:
         """
         上傳災損照片到 application-documents bucket
@@ -40,14 +75,15 @@ class StorageService:
             file: 檔案二進制資料
             filename: 檔案名稱
             photo_type: 照片類型 (before_damage, after_damage, site_inspection)
+            content_type: 實際的 MIME 類型（未指定時依副檔名判斷）
+            sign: 是否同時產生簽名 URL（批次上傳時改以 create_signed_urls 一次產生）
         
         Returns:
             包含 storage_path 和 signed_url 的字典
         """
         # 生成唯一檔案路徑
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_ext = filename.split('.')[-1].lower() if '.' in filename else 'jpg'
-        storage_path = f"{application_id}/photos/{photo_type}_{timestamp}.{file_ext}"
+        storage_path = self.build_damage_photo_path(application_id, filename, photo_type)
         
         # 正確的 MIME type 對應
         mime_types = {
@@ -57,20 +93,22 @@ class StorageService:
             'gif': 'image/gif',
             'webp': 'image/webp'
         }
-        content_type = mime_types.get(file_ext, 'image/jpeg')
+        content_type = content_type or mime_types.get(file_ext, 'image/jpeg')
         
         # 上傳到 application-documents bucket
-        result = self.client.storage.from_(self.documents_bucket).upload(
+        result = self._bucket(self.documents_bucket).upload(
             path=storage_path,
             file=file,
             file_options={"content-type": content_type}
         )
         
         # 取得檔案 URL (需要簽名的私有 URL)
-        url = self.client.storage.from_(self.documents_bucket).create_signed_url(
-            path=storage_path,
-            expires_in=3600 * 24 * 365  # 1年有效期
-        )
+        url = None
+        if sign:
+            url = self._bucket(self.documents_bucket).create_signed_url(
+                path=storage_path,
+                expires_in=PHOTO_SIGNED_URL_EXPIRES_IN
+            )
         
         return {
             "storage_path": storage_path,
@@ -78,6 +116,33 @@ class StorageService:
             "bucket": self.documents_bucket
         }
     
+    def build_damage_photo_path(self, application_id: str, filename: str, photo_type: str = "before_damage") -> str:
+        """
+        產生災損照片的唯一 Storage 路徑
+        
+        Args:
+            application_id: 申請案件 ID
+            filename: 檔案名稱（取副檔名）
+            photo_type: 照片類型
+        
+        Returns:
+            Storage 路徑
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_ext = filename.split('.')[-1].lower() if '.' in filename else 'jpg'
+        return f"{application_id}/photos/{photo_type}_{timestamp}_{uuid.uuid4().hex[:8]}.{file_ext}"
+    
+    def bucket_for_photo_path(self, storage_path: str) -> str:
+        """
+        依 Storage 路徑判斷照片所在的 bucket
+        
+        災損照片存放在 application-documents（路徑含 /photos/，或為內容去重後的共用物件 objects/），
+        現場勘查照片存放在 inspection-photos
+        """
+        if "/photos/" in storage_path or storage_path.startswith("objects/"):
+            return self.documents_bucket
+        return self.inspection_photos_bucket
+    
     def get_damage_photo_url(self, storage_path: str, expires_in: int = 3600) -> str:
         """
         取得災損照片的簽名 URL（從 application-documents bucket）
@@ -89,12 +154,9 @@ class StorageService:
         Returns:
             簽名的 URL
         """
-        # 照片存在 application-documents bucket 中
-        result = self.client.storage.from_(self.documents_bucket).create_signed_url(
-            path=storage_path,
-            expires_in=expires_in
-        )
-        return result['signedURL'] if result else None
+        # 照片存在 application-documents bucket 中（簽名 URL 會快取到到期前不久）
+        from app.services.signed_urls import get_signed_url_service
+        return get_signed_url_service().sign(self.documents_bucket, storage_path, expires_in)
     
     def delete_damage_photo(self, storage_path: str) -> bool:
         """
@@ -107,7 +169,8 @@ class StorageService:
             是否成功刪除
         """
         try:
-            self.client.storage.from_(self.damage_photos_bucket).remove([storage_path])
+            self._bucket(self.damage_photos_bucket).remove([storage_path])
+            self._invalidate_signed_urls(self.damage_photos_bucket, [storage_path])
             return True
         except Exception as e:
             print(f"刪除照片失敗: {e}")
@@ -120,7 +183,8 @@ class StorageService:
     def generate_qr_code(
         self, 
         certificate_no: str, 
-        qr_data: dict
+        qr_data: dict,
+        image_format: Optional[str] = None
     ) -> dict:
         """
         生成 QR Code 並上傳到 Storage
@@ -128,44 +192,42 @@ class StorageService:
         Args:
             certificate_no: 憑證編號
             qr_data: QR Code 包含的資料（dict，會轉成 JSON 字串）
+            image_format: png 或 svg，預設使用 QR_CODE_FORMAT
         
         Returns:
             包含 storage_path 和 public_url 的字典
         """
         import json
+        from app.services.qr_codes import get_qr_code_service
         
-        # 生成 QR Code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
+        qr_service = get_qr_code_service()
+        image_format = image_format or qr_service.image_format
         
         # 將資料轉成 JSON 字串
         qr_content = json.dumps(qr_data, ensure_ascii=False)
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        
-        # 建立圖片
-        img = qr.make_image(fill_color="black", back_color="white")
+        image = qr_service.render(qr_content, image_format)
+        return self.upload_qr_code(certificate_no, qr_content, image, image_format)
+    
+    def upload_qr_code(self, certificate_no: str, qr_content: str, image: bytes, image_format: str = "png") -> dict:
+        """
+        上傳已產生的憑證 QR Code
         
-        # 轉換成二進制
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
+        Args:
+            certificate_no: 憑證編號
+            qr_content: QR Code 內容
+            image: 圖片內容
+            image_format: png 或 svg
         
-        # 上傳到 Storage
-        storage_path = f"certificates/{certificate_no}.png"
+        Returns:
+            包含 storage_path 和 public_url 的字典
+        """
+        from app.services.qr_codes import QR_MIME_TYPES
         
-        result = self.client.storage.from_(self.qr_codes_bucket).upload(
-            path=storage_path,
-            file=img_buffer.getvalue(),
-            file_options={"content-type": "image/png"}
-        )
+        storage_path = f"certificates/{certificate_no}.{image_format}"
+        self.upload_file(self.qr_codes_bucket, storage_path, image, QR_MIME_TYPES[image_format])
         
         # 取得公開 URL (qr-codes bucket 是公開的)
-        public_url = self.client.storage.from_(self.qr_codes_bucket).get_public_url(storage_path)
+        public_url = self._bucket(self.qr_codes_bucket).get_public_url(storage_path)
         
         return {
             "storage_path": storage_path,
@@ -184,7 +246,7 @@ class StorageService:
         Returns:
             公開 URL
         """
-        return self.client.storage.from_(self.qr_codes_bucket).get_public_url(storage_path)
+        return self._bucket(self.qr_codes_bucket).get_public_url(storage_path)
     
     # ==========================================
     # 現場勘查照片處理
@@ -195,7 +257,8 @@ class StorageService:
         application_id: str, 
         file: BinaryIO, 
         filename: str,
-        reviewer_id: str
+        reviewer_id: str,
+        content_type: Optional[str] = None
     ) -> dict:
         """
         上傳現場勘查照片
@@ -205,6 +268,7 @@ class StorageService:
             file: 檔案二進制資料
             filename: 檔案名稱
             reviewer_id: 審核員 ID
+            content_type: 實際的 MIME 類型（未指定時依副檔名判斷）
         
         Returns:
             包含 storage_path 和 signed_url 的字典
@@ -212,7 +276,7 @@ class StorageService:
         # 生成唯一檔案路徑
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_ext = filename.split('.')[-1].lower() if '.' in filename else 'jpg'
-        storage_path = f"{application_id}/inspection_{timestamp}_{reviewer_id[:8]}.{file_ext}"
+        storage_path = f"{application_id}/inspection_{timestamp}_{reviewer_id[:8]}_{uuid.uuid4().hex[:8]}.{file_ext}"
         
         # 正確的 MIME type 對應
         mime_types = {
@@ -222,17 +286,17 @@ class StorageService:
             'gif': 'image/gif',
             'webp': 'image/webp'
         }
-        content_type = mime_types.get(file_ext, 'image/jpeg')
+        content_type = content_type or mime_types.get(file_ext, 'image/jpeg')
         
         # 上傳到 Supabase Storage
-        result = self.client.storage.from_(self.inspection_photos_bucket).upload(
+        result = self._bucket(self.inspection_photos_bucket).upload(
             path=storage_path,
             file=file,
             file_options={"content-type": content_type}
         )
         
         # 取得簽名 URL
-        url = self.client.storage.from_(self.inspection_photos_bucket).create_signed_url(
+        url = self._bucket(self.inspection_photos_bucket).create_signed_url(
             path=storage_path,
             expires_in=3600 * 24 * 365  # 1年有效期
         )
@@ -254,11 +318,8 @@ class StorageService:
         Returns:
             簽名的 URL
         """
-        result = self.client.storage.from_(self.inspection_photos_bucket).create_signed_url(
-            path=storage_path,
-            expires_in=expires_in
-        )
-        return result['signedURL'] if result else None
+        from app.services.signed_urls import get_signed_url_service
+        return get_signed_url_service().sign(self.inspection_photos_bucket, storage_path, expires_in)
     
     # ==========================================
     # 證明文件處理
@@ -269,7 +330,9 @@ class StorageService:
         application_id: str, 
         file: BinaryIO, 
         filename: str,
-        document_type: str = "other"
+        document_type: str = "other",
+        content_type: Optional[str] = None,
+        sign: bool = True
     ) -> dict:
         """
         上傳證明文件（戶籍謄本、財產證明等）
@@ -279,6 +342,8 @@ class StorageService:
             file: 檔案二進制資料
             filename: 檔案名稱
             document_type: 文件類型
+            content_type: 實際的 MIME 類型（未指定時依副檔名判斷）
+            sign: 是否同時產生簽名 URL（批次上傳時改以 create_signed_urls 一次產生）
         
         Returns:
             包含 storage_path 和 signed_url 的字典
@@ -286,7 +351,7 @@ class StorageService:
         # 生成唯一檔案路徑
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_ext = filename.split('.')[-1].lower() if '.' in filename else 'pdf'
-        storage_path = f"{application_id}/{document_type}_{timestamp}.{file_ext}"
+        storage_path = f"{application_id}/{document_type}_{timestamp}_{uuid.uuid4().hex[:8]}.{file_ext}"
         
         # MIME type 對應
         mime_types = {
@@ -299,20 +364,22 @@ class StorageService:
             'jpeg': 'image/jpeg',
             'png': 'image/png',
         }
-        content_type = mime_types.get(file_ext, 'application/octet-stream')
+        content_type = content_type or mime_types.get(file_ext, 'application/octet-stream')
         
         # 上傳到 Supabase Storage
-        result = self.client.storage.from_(self.documents_bucket).upload(
+        result = self._bucket(self.documents_bucket).upload(
             path=storage_path,
             file=file,
             file_options={"content-type": content_type}
         )
         
         # 生成簽名 URL（7 天有效期）
-        url = self.client.storage.from_(self.documents_bucket).create_signed_url(
-            path=storage_path,
-            expires_in=3600 * 24 * 7  # 7 days
-        )
+        url = None
+        if sign:
+            url = self._bucket(self.documents_bucket).create_signed_url(
+                path=storage_path,
+                expires_in=DOCUMENT_SIGNED_URL_EXPIRES_IN
+            )
         
         return {
             "storage_path": storage_path,
@@ -331,11 +398,8 @@ class StorageService:
         Returns:
             簽名的 URL
         """
-        result = self.client.storage.from_(self.documents_bucket).create_signed_url(
-            path=storage_path,
-            expires_in=expires_in
-        )
-        return result['signedURL'] if result else None
+        from app.services.signed_urls import get_signed_url_service
+        return get_signed_url_service().sign(self.documents_bucket, storage_path, expires_in)
     
     def download_document(self, storage_path: str) -> bytes:
         """
@@ -348,7 +412,7 @@ class StorageService:
             文件的二進制內容
         """
         try:
-            result = self.client.storage.from_(self.documents_bucket).download(storage_path)
+            result = self._bucket(self.documents_bucket).download(storage_path)
             return result
         except Exception as e:
             print(f"下載文件失敗: {e}")
@@ -365,7 +429,8 @@ class StorageService:
             是否成功刪除
         """
         try:
-            self.client.storage.from_(self.documents_bucket).remove([storage_path])
+            self._bucket(self.documents_bucket).remove([storage_path])
+            self._invalidate_signed_urls(self.documents_bucket, [storage_path])
             return True
         except Exception as e:
             print(f"刪除文件失敗: {e}")
@@ -375,6 +440,205 @@ class StorageService:
     # 通用檔案操作
     # ==========================================
     
+    def upload_file(self, bucket_name: str, path: str, content: bytes, content_type: str, upsert: bool = True) -> str:
+        """
+        上傳檔案（已存在時覆寫）
+        
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+            content: 檔案內容
+            content_type: MIME 類型
+            upsert: 是否覆寫既有檔案
+        
+        Returns:
+            Storage 路徑
+        """
+        self._bucket(bucket_name).upload(
+            path=path,
+            file=content,
+            file_options={"content-type": content_type, "upsert": "true" if upsert else "false"}
+        )
+        return path
+    
+    def copy_file(self, bucket_name: str, from_path: str, to_path: str) -> str:
+        """
+        在 Storage 內複製檔案（伺服器端複製，不經過 API）
+        
+        Args:
+            bucket_name: Bucket 名稱
+            from_path: 來源路徑
+            to_path: 目的路徑
+        
+        Returns:
+            目的路徑
+        """
+        self._bucket(bucket_name).copy(from_path, to_path)
+        return to_path
+    
+    def download_file(self, bucket_name: str, path: str) -> bytes:
+        """
+        下載檔案
+        
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+        
+        Returns:
+            檔案內容
+        """
+        return self._bucket(bucket_name).download(path)
+    
+    def create_signed_urls(self, bucket_name: str, paths: List[str], expires_in: int = 3600) -> Dict[str, Optional[str]]:
+        """
+        一次為多個檔案產生簽名 URL
+        
+        Args:
+            bucket_name: Bucket 名稱
+            paths: Storage 路徑列表
+            expires_in: URL 有效期限（秒）
+        
+        Returns:
+            Storage 路徑 → 簽名 URL（產生失敗者為 None）
+        """
+        if not paths:
+            return {}
+        result = self._bucket(bucket_name).create_signed_urls(paths, expires_in)
+        urls = {item['path']: item['signedURL'] for item in result if not item.get('error')}
+        return {path: urls.get(path) for path in paths}
+    
+    def create_signed_upload_url(self, bucket_name: str, path: str) -> dict:
+        """
+        產生讓用戶端直接上傳到 Storage 的簽名上傳 URL（只能上傳到指定路徑，約 2 小時內有效）
+
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+
+        Returns:
+            包含 signed_url、token、path 的字典
+        """
+        result = self._bucket(bucket_name).create_signed_upload_url(path)
+        return {"signed_url": result["signed_url"], "token": result["token"], "path": path}
+
+    @contextmanager
+    def open_object_response(
+        self,
+        bucket_name: str,
+        path: str,
+        request_headers: Optional[Dict[str, str]] = None
+    ) -> Iterator[httpx.Response]:
+        """
+        以串流方式向 Storage 取得物件（轉送 Range、條件式請求等標頭）
+
+        回傳 304、416 時不拋出例外，由呼叫端依狀態碼處理
+
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+            request_headers: 轉送給 Storage 的請求標頭
+
+        Returns:
+            尚未讀取內容的 httpx.Response
+
+        Raises:
+            FileNotFoundError: 物件不存在
+        """
+        try:
+            url = self._bucket(bucket_name).create_signed_url(path, 60)["signedURL"]
+        except StorageApiError as e:
+            if str(e.status) in ("400", "404"):
+                raise FileNotFoundError(path) from e
+            raise
+        with httpx.stream("GET", url, headers=request_headers or {}, timeout=30.0) as response:
+            if response.status_code in (400, 404):
+                raise FileNotFoundError(path)
+            if response.status_code not in (304, 416):
+                response.raise_for_status()
+            yield response
+
+    @contextmanager
+    def open_object_stream(
+        self,
+        bucket_name: str,
+        path: str,
+        chunk_size: int = 64 * 1024,
+        byte_range: Optional[str] = None
+    ) -> Iterator[Tuple[Dict[str, str], Iterator[bytes]]]:
+        """
+        以串流方式讀取 Storage 物件（不把整個檔案載入記憶體）
+
+            with storage_service.open_object_stream(bucket, path) as (headers, chunks): ...
+
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+            chunk_size: 每個區塊的大小
+            byte_range: HTTP Range（例如 "bytes=0-63"），未指定時讀取整個檔案
+
+        Returns:
+            (回應標頭, 位元組區塊迭代器)
+
+        Raises:
+            FileNotFoundError: 物件不存在
+        """
+        headers = {"Range": byte_range} if byte_range else {}
+        with self.open_object_response(bucket_name, path, headers) as response:
+            response.raise_for_status()
+            yield response.headers, response.iter_bytes(chunk_size)
+
+    def stream_object(
+        self,
+        bucket_name: str,
+        path: str,
+        chunk_size: int = 64 * 1024,
+        request_headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """
+        開啟 Storage 物件並回傳狀態碼、標頭與區塊迭代器（供 StreamingResponse 使用，讀完後關閉連線）
+
+        物件不存在時在回傳前就拋出 FileNotFoundError，呼叫端可在開始回應前改走其他流程
+
+        Args:
+            bucket_name: Bucket 名稱
+            path: Storage 路徑
+            chunk_size: 每個區塊的大小
+            request_headers: 轉送給 Storage 的請求標頭（Range、If-None-Match 等）
+
+        Returns:
+            (Storage 狀態碼, 回應標頭, 位元組區塊迭代器；讀完或呼叫 close() 時關閉連線)
+        """
+        stack = ExitStack()
+        response = stack.enter_context(self.open_object_response(bucket_name, path, request_headers))
+        return response.status_code, response.headers, ObjectChunks(response.iter_bytes(chunk_size), stack.close)
+
+    def remove_files(self, bucket_name: str, paths: List[str]) -> bool:
+        """
+        一次刪除多個檔案
+        
+        Args:
+            bucket_name: Bucket 名稱
+            paths: Storage 路徑列表
+        
+        Returns:
+            是否成功刪除
+        """
+        if not paths:
+            return True
+        try:
+            self._bucket(bucket_name).remove(paths)
+            self._invalidate_signed_urls(bucket_name, paths)
+            return True
+        except Exception as e:
+            print(f"刪除檔案失敗: {e}")
+            return False
+    
+    @staticmethod
+    def _invalidate_signed_urls(bucket_name: str, paths: List[str]) -> None:
+        """檔案刪除後移除快取的簽名 URL"""
+        from app.services.signed_urls import get_signed_url_service
+        get_signed_url_service().invalidate(bucket_name, paths)
+    
     def list_files(self, bucket_name: str, folder_path: str = "") -> list:
         """
         列出指定資料夾的所有檔案
@@ -386,7 +650,7 @@ class StorageService:
         Returns:
             檔案列表
         """
-        result = self.client.storage.from_(bucket_name).list(folder_path)
+        result = self._bucket(bucket_name).list(folder_path)
         return result
     
     def get_file_info(self, bucket_name: str, file_path: str) -> dict:
@@ -400,9 +664,16 @@ class StorageService:
         Returns:
             檔案資訊
         """
-        files = self.client.storage.from_(bucket_name).list(file_path)
+        files = self._bucket(bucket_name).list(file_path)
         return files[0] if files else None
 
+def _create_storage_service() -> StorageService:
+    """依 STORAGE_BACKEND 建立 Storage 服務（supabase 或 local）"""
+    if settings.STORAGE_BACKEND == "local":
+        from app.services.local_storage import LocalStorageService
+        return LocalStorageService()
+    return StorageService()
+
 # 全域 Storage 服務實例
-storage_service = StorageService()
+storage_service = _create_storage_service()
 
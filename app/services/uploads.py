@@ -0,0 +1,333 @@
+"""
+上傳檔案串流處理
+以固定大小的區塊讀取上傳檔案：邊讀邊累計大小（超過上限立即中止）、計算 SHA-256，
+並以開頭位元組判斷實際檔案格式；檔案內容留在 Starlette 的 SpooledTemporaryFile（超過 1MB 即寫入磁碟），
+記憶體用量與檔案大小無關
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+from typing import Any, Awaitable, BinaryIO, Callable, Collection, Dict, List, Optional, Sequence, Tuple, Union
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# 每次讀取的區塊大小
+CHUNK_SIZE = 64 * 1024
+
+# 判斷格式所需的開頭位元組數
+SNIFF_BYTES = 64
+
+# 允許的照片格式（以檔案內容判斷）
+PHOTO_MIME_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/heic"}
+
+# Office 舊格式（OLE）與新格式（ZIP）無法只憑開頭位元組區分 Word / Excel，以宣告的類型為準
+OLE_TYPES = {"application/msword", "application/vnd.ms-excel"}
+OOXML_TYPES = {
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# multipart 表單欄位與邊界的額外位元組（請求大小上限 = 檔案大小上限 + 此值）
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(ValueError):
+    """上傳檔案不符合規定"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_mime_type(head: bytes, declared: Optional[str] = None) -> Optional[str]:
+    """
+    以檔案開頭位元組判斷 MIME 類型
+
+    Args:
+        head: 檔案開頭位元組
+        declared: 用戶端宣告的類型（僅用於區分 OLE / OOXML 內的 Word、Excel）
+
+    Returns:
+        MIME 類型，無法辨識時回傳 None
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return declared if declared in OLE_TYPES else None
+    if head.startswith(b"PK\x03\x04"):
+        return declared if declared in OOXML_TYPES else None
+    return None
+
+
+class SpooledUpload:
+    """已驗證的上傳檔案（內容仍在暫存檔中）"""
+
+    def __init__(self, file: BinaryIO, filename: str, size: int, sha256: str, mime_type: str):
+        self.file = file
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+
+    def payload(self) -> Union[bytes, io.BufferedReader]:
+        """
+        取得可交給 Supabase Storage 上傳的內容
+
+        仍在記憶體中的小檔案（不超過 Starlette 的 1MB 門檻）回傳 bytes；
+        已寫入磁碟的檔案回傳檔案讀取器，由 httpx 以串流方式送出
+        """
+        self.file.seek(0)
+        if not getattr(self.file, "_rolled", True):
+            return self.file.read()
+        return io.open(self.file.fileno(), "rb", closefd=False)
+
+
+async def receive_upload(
+    file: UploadFile,
+    allowed_mime_types: Collection[str],
+    max_size: int
+) -> SpooledUpload:
+    """
+    以區塊讀取上傳檔案並驗證大小與格式
+
+    Args:
+        file: FastAPI 上傳檔案
+        allowed_mime_types: 允許的 MIME 類型（以實際內容判斷）
+        max_size: 檔案大小上限（位元組）
+
+    Returns:
+        SpooledUpload
+
+    Raises:
+        UploadError: 檔案過大（413）、格式不符（415）或空檔案（400）
+    """
+    limit_mb = max_size // 1024 // 1024
+    if file.size is not None and file.size > max_size:
+        raise UploadError(f"檔案大小不能超過 {limit_mb}MB（當前: {file.size / 1024 / 1024:.2f}MB）", status_code=413)
+
+    digest = hashlib.sha256()
+    size = 0
+    mime_type = None
+    await file.seek(0)
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if size == 0:
+            mime_type = sniff_mime_type(chunk[:SNIFF_BYTES], file.content_type)
+            if mime_type not in allowed_mime_types:
+                raise UploadError(f"不支援的檔案格式（{mime_type or '無法辨識'}）", status_code=415)
+        size += len(chunk)
+        if size > max_size:
+            raise UploadError(f"檔案大小不能超過 {limit_mb}MB", status_code=413)
+        digest.update(chunk)
+
+    if size == 0:
+        raise UploadError("檔案內容為空")
+
+    await file.seek(0)
+    return SpooledUpload(file.file, file.filename or "upload", size, digest.hexdigest(), mime_type)
+
+
+async def run_concurrently(
+    items: Sequence[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    limit: int
+) -> List[Tuple[Any, Optional[Exception]]]:
+    """
+    以最多 limit 個並行執行 worker，依輸入順序回傳 (結果, 例外)
+
+    單一項目失敗不影響其他項目
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return await worker(item), None
+            except Exception as e:
+                return None, e
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+async def upload_batch(
+    files: Sequence[UploadFile],
+    allowed_mime_types: Collection[str],
+    max_size: int,
+    store: Callable[[SpooledUpload], Dict],
+    build_row: Callable[[SpooledUpload, Dict], Dict],
+    insert_rows: Callable[[List[Dict]], List[Dict]],
+    bucket: str,
+    signed_url_expires_in: int,
+    concurrency: int,
+    discard: Optional[Callable[[List[Dict]], Any]] = None
+) -> Dict:
+    """
+    批次上傳管線：並行讀取、驗證並上傳到 Storage，再以單次寫入建立資料庫記錄、
+    一次產生所有簽名 URL
+
+    Args:
+        files: 上傳檔案
+        allowed_mime_types: 允許的 MIME 類型
+        max_size: 單一檔案大小上限
+        store: 上傳到 Storage（同步函式，於執行緒中呼叫，不需產生簽名 URL），回傳含 storage_path 的結果
+        build_row: 由上傳檔案與 Storage 結果組成資料庫記錄
+        insert_rows: 批次寫入資料庫，回傳建立的記錄
+        bucket: Storage bucket（產生簽名 URL、寫入失敗時清除檔案用）
+        signed_url_expires_in: 簽名 URL 有效期（秒）
+        concurrency: 同時處理的檔案數
+        discard: 記錄寫入失敗時清理已上傳內容（預設直接刪除 Storage 檔案；共用物件需改為釋放引用）
+
+    Returns:
+        {
+            "uploaded": 建立的記錄（含 signed_url）,
+            "errors": ["檔名: 錯誤訊息"],
+            "results": [{"file_name", "success", "id", "error"}]（依上傳順序）
+        }
+    """
+    from app.services.storage import storage_service
+
+    async def process(file: UploadFile):
+        upload = await receive_upload(file, allowed_mime_types, max_size)
+        stored = await asyncio.to_thread(store, upload)
+        return build_row(upload, stored)
+
+    outcomes = await run_concurrently(files, process, concurrency)
+
+    results = []
+    rows = []
+    for file, (row, error) in zip(files, outcomes):
+        results.append({"file_name": file.filename, "success": error is None, "id": None,
+                        "error": str(error) if error else None})
+        if row is not None:
+            rows.append(row)
+
+    uploaded = []
+    if rows:
+        paths = [row["storage_path"] for row in rows]
+        try:
+            uploaded = await asyncio.to_thread(insert_rows, rows)
+        except Exception as e:
+            # 記錄寫入失敗時清除已上傳的檔案，避免留下沒有記錄的孤兒檔案
+            logger.error(f"批次建立上傳記錄失敗: {e}")
+            if discard is not None:
+                await asyncio.to_thread(discard, rows)
+            else:
+                await asyncio.to_thread(storage_service.remove_files, bucket, paths)
+            for result in results:
+                if result["success"]:
+                    result.update(success=False, error=f"建立記錄失敗: {e}")
+            uploaded = []
+
+        if uploaded:
+            urls = await asyncio.to_thread(storage_service.create_signed_urls, bucket, paths, signed_url_expires_in)
+            for record in uploaded:
+                record["signed_url"] = urls.get(record.get("storage_path"))
+            # insert_rows 依寫入順序回傳記錄；內容相同的檔案共用 storage_path，不能以路徑對應
+            record_iter = iter(uploaded)
+            for result in results:
+                if result["success"]:
+                    record = next(record_iter, None)
+                    result["id"] = record.get("id") if record else None
+
+    errors = [f"{r['file_name']}: {r['error']}" for r in results if not r["success"]]
+    return {"uploaded": uploaded, "errors": errors, "results": results}
+
+
+class UploadSizeLimitMiddleware:
+    """
+    上傳路由的請求大小限制（ASGI middleware）
+
+    表單在進入路由前就會被完整解析，因此需要在 middleware 層以 Content-Length
+    與實際收到的位元組數提早中止過大的請求，避免先把整個請求寫入暫存檔
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        """
+        Args:
+            app: ASGI 應用程式
+            limits: 路徑前綴 → 請求大小上限（位元組），以最長的相符前綴為準
+        """
+        self.app = app
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        max_body_size = None
+        if scope["type"] == "http" and scope.get("method") in ("POST", "PUT", "PATCH"):
+            max_body_size = self._limit_for(scope["path"])
+        if max_body_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length", b"").decode()
+        if content_length.isdigit() and int(content_length) > max_body_size:
+            await self._reject(send, max_body_size)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    exceeded = True
+                    raise UploadError("上傳內容過大", status_code=413)
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if exceeded:
+                # 表單解析錯誤會被 FastAPI 轉為 400，改回傳 413
+                if message["type"] == "http.response.start":
+                    response_started = True
+                    await self._reject(send, max_body_size)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadError:
+            if response_started:
+                raise
+            await self._reject(send, max_body_size)
+
+    @staticmethod
+    async def _reject(send, max_body_size: int) -> None:
+        body = json.dumps(
+            {"detail": f"上傳內容不能超過 {max_body_size // 1024 // 1024}MB"},
+            ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
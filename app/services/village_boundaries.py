@@ -0,0 +1,247 @@
+"""
+村里界圖層
+載入里界 GeoJSON，以 STR 打包的外框樹（R-tree）篩選候選多邊形，
+再以向量化射線法判斷點是否位於多邊形內，將經緯度對應到里
+"""
+import json
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 內政部村里界圖資的屬性欄位，以及系統自訂欄位
+NAME_PROPERTY_KEYS = (
+    ("COUNTYNAME", "TOWNNAME", "VILLNAME"),
+    ("city", "district", "village"),
+)
+
+# STR 樹每個節點的子節點數
+NODE_CAPACITY = 16
+
+
+def _polygon_rings(geometry: Dict) -> List[np.ndarray]:
+    """取得 Polygon / MultiPolygon 的所有環（外環與內環），座標為 (lng, lat)"""
+    geometry_type = geometry.get("type")
+    if geometry_type == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry_type == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    return [
+        np.asarray(ring, dtype=np.float64)[:, :2]
+        for polygon in polygons
+        for ring in polygon
+        if len(ring) >= 3
+    ]
+
+
+class VillageBoundaryLayer:
+    """里界多邊形圖層"""
+
+    def __init__(self, features: Sequence[Dict]):
+        """
+        建立圖層
+
+        Args:
+            features: GeoJSON Feature 列表，幾何須為 Polygon 或 MultiPolygon
+        """
+        self.names: List[Dict] = []
+        edge_blocks = []
+        bboxes = []
+
+        for feature in features:
+            rings = _polygon_rings(feature.get("geometry") or {})
+            if not rings:
+                continue
+            properties = feature.get("properties") or {}
+            self.names.append(self._names_from_properties(properties))
+
+            # 以偶奇規則處理內環與多重多邊形：所有環的邊一起計算交點數
+            starts = np.concatenate([ring for ring in rings])
+            ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+            edge_blocks.append(np.hstack([starts, ends]))
+            bboxes.append((starts[:, 0].min(), starts[:, 1].min(), starts[:, 0].max(), starts[:, 1].max()))
+
+        # 各多邊形的邊依序存放在同一個陣列，以 offset 切片取用
+        lengths = [len(block) for block in edge_blocks]
+        self._edge_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._edges = np.vstack(edge_blocks) if edge_blocks else np.zeros((0, 4))
+        self._bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self._build_tree()
+
+    @staticmethod
+    def _names_from_properties(properties: Dict) -> Dict:
+        names = {"district_id": properties.get("district_id")}
+        for keys in NAME_PROPERTY_KEYS:
+            if keys[1] in properties:
+                names.update(city=properties.get(keys[0]), district=properties.get(keys[1]), village=properties.get(keys[2]))
+                break
+        else:
+            names.update(city=None, district=None, village=None)
+        return names
+
+    @classmethod
+    def from_geojson(cls, path: str) -> "VillageBoundaryLayer":
+        """從 GeoJSON 檔案（FeatureCollection）載入"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        features = data.get("features", []) if data.get("type") == "FeatureCollection" else [data]
+        return cls(features)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # ==========================================
+    # STR 外框樹
+    # ==========================================
+
+    def _build_tree(self) -> None:
+        """
+        以 Sort-Tile-Recursive 打包外框樹
+        每層為 (外框陣列, 子節點起訖)；葉層的子節點即多邊形編號（已重新排序）
+        """
+        count = len(self._bboxes)
+        if count == 0:
+            self._leaf_order = np.zeros(0, dtype=np.int64)
+            self._levels = []
+            return
+
+        # 葉層：先依中心經度切成垂直條帶，再於條帶內依中心緯度排序
+        centers = (self._bboxes[:, :2] + self._bboxes[:, 2:]) / 2
+        leaf_count = math.ceil(count / NODE_CAPACITY)
+        slice_count = math.ceil(math.sqrt(leaf_count))
+        slice_size = slice_count * NODE_CAPACITY
+        order = np.argsort(centers[:, 0], kind="stable")
+        for start in range(0, count, slice_size):
+            chunk = order[start:start + slice_size]
+            order[start:start + slice_size] = chunk[np.argsort(centers[chunk, 1], kind="stable")]
+        self._leaf_order = order
+
+        boxes = self._bboxes[order]
+        self._levels: List[Tuple[np.ndarray, np.ndarray]] = []
+        while True:
+            starts = np.arange(0, len(boxes), NODE_CAPACITY)
+            ends = np.minimum(starts + NODE_CAPACITY, len(boxes))
+            parents = np.column_stack([
+                np.minimum.reduceat(boxes[:, 0], starts),
+                np.minimum.reduceat(boxes[:, 1], starts),
+                np.maximum.reduceat(boxes[:, 2], starts),
+                np.maximum.reduceat(boxes[:, 3], starts),
+            ])
+            self._levels.append((boxes, np.column_stack([starts, ends])))
+            if len(parents) == 1:
+                self._root = parents[0]
+                break
+            boxes = parents
+        self._levels.reverse()
+
+    def _candidates(self, lat: float, lng: float) -> np.ndarray:
+        """以外框樹找出外框包含該點的多邊形編號"""
+        if not self._levels:
+            return np.zeros(0, dtype=np.int64)
+        root = self._root
+        if not (root[0] <= lng <= root[2] and root[1] <= lat <= root[3]):
+            return np.zeros(0, dtype=np.int64)
+
+        # 從根開始逐層展開：nodes 為目前層中外框包含該點的節點
+        nodes = np.zeros(1, dtype=np.int64)
+        for boxes, children in self._levels:
+            ranges = children[nodes]
+            slots = np.concatenate([np.arange(s, e) for s, e in ranges]) if len(ranges) > 1 else np.arange(*ranges[0])
+            box = boxes[slots]
+            nodes = slots[(box[:, 0] <= lng) & (lng <= box[:, 2]) & (box[:, 1] <= lat) & (lat <= box[:, 3])]
+            if not len(nodes):
+                break
+        return self._leaf_order[nodes]
+
+    # ==========================================
+    # 點位查詢
+    # ==========================================
+
+    def _contains(self, polygon: int, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """向量化射線法：回傳各點是否在多邊形內（偶奇規則）"""
+        edges = self._edges[self._edge_offsets[polygon]:self._edge_offsets[polygon + 1]]
+        x1, y1, x2, y2 = (edges[:, i][None, :] for i in range(4))
+        px = lngs[:, None]
+        py = lats[:, None]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        crossings = np.count_nonzero(straddles & (px < x_cross), axis=1)
+        return crossings % 2 == 1
+
+    def locate(self, latitude: float, longitude: float) -> int:
+        """
+        查詢單一座標所在的多邊形
+
+        Returns:
+            多邊形編號（對應 names），不在任何多邊形內時回傳 -1
+        """
+        lat = np.array([latitude], dtype=np.float64)
+        lng = np.array([longitude], dtype=np.float64)
+        for polygon in self._candidates(latitude, longitude).tolist():
+            if self._contains(polygon, lat, lng)[0]:
+                return polygon
+        return -1
+
+    def locate_many(self, latitudes: Sequence[float], longitudes: Sequence[float], max_cells: int = 1_000_000) -> np.ndarray:
+        """
+        批次查詢座標所在的多邊形（適合回填大量案件）
+
+        以經度排序點位，每個多邊形只以 searchsorted 取出外框經度範圍內的點再做射線判斷
+
+        Args:
+            latitudes: 緯度列表
+            longitudes: 經度列表
+            max_cells: 單次射線判斷的「點數 × 邊數」上限，用來限制暫存陣列大小
+
+        Returns:
+            多邊形編號陣列，不在任何多邊形內者為 -1
+        """
+        lats = np.asarray(latitudes, dtype=np.float64)
+        lngs = np.asarray(longitudes, dtype=np.float64)
+        result = np.full(len(lats), -1, dtype=np.int64)
+        if not len(lats) or not len(self._bboxes):
+            return result
+
+        order = np.argsort(lngs, kind="stable")
+        sorted_lngs = lngs[order]
+        lower = np.searchsorted(sorted_lngs, self._bboxes[:, 0], side="left")
+        upper = np.searchsorted(sorted_lngs, self._bboxes[:, 2], side="right")
+
+        for polygon in np.flatnonzero(upper > lower).tolist():
+            points = order[lower[polygon]:upper[polygon]]
+            min_x, min_y, max_x, max_y = self._bboxes[polygon]
+            points = points[(result[points] < 0) & (lats[points] >= min_y) & (lats[points] <= max_y)]
+            edge_count = self._edge_offsets[polygon + 1] - self._edge_offsets[polygon]
+            chunk_size = max(1, max_cells // max(int(edge_count), 1))
+            for start in range(0, len(points), chunk_size):
+                chunk = points[start:start + chunk_size]
+                inside = self._contains(polygon, lats[chunk], lngs[chunk])
+                result[chunk[inside]] = polygon
+        return result
+
+
+# 全域圖層（未設定 VILLAGE_BOUNDARIES_PATH 時為 None）
+_village_boundary_layer: Optional[VillageBoundaryLayer] = None
+_village_boundary_loaded = False
+
+
+def get_village_boundary_layer() -> Optional[VillageBoundaryLayer]:
+    """取得里界圖層；未設定或載入失敗時回傳 None"""
+    global _village_boundary_layer, _village_boundary_loaded
+    if not _village_boundary_loaded:
+        from app.settings import get_settings
+        path = get_settings().VILLAGE_BOUNDARIES_PATH
+        if path:
+            try:
+                _village_boundary_layer = VillageBoundaryLayer.from_geojson(path)
+                logger.info(f"已載入里界圖層: {len(_village_boundary_layer)} 個多邊形")
+            except Exception as e:
+                logger.error(f"載入里界圖層失敗: {e}")
+        _village_boundary_loaded = True
+    return _village_boundary_layer
@@ -1,6 +1,6 @@
 from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 import os
 
 class Settings(BaseSettings):
@@ -29,10 +29,43 @@ class Settings(BaseSettings):
     VERIFIER_API_KEY: str = "BLrdNlMkYL2vsCvudEsbd7N5tRlX58HS"
     
     # Storage 設定
+    STORAGE_BACKEND: Literal["supabase", "local"] = "supabase"  # local：檔案存放在本機磁碟（地端部署、效能測試）
+    LOCAL_STORAGE_ROOT: str = "data/storage"  # 本機 Storage 根目錄
+    LOCAL_STORAGE_BASE_URL: str = ""  # 簽名 URL 的網址前綴（例如 https://relief.example.gov.tw），空白時為相對路徑
+    LOCAL_STORAGE_SIGNING_KEY: Optional[str] = None  # 簽名 URL 的 HMAC 金鑰，未設定時使用 SECRET_KEY
+    LOCAL_STORAGE_ACCEL_REDIRECT: Optional[str] = None  # 設定時改由 nginx 以 X-Accel-Redirect 傳送檔案（對應 internal location，例如 /_storage）
     DAMAGE_PHOTOS_BUCKET: str = "damage-photos"
     QR_CODES_BUCKET: str = "qr-codes"
     INSPECTION_PHOTOS_BUCKET: str = "inspection-photos"
-    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB，單張照片上限
+    MAX_DOCUMENT_UPLOAD_SIZE: int = 20 * 1024 * 1024  # 20MB，單一證明文件上限
+    MAX_UPLOAD_REQUEST_SIZE: int = 100 * 1024 * 1024  # 100MB，批次上傳單一請求上限
+    UPLOAD_CONCURRENCY: int = 4  # 批次上傳時同時上傳到 Storage 的檔案數
+    DIRECT_UPLOAD_MAX_FILES: int = 20  # 直接上傳（upload-intent）單次最多檔案數
+    DIRECT_UPLOAD_INTENT_EXPIRES_MINUTES: int = 120  # 上傳意圖有效期（與 Storage 簽名上傳 URL 相同）
+    DIRECT_UPLOAD_VERIFY_HASH: bool = True  # commit 時讀回物件驗證 SHA-256；關閉時只檢查大小與開頭位元組
+    RESUMABLE_UPLOAD_DIR: Optional[str] = None  # 續傳上傳暫存目錄（多 worker 需共用），預設放在暫存目錄
+    RESUMABLE_UPLOAD_EXPIRES_MINUTES: int = 24 * 60  # 續傳上傳工作未完成的保留時間
+    PHOTO_OBJECT_GRACE_HOURS: int = 24  # 照片物件引用歸零後保留多久才從 Storage 刪除
+    SIMILAR_PHOTO_MAX_DISTANCE: int = 8  # 感知雜湊漢明距離不超過此值視為相似照片（0–64）
+    EVIDENCE_ARCHIVE_PREFETCH: int = 4  # 打包證據 ZIP 時同時從 Storage 讀取的檔案數
+    QR_CODE_FORMAT: Literal["png", "svg"] = "png"  # 憑證 QR Code 格式：png 或 svg（SVG 不需影像編碼，產生成本較低）
+    QR_CODE_CACHE_SIZE: int = 1000  # QR Code 圖片快取數量
+
+    # CPU 工作執行器（照片衍生圖、DOCX 轉 PDF、QR Code 共用的 process pool）
+    CPU_EXECUTOR_WORKERS: int = 2  # 子程序數
+    CPU_EXECUTOR_MAX_PENDING: int = 32  # 執行中與排隊中的工作上限，超過時等待空位
+    CPU_EXECUTOR_QUEUE_TIMEOUT_SECONDS: float = 30  # 等待空位的時限，逾時回應 503
+    CPU_JOB_TIMEOUT_SECONDS: float = 120  # 單一工作的執行時限
+
+    # Google Maps 用量控制
+    # 各端點額度覆寫，格式「端點=每秒請求數/每日上限」，例如 "geocode=20/10000,places=5/1000"
+    GOOGLE_MAPS_BUDGETS: str = ""
+    GOOGLE_MAPS_MAX_WAIT_SECONDS: float = 2.0  # 額度不足時最多排隊秒數，逾時改用快取/估算
+    GOOGLE_MAPS_QUOTA_STATE_PATH: Optional[str] = None  # 多 worker 共用的用量狀態檔，預設放在暫存目錄
+
+    # 里界圖層（GeoJSON，里的 Polygon/MultiPolygon），用於以經緯度判定所屬區域
+    VILLAGE_BOUNDARIES_PATH: Optional[str] = None
     
     class Config:
         env_file = ".env"
@@ -135,7 +135,9 @@ def drop_all_tables(force=False):
         "notifications",
         "digital_certificates",
         "review_records",
+        "photo_similarity_flags",
         "damage_photos",
+        "photo_objects",
         "applications",
         "users",
         "districts",
@@ -407,6 +409,108 @@ def show_statistics():
     except Exception as e:
         print_error(f"無法取得狀態統計: {str(e)}")
 
+# ==========================================
+# 區域回填
+# ==========================================
+
+def backfill_districts(use_geocode=False):
+    """
+    依地址為尚未指派區域的案件回填 district_id
+    先以離線配對處理，已有座標者再以里界圖層批次判定，--geocode 時再以地理編碼處理剩餘案件
+    """
+    import asyncio
+    from app.services.district_matcher import get_district_assignment_service
+
+    print_header("🧭 回填案件所屬區域")
+
+    service = get_district_assignment_service()
+    matcher = service.get_matcher()
+    print_info(f"已載入 {len(matcher.districts)} 個區域")
+
+    assigned = {}
+    unmatched = []
+    scanned = 0
+    after_id = None
+    while True:
+        page = db_service.get_applications_without_district(after_id=after_id)
+        if not page:
+            break
+        for app in page:
+            district_id = service.match_offline(app.get('damage_location'), app.get('address'))
+            if district_id:
+                assigned.setdefault(district_id, []).append(app['id'])
+            else:
+                unmatched.append(app)
+        scanned += len(page)
+        after_id = page[-1]['id']
+        print_info(f"已掃描 {scanned} 筆")
+
+    located = [app for app in unmatched if app.get('latitude') is not None and app.get('longitude') is not None]
+    if located:
+        print_info(f"以里界圖層判定 {len(located)} 筆已有座標的案件...")
+        district_ids = service.match_coordinates_many(
+            [float(app['latitude']) for app in located],
+            [float(app['longitude']) for app in located]
+        )
+        resolved = set()
+        for app, district_id in zip(located, district_ids):
+            if district_id:
+                assigned.setdefault(district_id, []).append(app['id'])
+                resolved.add(app['id'])
+        unmatched = [app for app in unmatched if app['id'] not in resolved]
+
+    if use_geocode and unmatched:
+        print_info(f"以地理編碼處理 {len(unmatched)} 筆無法離線配對的案件...")
+
+        async def geocode_all():
+            still_unmatched = []
+            for app in unmatched:
+                result = await service.assign(app.get('damage_location'), app.get('address'))
+                if result['district_id']:
+                    assigned.setdefault(result['district_id'], []).append(app['id'])
+                else:
+                    still_unmatched.append(app)
+            return still_unmatched
+
+        unmatched = asyncio.run(geocode_all())
+
+    # 依區域批次更新，每個區域只需一次 UPDATE ... WHERE id IN (...)
+    updated = 0
+    for district_id, ids in assigned.items():
+        for start in range(0, len(ids), 500):
+            try:
+                db_service.assign_district(ids[start:start + 500], district_id)
+                updated += len(ids[start:start + 500])
+            except Exception as e:
+                print_error(f"區域 {district_id} 更新失敗: {str(e)}")
+
+    print_success(f"已回填 {updated} 筆案件，涵蓋 {len(assigned)} 個區域")
+    if unmatched:
+        print_warning(f"{len(unmatched)} 筆案件無法判定區域")
+
+# ==========================================
+# 照片雜湊回填
+# ==========================================
+
+def backfill_photo_hashes():
+    """
+    為尚未計算感知雜湊的照片計算雜湊，並標記與他案照片相似的配對
+    先載入既有雜湊，回填的照片才能與所有照片比對
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from app.services.photo_similarity import get_photo_similarity_service
+
+    print_header("🔍 回填照片感知雜湊")
+
+    service = get_photo_similarity_service()
+    count = service.index.load_from_database()
+    print_info(f"已載入 {count} 張照片的雜湊")
+
+    with ProcessPoolExecutor(max_workers=settings.CPU_EXECUTOR_WORKERS) as executor:
+        completed = service.backfill(executor)
+
+    print_success(f"已回填 {completed} 張照片的雜湊")
+
 # ==========================================
 # 資料庫連線測試
 # ==========================================
@@ -449,12 +553,14 @@ def main():
   python command.py create-test-data      # 建立測試資料
   python command.py stats                 # 顯示統計資訊
   python command.py test                  # 測試資料庫連線
+  python command.py backfill-districts    # 依地址回填案件所屬區域（加 --geocode 使用地理編碼）
+  python command.py backfill-photo-hashes # 回填照片感知雜湊並標記跨案件相似照片
         """
     )
     
     parser.add_argument(
         'action',
-        choices=['clear', 'clear-table', 'drop-all-tables', 'create-all-tables', 'create-test-data', 'stats', 'test'],
+        choices=['clear', 'clear-table', 'drop-all-tables', 'create-all-tables', 'create-test-data', 'stats', 'test', 'backfill-districts', 'backfill-photo-hashes'],
         help='要執行的操作'
     )
     
@@ -470,6 +576,12 @@ def main():
         help='強制執行，不要求確認'
     )
     
+    parser.add_argument(
+        '--geocode',
+        action='store_true',
+        help='回填區域時，對無法離線配對的案件使用地理編碼'
+    )
+    
     args = parser.parse_args()
     
     # 執行對應的操作
@@ -497,6 +609,12 @@ def main():
     
     elif args.action == 'test':
         test_connection()
+    
+    elif args.action == 'backfill-districts':
+        backfill_districts(use_geocode=args.geocode)
+    
+    elif args.action == 'backfill-photo-hashes':
+        backfill_photo_hashes()
 
 if __name__ == "__main__":
     try:
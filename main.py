@@ -7,17 +7,56 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from app.settings import get_settings
-from app.routers import applications, users, reviews, certificates, photos, auth, districts, notifications, simplified_flow, complete_flow, maps, documents
+from app.routers import applications, users, reviews, certificates, photos, auth, districts, notifications, simplified_flow, complete_flow, maps, documents, storage_files
+from app.services.cpu_executor import CPUExecutorBusy, CPUJobTimeout, get_cpu_executor
+from app.services.uploads import MULTIPART_OVERHEAD, UploadSizeLimitMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting up application...")
+
+    # 照片衍生圖、DOCX 預覽、QR Code 等 CPU 工作共用的 process pool
+    get_cpu_executor().start()
+
+    # 建立案件空間索引（失敗不影響啟動，之後會隨案件異動增量更新）
+    try:
+        from app.services.spatial_index import get_case_spatial_index
+        count = await asyncio.to_thread(get_case_spatial_index().load_from_database)
+        print(f"Case spatial index ready: {count} cases")
+    except Exception as e:
+        print(f"Case spatial index not loaded: {e}")
+
+    # 建立地址自動完成索引
+    try:
+        from app.services.address_autocomplete import get_address_autocomplete_service
+        count = await asyncio.to_thread(get_address_autocomplete_service().load_from_database)
+        print(f"Address autocomplete index ready: {count} addresses")
+    except Exception as e:
+        print(f"Address autocomplete index not loaded: {e}")
+
+    # 在背景載入照片雜湊索引（照片數量大時不延遲啟動，載入前查詢只比對新處理的照片）
+    from app.services.photo_similarity import get_photo_similarity_service
+    photo_hash_index = asyncio.create_task(get_photo_similarity_service().load_index())
+
+    # 定期清除逾期未完成的續傳上傳工作
+    from app.services.resumable_uploads import get_resumable_upload_service
+    resumable_cleanup = asyncio.create_task(get_resumable_upload_service().run_cleanup())
+
+    # 定期回收未被引用的照片物件
+    from app.services.photo_objects import get_photo_object_service
+    photo_object_gc = asyncio.create_task(get_photo_object_service().run_gc())
+
     yield
     # Shutdown
     print("Shutting down application...")
+    resumable_cleanup.cancel()
+    photo_object_gc.cancel()
+    photo_hash_index.cancel()
+    get_cpu_executor().shutdown()
 
 # 取得設定
 settings = get_settings()
@@ -55,6 +94,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 上傳請求大小限制（在表單解析前中止過大的請求）
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/api/v1/photos": settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+        "/api/v1/photos/upload-multiple": settings.MAX_UPLOAD_REQUEST_SIZE,
+        "/api/v1/documents": settings.MAX_DOCUMENT_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+        "/api/v1/documents/upload-multiple": settings.MAX_UPLOAD_REQUEST_SIZE,
+        "/api/v1/storage/upload": max(settings.MAX_UPLOAD_SIZE, settings.MAX_DOCUMENT_UPLOAD_SIZE),
+    }
+)
+
 # CORS 設定 - 支援開發環境和 ngrok
 app.add_middleware(
     CORSMiddleware,
@@ -79,6 +130,7 @@ app.include_router(photos.router, prefix="/api/v1")
 app.include_router(documents.router, prefix="/api/v1")  # 證明文件管理
 app.include_router(districts.router)  # 區域管理
 app.include_router(notifications.router)  # 通知系統
+app.include_router(storage_files.router)  # 本機 Storage 檔案（STORAGE_BACKEND=local）
 
 # 引入 config 路由
 from app.routers import config
@@ -156,7 +208,8 @@ async def health_check():
     return {
         "status": "healthy",
         "app_name": settings.APP_NAME,
-        "version": settings.APP_VERSION
+        "version": settings.APP_VERSION,
+        "cpu_executor": get_cpu_executor().stats()
     }
 
 # 統計資料端點
@@ -197,6 +250,24 @@ async def get_statistics():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發生錯誤: {str(e)}")
 
+# CPU 工作佇列已滿或逾時
+@app.exception_handler(CPUExecutorBusy)
+async def cpu_executor_busy_handler(request, exc):
+    """CPU 工作佇列已滿：請用戶端稍後重試"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "5"},
+        content={"success": False, "message": "系統忙碌中，請稍後再試", "detail": str(exc)}
+    )
+
+@app.exception_handler(CPUJobTimeout)
+async def cpu_job_timeout_handler(request, exc):
+    """CPU 工作超過執行時限"""
+    return JSONResponse(
+        status_code=504,
+        content={"success": False, "message": "處理時間過長，請稍後再試", "detail": str(exc)}
+    )
+
 # 全域異常處理
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -0,0 +1,17 @@
+-- ==========================================
+-- 新增申請案件地理編碼欄位
+-- 地圖、勘查排程等功能會將 Google Maps 地理編碼結果寫回 applications
+-- ==========================================
+
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION; -- 緯度
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION; -- 經度
+ALTER TABLE applications ADD COLUMN IF NOT EXISTS formatted_address TEXT; -- Google 格式化地址
+
+-- 只索引已完成地理編碼的案件
+CREATE INDEX IF NOT EXISTS idx_applications_geocoded
+    ON applications(status, district_id)
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+
+COMMENT ON COLUMN applications.latitude IS '災損地點緯度（Google Maps 地理編碼）';
+COMMENT ON COLUMN applications.longitude IS '災損地點經度（Google Maps 地理編碼）';
+COMMENT ON COLUMN applications.formatted_address IS 'Google Maps 格式化後的災損地址';
@@ -0,0 +1,12 @@
+-- ==========================================
+-- 災損照片衍生圖欄位
+-- 上傳後（或第一次列出時）產生縮圖與預覽圖，存放在原始照片旁，
+-- 列表與詳情頁改用衍生圖 URL，不再載入原始照片
+-- ==========================================
+
+ALTER TABLE damage_photos ADD COLUMN IF NOT EXISTS thumbnail_path TEXT; -- 縮圖 Storage 路徑（長邊 320px）
+ALTER TABLE damage_photos ADD COLUMN IF NOT EXISTS preview_path TEXT; -- 預覽圖 Storage 路徑（長邊 1600px）
+ALTER TABLE damage_photos ADD COLUMN IF NOT EXISTS derivatives_generated_at TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN damage_photos.thumbnail_path IS '縮圖 Storage 路徑（依 EXIF 方向轉正）';
+COMMENT ON COLUMN damage_photos.preview_path IS '限制解析度的預覽圖 Storage 路徑';
@@ -0,0 +1,69 @@
+-- ==========================================
+-- 照片內容定址儲存（以 SHA-256 去除重複）
+-- 相同內容的照片只在 Storage 存一份（photo_objects），damage_photos 以 storage_path 指向共用物件，
+-- 以 ref_count 記錄引用數；引用歸零的物件保留一段時間後才由背景工作刪除
+-- ==========================================
+
+CREATE TABLE IF NOT EXISTS photo_objects (
+    sha256 VARCHAR(64) PRIMARY KEY, -- 內容 SHA-256（hex）
+    storage_path TEXT NOT NULL, -- 共用物件的 Storage 路徑
+    file_size INTEGER,
+    mime_type VARCHAR(100),
+    ref_count INTEGER NOT NULL DEFAULT 0, -- 引用此物件的照片記錄數
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending（上傳中）, stored
+    orphaned_at TIMESTAMP WITH TIME ZONE, -- 引用歸零的時間
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_photo_objects_orphaned_at
+    ON photo_objects(orphaned_at) WHERE ref_count = 0;
+
+-- 多筆照片記錄可共用同一個物件，storage_path 不再唯一；
+-- 直接上傳的 commit 改以 upload_ref（上傳意圖中的路徑）確保不重複建立記錄
+DROP INDEX IF EXISTS idx_damage_photos_storage_path;
+CREATE INDEX IF NOT EXISTS idx_damage_photos_storage_path ON damage_photos(storage_path);
+ALTER TABLE damage_photos ADD COLUMN IF NOT EXISTS upload_ref TEXT; -- 直接上傳時用戶端上傳的路徑
+CREATE UNIQUE INDEX IF NOT EXISTS idx_damage_photos_upload_ref ON damage_photos(upload_ref);
+
+-- 取得物件引用：不存在時建立（pending，由呼叫端上傳），存在時引用數 +1
+CREATE OR REPLACE FUNCTION acquire_photo_object(
+    p_sha256 VARCHAR,
+    p_storage_path TEXT,
+    p_file_size INTEGER,
+    p_mime_type VARCHAR
+)
+RETURNS SETOF photo_objects AS $$
+    INSERT INTO photo_objects (sha256, storage_path, file_size, mime_type, ref_count)
+    VALUES (p_sha256, p_storage_path, p_file_size, p_mime_type, 1)
+    ON CONFLICT (sha256) DO UPDATE
+        SET ref_count = photo_objects.ref_count + 1,
+            orphaned_at = NULL
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- 釋放物件引用：引用數 -1，歸零時記錄 orphaned_at
+CREATE OR REPLACE FUNCTION release_photo_object(p_sha256 VARCHAR)
+RETURNS SETOF photo_objects AS $$
+    UPDATE photo_objects
+    SET ref_count = GREATEST(ref_count - 1, 0),
+        orphaned_at = CASE WHEN ref_count <= 1 THEN NOW() ELSE NULL END
+    WHERE sha256 = p_sha256
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- 刪除引用歸零超過保留時間的物件記錄，回傳需從 Storage 刪除的物件
+-- （刪除與新的 acquire 以資料列鎖互斥；刪除後的 acquire 會建立新的物件路徑）
+CREATE OR REPLACE FUNCTION collect_orphaned_photo_objects(p_grace_seconds INTEGER, p_limit INTEGER DEFAULT 500)
+RETURNS SETOF photo_objects AS $$
+    DELETE FROM photo_objects
+    WHERE sha256 IN (
+        SELECT sha256 FROM photo_objects
+        WHERE ref_count = 0
+          AND orphaned_at < NOW() - make_interval(secs => p_grace_seconds)
+        ORDER BY orphaned_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    AND ref_count = 0
+    RETURNING *;
+$$ LANGUAGE sql;
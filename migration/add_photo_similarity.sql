@@ -0,0 +1,26 @@
+-- ==========================================
+-- 跨案件相似照片偵測
+-- damage_photos.phash 存放 64 位元差異雜湊（dHash，以有號 BIGINT 儲存），
+-- 由行程內的多重索引雜湊表查詢相似照片；與他案相似的照片記錄在 photo_similarity_flags 供審核
+-- ==========================================
+
+ALTER TABLE damage_photos ADD COLUMN IF NOT EXISTS phash BIGINT; -- 感知雜湊（dHash）
+
+-- 回填時找出尚未計算雜湊的照片
+CREATE INDEX IF NOT EXISTS idx_damage_photos_phash_missing ON damage_photos(id) WHERE phash IS NULL;
+
+CREATE TABLE IF NOT EXISTS photo_similarity_flags (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    application_id UUID NOT NULL REFERENCES applications(id) ON DELETE CASCADE, -- 後上傳照片所屬案件
+    photo_id UUID NOT NULL REFERENCES damage_photos(id) ON DELETE CASCADE,
+    similar_application_id UUID NOT NULL REFERENCES applications(id) ON DELETE CASCADE, -- 相似照片所屬案件
+    similar_photo_id UUID NOT NULL REFERENCES damage_photos(id) ON DELETE CASCADE,
+    distance SMALLINT NOT NULL, -- 漢明距離（0 表示內容幾乎相同）
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (photo_id, similar_photo_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_photo_similarity_flags_application_id ON photo_similarity_flags(application_id);
+CREATE INDEX IF NOT EXISTS idx_photo_similarity_flags_similar_application_id ON photo_similarity_flags(similar_application_id);
+
+ALTER TABLE photo_similarity_flags ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,8 @@
+-- ==========================================
+-- 照片 Storage 路徑唯一索引
+-- 直接上傳（upload-intent / commit）允許重複呼叫 commit，
+-- 以唯一索引避免同一物件在並行 commit 時被建立兩筆記錄
+-- ==========================================
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_damage_photos_storage_path
+    ON damage_photos(storage_path);
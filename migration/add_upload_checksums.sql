@@ -0,0 +1,13 @@
+-- ==========================================
+-- 新增上傳檔案的內容雜湊欄位
+-- 照片與證明文件上傳時會邊讀取邊計算 SHA-256，供完整性檢查與重複檔案比對
+-- ==========================================
+
+ALTER TABLE damage_photos ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64); -- 檔案內容 SHA-256（hex）
+ALTER TABLE application_documents ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64); -- 檔案內容 SHA-256（hex）
+
+CREATE INDEX IF NOT EXISTS idx_damage_photos_content_sha256
+    ON damage_photos(application_id, content_sha256);
+
+COMMENT ON COLUMN damage_photos.content_sha256 IS '照片內容 SHA-256（上傳時串流計算）';
+COMMENT ON COLUMN application_documents.content_sha256 IS '文件內容 SHA-256（上傳時串流計算）';
@@ -22,7 +22,9 @@ DROP TABLE IF EXISTS bank_verification_records CASCADE;
 DROP TABLE IF EXISTS notifications CASCADE;
 DROP TABLE IF EXISTS digital_certificates CASCADE;
 DROP TABLE IF EXISTS review_records CASCADE;
+DROP TABLE IF EXISTS photo_similarity_flags CASCADE;
 DROP TABLE IF EXISTS damage_photos CASCADE;
+DROP TABLE IF EXISTS photo_objects CASCADE;
 DROP TABLE IF EXISTS applications CASCADE;
 DROP TABLE IF EXISTS users CASCADE;
 DROP TABLE IF EXISTS districts CASCADE;
@@ -84,6 +84,11 @@ CREATE TABLE IF NOT EXISTS applications (
     damage_location TEXT NOT NULL, -- 災損地點
     estimated_loss DECIMAL(12, 2), -- 預估損失金額
     
+    -- 地理編碼（Google Maps）
+    latitude DOUBLE PRECISION, -- 緯度
+    longitude DOUBLE PRECISION, -- 經度
+    formatted_address TEXT, -- 格式化地址
+    
     -- 申請資料
     subsidy_type VARCHAR(50) NOT NULL, -- 補助類型：房屋、設備、生活補助等
     requested_amount DECIMAL(12, 2), -- 申請金額
@@ -129,12 +134,85 @@ CREATE TABLE IF NOT EXISTS damage_photos (
     file_name VARCHAR(255) NOT NULL,
     file_size INTEGER, -- bytes
     mime_type VARCHAR(100),
+    content_sha256 VARCHAR(64), -- 檔案內容 SHA-256
+    thumbnail_path TEXT, -- 縮圖 Storage 路徑
+    preview_path TEXT, -- 預覽圖 Storage 路徑
+    derivatives_generated_at TIMESTAMP WITH TIME ZONE,
+    upload_ref TEXT, -- 直接上傳時用戶端上傳的路徑（commit 不重複建立記錄）
+    phash BIGINT, -- 感知雜湊（dHash），跨案件相似照片偵測
     
     description TEXT, -- 照片說明
     uploaded_by UUID REFERENCES users(id),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- 4-1. 照片物件表（內容定址，相同內容只存一份）
+CREATE TABLE IF NOT EXISTS photo_objects (
+    sha256 VARCHAR(64) PRIMARY KEY, -- 內容 SHA-256（hex）
+    storage_path TEXT NOT NULL, -- 共用物件的 Storage 路徑
+    file_size INTEGER,
+    mime_type VARCHAR(100),
+    ref_count INTEGER NOT NULL DEFAULT 0, -- 引用此物件的照片記錄數
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending（上傳中）, stored
+    orphaned_at TIMESTAMP WITH TIME ZONE, -- 引用歸零的時間
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- 取得物件引用：不存在時建立（pending，由呼叫端上傳），存在時引用數 +1
+CREATE OR REPLACE FUNCTION acquire_photo_object(
+    p_sha256 VARCHAR,
+    p_storage_path TEXT,
+    p_file_size INTEGER,
+    p_mime_type VARCHAR
+)
+RETURNS SETOF photo_objects AS $$
+    INSERT INTO photo_objects (sha256, storage_path, file_size, mime_type, ref_count)
+    VALUES (p_sha256, p_storage_path, p_file_size, p_mime_type, 1)
+    ON CONFLICT (sha256) DO UPDATE
+        SET ref_count = photo_objects.ref_count + 1,
+            orphaned_at = NULL
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- 釋放物件引用：引用數 -1，歸零時記錄 orphaned_at
+CREATE OR REPLACE FUNCTION release_photo_object(p_sha256 VARCHAR)
+RETURNS SETOF photo_objects AS $$
+    UPDATE photo_objects
+    SET ref_count = GREATEST(ref_count - 1, 0),
+        orphaned_at = CASE WHEN ref_count <= 1 THEN NOW() ELSE NULL END
+    WHERE sha256 = p_sha256
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- 刪除引用歸零超過保留時間的物件記錄，回傳需從 Storage 刪除的物件
+-- （刪除與新的 acquire 以資料列鎖互斥；刪除後的 acquire 會建立新的物件路徑）
+CREATE OR REPLACE FUNCTION collect_orphaned_photo_objects(p_grace_seconds INTEGER, p_limit INTEGER DEFAULT 500)
+RETURNS SETOF photo_objects AS $$
+    DELETE FROM photo_objects
+    WHERE sha256 IN (
+        SELECT sha256 FROM photo_objects
+        WHERE ref_count = 0
+          AND orphaned_at < NOW() - make_interval(secs => p_grace_seconds)
+        ORDER BY orphaned_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    AND ref_count = 0
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- 4-2. 相似照片標記表（跨案件重複使用的災損照片）
+CREATE TABLE IF NOT EXISTS photo_similarity_flags (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    application_id UUID NOT NULL REFERENCES applications(id) ON DELETE CASCADE, -- 後上傳照片所屬案件
+    photo_id UUID NOT NULL REFERENCES damage_photos(id) ON DELETE CASCADE,
+    similar_application_id UUID NOT NULL REFERENCES applications(id) ON DELETE CASCADE, -- 相似照片所屬案件
+    similar_photo_id UUID NOT NULL REFERENCES damage_photos(id) ON DELETE CASCADE,
+    distance SMALLINT NOT NULL, -- 漢明距離（0 表示內容幾乎相同）
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (photo_id, similar_photo_id)
+);
+
 -- 5. 審核記錄表
 CREATE TABLE IF NOT EXISTS review_records (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -361,6 +439,7 @@ CREATE INDEX IF NOT EXISTS idx_applications_case_no ON applications(case_no);
 CREATE INDEX IF NOT EXISTS idx_applications_submitted_at ON applications(submitted_at DESC);
 CREATE INDEX IF NOT EXISTS idx_applications_assigned_reviewer ON applications(assigned_reviewer_id);
 CREATE INDEX IF NOT EXISTS idx_applications_disaster_date ON applications(disaster_date);
+CREATE INDEX IF NOT EXISTS idx_applications_geocoded ON applications(status, district_id) WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
 
 -- Applications 政府 API 相關索引（來自 add_gov_api_fields.sql）
 CREATE INDEX IF NOT EXISTS idx_applications_gov_transaction_id ON applications(gov_transaction_id);
@@ -370,6 +449,12 @@ CREATE INDEX IF NOT EXISTS idx_applications_status_disbursed ON applications(sta
 -- Damage Photos 索引
 CREATE INDEX IF NOT EXISTS idx_damage_photos_application_id ON damage_photos(application_id);
 CREATE INDEX IF NOT EXISTS idx_damage_photos_photo_type ON damage_photos(photo_type);
+CREATE INDEX IF NOT EXISTS idx_damage_photos_storage_path ON damage_photos(storage_path);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_damage_photos_upload_ref ON damage_photos(upload_ref);
+CREATE INDEX IF NOT EXISTS idx_photo_objects_orphaned_at ON photo_objects(orphaned_at) WHERE ref_count = 0;
+CREATE INDEX IF NOT EXISTS idx_damage_photos_phash_missing ON damage_photos(id) WHERE phash IS NULL;
+CREATE INDEX IF NOT EXISTS idx_photo_similarity_flags_application_id ON photo_similarity_flags(application_id);
+CREATE INDEX IF NOT EXISTS idx_photo_similarity_flags_similar_application_id ON photo_similarity_flags(similar_application_id);
 
 -- Review Records 索引
 CREATE INDEX IF NOT EXISTS idx_review_records_application_id ON review_records(application_id);
@@ -429,6 +514,7 @@ ALTER TABLE districts ENABLE ROW LEVEL SECURITY;
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE applications ENABLE ROW LEVEL SECURITY;
 ALTER TABLE damage_photos ENABLE ROW LEVEL SECURITY;
+ALTER TABLE photo_similarity_flags ENABLE ROW LEVEL SECURITY;
 ALTER TABLE review_records ENABLE ROW LEVEL SECURITY;
 ALTER TABLE digital_certificates ENABLE ROW LEVEL SECURITY;
 ALTER TABLE subsidy_items ENABLE ROW LEVEL SECURITY;
@@ -696,6 +782,7 @@ CREATE TABLE IF NOT EXISTS application_documents (
     file_name VARCHAR(255) NOT NULL,
     file_size INTEGER NOT NULL,
     mime_type VARCHAR(100) NOT NULL,
+    content_sha256 VARCHAR(64), -- 檔案內容 SHA-256
     description TEXT,
     
     uploaded_by UUID REFERENCES users(id),
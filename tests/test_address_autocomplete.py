@@ -0,0 +1,86 @@
+"""
+測試地址自動完成的本地前綴索引
+"""
+import asyncio
+
+from app.services import address_autocomplete, google_maps
+from app.services.address_autocomplete import AddressAutocompleteService, AddressPrefixIndex
+
+
+def test_prefix_index_matches_from_road_and_ranks_by_weight():
+    """可從全名或路名開始比對，區域排在路名、Google 建議之前"""
+    index = AddressPrefixIndex()
+    index.build([
+        ("700台灣台南市中西區民權路一段", "road"),
+        ("台南市中西區民生路二段5號", "provider"),
+        ("台南市東區民族路三段", "road"),
+        ("台南市中西區民安里", "district"),
+    ])
+    index.add("台南市中西區民生路二段", "road")
+
+    ranked = [s["text"] for s in index.search("台南市中西區民")]
+    assert ranked[0] == "台南市中西區民安里"
+    assert set(ranked[1:3]) == {"台南市中西區民權路一段", "台南市中西區民生路二段"}
+    assert ranked[3] == "台南市中西區民生路二段5號"
+    assert index.search("民族路")[0]["text"] == "台南市東區民族路三段"
+    assert index.search("台") == []
+
+
+def test_index_never_holds_applicant_addresses(monkeypatch):
+    """案件地址只貢獻路名；驗證過的地址也只加入路名，建議結果不含座標"""
+    from app.models.database import db_service
+
+    monkeypatch.setattr(db_service, "get_geocoded_applications", lambda **kwargs: [
+        {"formatted_address": "700台灣台南市中西區民權路一段100號"},
+        {"formatted_address": "台南市中西區民權路一段12號"},
+    ])
+    monkeypatch.setattr(db_service, "get_active_districts", lambda: [{"city": "台南市", "district": "中西區"}])
+    service = AddressAutocompleteService()
+    assert service.load_from_database() == 2
+    service.add_validated("台南市東區民族路三段8號")
+
+    texts = [s["text"] for s in service.index.search("台南市", limit=20)]
+    assert sorted(texts) == ["台南市中西區", "台南市中西區民權路一段", "台南市東區民族路三段"]
+    assert all("latitude" not in s for s in service.index.search("民權路"))
+
+
+class _FakeAutocompleteMaps(google_maps.GoogleMapsService):
+    def __init__(self):
+        super().__init__(api_key="test-key")
+        self.calls = []
+
+    async def autocomplete_address(self, text, session_token=None, language="zh-TW"):
+        self.calls.append(text)
+        return {"success": True, "predictions": [{"description": f"台灣{text}街1號", "place_id": "p1"}]}
+
+
+def test_suggest_calls_provider_once_per_unseen_prefix(monkeypatch):
+    """本地結果不足時才呼叫 Google，同一前綴第二次由快取回應，同一 session 的舊輸入會被防抖；建議的門牌地址不進入索引"""
+    fake = _FakeAutocompleteMaps()
+    monkeypatch.setattr(google_maps, "_google_maps_service", fake)
+    monkeypatch.setattr(address_autocomplete, "DEBOUNCE_SECONDS", 0.01)
+    service = AddressAutocompleteService()
+    service.index.build([("台南市中西區", "district")])
+
+    async def run():
+        first = await service.suggest("高雄市苓雅區")
+        second = await service.suggest("高雄市苓雅區")
+        stale, latest = await asyncio.gather(
+            service.suggest("高雄市前鎮", session="s1"),
+            service.suggest("高雄市前鎮區", session="s1")
+        )
+        return first, second, stale, latest
+
+    first, second, stale, latest = asyncio.run(run())
+
+    assert first["source"] == "provider"
+    assert first["suggestions"][0]["text"] == "高雄市苓雅區街1號"
+    assert second["source"] == "local"
+    assert stale["debounced"] and not latest["debounced"]
+    assert fake.calls == ["高雄市苓雅區", "高雄市前鎮區"]
+    # Google 建議的門牌地址不會進入共用索引，只留下路名
+    assert [s["text"] for s in service.index.search("高雄市苓雅區", limit=20)] == ["高雄市苓雅區街"]
+    # 只輸入縣市時直接由本地回應
+    assert asyncio.run(service.suggest("台南")) == {
+        "suggestions": service.index.search("台南"), "source": "local", "debounced": False
+    }
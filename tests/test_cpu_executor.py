@@ -0,0 +1,76 @@
+"""
+測試 CPU 工作執行器（back-pressure、執行時限與統計）
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.cpu_executor import CPUExecutor, CPUExecutorBusy, CPUJobTimeout
+
+
+def _wait_for(event: threading.Event) -> str:
+    event.wait(5)
+    return "done"
+
+
+def _sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def _fail() -> None:
+    raise ValueError("bad input")
+
+
+def test_back_pressure_waits_then_rejects():
+    """超過上限的工作等待空位，空位釋放後依序執行；等待逾時則拒絕"""
+    cpu = CPUExecutor(max_workers=2, max_pending=2, queue_timeout=0.2, executor=ThreadPoolExecutor(2))
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.create_task(cpu.run(_wait_for, release, job="blocking")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert cpu.stats()["pending"] == 2
+
+        # 佇列已滿：等待逾時後拒絕
+        with pytest.raises(CPUExecutorBusy):
+            await cpu.run(_sleep, 0, job="quick")
+
+        # 等待中的工作在空位釋放後取得位置
+        waiting = asyncio.create_task(cpu.run(_sleep, 0, job="quick", queue_timeout=5))
+        await asyncio.sleep(0.05)
+        assert cpu.stats()["waiting"] == 1
+        release.set()
+        return await asyncio.gather(*running), await waiting
+
+    assert asyncio.run(scenario()) == (["done", "done"], 0)
+    stats = cpu.stats()
+    assert stats["pending"] == 0 and stats["waiting"] == 0
+    assert stats["jobs"]["quick"]["rejected"] == 1
+    assert stats["jobs"]["quick"]["completed"] == 1
+    assert stats["jobs"]["blocking"]["completed"] == 2
+    cpu.shutdown()
+
+
+def test_timeout_and_failure_metrics():
+    """逾時的工作拋出 CPUJobTimeout，仍在執行時佔用位置直到結束；失敗的工作傳回原本的例外"""
+    cpu = CPUExecutor(max_workers=1, max_pending=4, executor=ThreadPoolExecutor(1))
+
+    async def scenario():
+        with pytest.raises(CPUJobTimeout):
+            await cpu.run(_sleep, 0.3, timeout=0.05)
+        assert cpu.stats()["pending"] == 1
+        with pytest.raises(ValueError):
+            await cpu.run(_fail)
+        return await cpu.run(_sleep, 0.01)
+
+    assert asyncio.run(scenario()) == 0.01
+    stats = cpu.stats()
+    assert stats["pending"] == 0
+    assert stats["jobs"]["_sleep"]["timeouts"] == 1
+    assert stats["jobs"]["_sleep"]["completed"] == 1
+    assert stats["jobs"]["_fail"]["failed"] == 1
+    cpu.shutdown()
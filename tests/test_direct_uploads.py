@@ -0,0 +1,144 @@
+"""
+測試照片直接上傳的意圖與確認流程
+"""
+import asyncio
+import hashlib
+from contextlib import contextmanager
+
+import pytest
+
+from app.models.database import db_service
+from app.services import storage as storage_module
+from app.services.direct_uploads import DirectUploadService
+from app.services.uploads import UploadError
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 200
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    """以記憶體模擬 Storage：objects 為已上傳的物件"""
+    service = storage_module.storage_service
+    state = {"objects": {}, "removed": [], "ranges": []}
+
+    monkeypatch.setattr(service, "create_signed_upload_url",
+                        lambda bucket, path: {"signed_url": f"https://upload/{path}", "token": "t", "path": path})
+    monkeypatch.setattr(service, "create_signed_urls",
+                        lambda bucket, paths, expires_in: {p: f"https://signed/{p}" for p in paths})
+    monkeypatch.setattr(service, "remove_files", lambda bucket, paths: state["removed"].extend(paths) or True)
+
+    @contextmanager
+    def open_object_stream(bucket, path, chunk_size=65536, byte_range=None):
+        if path not in state["objects"]:
+            raise FileNotFoundError(path)
+        data = state["objects"][path]
+        state["ranges"].append(byte_range)
+        if byte_range:
+            end = int(byte_range.split("-")[1])
+            yield {"content-range": f"bytes 0-{end}/{len(data)}"}, iter([data[:end + 1]])
+        else:
+            yield {"content-length": str(len(data))}, (data[i:i + 64] for i in range(0, len(data), 64))
+
+    monkeypatch.setattr(service, "open_object_stream", open_object_stream)
+    return state
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    rows = []
+    inserts = []
+
+    def create_damage_photos(photos):
+        inserts.append(photos)
+        created = [{"id": f"photo-{len(rows) + i}", **p} for i, p in enumerate(photos)]
+        rows.extend(created)
+        return created
+
+    objects = {}
+
+    def acquire_photo_object(sha256, storage_path, file_size, mime_type):
+        record = objects.setdefault(sha256, {"sha256": sha256, "storage_path": storage_path,
+                                             "ref_count": 0, "status": "pending"})
+        record["ref_count"] += 1
+        return dict(record)
+
+    monkeypatch.setattr(db_service, "create_damage_photos", create_damage_photos)
+    monkeypatch.setattr(db_service, "get_photos_by_upload_refs",
+                        lambda refs: [dict(r) for r in rows if r["upload_ref"] in refs])
+    monkeypatch.setattr(db_service, "acquire_photo_object", acquire_photo_object)
+    monkeypatch.setattr(db_service, "mark_photo_object_stored",
+                        lambda sha256: objects[sha256].update(status="stored"))
+    return inserts
+
+
+def _declare(name, content, mime_type="image/jpeg"):
+    return {"file_name": name, "size": len(content), "mime_type": mime_type,
+            "sha256": hashlib.sha256(content).hexdigest()}
+
+
+def test_commit_verifies_objects_and_inserts_once(fake_storage, fake_db):
+    """驗證大小、格式與雜湊，符合者單次寫入；不符者刪除物件；重複 commit 不重複寫入"""
+    service = DirectUploadService(verify_hash=True)
+    intent = service.create_photo_intent(
+        "app-1", "after_damage",
+        [_declare("a.jpg", JPEG), _declare("b.png", PNG, "image/png"), _declare("c.jpg", JPEG)],
+        uploaded_by="user-1"
+    )
+    paths = [u["storage_path"] for u in intent["uploads"]]
+    assert all(p.startswith("app-1/photos/after_damage_") for p in paths)
+
+    fake_storage["objects"][paths[0]] = JPEG
+    fake_storage["objects"][paths[1]] = PNG[:-1] + b"\x01"  # 內容被竄改
+    # c.jpg 尚未上傳
+
+    result = asyncio.run(service.commit_photos(intent["intent_token"]))
+    assert [r["success"] for r in result["results"]] == [True, False, False]
+    assert len(fake_db) == 1 and len(fake_db[0]) == 1
+    assert fake_db[0][0]["content_sha256"] == hashlib.sha256(JPEG).hexdigest()
+    assert result["uploaded"][0]["signed_url"] == f"https://signed/{paths[0]}"
+    assert fake_storage["removed"] == [paths[1]]
+    assert "找不到" in result["results"][2]["error"]
+
+    # 補上傳後再次 commit：只寫入新的檔案，先前的記錄直接回傳
+    fake_storage["objects"][paths[2]] = JPEG
+    again = asyncio.run(service.commit_photos(intent["intent_token"]))
+    assert [r["success"] for r in again["results"]] == [True, False, True]
+    assert len(fake_db) == 2 and [p["upload_ref"] for p in fake_db[1]] == [paths[2]]
+    assert again["results"][0]["id"] == result["results"][0]["id"]
+
+    # 與 a.jpg 內容相同：記錄指向共用物件，重複上傳的檔案被刪除
+    assert fake_db[1][0]["storage_path"] == paths[0]
+    assert fake_storage["removed"][-1] == paths[2]
+
+
+def test_intent_validation_and_range_only_verification(fake_storage, fake_db, monkeypatch):
+    """宣告不符規定時拒絕；不驗證雜湊時只讀取開頭位元組；竄改的 token 無效"""
+    service = DirectUploadService(max_size=1024, verify_hash=False)
+
+    with pytest.raises(UploadError) as oversized:
+        service.create_photo_intent("app-1", "after_damage", [_declare("big.jpg", JPEG * 10)])
+    assert oversized.value.status_code == 413
+    with pytest.raises(UploadError) as unsupported:
+        service.create_photo_intent("app-1", "after_damage", [_declare("a.pdf", b"%PDF-", "application/pdf")])
+    assert unsupported.value.status_code == 415
+
+    intent = service.create_photo_intent("app-1", "after_damage", [_declare("a.jpg", JPEG)])
+    fake_storage["objects"][intent["uploads"][0]["storage_path"]] = JPEG
+    result = asyncio.run(service.commit_photos(intent["intent_token"]))
+    assert result["results"][0]["success"]
+    assert fake_storage["ranges"] == ["bytes=0-63"]
+
+    # 宣告其他照片的雜湊但上傳不同內容：未驗證的雜湊不參與內容定址，也不寫入記錄
+    monkeypatch.setattr(db_service, "acquire_photo_object", lambda *args: pytest.fail("未驗證的雜湊不應取得共用物件"))
+    victim = _declare("b.jpg", JPEG + b"\x01")
+    forged = service.create_photo_intent("app-2", "after_damage", [{**_declare("b.jpg", JPEG), "sha256": victim["sha256"]}])
+    forged_path = forged["uploads"][0]["storage_path"]
+    fake_storage["objects"][forged_path] = JPEG
+    asyncio.run(service.commit_photos(forged["intent_token"]))
+    assert fake_db[-1][0]["storage_path"] == forged_path
+    assert fake_db[-1][0]["content_sha256"] is None
+
+    with pytest.raises(UploadError) as invalid:
+        asyncio.run(service.commit_photos(intent["intent_token"][:-2] + "xx"))
+    assert invalid.value.status_code == 401
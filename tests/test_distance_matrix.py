@@ -0,0 +1,111 @@
+"""
+測試距離矩陣的切塊請求、成對快取與直線距離估算
+"""
+import asyncio
+
+from app.services.geo import haversine_m
+from app.services.google_maps import MATRIX_MAX_ELEMENTS, MATRIX_MAX_ORIGINS, GoogleMapsService
+
+
+class _FakeLimiter:
+    """記錄降級次數；blocked 為 True 時模擬配額已用盡"""
+
+    def __init__(self, blocked=False):
+        self.blocked = blocked
+        self.degraded = []
+
+    def is_blocked(self, endpoint):
+        return self.blocked
+
+    def record_degraded(self, endpoint):
+        self.degraded.append(endpoint)
+
+
+class _FakeMatrixService(GoogleMapsService):
+    """以直線距離回應 Distance Matrix，並記錄每次請求的起訖點"""
+
+    def __init__(self, status="OK", blocked=False):
+        super().__init__(api_key="test-key")
+        self.rate_limiter = _FakeLimiter(blocked)
+        self.status = status
+        self.requests = []
+
+    async def _call_api(self, endpoint, path, params, client=None):
+        origins = params["origins"].split("|")
+        destinations = params["destinations"].split("|")
+        self.requests.append((origins, destinations))
+        if self.status != "OK":
+            return {"status": self.status}
+        rows = []
+        for origin in origins:
+            o_lat, o_lng = (float(v) for v in origin.split(","))
+            elements = []
+            for destination in destinations:
+                d_lat, d_lng = (float(v) for v in destination.split(","))
+                meters = int(haversine_m(o_lat, o_lng, d_lat, d_lng))
+                elements.append({
+                    "status": "OK",
+                    "distance": {"text": f"{meters} 公尺", "value": meters},
+                    "duration": {"text": "1 分鐘", "value": 60}
+                })
+            rows.append({"elements": elements})
+        return {"status": "OK", "origin_addresses": origins, "destination_addresses": destinations, "rows": rows}
+
+
+ORIGINS = [(22.99 + i * 0.001, 120.20) for i in range(30)]
+DESTINATIONS = [(23.00, 120.21 + j * 0.001) for j in range(8)]
+
+
+def test_tiles_respect_api_limits_and_cover_every_pair():
+    """30 × 8 的矩陣切成不超過 25 起點 / 100 元素的區塊，每組起訖點只請求一次"""
+    service = _FakeMatrixService()
+    result = asyncio.run(service.distance_matrix(ORIGINS, DESTINATIONS))
+
+    assert result["success"] and result["estimated_count"] == 0
+    assert len(service.requests) == 3
+    requested = []
+    for origins, destinations in service.requests:
+        assert len(origins) <= MATRIX_MAX_ORIGINS and len(origins) * len(destinations) <= MATRIX_MAX_ELEMENTS
+        requested.extend((o, d) for o in origins for d in destinations)
+    assert len(requested) == len(set(requested)) == len(ORIGINS) * len(DESTINATIONS)
+
+    element = result["rows"][29]["elements"][7]
+    assert element["distance"]["value"] == int(haversine_m(*ORIGINS[29], *DESTINATIONS[7]))
+    assert element["estimated"] is False
+
+
+def test_repeated_pairs_are_served_from_cache():
+    """已查詢過的起訖點由快取回應，只請求新增的終點"""
+    service = _FakeMatrixService()
+    asyncio.run(service.distance_matrix(ORIGINS, DESTINATIONS))
+    service.requests.clear()
+
+    again = asyncio.run(service.distance_matrix(ORIGINS, DESTINATIONS))
+    assert service.requests == []
+    assert again["cached_count"] == len(ORIGINS) * len(DESTINATIONS)
+
+    extra = (23.01, 120.25)
+    grown = asyncio.run(service.distance_matrix(ORIGINS, DESTINATIONS + [extra]))
+    assert grown["cached_count"] == len(ORIGINS) * len(DESTINATIONS)
+    assert {d for _, destinations in service.requests for d in destinations} == {"23.01000,120.25000"}
+    assert sum(len(origins) for origins, _ in service.requests) == len(ORIGINS)
+
+
+def test_falls_back_to_haversine_when_rate_limited_or_over_quota():
+    """速率限制、配額錯誤或已封鎖時以直線距離估算；沒有座標的地址無法估算"""
+    for status in ("RATE_LIMITED", "OVER_QUERY_LIMIT"):
+        service = _FakeMatrixService(status=status)
+        result = asyncio.run(service.distance_matrix(ORIGINS[:2], DESTINATIONS[:2] + ["台南市中西區民權路一段"]))
+
+        assert result["success"] and result["estimated_count"] == 4
+        element = result["rows"][0]["elements"][0]
+        assert element["estimated"] is True
+        assert element["distance"]["value"] == int(round(haversine_m(*ORIGINS[0], *DESTINATIONS[0]) * 1.3))
+        assert result["rows"][0]["elements"][2]["status"] == "NOT_ESTIMABLE"
+        assert service.rate_limiter.degraded == ["distance_matrix"]
+        assert service.matrix_cache.get(("22.99000,120.20000", "23.00000,120.21000", "driving")) is None
+
+    blocked = _FakeMatrixService(blocked=True)
+    result = asyncio.run(blocked.distance_matrix(ORIGINS, DESTINATIONS))
+    assert blocked.requests == []
+    assert result["estimated_count"] == len(ORIGINS) * len(DESTINATIONS)
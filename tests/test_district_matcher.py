@@ -0,0 +1,46 @@
+"""
+測試地址自動配對區域
+"""
+from app.services.district_matcher import AhoCorasick, DistrictMatcher, normalize_address
+
+
+DISTRICTS = [
+    {"id": "d-cw", "city": "臺南市", "district": "中西區", "village": None},
+    {"id": "d-cw-mq", "city": "臺南市", "district": "中西區", "village": "民權里"},
+    {"id": "d-ea", "city": "台南市", "district": "東區", "village": None},
+    {"id": "d-tp-ea", "city": "台北市", "district": "大安區", "village": None},
+    {"id": "d-cy-ea", "city": "嘉義市", "district": "東區", "village": None},
+]
+
+
+def test_normalize_address():
+    """全形、臺/台與空白正規化"""
+    assert normalize_address("臺南市 中西區　民權路１段１００號") == "台南市中西區民權路1段100號"
+
+
+def test_aho_corasick_overlapping_patterns():
+    """重疊樣式皆可找到"""
+    automaton = AhoCorasick([("東區", 1), ("區", 2), ("中西區", 3)])
+
+    found = sorted(payload for _, _, payload in automaton.search("中西區與東區"))
+
+    assert found == [1, 2, 2, 3]
+
+
+def test_match_village_and_district_level():
+    """有里名稱時配對到里，否則配對到行政區"""
+    matcher = DistrictMatcher(DISTRICTS)
+
+    assert matcher.match("臺南市中西區民權里民權路一段100號") == "d-cw-mq"
+    assert matcher.match("台南市中西區永福路二段") == "d-cw"
+    assert matcher.match("台南市東區大學路１號") == "d-ea"
+
+
+def test_match_ambiguous_district_requires_city():
+    """同名行政區需靠縣市區分"""
+    matcher = DistrictMatcher(DISTRICTS)
+
+    assert matcher.match("東區大學路1號") is None
+    assert matcher.match("嘉義市東區") == "d-cy-ea"
+    assert matcher.match_components("台南市", "東區") == "d-ea"
+    assert matcher.match("不明地址") is None
@@ -0,0 +1,92 @@
+"""
+測試 DOCX 預覽的轉換快取
+"""
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import docx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.database import db_service
+from app.routers import documents
+from app.services import document_previews
+from app.services import storage as storage_module
+from app.services.storage import ObjectChunks
+from app.services.cpu_executor import CPUExecutor
+from app.services.document_previews import DOCX_MIME_TYPE, DocumentPreviewService, convert_docx_to_pdf, preview_path
+
+
+def _docx(*paragraphs) -> bytes:
+    document = docx.Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+DOCUMENT = {
+    "id": "doc-1",
+    "storage_path": "app-1/income_proof_x.docx",
+    "file_name": "收入證明.docx",
+    "mime_type": DOCX_MIME_TYPE,
+    "content_sha256": "ab" * 32,
+}
+
+
+def _fake_storage(monkeypatch, objects):
+    service = storage_module.storage_service
+    calls = {"downloads": 0, "uploads": []}
+
+    def download_document(path):
+        calls["downloads"] += 1
+        return objects.get(path)
+
+    def upload_file(bucket, path, content, content_type, upsert=True):
+        calls["uploads"].append(path)
+        objects[path] = content
+        return path
+
+    def stream_object(bucket, path, chunk_size=65536, request_headers=None):
+        if path not in objects:
+            raise FileNotFoundError(path)
+        return 200, {"content-length": str(len(objects[path]))}, ObjectChunks(iter([objects[path]]), None)
+
+    monkeypatch.setattr(service, "download_document", download_document)
+    monkeypatch.setattr(service, "upload_file", upload_file)
+    monkeypatch.setattr(service, "stream_object", stream_object)
+    return calls
+
+
+def test_convert_escapes_markup_and_supports_chinese():
+    """段落中的 < & 不會被當成標記，中文段落可轉換"""
+    pdf = convert_docx_to_pdf(_docx("災損金額 <5000> & 以上", "第二段"))
+    assert pdf.startswith(b"%PDF")
+
+
+def test_preview_converts_once_then_streams_cache(monkeypatch):
+    """第一次預覽轉換並存入快取（同時的請求只轉換一次），之後直接串流快取的 PDF"""
+    objects = {DOCUMENT["storage_path"]: _docx("收入證明")}
+    calls = _fake_storage(monkeypatch, objects)
+    service = DocumentPreviewService(cpu=CPUExecutor(executor=ThreadPoolExecutor(max_workers=1)))
+    monkeypatch.setattr(document_previews, "_document_preview_service", service)
+    monkeypatch.setattr(db_service, "get_document_by_id", lambda document_id: dict(DOCUMENT))
+
+    async def concurrent():
+        return await asyncio.gather(*(service.ensure_preview(dict(DOCUMENT)) for _ in range(3)))
+
+    paths = asyncio.run(concurrent())
+    expected = preview_path(DOCUMENT, DOCUMENT["content_sha256"])
+    assert paths == [expected] * 3
+    assert expected.startswith("app-1/previews/doc-1_abababababababab")
+    assert calls["downloads"] == 1 and calls["uploads"] == [expected]
+
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/api/v1")
+    response = TestClient(app).get("/api/v1/documents/doc-1/preview")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content == objects[expected]
+    assert calls["downloads"] == 1
@@ -0,0 +1,107 @@
+"""
+測試 Storage 物件的串流下載（Range、ETag、條件式請求）
+"""
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.database import db_service
+from app.routers import documents
+from app.services import storage as storage_module
+from app.services.storage import ObjectChunks
+
+CONTENT = bytes(range(256)) * 4096  # 1MB
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """以記憶體模擬 Storage：依 Range 回傳 206，依 If-None-Match 回傳 304"""
+    calls = []
+    closed = []
+
+    def stream_object(bucket, path, chunk_size=65536, request_headers=None):
+        request_headers = request_headers or {}
+        calls.append(dict(request_headers))
+        if request_headers.get("If-None-Match") == '"storage-etag"':
+            return 304, {"etag": '"storage-etag"'}, ObjectChunks(iter([]), lambda: closed.append(path))
+        headers = {"etag": '"storage-etag"', "last-modified": "Wed, 01 Oct 2025 00:00:00 GMT"}
+        byte_range = request_headers.get("Range")
+        if byte_range:
+            start, end = (int(x) for x in byte_range.split("=")[1].split("-"))
+            if start >= len(CONTENT):
+                headers["content-range"] = f"bytes */{len(CONTENT)}"
+                return 416, headers, ObjectChunks(iter([]), lambda: closed.append(path))
+            body = CONTENT[start:end + 1]
+            headers.update({"content-range": f"bytes {start}-{end}/{len(CONTENT)}", "content-length": str(len(body))})
+            status_code = 206
+        else:
+            body = CONTENT
+            headers["content-length"] = str(len(body))
+            status_code = 200
+        chunks = (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+        return status_code, headers, ObjectChunks(chunks, lambda: closed.append(path))
+
+    monkeypatch.setattr(storage_module.storage_service, "stream_object", stream_object)
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/api/v1")
+    return TestClient(app), calls, closed
+
+
+def _document(sha256):
+    return {
+        "id": "doc-1",
+        "storage_path": "app-1/income_proof_x.pdf",
+        "file_name": "收入證明.pdf",
+        "mime_type": "application/pdf",
+        "content_sha256": sha256,
+        "uploaded_at": "2025-10-01T08:30:00.123456+00:00",
+    }
+
+
+def test_known_etag_serves_conditionals_without_storage(client, monkeypatch):
+    """以內容雜湊作 ETag：304 不呼叫 Storage；Range 回傳 206；If-Range 不符時回傳完整內容"""
+    http, calls, _ = client
+    monkeypatch.setattr(db_service, "get_document_by_id", lambda document_id: _document(SHA256))
+    url = "/api/v1/documents/doc-1/download"
+
+    full = http.get(url)
+    assert full.status_code == 200 and full.content == CONTENT
+    assert full.headers["etag"] == f'"{SHA256}"'
+    assert full.headers["last-modified"] == "Wed, 01 Oct 2025 08:30:00 GMT"
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.headers["content-disposition"].startswith("attachment;")
+
+    assert http.get(url, headers={"If-None-Match": f'W/"{SHA256}"'}).status_code == 304
+    assert http.get(url, headers={"If-Modified-Since": "Wed, 01 Oct 2025 09:00:00 GMT"}).status_code == 304
+    assert len(calls) == 1
+
+    part = http.get(url, headers={"Range": "bytes=100-199", "If-Range": f'"{SHA256}"'})
+    assert part.status_code == 206 and part.content == CONTENT[100:200]
+    assert part.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+    stale = http.get(url, headers={"Range": "bytes=100-199", "If-Range": '"old"'})
+    assert stale.status_code == 200 and len(stale.content) == len(CONTENT)
+    assert "Range" not in calls[-1]
+
+
+def test_unknown_etag_forwards_conditionals_to_storage(client, monkeypatch):
+    """沒有內容雜湊時由 Storage 判斷條件式請求；304 / 416 不讀取內容並關閉連線"""
+    http, calls, closed = client
+    monkeypatch.setattr(db_service, "get_document_by_id", lambda document_id: _document(None))
+    url = "/api/v1/documents/doc-1/preview"
+
+    first = http.get(url)
+    assert first.headers["etag"] == '"storage-etag"'
+    assert first.headers["content-disposition"].startswith("inline;")
+
+    cached = http.get(url, headers={"If-None-Match": '"storage-etag"'})
+    assert cached.status_code == 304 and cached.headers["etag"] == '"storage-etag"'
+    assert calls[-1] == {"If-None-Match": '"storage-etag"'}
+
+    beyond = http.get(url, headers={"Range": f"bytes={len(CONTENT)}-{len(CONTENT) + 10}"})
+    assert beyond.status_code == 416
+    assert beyond.headers["content-range"] == f"bytes */{len(CONTENT)}"
+    assert closed.count("app-1/income_proof_x.pdf") == 3
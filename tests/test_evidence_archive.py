@@ -0,0 +1,177 @@
+"""
+測試證據 ZIP 串流打包
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import os
+import random
+import time
+import zipfile
+
+from app.services.evidence_archive import MANIFEST_NAME, EvidenceArchive, application_entries
+from app.services.storage import ObjectChunks, storage_service
+
+
+class _FakeStorage:
+    """以 stream_object 提供物件內容，記錄同時開啟的串流數"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.open = 0
+        self.max_open = 0
+
+    def stream_object(self, bucket, path, chunk_size=64 * 1024, request_headers=None):
+        if path not in self.objects:
+            raise FileNotFoundError(path)
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+        data = self.objects[path]
+
+        def chunks():
+            for start in range(0, len(data), chunk_size):
+                time.sleep(random.random() / 200)
+                yield data[start:start + chunk_size]
+
+        def closed():
+            self.open -= 1
+
+        return 200, {}, ObjectChunks(chunks(), closed)
+
+
+def _collect(archive: EvidenceArchive) -> bytes:
+    async def run():
+        return b"".join([part async for part in archive.stream()])
+    return asyncio.run(run())
+
+
+def test_streams_valid_zip_with_manifest(monkeypatch):
+    """照片以 stored、文字檔以 deflate 寫入；找不到的檔案與雜湊不符記錄在 manifest"""
+    photo = os.urandom(700 * 1024)
+    document = "受災證明\n".encode("utf-8") * 20000
+    fake = _FakeStorage({"app-1/photos/a.jpg": photo, "app-1/documents/b.txt": document})
+    monkeypatch.setattr(storage_service, "stream_object", fake.stream_object)
+
+    entries = application_entries(
+        {"id": "app-1", "case_no": "TN-0001"},
+        [
+            {"id": "p1", "photo_type": "before_damage", "file_name": "a.jpg", "storage_path": "app-1/photos/a.jpg",
+             "mime_type": "image/jpeg", "file_size": len(photo), "content_sha256": hashlib.sha256(photo).hexdigest()},
+            {"id": "p2", "photo_type": "before_damage", "file_name": "a.jpg", "storage_path": "app-1/photos/gone.jpg",
+             "mime_type": "image/jpeg", "file_size": 10},
+        ],
+        [
+            {"id": "d1", "document_type": "other", "file_name": "../b.txt", "storage_path": "app-1/documents/b.txt",
+             "mime_type": "text/plain", "file_size": len(document), "content_sha256": "0" * 64},
+        ]
+    )
+    data = _collect(EvidenceArchive(entries, prefetch=2))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        infos = {info.filename: info for info in archive.infolist()}
+        assert infos["TN-0001/photos/before_damage_a.jpg"].compress_type == zipfile.ZIP_STORED
+        assert infos["TN-0001/documents/other_b.txt"].compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read("TN-0001/photos/before_damage_a.jpg") == photo
+        assert archive.read("TN-0001/documents/other_b.txt") == document
+        assert "TN-0001/photos/before_damage_a (2).jpg" not in infos
+
+        rows = {row["name"]: row for row in csv.DictReader(io.StringIO(archive.read(MANIFEST_NAME).decode("utf-8-sig")))}
+    assert rows["TN-0001/photos/before_damage_a.jpg"]["status"] == "ok"
+    assert rows["TN-0001/photos/before_damage_a (2).jpg"]["status"] == "missing"
+    assert rows["TN-0001/documents/other_b.txt"]["status"] == "checksum_mismatch"
+    assert fake.open == 0
+
+
+def test_prefetch_is_bounded(monkeypatch):
+    """同時開啟的 Storage 串流數不超過 prefetch，所有檔案依到達順序完整寫入"""
+    objects = {f"app/photos/{i}.jpg": os.urandom(random.randrange(1, 600 * 1024)) for i in range(12)}
+    fake = _FakeStorage(objects)
+    monkeypatch.setattr(storage_service, "stream_object", fake.stream_object)
+
+    entries = [
+        {"name": f"case/{i}.jpg", "bucket": "b", "path": path, "mime_type": "image/jpeg", "size": len(content)}
+        for i, (path, content) in enumerate(objects.items())
+    ]
+    data = _collect(EvidenceArchive(iter(entries), prefetch=3))
+
+    assert 1 <= fake.max_open <= 3
+    assert fake.open == 0
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for entry in entries:
+            assert archive.read(entry["name"]) == objects[entry["path"]]
+        assert len(archive.namelist()) == len(entries) + 1
+
+
+class _PagedQuery:
+    """只支援 district_entries 用到的 PostgREST 查詢，range 以外的條件直接忽略"""
+
+    def __init__(self, rows, ranges):
+        self.rows = rows
+        self.ranges = ranges
+        self.window = None
+
+    def select(self, *args):
+        return self
+
+    def in_(self, column, values):
+        self.rows = [row for row in self.rows if row[column] in values]
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        self.ranges.append(self.window)
+        return self
+
+    def execute(self):
+        start, end = self.window
+        return type("Result", (), {"data": self.rows[start:end + 1]})()
+
+
+def test_batched_photo_lookup_reads_every_page(monkeypatch):
+    """批次查詢照片時分頁讀取，不會被單次查詢的筆數上限截斷"""
+    from app.models.database import db_service
+
+    rows = [{"id": f"p{i}", "application_id": f"app-{i % 3}"} for i in range(7)]
+    ranges = []
+    monkeypatch.setattr(db_service, "_client", type("Client", (), {
+        "table": lambda self, name: _PagedQuery(rows, ranges)
+    })())
+
+    photos = db_service.get_photos_by_applications(["app-0", "app-1", "app-2"], page_size=3)
+    assert [photo["id"] for photo in photos] == [row["id"] for row in rows]
+    assert ranges == [(0, 2), (3, 5), (6, 8)]
+
+
+def test_application_archive_requires_case_access(monkeypatch):
+    """案件證據下載需登入，且只有管理員、轄區里長與申請人本人可以下載"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.models.database import db_service
+    from app.routers import applications
+    from app.services.auth import get_current_user
+
+    monkeypatch.setattr(db_service, "get_application_by_id", lambda application_id: {
+        "id": application_id, "case_no": "TN-0001", "applicant_id": "user-1", "district_id": "d-1"
+    })
+    monkeypatch.setattr(db_service, "get_photos_by_application", lambda application_id: [])
+    monkeypatch.setattr(db_service, "get_documents_by_application", lambda application_id: [])
+    app = FastAPI()
+    app.include_router(applications.router, prefix="/api/v1")
+    client = TestClient(app)
+
+    assert client.get("/api/v1/applications/app-1/evidence.zip").status_code in (401, 403)
+
+    for user, expected in [
+        ({"id": "user-2", "role": "applicant"}, 403),
+        ({"id": "reviewer-2", "role": "reviewer", "district_id": "d-2"}, 403),
+        ({"id": "reviewer-1", "role": "reviewer", "district_id": "d-1"}, 200),
+        ({"id": "user-1", "role": "applicant"}, 200),
+    ]:
+        app.dependency_overrides[get_current_user] = lambda user=user: user
+        assert client.get("/api/v1/applications/app-1/evidence.zip").status_code == expected
@@ -0,0 +1,70 @@
+"""
+測試災損網格統計與增量更新
+"""
+import numpy as np
+import pytest
+
+from app.services.geo_analytics import GeoAnalyticsService
+from app.services.spatial_index import CaseSpatialIndex
+
+
+def _index(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = 22.95 + rng.random(n) * 0.1
+    lngs = 120.1 + rng.random(n) * 0.1
+    statuses = ["pending", "approved"]
+    disasters = ["flood", "typhoon"]
+    index = CaseSpatialIndex()
+    index.build(
+        {"id": f"case-{i}", "latitude": lats[i], "longitude": lngs[i],
+         "status": statuses[i % 2], "disaster_type": disasters[i % 4 // 2], "district_id": "d1",
+         "requested_amount": 1000, "approved_amount": 500 if i % 2 else None}
+        for i in range(n)
+    )
+    return index
+
+
+def test_grid_totals_and_filters():
+    """網格加總等於案件合計，核准金額只計入核准狀態，災害類型篩選生效"""
+    service = GeoAnalyticsService(_index())
+
+    grid = service.get_grid(0.01)
+    assert grid["totals"] == {
+        "count": 2000, "requested_amount": 2_000_000.0, "approved_count": 1000, "approved_amount": 500_000.0
+    }
+    assert sum(grid["cells"]["count"]) == 2000
+    assert grid["cell_count"] <= 12 * 12
+
+    flood = service.get_grid(0.01, disaster_type="flood")
+    assert flood["totals"]["count"] == 1000
+    assert service.get_grid(0.01, district_id="other")["totals"]["count"] == 0
+
+    heatmap = service.get_heatmap(0.02, weight="approved_amount")
+    assert max(p[2] for p in heatmap["points"]) == 1.0
+
+    with pytest.raises(ValueError):
+        service.get_grid(0.003)
+
+
+def test_incremental_updates_match_recompute():
+    """狀態、金額、位置異動後，快取網格的增量結果與重新計算一致"""
+    index = _index()
+    service = GeoAnalyticsService(index)
+    service.get_grid(0.005)
+    service.get_grid(0.005, disaster_type="flood")
+
+    index.upsert({"id": "case-0", "status": "approved", "approved_amount": 800})
+    index.upsert({"id": "case-1", "status": "rejected"})
+    index.upsert({"id": "case-2", "latitude": 23.0, "longitude": 120.15, "disaster_type": "typhoon"})
+    index.remove("case-3")
+    index.upsert({"id": "new", "latitude": 23.01, "longitude": 120.12, "status": "approved",
+                  "disaster_type": "flood", "requested_amount": 2500, "approved_amount": 2000})
+    # 超出網格範圍的案件會讓快取失效並重新計算
+    index.upsert({"id": "far", "latitude": 25.0, "longitude": 121.5, "disaster_type": "flood",
+                  "requested_amount": 100})
+
+    fresh = GeoAnalyticsService(index)
+    for disaster_type in (None, "flood"):
+        cached = service.get_grid(0.005, disaster_type=disaster_type)
+        expected = fresh.get_grid(0.005, disaster_type=disaster_type)
+        assert cached == expected
@@ -0,0 +1,57 @@
+"""
+測試案件位置的 GeoJSON 串流匯出
+"""
+import gzip
+import json
+
+import pytest
+
+from app.models.database import db_service
+from app.services import geo_export
+from app.services.geo_export import gzip_stream, iter_application_pages, iter_feature_collection, parse_properties
+
+
+def _rows(n):
+    return [
+        {"id": f"{i:05d}", "latitude": 23.0 + i * 1e-4, "longitude": 120.2, "case_no": f"CASE-{i}",
+         "status": "pending", "requested_amount": 1000}
+        for i in range(n)
+    ]
+
+
+def test_keyset_pages_stream_valid_geojson(monkeypatch):
+    """逐頁以上一頁最後的 id 續讀，輸出可解析的 FeatureCollection，gzip 串流可解壓"""
+    rows = _rows(2501)
+    calls = []
+
+    def fake_page(columns, after_id=None, page_size=1000, **filters):
+        calls.append(after_id)
+        remaining = [r for r in rows if after_id is None or r["id"] > after_id]
+        return remaining[:page_size]
+
+    monkeypatch.setattr(db_service, "get_geocoded_applications_page", fake_page)
+    monkeypatch.setattr(geo_export, "FLUSH_BYTES", 4096)
+    fields = parse_properties("case_no,status")
+
+    chunks = list(iter_feature_collection(iter_application_pages(fields, status=["pending"]), fields))
+    collection = json.loads(b"".join(chunks))
+
+    assert calls == [None, "00999", "01999"]
+    assert len(chunks) > 3
+    assert len(collection["features"]) == 2501
+    assert collection["features"][1] == {
+        "type": "Feature", "id": "00001",
+        "geometry": {"type": "Point", "coordinates": [120.2, 23.0001]},
+        "properties": {"case_no": "CASE-1", "status": "pending"}
+    }
+
+    compressed = b"".join(gzip_stream(iter_feature_collection([rows[:10]], fields)))
+    assert len(json.loads(gzip.decompress(compressed))["features"]) == 10
+
+
+def test_empty_export_and_property_whitelist():
+    """沒有案件時輸出空集合，個資欄位不可匯出"""
+    assert json.loads(b"".join(iter_feature_collection([], ["status"]))) == {"type": "FeatureCollection", "features": []}
+    assert parse_properties(None) == list(geo_export.DEFAULT_PROPERTIES)
+    with pytest.raises(ValueError):
+        parse_properties("case_no,applicant_name")
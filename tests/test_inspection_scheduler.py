@@ -0,0 +1,85 @@
+"""
+測試多審核員現場勘查排程
+"""
+import time
+
+import numpy as np
+
+from app.services.inspection_scheduler import InspectionScheduler
+
+
+def _random_cases(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"case-{i}", "latitude": 22.95 + rng.random() * 0.1, "longitude": 120.15 + rng.random() * 0.1}
+        for i in range(n)
+    ]
+
+
+def test_schedule_respects_capacity_and_covers_all_cases():
+    """每位審核員不超過容量，所有案件剛好分配一次"""
+    cases = _random_cases(200)
+    inspectors = [{"reviewer_id": f"r{j}", "capacity": 25} for j in range(10)]
+
+    result = InspectionScheduler().schedule(cases, inspectors)
+
+    assert result["success"]
+    assigned = [cid for a in result["assignments"] for cid in a["application_ids"]]
+    assert sorted(assigned) == sorted(c["id"] for c in cases)
+    assert all(a["case_count"] <= 25 for a in result["assignments"])
+    assert result["unassigned"] == []
+
+
+def test_schedule_reports_overflow_and_missing_coordinates():
+    """超出總容量或沒有經緯度的案件列為未分配"""
+    cases = _random_cases(30) + [{"id": "no-geo", "latitude": None, "longitude": None}]
+    inspectors = [{"reviewer_id": "r1", "capacity": 10}, {"reviewer_id": "r2", "capacity": 10}]
+
+    result = InspectionScheduler().schedule(cases, inspectors)
+
+    assert "no-geo" in result["unassigned"]
+    assert len(result["unassigned"]) == 11
+    assert sum(a["case_count"] for a in result["assignments"]) == 20
+
+
+def test_zero_capacity_inspector_gets_no_cases():
+    """容量為 0 的審核員（無法出勤）不分配案件，其餘案件由可出勤的審核員平均分配"""
+    cases = _random_cases(10)
+    inspectors = [
+        {"reviewer_id": "off-1", "capacity": 0},
+        {"reviewer_id": "off-2", "capacity": 0},
+        {"reviewer_id": "r1"},
+    ]
+
+    result = InspectionScheduler().schedule(cases, inspectors)
+
+    counts = {a["reviewer_id"]: a["case_count"] for a in result["assignments"]}
+    assert counts.get("off-1", 0) == 0 and counts.get("off-2", 0) == 0
+    assert counts["r1"] == 10
+    assert result["unassigned"] == []
+
+
+def test_tour_is_not_worse_than_input_order():
+    """路線最佳化後的距離不應比原始順序長"""
+    scheduler = InspectionScheduler()
+    rng = np.random.default_rng(1)
+    points = rng.random((40, 2)) * 5000
+
+    order, distance = scheduler._optimize_tour(points)
+    naive = float(np.sqrt(((points[1:] - points[:-1]) ** 2).sum(axis=1)).sum())
+
+    assert sorted(order.tolist()) == list(range(40))
+    assert distance <= naive
+
+
+def test_schedule_1000_cases_20_inspectors_is_fast():
+    """1,000 件案件 × 20 位審核員應在數秒內完成"""
+    cases = _random_cases(1000)
+    inspectors = [{"reviewer_id": f"r{j}"} for j in range(20)]
+
+    started = time.perf_counter()
+    result = InspectionScheduler().schedule(cases, inspectors)
+    elapsed = time.perf_counter() - started
+
+    assert sum(a["case_count"] for a in result["assignments"]) == 1000
+    assert elapsed < 5
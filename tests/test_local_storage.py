@@ -0,0 +1,88 @@
+"""
+測試本機磁碟 Storage 後端（分片目錄、原子寫入、簽名 URL 與檔案回應）
+"""
+from urllib.parse import urlsplit
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from storage3.exceptions import StorageApiError
+
+from app.routers import storage_files
+from app.services import storage as storage_module
+from app.services.local_storage import LocalStorageService
+
+CONTENT = bytes(range(256)) * 1024  # 256KB
+
+
+def test_sharded_atomic_writes_and_ranges(tmp_path):
+    """檔案寫入依案件 ID 分片的目錄、不留下暫存檔；不覆寫時重複上傳回傳 409；不允許跳出根目錄"""
+    service = LocalStorageService(root=tmp_path)
+    service.upload_file(service.documents_bucket, "app-1/report.pdf", CONTENT, "application/pdf", upsert=False)
+
+    target = service.local_path(service.documents_bucket, "app-1/report.pdf")
+    assert target.read_bytes() == CONTENT
+    assert len(target.relative_to(tmp_path / service.documents_bucket).parts) == 4
+    assert [p.name for p in target.parent.iterdir()] == ["report.pdf"]
+    assert [f["name"] for f in service._bucket(service.documents_bucket).list("app-1")] == ["report.pdf"]
+
+    with pytest.raises(StorageApiError) as exc_info:
+        service._bucket(service.documents_bucket).upload("app-1/report.pdf", b"other", {"upsert": "false"})
+    assert exc_info.value.status == 409
+    assert target.read_bytes() == CONTENT
+
+    for path in ("../escape.pdf", "app-1/../../escape.pdf", "/etc/passwd", "app-1//x"):
+        with pytest.raises(ValueError):
+            service.local_path(service.documents_bucket, path)
+
+    status_code, headers, chunks = service.stream_object(
+        service.documents_bucket, "app-1/report.pdf", request_headers={"Range": "bytes=100-199"}
+    )
+    assert status_code == 206
+    assert headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert b"".join(chunks) == CONTENT[100:200]
+
+    with service.open_object_response(service.documents_bucket, "app-1/report.pdf", {"Range": "bytes=-10"}) as response:
+        response.raise_for_status()
+        assert response.status_code == 206
+        assert b"".join(response.iter_bytes(4)) == CONTENT[-10:]
+    with service.open_object_stream(service.documents_bucket, "app-1/report.pdf", chunk_size=100_000) as (headers, chunks):
+        assert headers["content-length"] == str(len(CONTENT))
+        assert b"".join(chunks) == CONTENT
+    with pytest.raises(FileNotFoundError):
+        with service.open_object_stream(service.documents_bucket, "app-1/missing.pdf"):
+            pass
+
+
+def test_signed_urls_served_by_local_routes(tmp_path, monkeypatch):
+    """簽名 URL 可下載（Range、304）、竄改或過期的 token 被拒絕；簽名上傳 URL 不覆寫既有檔案"""
+    service = LocalStorageService(root=tmp_path)
+    monkeypatch.setattr(storage_module, "storage_service", service)
+    app = FastAPI()
+    app.include_router(storage_files.router)
+    client = TestClient(app)
+
+    bucket = service.documents_bucket
+    upload = service.create_signed_upload_url(bucket, "app-2/photo.jpg")
+    upload_url = urlsplit(upload["signed_url"])
+    response = client.put(f"{upload_url.path}?{upload_url.query}", content=CONTENT)
+    assert response.status_code == 201
+    assert client.put(f"{upload_url.path}?{upload_url.query}", content=b"again").status_code == 409
+
+    signed = urlsplit(service._bucket(bucket).create_signed_url("app-2/photo.jpg", 60)["signedURL"])
+    url = f"{signed.path}?{signed.query}"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-type"] == "image/jpeg"
+
+    partial = client.get(url, headers={"Range": "bytes=-10"})
+    assert partial.status_code == 206
+    assert partial.content == CONTENT[-10:]
+    assert client.get(url, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+    assert client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"}).status_code == 416
+
+    expires_at, signature = signed.query.split("=", 1)[1].split(".", 1)
+    assert client.get(f"{signed.path}?token={int(expires_at) - 3600}.{signature}").status_code == 403
+    assert client.get(f"/api/v1/storage/object/{bucket}/app-2/other.jpg?token={expires_at}.{signature}").status_code == 403
+    assert client.get(f"/api/v1/storage/public/{bucket}/app-2/photo.jpg").status_code == 404
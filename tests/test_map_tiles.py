@@ -0,0 +1,65 @@
+"""
+測試地圖圖磚分群
+"""
+import numpy as np
+
+from app.services.map_tiles import MapTileService, tile_bounds, tile_for_point
+from app.services.spatial_index import CaseSpatialIndex
+
+
+def _service(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = 22.95 + rng.random(n) * 0.1
+    lngs = 120.1 + rng.random(n) * 0.1
+    statuses = ["pending", "approved"]
+    index = CaseSpatialIndex()
+    index.build(
+        {"id": f"case-{i}", "latitude": lats[i], "longitude": lngs[i],
+         "status": statuses[i % 2], "requested_amount": 1000}
+        for i in range(n)
+    )
+    return MapTileService(index), index
+
+
+def test_tile_aggregates_match_contents():
+    """分群件數、金額與狀態分布加總等於圖磚內案件"""
+    service, _ = _service()
+    z, x, y = tile_for_point(23.0, 120.15, 10)
+
+    tile = service.get_tile(z, x, y)
+
+    assert tile["total"] == 3000
+    assert len(tile["clusters"]) <= 64
+    counted = sum(c["count"] for c in tile["clusters"]) + len(tile["points"])
+    assert counted == 3000
+    assert sum(c["requested_amount"] for c in tile["clusters"]) + 1000 * len(tile["points"]) == 3_000_000
+    assert tile["status_counts"] == {"approved": 1500, "pending": 1500}
+
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(z, x, y)
+    for cluster in tile["clusters"]:
+        assert min_lat <= cluster["latitude"] <= max_lat
+        assert min_lng <= cluster["longitude"] <= max_lng
+
+
+def test_status_change_invalidates_tile():
+    """案件狀態異動後，所屬圖磚的快取會失效"""
+    service, index = _service()
+    z, x, y = tile_for_point(23.0, 120.15, 10)
+    assert service.get_tile(z, x, y, status="pending")["total"] == 1500
+    assert service.get_tile(z, x, y, status="pending") is service.get_tile(z, x, y, status="pending")
+
+    index.upsert({"id": "case-1", "status": "pending"})
+
+    assert service.get_tile(z, x, y, status="pending")["total"] == 1501
+
+
+def test_high_zoom_returns_points():
+    """高縮放層級回傳個別案件"""
+    service, index = _service(n=0)
+    index.upsert({"id": "a", "latitude": 23.0, "longitude": 120.2, "status": "pending", "requested_amount": 5})
+    z, x, y = tile_for_point(23.0, 120.2, 18)
+
+    tile = service.get_tile(z, x, y)
+
+    assert tile["clusters"] == []
+    assert tile["points"][0]["id"] == "a"
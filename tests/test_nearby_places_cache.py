@@ -0,0 +1,140 @@
+"""
+測試附近地點的 geohash 格子快取
+"""
+import asyncio
+
+from app.services.geo import geohash_bbox, geohash_cells_in_radius, geohash_encode, haversine_m
+from app.services.google_maps import GoogleMapsService
+
+
+def test_geohash_roundtrip_and_cover():
+    """geohash 編碼可解回包含原點的格子，且覆蓋格子包含圓心所在格"""
+    code = geohash_encode(22.9917, 120.2009, 6)
+    min_lat, min_lng, max_lat, max_lng = geohash_bbox(code)
+
+    assert min_lat <= 22.9917 < max_lat and min_lng <= 120.2009 < max_lng
+    cells = geohash_cells_in_radius(22.9917, 120.2009, 1000, 6)
+    assert cells[0] == code
+    assert len(cells) == len(set(cells)) and 4 <= len(cells) <= 20
+
+
+class _FakePlacesService(GoogleMapsService):
+    """以假資料回應 Places API，並記錄呼叫次數"""
+
+    def __init__(self, places):
+        super().__init__(api_key="test-key")
+        self.places = places
+        self.calls = 0
+
+    async def _call_api(self, endpoint, path, params, client=None):
+        self.calls += 1
+        lat, lng = (float(v) for v in params["location"].split(","))
+        results = [
+            {"name": name, "place_id": name, "geometry": {"location": {"lat": p_lat, "lng": p_lng}}}
+            for name, p_lat, p_lng in self.places
+            if haversine_m(lat, lng, p_lat, p_lng) <= params["radius"]
+        ]
+        return {"status": "OK", "results": results}
+
+
+def test_nearby_places_merges_cells_and_reuses_cache():
+    """合併相鄰格子並依距離排序，第二次查詢不再呼叫 API"""
+    service = _FakePlacesService([
+        ("near", 22.9920, 120.2010),
+        ("mid", 22.9950, 120.2050),
+        ("far", 23.0500, 120.3000),
+    ])
+
+    first = asyncio.run(service.find_nearby_places(22.9917, 120.2009, radius=1000))
+    calls = service.calls
+    second = asyncio.run(service.find_nearby_places(22.9918, 120.2011, radius=800))
+
+    assert [p["name"] for p in first["places"]] == ["near", "mid"]
+    assert first["places"][0]["distance"] < first["places"][1]["distance"]
+    assert [p["name"] for p in second["places"]] == ["near", "mid"]
+    assert service.calls == calls
+
+
+class _PagedPlacesService(GoogleMapsService):
+    """每頁回傳 20 筆並附上 next_page_token，模擬 Nearby Search 的分頁"""
+
+    def __init__(self, places, fail_page=None):
+        super().__init__(api_key="test-key")
+        self.places = places
+        self.fail_page = fail_page
+        self.requests = []
+
+    async def _call_api(self, endpoint, path, params, client=None):
+        self.requests.append(dict(params))
+        page = int(params.get("pagetoken", 0))
+        if page == self.fail_page:
+            return {"status": "RATE_LIMITED"}
+        results = [
+            {"name": name, "place_id": name, "geometry": {"location": {"lat": p_lat, "lng": p_lng}}}
+            for name, p_lat, p_lng in self.places[page * 20:(page + 1) * 20]
+        ]
+        data = {"status": "OK", "results": results}
+        if (page + 1) * 20 < len(self.places):
+            data["next_page_token"] = str(page + 1)
+        return data
+
+
+def test_cell_with_more_than_20_places_follows_pages(monkeypatch):
+    """格子內超過 20 個地點時依 next_page_token 取得所有分頁；分頁失敗時的部分結果會在下次查詢更新"""
+    from app.services import google_maps
+
+    monkeypatch.setattr(google_maps, "PLACES_PAGE_TOKEN_DELAY", 0)
+    cell = geohash_encode(22.9917, 120.2009, 5)
+    min_lat, min_lng, max_lat, max_lng = geohash_bbox(cell)
+    places = [
+        (f"store-{i}", min_lat + (max_lat - min_lat) * (i + 1) / 50, min_lng + (max_lng - min_lng) / 2)
+        for i in range(45)
+    ]
+
+    service = _PagedPlacesService(places)
+    result, failure = asyncio.run(service._fetch_places_cell((cell, "convenience_store", 5000, "zh-TW")))
+    assert len(result) == 45 and failure is None
+    assert [r.get("pagetoken") for r in service.requests] == [None, "1", "2"]
+    assert service.places_cache.get((cell, "convenience_store", 5000, "zh-TW"))[0] > 0
+
+    partial = _PagedPlacesService(places, fail_page=2)
+    result, failure = asyncio.run(partial._fetch_places_cell((cell, "convenience_store", 5000, "zh-TW")))
+    assert len(result) == 40 and failure == "RATE_LIMITED"
+    assert partial.places_cache.get((cell, "convenience_store", 5000, "zh-TW"))[0] == 0
+
+
+class _FailingPlacesService(_FakePlacesService):
+    """指定中心點落在某些格子時回傳錯誤狀態"""
+
+    def __init__(self, places, failures):
+        super().__init__(places)
+        self.failures = failures
+        self.rate_limiter = type("Limiter", (), {"record_degraded": lambda self, endpoint: None})()
+
+    async def _call_api(self, endpoint, path, params, client=None):
+        lat, lng = (float(v) for v in params["location"].split(","))
+        cell = geohash_encode(lat, lng, 6)
+        if cell in self.failures:
+            self.calls += 1
+            return {"status": self.failures[cell]}
+        return await super()._call_api(endpoint, path, params, client)
+
+
+def test_failures_report_reason_and_partial_results():
+    """只有額度不足才回報使用量上限；其他錯誤回報失敗原因，部分區塊失敗時標記 partial"""
+    cells = geohash_cells_in_radius(22.9917, 120.2009, 1000, 6)
+    places = [("near", 22.9920, 120.2010)]
+
+    denied = _FailingPlacesService(places, {cell: "REQUEST_DENIED" for cell in cells})
+    result = asyncio.run(denied.find_nearby_places(22.9917, 120.2009, radius=1000))
+    assert result["success"] is False and not result.get("rate_limited")
+    assert "REQUEST_DENIED" in result["message"]
+
+    limited = _FailingPlacesService(places, {cell: "OVER_QUERY_LIMIT" for cell in cells})
+    result = asyncio.run(limited.find_nearby_places(22.9917, 120.2009, radius=1000))
+    assert result["success"] is False and result["rate_limited"] is True
+
+    partial = _FailingPlacesService(places, {cells[-1]: "RATE_LIMITED"})
+    result = asyncio.run(partial.find_nearby_places(22.9917, 120.2009, radius=1000))
+    assert result["success"] is True and result["partial"] is True and result["rate_limited"] is True
+    assert [p["name"] for p in result["places"]] == ["near"]
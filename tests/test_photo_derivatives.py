@@ -0,0 +1,76 @@
+"""
+測試災損照片縮圖 / 預覽圖產生
+"""
+import asyncio
+import io
+
+from PIL import Image
+
+from app.models.database import db_service
+from app.services import storage as storage_module
+from app.services.cpu_executor import CPUExecutor
+from app.services.photo_derivatives import DERIVATIVE_SIZES, PhotoDerivativeService, derivative_path, render_derivatives
+
+
+def _jpeg(width=3000, height=2000, orientation=None) -> bytes:
+    image = Image.new("RGB", (width, height), (200, 80, 40))
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buffer, format="JPEG", quality=90, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_render_respects_exif_orientation_and_size_caps():
+    """依 EXIF 方向轉正（直拍照片輸出為直向），長邊不超過上限"""
+    rendered = render_derivatives(_jpeg(orientation=6), image_format="JPEG")
+
+    preview = rendered["preview"]
+    thumbnail = rendered["thumbnail"]
+    assert (preview["width"], preview["height"]) == (1067, DERIVATIVE_SIZES["preview"])
+    assert (thumbnail["width"], thumbnail["height"]) == (213, DERIVATIVE_SIZES["thumbnail"])
+    with Image.open(io.BytesIO(thumbnail["content"])) as decoded:
+        assert decoded.size == (213, 320)
+    assert len(thumbnail["content"]) < len(preview["content"])
+
+    assert derivative_path("app-1/photos/after_damage_x.jpg", "thumbnail", "WEBP") == "app-1/photos/after_damage_x_thumbnail.webp"
+
+
+def test_generate_in_process_pool_and_attach_urls(monkeypatch):
+    """在子程序產生衍生圖並上傳到原始檔旁，列表一次簽名所有 URL，缺少衍生圖時以原圖代替"""
+    service = storage_module.storage_service
+    uploaded = {}
+    updates = {}
+    signed_batches = []
+    monkeypatch.setattr(service, "download_file", lambda bucket, path: _jpeg(800, 600))
+    monkeypatch.setattr(service, "upload_file",
+                        lambda bucket, path, content, content_type: uploaded.setdefault(path, (bucket, content_type)))
+    monkeypatch.setattr(db_service, "update_photo", lambda photo_id, data: updates.setdefault(photo_id, data))
+    monkeypatch.setattr(db_service, "get_photos_by_storage_paths", lambda paths: [])
+
+    def create_signed_urls(bucket, paths, expires_in):
+        signed_batches.append(list(paths))
+        return {p: f"https://signed/{p}" for p in paths}
+
+    monkeypatch.setattr(service, "create_signed_urls", create_signed_urls)
+
+    derivatives = PhotoDerivativeService(cpu=CPUExecutor(max_workers=1))
+    try:
+        photo = {"id": "p1", "storage_path": "app-1/photos/a.jpg", "mime_type": "image/jpeg"}
+        update = asyncio.run(derivatives.generate(photo))
+    finally:
+        derivatives.cpu.shutdown()
+
+    assert set(uploaded) == {update["thumbnail_path"], update["preview_path"]}
+    assert all(bucket == service.documents_bucket for bucket, _ in uploaded.values())
+    assert updates["p1"] == update
+
+    photos = [
+        {"id": "p1", "storage_path": "app-1/photos/a.jpg", **update},
+        {"id": "p2", "storage_path": "app-1/photos/b.jpg", "mime_type": "application/pdf"},
+    ]
+    asyncio.run(derivatives.attach_urls(photos))
+    assert len(signed_batches) == 1 and len(signed_batches[0]) == 4
+    assert photos[0]["thumbnail_url"] == f"https://signed/{update['thumbnail_path']}"
+    assert photos[1]["thumbnail_url"] == photos[1]["signed_url"] == "https://signed/app-1/photos/b.jpg"
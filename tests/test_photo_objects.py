@@ -0,0 +1,86 @@
+"""
+測試照片內容定址儲存（去除重複、引用計數與回收）
+"""
+import hashlib
+
+import pytest
+
+from app.models.database import db_service
+from app.services import storage as storage_module
+from app.services.photo_derivatives import derivative_path
+from app.services.photo_objects import PhotoObjectService
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 200
+SHA256 = hashlib.sha256(JPEG).hexdigest()
+
+
+@pytest.fixture
+def fake_objects(monkeypatch):
+    """以記憶體模擬 photo_objects 資料表與 Storage"""
+    objects = {}
+    storage = {"uploads": [], "removed": []}
+
+    def acquire_photo_object(sha256, storage_path, file_size, mime_type):
+        record = objects.setdefault(sha256, {"sha256": sha256, "storage_path": storage_path,
+                                             "ref_count": 0, "status": "pending"})
+        record["ref_count"] += 1
+        return dict(record)
+
+    def release_photo_object(sha256):
+        objects[sha256]["ref_count"] -= 1
+        return dict(objects[sha256])
+
+    def collect_orphaned_photo_objects(grace_seconds, limit=500):
+        orphaned = [sha for sha, record in objects.items() if record["ref_count"] == 0]
+        return [objects.pop(sha) for sha in orphaned[:limit]]
+
+    monkeypatch.setattr(db_service, "acquire_photo_object", acquire_photo_object)
+    monkeypatch.setattr(db_service, "release_photo_object", release_photo_object)
+    monkeypatch.setattr(db_service, "mark_photo_object_stored",
+                        lambda sha256: objects[sha256].update(status="stored"))
+    monkeypatch.setattr(db_service, "get_photo_object", lambda sha256: objects.get(sha256))
+    monkeypatch.setattr(db_service, "collect_orphaned_photo_objects", collect_orphaned_photo_objects)
+
+    service = storage_module.storage_service
+    monkeypatch.setattr(service, "upload_file",
+                        lambda bucket, path, content, content_type: storage["uploads"].append((path, content)))
+    monkeypatch.setattr(service, "remove_files", lambda bucket, paths: storage["removed"].extend(paths) or True)
+    return objects, storage
+
+
+def test_duplicate_content_is_stored_once(fake_objects):
+    """相同內容第二次儲存時不上傳，只增加引用"""
+    objects, storage = fake_objects
+    service = PhotoObjectService(grace_seconds=0)
+
+    first = service.store(SHA256, len(JPEG), "image/jpeg", "a.jpg", lambda: JPEG, sign=False)
+    second = service.store(SHA256, len(JPEG), "image/jpeg", "b.JPG",
+                           lambda: pytest.fail("重複內容不應讀取上傳內容"), sign=False)
+
+    assert first["deduplicated"] is False and second["deduplicated"] is True
+    assert first["storage_path"] == second["storage_path"]
+    assert first["storage_path"].startswith(f"objects/{SHA256[:2]}/{SHA256}_")
+    # 共用物件沒有 /photos/，仍需對應到災損照片所在的 bucket（簽名、衍生圖與回收都依此判斷）
+    storage_service = storage_module.storage_service
+    assert storage_service.bucket_for_photo_path(first["storage_path"]) == storage_service.documents_bucket
+    assert storage_service.bucket_for_photo_path("app-1/inspection_x.jpg") == storage_service.inspection_photos_bucket
+    assert storage["uploads"] == [(first["storage_path"], JPEG)]
+    assert objects[SHA256]["ref_count"] == 2
+
+
+def test_object_removed_only_after_last_reference(fake_objects):
+    """刪除照片只釋放引用；引用歸零後才由回收工作刪除物件與衍生圖"""
+    objects, storage = fake_objects
+    service = PhotoObjectService(grace_seconds=0)
+    path = service.store(SHA256, len(JPEG), "image/jpeg", "a.jpg", lambda: JPEG, sign=False)["storage_path"]
+    service.store(SHA256, len(JPEG), "image/jpeg", "a.jpg", lambda: JPEG, sign=False)
+    photo = {"storage_path": path, "content_sha256": SHA256}
+
+    service.release_photos([photo])
+    assert service.collect_garbage() == 0
+    assert storage["removed"] == []
+
+    service.release_photos([photo])
+    assert service.collect_garbage() == 1
+    assert storage["removed"] == [path, derivative_path(path, "preview"), derivative_path(path, "thumbnail")]
+    assert SHA256 not in objects
@@ -0,0 +1,142 @@
+"""
+測試跨案件相似照片偵測（dHash 與多重索引雜湊表）
+"""
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from app.models.database import db_service
+from app.services.photo_similarity import (
+    PhotoHashIndex,
+    PhotoSimilarityService,
+    dhash_bytes,
+    from_signed,
+    hamming_distance,
+    to_signed,
+)
+
+
+def _scene(seed: int, size=(1200, 900), quality=90) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (90, 110, 130))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(100, 500), rng.randrange(100, 400)
+        draw.rectangle([x, y, x + w, y + h], fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _resized(data: bytes, size, quality) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        buffer = io.BytesIO()
+        image.resize(size).save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+
+def test_dhash_survives_resize_and_recompression():
+    """縮小與重新壓縮後的照片雜湊接近，不同照片的雜湊差距大；可存入 BIGINT"""
+    original = dhash_bytes(_scene(1))
+    copy = dhash_bytes(_resized(_scene(1), (600, 450), quality=60))
+    other = dhash_bytes(_scene(2))
+
+    assert hamming_distance(original, copy) <= 4
+    assert hamming_distance(original, other) > 12
+    for value in (original, copy, other, (1 << 64) - 1):
+        assert -(1 << 63) <= to_signed(value) < 1 << 63
+        assert from_signed(to_signed(value)) == value
+
+
+def test_index_matches_brute_force_and_supports_removal():
+    """多重索引查詢結果與逐一比對相同（依距離排序），移除後不再出現"""
+    rng = random.Random(7)
+    index = PhotoHashIndex(initial_capacity=4)
+    base = rng.getrandbits(64)
+    hashes = {}
+    for i in range(3000):
+        if i % 10 == 0:
+            # 與 base 相差 0–12 位元的近似照片
+            value = base
+            for bit in rng.sample(range(64), i % 13):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(64)
+        hashes[f"p{i}"] = value
+        index.add(f"p{i}", f"app-{i % 50}", value)
+
+    expected = sorted(
+        (hamming_distance(base, value), photo_id) for photo_id, value in hashes.items()
+        if hamming_distance(base, value) <= 8
+    )
+    results = index.query(base, max_distance=8, limit=1000)
+    assert sorted((distance, photo_id) for photo_id, _, distance in results) == expected
+    assert [distance for _, _, distance in results] == sorted(distance for _, _, distance in results)
+
+    removed = results[0][0]
+    assert index.remove(removed)
+    assert removed not in [photo_id for photo_id, _, _ in index.query(base, max_distance=8, limit=1000)]
+    assert len(index) == 2999
+
+
+def test_record_flags_only_other_applications(monkeypatch):
+    """新照片與他案照片相似時建立標記，同案件的相似照片不標記"""
+    flags = []
+    monkeypatch.setattr(db_service, "create_photo_similarity_flags", lambda rows: flags.extend(rows) or rows)
+    service = PhotoSimilarityService(index=PhotoHashIndex(), max_distance=6)
+
+    value = dhash_bytes(_scene(3))
+    service.index.add("same-app-photo", "app-1", value)
+    service.index.add("other-app-photo", "app-2", value ^ 0b101)
+    service.index.add("unrelated", "app-3", ~value & ((1 << 64) - 1))
+
+    created = service.record({"id": "new-photo", "application_id": "app-1", "phash": to_signed(value)})
+    assert created == flags == [{
+        "application_id": "app-1",
+        "photo_id": "new-photo",
+        "similar_application_id": "app-2",
+        "similar_photo_id": "other-app-photo",
+        "distance": 2
+    }]
+    assert len(service.index) == 4
+
+
+class _EqQuery:
+    """只支援 .eq() 篩選的假查詢，任何 .or_() 呼叫都會失敗"""
+
+    def __init__(self, rows, filters):
+        self.rows = rows
+        self.filters = filters
+
+    def select(self, *args):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        self.rows = [row for row in self.rows if row[column] == value]
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        return type("Result", (), {"data": list(self.rows)})()
+
+
+def test_similarity_flags_are_queried_with_eq_filters(monkeypatch):
+    """兩個方向的標記以 .eq() 查詢後合併並依距離排序，案件 ID 不會拼入篩選字串"""
+    rows = [
+        {"id": "f1", "application_id": "app-1", "similar_application_id": "app-2", "distance": 4},
+        {"id": "f2", "application_id": "app-3", "similar_application_id": "app-1", "distance": 1},
+        {"id": "f3", "application_id": "app-2", "similar_application_id": "app-3", "distance": 0},
+    ]
+    filters = []
+    monkeypatch.setattr(db_service, "_client", type("Client", (), {
+        "table": lambda self, name: _EqQuery(rows, filters)
+    })())
+
+    assert [flag["id"] for flag in db_service.get_photo_similarity_flags("app-1")] == ["f2", "f1"]
+    assert db_service.get_photo_similarity_flags("app-2,similar_application_id.neq.x") == []
+    assert ("application_id", "app-2,similar_application_id.neq.x") in filters
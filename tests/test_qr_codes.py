@@ -0,0 +1,66 @@
+"""
+測試 QR Code 產生服務（PNG / SVG、快取與批次產生）
+"""
+import asyncio
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+from app.services.cpu_executor import CPUExecutor
+from app.services.qr_codes import QRCodeService, render_qr_code
+from app.services.storage import storage_service
+
+CONTENT = '{"certificate_no": "CERT-20240101-abc", "applicant_name": "王小明", "approved_amount": 30000.0}'
+
+
+def _reference_png(content: str) -> Image.Image:
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
+    qr.add_data(content)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_png_matches_qrcode_library_and_svg_covers_same_modules():
+    """PNG 與 qrcode 套件逐格繪製的結果相同；SVG 的路徑涵蓋相同的黑色模組"""
+    png = Image.open(io.BytesIO(render_qr_code(CONTENT, "png")))
+    reference = _reference_png(CONTENT)
+    assert png.size == reference.size
+    assert np.array_equal(np.array(png.convert("L")), np.array(reference.convert("L")))
+
+    svg = render_qr_code(CONTENT, "svg").decode()
+    modules = png.size[0] // 10
+    assert f'viewBox="0 0 {modules} {modules}"' in svg
+    dark = sum(int(width) for width in re.findall(r"M\d+ \d+h(\d+)", svg))
+    assert dark == int((np.array(reference.convert("L")) == 0).sum()) // 100
+
+
+def test_render_many_dedupes_caches_and_uploads(monkeypatch):
+    """批次產生時相同內容只產生一次，之後命中快取；上傳結果依輸入順序回傳"""
+    uploaded = []
+
+    def fake_upload(certificate_no, qr_content, image, image_format="png"):
+        uploaded.append(certificate_no)
+        return {"storage_path": f"certificates/{certificate_no}.{image_format}", "qr_data": qr_content}
+
+    monkeypatch.setattr(storage_service, "upload_qr_code", fake_upload)
+    service = QRCodeService(cpu=CPUExecutor(max_workers=2, executor=ThreadPoolExecutor(2)), cache_size=100, image_format="svg")
+
+    contents = [f"cert-{i}" for i in range(5)] + ["cert-0"]
+    images = asyncio.run(service.render_many(contents))
+    assert images[0] == images[5] == render_qr_code("cert-0", "svg")
+    assert len(service.cache) == 5
+    assert service.render("cert-3") == images[3]
+    assert service.cache.hits == 1
+
+    items = [(f"CERT-{i}", {"n": i}) for i in range(4)]
+    results = asyncio.run(service.issue_certificate_codes(items))
+    assert [result["storage_path"] for result, error in results] == [f"certificates/CERT-{i}.svg" for i in range(4)]
+    assert all(error is None for _, error in results)
+    assert sorted(uploaded) == [f"CERT-{i}" for i in range(4)]
+    service.cpu.shutdown()
@@ -0,0 +1,76 @@
+"""
+測試 Google Maps 速率限制器
+"""
+import asyncio
+
+from app.services.rate_limiter import MapsRateLimiter, parse_budgets
+
+
+def _limiter(tmp_path, spec="geocode=2/3"):
+    return MapsRateLimiter(state_path=str(tmp_path / "quota.json"), budgets=parse_budgets(spec), max_wait_seconds=0)
+
+
+def test_parse_budgets_overrides_defaults():
+    """設定字串只覆寫指定的端點"""
+    budgets = parse_budgets("geocode=5/100")
+
+    assert budgets["geocode"]["qps"] == 5
+    assert budgets["geocode"]["daily_limit"] == 100
+    assert budgets["places"]["qps"] == 10
+
+
+def test_bucket_and_daily_limit_shared_through_state_file(tmp_path):
+    """權杖與每日上限透過狀態檔在不同實例（worker）間共用"""
+    first = _limiter(tmp_path)
+    second = _limiter(tmp_path)
+
+    assert first.try_acquire("geocode")[0]
+    assert second.try_acquire("geocode")[0]
+    acquired, wait = first.try_acquire("geocode")
+    assert not acquired and 0 < wait <= 0.5
+
+    assert asyncio.run(second.acquire("geocode", max_wait=1))
+    assert first.try_acquire("geocode") == (False, float("inf"))
+
+    today = first.usage()["today"]["geocode"]
+    assert today["requests"] == 3
+    assert today["remaining"] == 0
+
+
+def test_quota_error_blocks_endpoint(tmp_path):
+    """配額錯誤後暫停呼叫並記錄拒絕次數"""
+    limiter = _limiter(tmp_path)
+    limiter.record_quota_error("geocode")
+
+    assert limiter.is_blocked("geocode")
+    assert not asyncio.run(limiter.acquire("geocode"))
+    usage = limiter.usage()["today"]["geocode"]
+    assert usage["quota_errors"] == 1
+    assert usage["denied"] == 1
+
+
+def test_maps_service_degrades_when_rate_limited(tmp_path):
+    """額度不足時改用快取或直線估算，不呼叫 API"""
+    from app.services.google_maps import GoogleMapsService
+
+    limiter = _limiter(tmp_path)
+    limiter.record_quota_error("geocode")
+    limiter.record_quota_error("directions")
+    service = GoogleMapsService(api_key="test-key")
+    service.rate_limiter = limiter
+    service.geocode_cache.set(("台南市中西區民權路一段100號", "zh-TW"), {"success": True, "latitude": 22.99, "longitude": 120.20})
+
+    cached = asyncio.run(service.geocode_address(" 台南市中西區民權路一段100號 "))
+    missing = asyncio.run(service.geocode_address("台南市東區大學路1號"))
+    route = asyncio.run(service.calculate_route("22.98,120.19", "台南市中西區民權路一段100號", waypoints=["23.00,120.21"]))
+
+    assert cached["latitude"] == 22.99
+    assert missing["rate_limited"] is True
+    assert route["estimated"] is True
+    assert len(route["routes"][0]["legs"]) == 2
+    assert limiter.usage()["today"]["directions"]["degraded"] == 1
+
+    unknown = asyncio.run(service.calculate_route("22.98,120.19", "台南市東區大學路1號"))
+    assert unknown["rate_limited"] is True
+    # 每次降級只記錄一次
+    assert limiter.usage()["today"]["directions"]["degraded"] == 2
@@ -0,0 +1,155 @@
+"""
+測試可續傳照片上傳（建立、PATCH 區塊、HEAD 查詢、逾期清除）
+"""
+import asyncio
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.database import db_service
+from app.routers import photos
+from app.services import resumable_uploads
+from app.services.photo_derivatives import PhotoDerivativeService
+from app.services.photo_objects import PhotoObjectService
+from app.services.resumable_uploads import ResumableUploadService
+from app.services.uploads import UploadError
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    uploads = []
+
+    def store(self, sha256, size, mime_type, filename, open_payload, sign=True):
+        uploads.append({"content": open_payload().read(), "content_type": mime_type})
+        return {"storage_path": f"objects/{sha256[:2]}/{sha256}.jpg", "signed_url": "https://signed/x"}
+
+    monkeypatch.setattr(PhotoObjectService, "store", store)
+    monkeypatch.setattr(db_service, "create_damage_photo", lambda data: {"id": "photo-1", **data})
+    monkeypatch.setattr(db_service, "get_application_by_id", lambda application_id: {"id": application_id})
+    return uploads
+
+
+async def _stream(*parts, fail=False):
+    for part in parts:
+        yield part
+    if fail:
+        raise ConnectionResetError("client disconnected")
+
+
+def test_resume_after_dropped_connection(tmp_path, stored):
+    """中途斷線時保留已收到的位元組，從伺服器回報的位置續傳，收齊後上傳到 Storage"""
+    service = ResumableUploadService(directory=str(tmp_path), max_size=1024 * 1024)
+    upload = service.create("app-1", "after_damage", "a.jpg", len(JPEG))
+    upload_id = upload["upload_id"]
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(service.append(upload_id, 0, _stream(JPEG[:3000], JPEG[3000:4000], fail=True)))
+    assert service.status(upload_id)["offset"] == 4000
+
+    with pytest.raises(UploadError) as conflict:
+        asyncio.run(service.append(upload_id, 0, _stream(JPEG)))
+    assert conflict.value.status_code == 409
+
+    result = asyncio.run(service.append(upload_id, 4000, _stream(JPEG[4000:8000])))
+    assert result["completed"] is False and result["offset"] == 8000
+
+    result = asyncio.run(service.append(upload_id, 8000, _stream(JPEG[8000:])))
+    assert result["completed"] is True
+    assert result["photo"]["content_sha256"] == hashlib.sha256(JPEG).hexdigest()
+    assert result["photo"]["file_size"] == len(JPEG)
+    assert stored == [{"content": JPEG, "content_type": "image/jpeg"}]
+    assert os.listdir(tmp_path) == []
+
+
+def test_http_protocol_and_expiry(tmp_path, stored, monkeypatch):
+    """HEAD 回報 Upload-Offset；非圖片內容在第一個區塊就被拒絕；逾期工作會被清除"""
+    service = ResumableUploadService(directory=str(tmp_path), max_size=1024 * 1024)
+    monkeypatch.setattr(resumable_uploads, "_resumable_upload_service", service)
+    monkeypatch.setattr(PhotoDerivativeService, "schedule", lambda self, photos: [])
+    app = FastAPI()
+    app.include_router(photos.router, prefix="/api/v1")
+    client = TestClient(app)
+
+    created = client.post("/api/v1/photos/resumable", json={
+        "application_id": "app-1", "photo_type": "after_damage", "file_name": "a.jpg", "size": len(JPEG)
+    })
+    assert created.status_code == 201
+    location = created.headers["Location"]
+
+    patched = client.patch(location, content=JPEG[:5000], headers={"Upload-Offset": "0"})
+    assert patched.headers["Upload-Offset"] == "5000"
+    head = client.head(location)
+    assert head.status_code == 200 and head.headers["Upload-Offset"] == "5000"
+    done = client.patch(location, content=JPEG[5000:], headers={"Upload-Offset": "5000"})
+    assert done.json()["data"]["completed"] is True
+    assert client.head(location).status_code == 404
+
+    bad = service.create("app-1", "after_damage", "b.jpg", 1000)
+    with pytest.raises(UploadError) as unsupported:
+        asyncio.run(service.append(bad["upload_id"], 0, _stream(b"<html>" + b"x" * 100)))
+    assert unsupported.value.status_code == 415
+
+    abandoned = ResumableUploadService(directory=str(tmp_path), expires_minutes=-1)
+    stale = abandoned.create("app-1", "after_damage", "c.jpg", 1000)
+    assert abandoned.purge_expired() == 1
+    with pytest.raises(UploadError):
+        service.status(stale["upload_id"])
+
+
+def test_workers_sharing_directory_do_not_interleave(tmp_path, stored):
+    """另一個 worker 在區塊傳輸中收到同一工作的請求時回傳 409，完成後的重送不會再次建立照片"""
+    worker_a = ResumableUploadService(directory=str(tmp_path), max_size=1024 * 1024)
+    worker_b = ResumableUploadService(directory=str(tmp_path), max_size=1024 * 1024)
+    upload_id = worker_a.create("app-1", "after_damage", "a.jpg", len(JPEG))["upload_id"]
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_stream():
+            yield JPEG[:4000]
+            started.set()
+            await release.wait()
+            yield JPEG[4000:]
+
+        first = asyncio.create_task(worker_a.append(upload_id, 0, slow_stream()))
+        await started.wait()
+        with pytest.raises(UploadError) as busy:
+            await worker_b.append(upload_id, 0, _stream(JPEG))
+        release.set()
+        return busy.value, await first
+
+    busy, result = asyncio.run(run())
+    assert busy.status_code == 409
+    assert result["completed"] is True
+
+    with pytest.raises(UploadError) as retried:
+        asyncio.run(worker_b.append(upload_id, len(JPEG), _stream(b"")))
+    assert retried.value.status_code == 404
+    assert stored == [{"content": JPEG, "content_type": "image/jpeg"}]
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_insert_releases_object_reference(tmp_path, stored, monkeypatch):
+    """建立照片記錄時資料庫拋出錯誤也會釋放引用，重試時只持有一次引用"""
+    service = ResumableUploadService(directory=str(tmp_path), max_size=1024 * 1024)
+    upload_id = service.create("app-1", "after_damage", "a.jpg", len(JPEG))["upload_id"]
+    released = []
+    monkeypatch.setattr(PhotoObjectService, "release_photos", lambda self, photos: released.extend(photos))
+
+    def broken_insert(data):
+        raise RuntimeError("postgrest error")
+
+    monkeypatch.setattr(db_service, "create_damage_photo", broken_insert)
+    with pytest.raises(RuntimeError):
+        asyncio.run(service.append(upload_id, 0, _stream(JPEG)))
+    assert len(stored) == 1 and len(released) == 1
+
+    monkeypatch.setattr(db_service, "create_damage_photo", lambda data: {"id": "photo-1", **data})
+    result = asyncio.run(service.append(upload_id, len(JPEG), _stream(b"")))
+    assert result["completed"] is True
+    assert len(stored) - len(released) == 1
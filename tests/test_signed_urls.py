@@ -0,0 +1,52 @@
+"""
+測試簽名 URL 的批次產生與快取
+"""
+from app.services import storage as storage_module
+from app.services.signed_urls import SignedUrlService
+
+
+def test_batches_misses_and_serves_hits_from_cache(monkeypatch):
+    """未命中的路徑以單次批次簽名產生，再次瀏覽不呼叫 Storage；刪除檔案後重新簽名"""
+    calls = []
+
+    def create_signed_urls(bucket, paths, expires_in):
+        calls.append((bucket, list(paths), expires_in))
+        return {p: f"https://signed/{p}?v={len(calls)}" for p in paths if p != "missing.jpg"}
+
+    monkeypatch.setattr(storage_module.storage_service, "create_signed_urls", create_signed_urls)
+    service = SignedUrlService()
+
+    first = service.sign_many("docs", ["a.jpg", "b.jpg", "a.jpg", "missing.jpg"], expires_in=3600)
+    assert calls == [("docs", ["a.jpg", "b.jpg", "missing.jpg"], 3600)]
+    assert first["a.jpg"] == "https://signed/a.jpg?v=1" and first["missing.jpg"] is None
+
+    again = service.sign_many("docs", ["a.jpg", "b.jpg", "c.jpg"], expires_in=3600)
+    assert calls[1] == ("docs", ["c.jpg"], 3600)
+    assert again["b.jpg"] == first["b.jpg"]
+    assert service.sign("docs", "a.jpg") == first["a.jpg"]
+    assert len(calls) == 2
+
+    # 不同有效期或 bucket 分開快取；刪除後清除所有有效期的快取
+    service.sign("docs", "a.jpg", expires_in=86400)
+    assert len(calls) == 3
+    service.invalidate("docs", ["a.jpg"])
+    assert service.sign("docs", "a.jpg") == "https://signed/a.jpg?v=4"
+    assert service.stats()["storage_calls"] == 4
+
+
+def test_cache_expires_before_url(monkeypatch):
+    """快取在 URL 到期前失效，回傳的 URL 至少還有 80% 有效期"""
+    service = SignedUrlService(refresh_margin=300)
+    assert service._cache_ttl(3600) == 3300
+    assert service._cache_ttl(60) == 48
+
+    now = [1000.0]
+    monkeypatch.setattr("app.services.cache.time.monotonic", lambda: now[0])
+    monkeypatch.setattr(storage_module.storage_service, "create_signed_urls",
+                        lambda bucket, paths, expires_in: {p: f"https://signed/{p}@{now[0]}" for p in paths})
+
+    url = service.sign("docs", "a.jpg", expires_in=3600)
+    now[0] += 3299
+    assert service.sign("docs", "a.jpg", expires_in=3600) == url
+    now[0] += 2
+    assert service.sign("docs", "a.jpg", expires_in=3600) != url
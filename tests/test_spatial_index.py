@@ -0,0 +1,131 @@
+"""
+測試案件空間索引
+"""
+import numpy as np
+
+from app.services.geo import haversine_to_point
+from app.services.spatial_index import CaseSpatialIndex
+
+
+def _build_index(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = 22.9 + rng.random(n) * 0.2
+    lngs = 120.1 + rng.random(n) * 0.2
+    statuses = ["pending", "approved", "site_inspection"]
+    rows = [
+        {"id": f"case-{i}", "latitude": lats[i], "longitude": lngs[i],
+         "status": statuses[i % 3], "district_id": f"d{i % 5}"}
+        for i in range(n)
+    ]
+    index = CaseSpatialIndex()
+    index.build(rows)
+    return index, lats, lngs
+
+
+def test_radius_query_matches_brute_force():
+    """半徑查詢結果與暴力搜尋一致"""
+    index, lats, lngs = _build_index()
+    distances = haversine_to_point(lats, lngs, 23.0, 120.2)
+
+    result = index.query_radius(23.0, 120.2, 800)
+
+    expected = {f"case-{i}" for i in np.flatnonzero(distances <= 800)}
+    assert {r["id"] for r in result} == expected
+    assert [r["distance_m"] for r in result] == sorted(r["distance_m"] for r in result)
+
+
+def test_knn_with_status_filter():
+    """最近 k 件查詢會套用狀態篩選"""
+    index, lats, lngs = _build_index()
+    distances = haversine_to_point(lats, lngs, 23.0, 120.2)
+    pending = np.arange(len(lats)) % 3 == 0
+    expected = [f"case-{i}" for i in np.flatnonzero(pending)[np.argsort(distances[pending])][:5]]
+
+    result = index.query_knn(23.0, 120.2, 5, status="pending")
+
+    assert [r["id"] for r in result] == expected
+
+
+def test_incremental_update_and_remove():
+    """增量更新座標、狀態與移除"""
+    index = CaseSpatialIndex()
+    index.upsert({"id": "a", "latitude": 23.0, "longitude": 120.2, "status": "pending"})
+
+    assert index.query_radius(23.0, 120.2, 10)[0]["id"] == "a"
+
+    index.upsert({"id": "a", "latitude": 23.1, "longitude": 120.3, "status": "approved"})
+    assert index.query_radius(23.0, 120.2, 10) == []
+    assert index.get("a")["status"] == "approved"
+
+    index.upsert({"id": "a", "status": "completed"})
+    assert index.get("a")["status"] == "completed"
+
+    index.upsert({"id": "a", "latitude": None, "longitude": None})
+    assert index.get("a") is None
+    assert len(index) == 0
+
+
+class _FakeQuery:
+    """模擬 PostgREST 查詢鏈：insert / update 回傳寫入後的資料列"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.data = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def insert(self, data):
+        self.data = [{"id": "new-case", **data}]
+        return self
+
+    def update(self, data):
+        self.data = [{**row, **data} for row in self.rows]
+        return self
+
+    def execute(self):
+        return self
+
+
+class _FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        return _FakeQuery(self.rows)
+
+
+def test_database_writes_publish_to_index(monkeypatch):
+    """建立案件與指派區域都會發布異動，索引不必等到重新啟動"""
+    from app.models.database import DatabaseService
+    from app.services import case_events
+
+    index = CaseSpatialIndex()
+    case_events.subscribe(index.upsert)
+    try:
+        db = DatabaseService()
+        db._client = _FakeClient([{"id": "new-case", "latitude": 23.0, "longitude": 120.2, "status": "pending"}])
+        db.create_application({"latitude": 23.0, "longitude": 120.2, "status": "pending"})
+        assert index.get("new-case")["status"] == "pending"
+
+        db.assign_district(["new-case"], "d1")
+        assert index.get("new-case")["district_id"] == "d1"
+        assert [r["id"] for r in index.query_knn(23.0, 120.2, 1, district_id="d1")] == ["new-case"]
+    finally:
+        case_events.unsubscribe(index.upsert)
+
+
+def test_knn_bounds_follow_incremental_updates():
+    """已使用網格的外框隨新增、搬移與移除更新；最近 k 件在移除邊界案件後仍正確"""
+    index, lats, lngs = _build_index(n=2000, seed=1)
+    index.upsert({"id": "far", "latitude": 24.5, "longitude": 121.5, "status": "pending"})
+    assert index.query_knn(24.5, 121.5, 1)[0]["id"] == "far"
+
+    index.upsert({"id": "far", "latitude": 23.0, "longitude": 120.2})
+    index.remove("case-0")
+    xs, ys = zip(*index._cells.keys())
+    assert index._occupied_bounds() == (min(xs), max(xs), min(ys), max(ys))
+
+    distances = haversine_to_point(lats, lngs, 24.5, 121.5)
+    expected = [f"case-{i}" for i in np.argsort(distances) if i != 0][:3]
+    assert [r["id"] for r in index.query_knn(24.5, 121.5, 3, status=["pending", "approved", "site_inspection"])] == expected
@@ -0,0 +1,145 @@
+"""
+測試上傳檔案的串流讀取、大小限制與格式判斷
+"""
+import asyncio
+import hashlib
+import io
+import tempfile
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.services import storage as storage_module
+from app.services.uploads import UploadError, UploadSizeLimitMiddleware, receive_upload, sniff_mime_type, upload_batch
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 60
+PDF = b"%PDF-1.7\n"
+
+
+def _upload(content: bytes, content_type: str = "image/jpeg", filename: str = "a.jpg") -> UploadFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(content)
+    spool.seek(0)
+    return UploadFile(spool, size=None, filename=filename, headers={"content-type": content_type})
+
+
+def test_sniff_mime_type():
+    """依開頭位元組判斷格式，Office 格式以宣告類型區分"""
+    assert sniff_mime_type(JPEG) == "image/jpeg"
+    assert sniff_mime_type(PDF) == "application/pdf"
+    assert sniff_mime_type(b"PK\x03\x04rest", "application/vnd.openxmlformats-officedocument.wordprocessingml.document") \
+        == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    assert sniff_mime_type(b"PK\x03\x04rest", "image/jpeg") is None
+    assert sniff_mime_type(b"<html>") is None
+
+
+def test_receive_upload_hashes_and_spools():
+    """串流計算 SHA-256 與大小，超過記憶體門檻的檔案以檔案讀取器交給 Storage"""
+    content = JPEG + b"x" * (2 * 1024 * 1024)
+    upload = asyncio.run(receive_upload(_upload(content), {"image/jpeg"}, 10 * 1024 * 1024))
+
+    assert upload.size == len(content)
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+    assert upload.mime_type == "image/jpeg"
+    payload = upload.payload()
+    assert isinstance(payload, io.BufferedReader)
+    assert payload.read() == content
+
+    small = asyncio.run(receive_upload(_upload(PDF, "application/pdf"), {"application/pdf"}, 1024))
+    assert small.payload() == PDF
+
+
+def test_receive_upload_rejects_oversized_and_mismatched():
+    """超過上限回傳 413，內容與允許格式不符回傳 415"""
+    with pytest.raises(UploadError) as oversized:
+        asyncio.run(receive_upload(_upload(JPEG + b"x" * 2048), {"image/jpeg"}, 1024))
+    assert oversized.value.status_code == 413
+
+    with pytest.raises(UploadError) as mismatched:
+        asyncio.run(receive_upload(_upload(PDF, "image/jpeg"), {"image/jpeg"}, 1024))
+    assert mismatched.value.status_code == 415
+
+
+def test_middleware_rejects_large_request_before_route():
+    """請求超過路徑上限時直接回傳 413，不進入路由"""
+    app = FastAPI()
+    calls = []
+
+    @app.post("/api/v1/photos/upload")
+    async def upload(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"ok": True}
+
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/api/v1/photos": 4096})
+    client = TestClient(app)
+
+    assert client.post("/api/v1/photos/upload", files={"file": ("a.jpg", JPEG)}).status_code == 200
+    response = client.post("/api/v1/photos/upload", files={"file": ("b.jpg", JPEG * 200)})
+    assert response.status_code == 413
+    assert calls == ["a.jpg"]
+
+
+def test_upload_batch_runs_concurrently_and_inserts_once(monkeypatch):
+    """批次上傳並行執行（不超過上限），記錄只寫入一次，並逐檔回報結果"""
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def store(upload):
+        with lock:
+            active.append(upload.filename)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(upload.filename)
+        return {"storage_path": f"app/{upload.filename}"}
+
+    inserts = []
+
+    def insert_rows(rows):
+        inserts.append(rows)
+        return [{"id": f"id-{i}", **row} for i, row in enumerate(rows)]
+
+    monkeypatch.setattr(storage_module.storage_service, "create_signed_urls",
+                        lambda bucket, paths, expires_in: {p: f"https://signed/{p}" for p in paths})
+
+    files = [_upload(JPEG, filename=f"{i}.jpg") for i in range(6)] + [_upload(b"not an image", filename="bad.jpg")]
+    batch = asyncio.run(upload_batch(
+        files, {"image/jpeg"}, 1024 * 1024,
+        store=store,
+        build_row=lambda upload, stored: {"storage_path": stored["storage_path"], "sha": upload.sha256},
+        insert_rows=insert_rows,
+        bucket="bucket",
+        signed_url_expires_in=60,
+        concurrency=3
+    ))
+
+    assert max(peak) == 3
+    assert len(inserts) == 1 and len(inserts[0]) == 6
+    assert [r["success"] for r in batch["results"]] == [True] * 6 + [False]
+    assert batch["results"][2]["id"] == "id-2"
+    assert batch["uploaded"][0]["signed_url"] == "https://signed/app/0.jpg"
+    assert batch["errors"][0].startswith("bad.jpg:")
+
+
+def test_upload_batch_maps_duplicate_content_by_position(monkeypatch):
+    """內容相同的檔案共用 storage_path，仍各自回報自己的記錄 ID"""
+    monkeypatch.setattr(storage_module.storage_service, "create_signed_urls",
+                        lambda bucket, paths, expires_in: {p: f"https://signed/{p}" for p in paths})
+
+    files = [_upload(JPEG, filename="a.jpg"), _upload(JPEG, filename="b.jpg"), _upload(JPEG + b"x", filename="c.jpg")]
+    batch = asyncio.run(upload_batch(
+        files, {"image/jpeg"}, 1024 * 1024,
+        store=lambda upload: {"storage_path": f"objects/{upload.sha256}.jpg"},
+        build_row=lambda upload, stored: {"storage_path": stored["storage_path"], "file_name": upload.filename},
+        insert_rows=lambda rows: [{"id": f"id-{i}", **row} for i, row in enumerate(rows)],
+        bucket="bucket",
+        signed_url_expires_in=60,
+        concurrency=3
+    ))
+
+    assert [r["id"] for r in batch["results"]] == ["id-0", "id-1", "id-2"]
+    assert batch["uploaded"][0]["storage_path"] == batch["uploaded"][1]["storage_path"]
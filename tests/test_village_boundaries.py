@@ -0,0 +1,65 @@
+"""
+測試里界圖層的點位判定
+"""
+import numpy as np
+
+from app.services.village_boundaries import VillageBoundaryLayer
+
+
+def _square(x0, y0, size):
+    return [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+
+
+def _grid_layer(n=20, size=0.01):
+    """n x n 個相鄰正方形里"""
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"COUNTYNAME": "臺南市", "TOWNNAME": "東區", "VILLNAME": f"里{i}-{j}"},
+            "geometry": {"type": "Polygon", "coordinates": [_square(120.0 + i * size, 23.0 + j * size, size)]}
+        }
+        for i in range(n) for j in range(n)
+    ]
+    return VillageBoundaryLayer(features)
+
+
+def test_locate_on_grid():
+    """單點查詢對應到正確的格子"""
+    layer = _grid_layer()
+
+    polygon = layer.locate(23.0 + 0.0155, 120.0 + 0.0735)
+
+    assert layer.names[polygon]["village"] == "里7-1"
+    assert layer.names[polygon]["city"] == "臺南市"
+    assert layer.locate(22.0, 120.0) == -1
+
+
+def test_hole_and_multipolygon():
+    """內環（洞）不算在多邊形內，多重多邊形任一部分皆可"""
+    layer = VillageBoundaryLayer([
+        {
+            "properties": {"city": "台南市", "district": "北區", "village": "甲里"},
+            "geometry": {"type": "MultiPolygon", "coordinates": [
+                [_square(0, 0, 10), _square(4, 4, 2)],
+                [_square(20, 20, 1)],
+            ]}
+        }
+    ])
+
+    assert layer.locate(1, 1) == 0
+    assert layer.locate(5, 5) == -1
+    assert layer.locate(20.5, 20.5) == 0
+    assert layer.locate(15, 15) == -1
+
+
+def test_locate_many_matches_single_lookup():
+    """批次查詢與單點查詢結果一致"""
+    layer = _grid_layer()
+    rng = np.random.default_rng(0)
+    lats = 22.99 + rng.random(2000) * 0.22
+    lngs = 119.99 + rng.random(2000) * 0.22
+
+    batch = layer.locate_many(lats, lngs)
+
+    assert batch.tolist() == [layer.locate(lat, lng) for lat, lng in zip(lats, lngs)]
+    assert (batch == -1).any() and (batch >= 0).any()